@@ -19,12 +19,15 @@ from copy import deepcopy
 if os.path.abspath(os.path.join(sys.path[0], '..')) not in sys.path:
     sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '..')))
 
+import numpy
 from pygeoc.utils import FileClass
 
 from preprocess.db_mongodb import ConnectMongoDB
-from preprocess.text import DBTableNames
+from preprocess.text import DBTableNames, ModelParamFields
 from preprocess.utility import read_data_items_from_txt
+from postprocess.utility import match_simulation_observation
 from run_seims import MainSEIMS
+from run_queue import ModelRunQueue
 from calibration.config import CaliConfig, get_cali_config
 from calibration.sample_lhs import lhs
 
@@ -122,6 +125,8 @@ class Calibration(object):
             - bounds - a list of lists of lower and upper bounds
             - num_vars - a scalar indicating the number of variables
                          (the length of names)
+            - impacts - the current values of IMPACT field, i.e., the neutral values
+                        of parameters which are not calibrated
         """
         # read param_defs.json if already existed
         if self.param_defs:
@@ -134,6 +139,7 @@ class Calibration(object):
 
         names = list()
         bounds = list()
+        impacts = list()
         num_vars = 0
         if not FileClass.is_file_exists(self.cfg.param_range_def):
             raise ValueError('Parameters definition file: %s is not'
@@ -143,14 +149,41 @@ class Calibration(object):
             if len(item) < 3:
                 continue
             # find parameter name, print warning message if not existed
-            cursor = collection.find({'NAME': item[0]}, no_cursor_timeout=True)
-            if not cursor.count():
+            param_doc = collection.find_one({ModelParamFields.name: item[0]})
+            if param_doc is None:
                 print('WARNING: parameter %s is not existed!' % item[0])
                 continue
             num_vars += 1
             names.append(item[0])
             bounds.append([float(item[1]), float(item[2])])
-        self.param_defs = {'names': names, 'bounds': bounds, 'num_vars': num_vars}
+            impacts.append(float(param_doc.get(ModelParamFields.impact, 0.)))
+        client.close()
+        self.param_defs = {'names': names, 'bounds': bounds, 'num_vars': num_vars,
+                           'impacts': impacts}
+        return self.param_defs
+
+    def merge_param_defs(self, names, bounds, impacts):
+        """Merge parameters calibrated by the former step, e.g., the seeds of current step.
+
+        The given parameters are placed first (in the given order), followed by the
+        parameters that only defined in the parameters range file of current step.
+        The bounds defined in current step take precedence.
+        """
+        cur_defs = self.ParamDefs
+        merged_names = list(names) + [n for n in cur_defs['names'] if n not in names]
+        merged_bounds = list()
+        merged_impacts = list()
+        for pname in merged_names:
+            if pname in cur_defs['names']:
+                idx = cur_defs['names'].index(pname)
+                merged_bounds.append(cur_defs['bounds'][idx])
+                merged_impacts.append(cur_defs['impacts'][idx])
+            else:
+                idx = list(names).index(pname)
+                merged_bounds.append(list(bounds[idx]))
+                merged_impacts.append(impacts[idx])
+        self.param_defs = {'names': merged_names, 'bounds': merged_bounds,
+                           'num_vars': len(merged_names), 'impacts': merged_impacts}
         return self.param_defs
 
     def reset_simulation_timerange(self):
@@ -183,6 +216,36 @@ class Calibration(object):
             all.append(gene_values)
         return all
 
+    def initialize_around_seeds(self, n, seed_values, radius=0.1):
+        """Initialize parameters samples around seeds by Latin-Hypercube sampling method.
+
+        The parameters carried by seeds (i.e., the first `len(seed_values[0])` parameters after
+        `merge_param_defs`) are sampled within +-radius * range of the seed values assigned
+        in turn, and the other parameters are sampled within the entire range.
+
+        Args:
+            n: Number of samples.
+            seed_values: Parameters values of seeds, (seeds x carried parameters).
+            radius: Perturbation radius as a ratio of parameter ranges.
+        Returns:
+            A list contains parameter value at each gene location.
+        """
+        if n < 1:
+            return list()
+        bounds = numpy.array(self.ParamDefs['bounds'], dtype=numpy.float64)
+        low = numpy.tile(bounds[:, 0], (n, 1))
+        up = numpy.tile(bounds[:, 1], (n, 1))
+        seed_values = numpy.array(seed_values, dtype=numpy.float64)
+        if seed_values.size:
+            ncarried = seed_values.shape[1]
+            seeds = numpy.clip(seed_values[numpy.arange(n) % len(seed_values)],
+                               bounds[:ncarried, 0], bounds[:ncarried, 1])
+            delta = radius * (bounds[:ncarried, 1] - bounds[:ncarried, 0])
+            low[:, :ncarried] = numpy.maximum(low[:, :ncarried], seeds - delta)
+            up[:, :ncarried] = numpy.minimum(up[:, :ncarried], seeds + delta)
+        lhs_samples = numpy.array(lhs(self.ParamDefs['num_vars'], n)).reshape(n, -1)
+        return (low + lhs_samples * (up - low)).tolist()
+
 
 def initialize_calibrations(cf):
     """Initial individual of population.
@@ -213,6 +276,19 @@ def calibration_objectives(cali_obj, ind):
         ind.sim.data = deepcopy(model_obj.sim_value)
     else:
         return ind
+    calculate_calibration_statistics(cali_obj, ind, model_obj)
+
+    # Get timespan
+    ind.io_time, ind.comp_time, ind.simu_time, ind.runtime = model_obj.GetTimespan()
+
+    # delete model output directory for saving storage
+    shutil.rmtree(model_obj.output_dir)
+    return ind
+
+
+def calculate_calibration_statistics(cali_obj, ind, model_obj):
+    """Calculate the statistics of calibration and validation periods of given individual
+    from the simulation data of `model_obj`."""
     # Calculate NSE, R2, RMSE, PBIAS, and RSR, etc. of calibration period
     ind.cali.vars, ind.cali.data = model_obj.ExtractSimData(cali_obj.cfg.cali_stime,
                                                             cali_obj.cfg.cali_etime)
@@ -240,12 +316,39 @@ def calibration_objectives(cali_obj, ind):
         if ind.vali.objnames and ind.vali.objvalues:
             ind.vali.valid = True
 
-    # Get timespan
-    ind.io_time, ind.comp_time, ind.simu_time, ind.runtime = model_obj.GetTimespan()
 
-    # delete model output directory for saving storage
-    shutil.rmtree(model_obj.output_dir)
-    return ind
+def queued_calibration_objectives(cali_obj, inds, run_name=''):
+    """Evaluate the objectives of individuals by the model-run queue, i.e., the models are
+    run by `run_queue.QueueWorker` daemons and the simulations are posted back.
+
+    The individuals of failed model runs are returned without simulation data,
+    the same as `calibration_objectives`.
+    """
+    model_args = cali_obj.model.ConfigDict
+    model_args['calibration_id'] = -1
+    # Only used to extract simulation data and calculate statistics, never run
+    model_obj = MainSEIMS(args_dict=model_args)
+    queue = ModelRunQueue(cali_obj.model.host, cali_obj.model.port, model_obj.db_name)
+    specs = [{'calibration_id': ind.id, 'outputs': ind.obs.vars} for ind in inds]
+    results = queue.map(specs, run_name, cali_obj.cfg.queue_attempts, cali_obj.cfg.queue_timeout)
+    queue.clear(run_name)
+    for ind, result in zip(inds, results):
+        if result is None:
+            continue
+        ind.io_time, ind.comp_time, ind.simu_time, ind.runtime = result['TIMESPAN']
+        if not result['SIM_VARS']:
+            continue
+        model_obj.SetOutletObservations(ind.obs.vars, ind.obs.data)
+        model_obj.sim_vars = result['SIM_VARS'][:]
+        model_obj.sim_value = OrderedDict(zip(result['SIM_DATES'], result['SIM_VALUES']))
+        model_obj.sim_obs_dict = match_simulation_observation(model_obj.sim_vars,
+                                                              model_obj.sim_value,
+                                                              model_obj.obs_vars,
+                                                              model_obj.obs_value)
+        ind.sim.vars = model_obj.sim_vars[:]
+        ind.sim.data = deepcopy(model_obj.sim_value)
+        calculate_calibration_statistics(cali_obj, ind, model_obj)
+    return inds
 
 
 if __name__ == '__main__':
@@ -10,6 +10,7 @@ from __future__ import absolute_import
 import os
 import sys
 import argparse
+from collections import OrderedDict
 
 try:
     from ConfigParser import ConfigParser  # py2
@@ -23,12 +24,25 @@ if os.path.abspath(os.path.join(sys.path[0], '..')) not in sys.path:
 
 from run_seims import ParseSEIMSConfig
 
+# Default objectives, weights, and worst values of calibration steps
+DEFAULT_CALI_STEPS = OrderedDict([
+    # Step 1: Calibrate discharge, max. Nash-Sutcliffe, min. RSR, and min. |PBIAS| (percent)
+    #   NSE taken bigger weight (actually used)
+    ('Q', (['Q-NSE', 'Q-RSR', 'Q-PBIAS'], [2., -1., -1.], [-1., 100., 10.])),
+    # Step 2: Calibration sediment, max. NSE-SED, min. RSR-SED, min. |PBIAS|-SED, and max. NSE-Q
+    #   NSE of sediment taken a bigger weight
+    ('SED', (['SED-NSE', 'SED-RSR', 'SED-PBIAS', 'Q-NSE'], [2., -1., -1., 1.],
+             [-100., 100., 100., -100.])),
+    # Step 3: Calibration NSE-TN, NSE-TP, NSE-Q, NSE-SED
+    ('NUTRIENT', (['CH_TN-NSE', 'CH_TP-NSE', 'Q-NSE', 'SED-NSE'], [1., 1., 1., 1.],
+                  [-100., -100., -100., -100.]))])
+
 
 def get_cali_config():
     """Parse arguments.
     Returns:
         cf: ConfigParse object of *.ini file
-        mtd: Calibration method name, currently, 'nsga2' is supported.
+        mtd: Calibration method name, currently, 'nsga2' and 'dream' are supported.
     """
     # define input arguments
     parser = argparse.ArgumentParser(description="Execute parameters calibration.")
@@ -36,12 +50,15 @@ def get_cali_config():
     # add mutually group
     psa_group = parser.add_mutually_exclusive_group()
     psa_group.add_argument('-nsga2', action='store_true', help='Run NSGA-II method')
+    psa_group.add_argument('-dream', action='store_true', help='Run DREAM sampler')
     # parse arguments
     args = parser.parse_args()
     ini_file = args.ini
     psa_mtd = 'nsga2'  # Default
     if args.nsga2:
         psa_mtd = 'nsga2'
+    elif args.dream:
+        psa_mtd = 'dream'
     if not FileClass.is_file_exists(ini_file):
         raise ImportError('Configuration file is not existed: %s' % ini_file)
     cf = ConfigParser()
@@ -49,6 +66,55 @@ def get_cali_config():
     return cf, psa_mtd
 
 
+class ParseCaliStep(object):
+    """Objectives and parameters of one calibration step, e.g., [CALI_Step_Q] section.
+
+    Options (all optional for the steps in `DEFAULT_CALI_STEPS`):
+        paramRngDef: Parameters to be calibrated in this step, the parameters calibrated in
+                     the former steps are carried by the seeds, see `Calibration.merge_param_defs`
+        objectives: Comma-separated objectives, e.g., Q-NSE, Q-RSR, Q-PBIAS
+        weights: Weights of objectives, positive for maximization, negative for minimization
+        worstValues: Worst values of objectives, used as the reference point of hypervolume
+    """
+
+    def __init__(self, cf, name, model_dir, param_range_def):
+        """Initialization."""
+        self.name = name
+        self.param_range_def = param_range_def
+        self.objectives = list()
+        self.weights = list()
+        self.worst_values = list()
+        if name in DEFAULT_CALI_STEPS:
+            self.objectives, self.weights, self.worst_values = DEFAULT_CALI_STEPS[name]
+        sec = 'CALI_Step_%s' % name
+        if cf.has_section(sec):
+            if cf.has_option(sec, 'paramrngdef'):
+                self.param_range_def = model_dir + os.path.sep + cf.get(sec, 'paramrngdef')
+            if cf.has_option(sec, 'objectives'):
+                self.objectives = StringClass.split_string(cf.get(sec, 'objectives'), ',')
+            if cf.has_option(sec, 'weights'):
+                self.weights = StringClass.extract_numeric_values_from_string(
+                    cf.get(sec, 'weights'))
+            if cf.has_option(sec, 'worstvalues'):
+                self.worst_values = StringClass.extract_numeric_values_from_string(
+                    cf.get(sec, 'worstvalues'))
+        self.objectives = [obj.strip() for obj in self.objectives]
+        if not self.objectives:
+            raise ValueError('Objectives of calibration step %s MUST be specified in [%s].' %
+                             (name, sec))
+        if not len(self.objectives) == len(self.weights) == len(self.worst_values):
+            raise ValueError('The numbers of objectives, weights, and worstValues of '
+                             'calibration step %s MUST be the same.' % name)
+        if not FileClass.is_file_exists(self.param_range_def):
+            raise IOError('Ranges of parameters of calibration step %s MUST be provided!' % name)
+        # Variables of objectives in order, e.g., ['SED', 'Q']
+        self.vars = list()
+        for obj in self.objectives:
+            var = obj.rsplit('-', 1)[0]
+            if var not in self.vars:
+                self.vars.append(var)
+
+
 class ParseNSGA2Config(object):
     """NSGA-II related parameters"""
 
@@ -66,20 +132,84 @@ class ParseNSGA2Config(object):
         self.rsel = cf.getfloat('NSGA2', 'selectrate')
         self.rcross = cf.getfloat('NSGA2', 'crossoverrate')
         self.rmut = cf.getfloat('NSGA2', 'mutaterate')
+        # Non-dominated sorting method, and sample budget of Monte Carlo hypervolume
+        self.nd = 'standard'
+        self.hv_samples = 100000
+        if cf.has_option('NSGA2', 'nondominatedsort'):
+            self.nd = cf.get('NSGA2', 'nondominatedsort').lower()
+        if cf.has_option('NSGA2', 'hypervolumesamples'):
+            self.hv_samples = cf.getint('NSGA2', 'hypervolumesamples')
+        if self.nd not in ['standard', 'log', 'efficient']:
+            raise ValueError('NonDominatedSort must be one of standard, log, and efficient.')
 
         if self.npop % 4 != 0:
             raise ValueError('PopulationSize must be a multiple of 4.')
         self.dirname = 'Cali_NSGA2_Gen_%d_Pop_%d' % (self.ngens, self.npop)
 
-        self.out_dir = wp + os.path.sep + self.dirname
-        UtilClass.rmmkdir(self.out_dir)
+        self.base_dir = wp + os.path.sep + self.dirname
+        UtilClass.rmmkdir(self.base_dir)
+        self.set_step()
+
+    def set_step(self, step=''):
+        """Set output directory of calibration step, e.g., <base_dir>/Step_SED."""
+        self.out_dir = self.base_dir
+        if step:
+            self.out_dir += os.path.sep + 'Step_%s' % step
+            UtilClass.rmmkdir(self.out_dir)
         self.hypervlog = self.out_dir + os.path.sep + 'hypervolume.txt'
         self.logfile = self.out_dir + os.path.sep + 'runtime.log'
+        self.jsonlog = self.out_dir + os.path.sep + 'runtime.jsonl'
         self.logbookfile = self.out_dir + os.path.sep + 'logbook.txt'
         self.simdata_dir = self.out_dir + os.path.sep + 'simulated_data'
+        self.paretofile = self.out_dir + os.path.sep + 'pareto_set.pickle'
         UtilClass.rmmkdir(self.simdata_dir)
 
 
+class ParseDREAMConfig(object):
+    """DREAM (DiffeRential Evolution Adaptive Metropolis) related parameters"""
+
+    def __init__(self, cf, wp):
+        if 'DREAM' not in cf.sections():
+            raise ValueError('[DREAM] section MUST be existed in *.ini file.')
+        self.nchains = 8
+        self.max_iters = 1000
+        self.min_iters = 50
+        self.rhat_threshold = 1.2
+        self.check_interval = 10
+        self.delta = 3
+        self.ncr = 3
+        self.burnin = 0.1
+        self.likelihood_vars = ['Q']
+        if cf.has_option('DREAM', 'chainsnum'):
+            self.nchains = cf.getint('DREAM', 'chainsnum')
+        if cf.has_option('DREAM', 'maxiterations'):
+            self.max_iters = cf.getint('DREAM', 'maxiterations')
+        if cf.has_option('DREAM', 'miniterations'):
+            self.min_iters = cf.getint('DREAM', 'miniterations')
+        if cf.has_option('DREAM', 'rhatthreshold'):
+            self.rhat_threshold = cf.getfloat('DREAM', 'rhatthreshold')
+        if cf.has_option('DREAM', 'checkinterval'):
+            self.check_interval = cf.getint('DREAM', 'checkinterval')
+        if cf.has_option('DREAM', 'deltapairs'):
+            self.delta = cf.getint('DREAM', 'deltapairs')
+        if cf.has_option('DREAM', 'crossovernum'):
+            self.ncr = cf.getint('DREAM', 'crossovernum')
+        if cf.has_option('DREAM', 'burninratio'):
+            self.burnin = cf.getfloat('DREAM', 'burninratio')
+        if cf.has_option('DREAM', 'likelihoodvars'):
+            self.likelihood_vars = StringClass.split_string(cf.get('DREAM', 'likelihoodvars'),
+                                                            ',')
+        if self.nchains < 3:
+            raise ValueError('ChainsNum must be greater than 2.')
+
+        self.dirname = 'Cali_DREAM_Chains_%d_Iter_%d' % (self.nchains, self.max_iters)
+        self.out_dir = wp + os.path.sep + self.dirname
+        UtilClass.rmmkdir(self.out_dir)
+        self.chainlog = self.out_dir + os.path.sep + 'chains.jsonl'
+        self.rhatlog = self.out_dir + os.path.sep + 'rhat.txt'
+        self.logfile = self.out_dir + os.path.sep + 'runtime.log'
+
+
 class CaliConfig(object):
     """Parse parameters calibration configuration of SEIMS project."""
 
@@ -121,11 +251,49 @@ class CaliConfig(object):
                                                   self.vali_stime >= self.vali_etime):
             raise ValueError("Wrong time setted in [CALI_Settings]!")
 
-        # 3. Parameters settings for specific optimization algorithm
+        # 3. Calibration steps, e.g., Q,SED,NUTRIENT. The Pareto set of each step
+        #    seeds the initial population of the next step.
+        step_names = ['Q']
+        if cf.has_option('CALI_Settings', 'steps'):
+            step_names = StringClass.split_string(cf.get('CALI_Settings', 'steps'), ',')
+        self.steps = [ParseCaliStep(cf, sname.strip(), self.model.model_dir,
+                                    self.param_range_def) for sname in step_names]
+        # Variables observed at the outlet of all steps, which are evaluated in every step
+        #   so that the Pareto set can be reused by the next step without model runs.
+        self.obs_vars = list()
+        for step in self.steps:
+            self.obs_vars += [var for var in step.vars if var not in self.obs_vars]
+        # Perturbation radius (ratio of parameter range) of LHS sampling around seeds
+        self.seed_radius = 0.1
+        if cf.has_option('CALI_Settings', 'seedradius'):
+            self.seed_radius = cf.getfloat('CALI_Settings', 'seedradius')
+        # Pareto set stored by the former step (e.g., pareto_set.pickle in Step_Q) to seed
+        #   the first step of current run
+        self.seed_file = None
+        if cf.has_option('CALI_Settings', 'seedfile'):
+            self.seed_file = cf.get('CALI_Settings', 'seedfile')
+            if not FileClass.is_file_exists(self.seed_file):
+                raise IOError('Seed file %s is not existed!' % self.seed_file)
+
+        # Run models by the model-run queue (see `run_queue.py`) instead of SCOOP,
+        #   the timeout (seconds) of each batch and the attempts of each model run.
+        self.run_queue = False
+        self.queue_timeout = None
+        self.queue_attempts = 3
+        if cf.has_option('CALI_Settings', 'runqueue'):
+            self.run_queue = cf.getboolean('CALI_Settings', 'runqueue')
+        if cf.has_option('CALI_Settings', 'queuetimeout'):
+            self.queue_timeout = cf.getfloat('CALI_Settings', 'queuetimeout')
+        if cf.has_option('CALI_Settings', 'queueattempts'):
+            self.queue_attempts = cf.getint('CALI_Settings', 'queueattempts')
+
+        # 4. Parameters settings for specific optimization algorithm
         self.opt_mtd = method
         self.opt = None
         if self.opt_mtd == 'nsga2':
             self.opt = ParseNSGA2Config(cf, self.model.model_dir)
+        elif self.opt_mtd == 'dream':
+            self.opt = ParseDREAMConfig(cf, self.model.model_dir)
 
 
 if __name__ == '__main__':
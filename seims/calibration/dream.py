@@ -0,0 +1,194 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Differential evolution adaptive Metropolis (DREAM) sampler for Bayesian calibration.
+
+    All chains propose their candidates at once, so that one iteration is one batch of
+    model runs that can be evaluated in parallel, see `calibration.main_dream`.
+
+    - Proposals are generated by differential evolution of `delta` randomly chosen pairs
+      of other chains, with randomized subspace sampling (crossover) and a jump rate of
+      1 every `jump_interval` iterations to switch between modes (Vrugt et al., 2009).
+    - Proposals out of bounds are folded back into the feasible space.
+    - Outlier chains are replaced by the best chain by the IQR test during burn-in.
+    - The Gelman-Rubin R-hat of each parameter is calculated on the latter half of chains.
+"""
+from __future__ import absolute_import, division
+
+import numpy
+
+
+def gelman_rubin(chains):
+    """Potential scale reduction factor (R-hat) of each parameter.
+
+    Args:
+        chains: Samples of chains, (chains x iterations x parameters).
+    Returns:
+        R-hat values of parameters, numpy.inf if less than 2 iterations.
+    """
+    chains = numpy.asarray(chains, dtype=numpy.float64)
+    nchains, niters, nparams = chains.shape
+    if niters < 2 or nchains < 2:
+        return numpy.inf * numpy.ones(nparams)
+    chain_means = chains.mean(axis=1)
+    chain_vars = chains.var(axis=1, ddof=1)
+    b = niters * chain_means.var(axis=0, ddof=1)  # between-chain variance
+    w = chain_vars.mean(axis=0)  # within-chain variance
+    var_est = (niters - 1.) / niters * w + b / niters
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        rhat = numpy.sqrt(var_est / w)
+    rhat[w == 0] = numpy.where(b[w == 0] == 0, 1., numpy.inf)
+    return rhat
+
+
+def gaussian_loglikelihood(sim_obs_data, variables):
+    """Gaussian log-likelihood with the error variance integrated out, i.e.,
+
+        log L = sum_v -n_v / 2 * log(SSE_v)
+
+    Args:
+        sim_obs_data: Paired simulation and observation data, e.g., `ObsSimData.sim_obs_data`.
+        variables: Variables considered, e.g., ['Q', 'SED'].
+    Returns:
+        Log-likelihood, -numpy.inf if any variable is not available.
+    """
+    logp = 0.
+    for var in variables:
+        if var not in sim_obs_data:
+            return -numpy.inf
+        obs = numpy.array(sim_obs_data[var]['Obs'], dtype=numpy.float64)
+        sim = numpy.array(sim_obs_data[var]['Sim'], dtype=numpy.float64)
+        if obs.size == 0:
+            return -numpy.inf
+        sse = numpy.sum((sim - obs) ** 2)
+        if not numpy.isfinite(sse):
+            return -numpy.inf
+        logp -= obs.size / 2. * numpy.log(max(sse, 1.e-12))
+    return float(logp)
+
+
+class DREAMSampler(object):
+    """Multi-chain DREAM sampler with uniform prior within parameter bounds.
+
+    Usage:
+        sampler = DREAMSampler(bounds, nchains)
+        sampler.initialize(init_values, init_logp)
+        while not converged:
+            proposals = sampler.propose()
+            sampler.update(proposals, logp_of_proposals)
+    """
+
+    def __init__(self, bounds, nchains, delta=3, ncr=3, jump_interval=5,
+                 burnin=0.1, seed=None):
+        """Initialization.
+
+        Args:
+            bounds: Lower and upper bounds of parameters, (parameters x 2).
+            nchains: Number of chains.
+            delta: Maximum number of chain pairs used to generate one proposal.
+            ncr: Number of crossover values, i.e., CR = 1/ncr, 2/ncr, ..., 1.
+            jump_interval: Set the jump rate to 1 every `jump_interval` iterations.
+            burnin: Ratio of iterations in which outlier chains are checked.
+            seed: (Optional) Random seed.
+        """
+        self.bounds = numpy.array(bounds, dtype=numpy.float64)
+        self.low = self.bounds[:, 0]
+        self.up = self.bounds[:, 1]
+        self.nparams = len(self.bounds)
+        self.nchains = nchains
+        self.delta = max(1, min(delta, (nchains - 1) // 2))
+        self.crs = numpy.arange(1, ncr + 1) / float(ncr)
+        self.jump_interval = jump_interval
+        self.burnin = burnin
+        self.rng = numpy.random.RandomState(seed)
+        self.states = None  # current states of chains, (chains x parameters)
+        self.logp = None  # log-likelihood of current states
+        self.history = list()  # states of each iteration
+        self.logp_history = list()
+        self.accepted = numpy.zeros(nchains, dtype=numpy.int64)
+        self.iteration = 0
+
+    def initialize(self, values, logp):
+        """Set the initial states of chains."""
+        self.states = numpy.array(values, dtype=numpy.float64).reshape(self.nchains,
+                                                                       self.nparams)
+        self.logp = numpy.array(logp, dtype=numpy.float64)
+        self.history = [self.states.copy()]
+        self.logp_history = [self.logp.copy()]
+        self.iteration = 0
+
+    def fold(self, values):
+        """Fold the values out of bounds back into bounds (periodic boundary)."""
+        span = self.up - self.low
+        return self.low + numpy.mod(values - self.low, span)
+
+    def propose(self):
+        """Generate one proposal for each chain, (chains x parameters)."""
+        n, d = self.nchains, self.nparams
+        span = self.up - self.low
+        proposals = self.states.copy()
+        jump = (self.iteration + 1) % self.jump_interval == 0
+        for i in range(n):
+            others = numpy.delete(numpy.arange(n), i)
+            npairs = self.rng.randint(1, self.delta + 1)
+            picked = self.rng.choice(others, 2 * npairs, replace=False)
+            diff = (self.states[picked[:npairs]] - self.states[picked[npairs:]]).sum(axis=0)
+            # randomized subspace sampling
+            cr = self.crs[self.rng.randint(len(self.crs))]
+            dims = self.rng.random_sample(d) < cr
+            if not dims.any():
+                dims[self.rng.randint(d)] = True
+            gamma = 1. if jump else 2.38 / numpy.sqrt(2. * npairs * dims.sum())
+            noise_e = 1. + self.rng.uniform(-0.05, 0.05, d)
+            noise_eps = self.rng.normal(0., 1.e-6, d) * span
+            step = noise_e * gamma * diff + noise_eps
+            proposals[i, dims] += step[dims]
+        return self.fold(proposals)
+
+    def update(self, proposals, logp):
+        """Metropolis acceptance of proposals with their log-likelihood.
+
+        Returns:
+            Boolean array, True means the proposal of the chain is accepted.
+        """
+        logp = numpy.array(logp, dtype=numpy.float64)
+        with numpy.errstate(invalid='ignore'):
+            ratio = numpy.where(numpy.isfinite(logp), logp - self.logp, -numpy.inf)
+        ratio[~numpy.isfinite(self.logp) & numpy.isfinite(logp)] = 0.
+        accept = numpy.log(self.rng.random_sample(self.nchains)) < ratio
+        self.states[accept] = proposals[accept]
+        self.logp[accept] = logp[accept]
+        self.accepted += accept
+        self.iteration += 1
+        self.history.append(self.states.copy())
+        self.logp_history.append(self.logp.copy())
+        return accept
+
+    def remove_outliers(self, max_iterations):
+        """Replace outlier chains by the best chain during burn-in (IQR test).
+
+        Returns:
+            Indexes of the replaced chains.
+        """
+        if self.iteration > self.burnin * max_iterations or self.iteration < 2:
+            return numpy.array([], dtype=numpy.int64)
+        recent = numpy.array(self.logp_history[self.iteration // 2:])
+        mean_logp = numpy.where(numpy.isfinite(recent), recent, -1.e300).mean(axis=0)
+        q1, q3 = numpy.percentile(mean_logp, [25, 75])
+        outliers = numpy.where(mean_logp < q1 - 2. * (q3 - q1))[0]
+        if len(outliers):
+            best = int(numpy.argmax(self.logp))
+            self.states[outliers] = self.states[best]
+            self.logp[outliers] = self.logp[best]
+            self.history[-1] = self.states.copy()
+            self.logp_history[-1] = self.logp.copy()
+        return outliers
+
+    def rhat(self):
+        """R-hat of each parameter on the latter half of chains."""
+        samples = numpy.array(self.history[len(self.history) // 2:])  # iters x chains x params
+        return gelman_rubin(samples.transpose(1, 0, 2))
+
+    @property
+    def acceptance_rate(self):
+        """Acceptance rate of each chain."""
+        return self.accepted / float(max(self.iteration, 1))
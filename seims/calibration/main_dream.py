@@ -0,0 +1,170 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Bayesian calibration by multi-chain DREAM sampler.
+
+    The proposals of all chains of one iteration are evaluated as one batch of model runs
+    by SCOOP (or the build-in map), through the same path as NSGA-II, i.e.,
+    `write_param_values_to_mongodb` and `calibration_objectives`. Hence, the number of chains
+    is better a multiple of the available processes.
+
+    The states of chains are appended to `chains.jsonl` every iteration, and the R-hat of
+    each parameter is logged to `rhat.txt` every `CheckInterval` iterations. The sampling
+    stops once all R-hat values are less than `RhatThreshold`.
+
+        python -m scoop -n 16 main_dream.py -ini <config file> -dream
+"""
+from __future__ import absolute_import, division
+
+import json
+import os
+import sys
+import time
+
+if os.path.abspath(os.path.join(sys.path[0], '..')) not in sys.path:
+    sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '..')))
+
+import numpy
+from pygeoc.utils import UtilClass
+
+from scenario_analysis.utility import print_message
+from calibration.config import CaliConfig, get_cali_config
+from calibration.calibrate import Calibration, calibration_objectives, \
+    queued_calibration_objectives
+from calibration.calibrate import TimeseriesData, ObsSimData
+from calibration.dream import DREAMSampler, gaussian_loglikelihood
+from calibration.userdef import write_param_values_to_mongodb
+from run_seims import MainSEIMS
+
+
+class ChainProposal(object):
+    """Proposal of one chain to be evaluated by `calibration_objectives`."""
+
+    def __init__(self, values, sid):
+        self.values = list(values)
+        self.id = sid
+        self.obs = TimeseriesData()
+        self.sim = TimeseriesData()
+        self.cali = ObsSimData()
+        self.vali = ObsSimData()
+        self.io_time = 0.
+        self.comp_time = 0.
+        self.simu_time = 0.
+        self.runtime = 0.
+
+
+def evaluate_proposals(cfg, cali_obj, values, obs_vars, obs_data_dict):
+    """Evaluate proposals of all chains in parallel, return log-likelihood and runtime."""
+    write_param_values_to_mongodb(cfg.model.host, cfg.model.port, cfg.model.db_name,
+                                  cali_obj.ParamDefs, numpy.array(values))
+    proposals = list()
+    for idx, v in enumerate(values):
+        prop = ChainProposal(v, idx)
+        prop.obs.vars = obs_vars[:]
+        prop.obs.data = obs_data_dict
+        proposals.append(prop)
+    num = len(proposals)
+    if cfg.run_queue:  # model-run queue served by workers on any node
+        proposals = queued_calibration_objectives(cali_obj, proposals, cfg.opt.dirname)
+    else:
+        try:  # parallel on multi-processors or clusters using SCOOP
+            from scoop import futures
+            proposals = list(futures.map(calibration_objectives, [cali_obj] * num, proposals))
+        except ImportError or ImportWarning:  # Python build-in map (serial)
+            proposals = list(map(calibration_objectives, [cali_obj] * num, proposals))
+    logp = [gaussian_loglikelihood(prop.cali.sim_obs_data, cfg.opt.likelihood_vars)
+            if prop.cali.valid else -numpy.inf for prop in proposals]
+    return numpy.array(logp), sum(prop.runtime for prop in proposals)
+
+
+def write_chain_records(jsonfile, iteration, sampler, names, accepted=None, mode='append'):
+    """Append the current states of all chains to JSON-lines file, e.g.,
+
+        {"iter": 3, "chain": 0, "logp": -123.4, "accepted": true, "params": {"CN2": 2.1}}
+    """
+    lines = list()
+    for idx, (values, logp) in enumerate(zip(sampler.states, sampler.logp)):
+        record = {'iter': iteration, 'chain': idx,
+                  'logp': float(logp) if numpy.isfinite(logp) else None,
+                  'params': dict((name, float(v)) for name, v in zip(names, values))}
+        if accepted is not None:
+            record['accepted'] = bool(accepted[idx])
+        lines.append(json.dumps(record))
+    with open(jsonfile, 'w' if mode == 'replace' else 'a') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def main(cfg):
+    """Main workflow of DREAM based calibration."""
+    print_message('Chains: %d, Max. iterations: %d' % (cfg.opt.nchains, cfg.opt.max_iters))
+    stime = time.time()
+    cali_obj = Calibration(cfg)
+    names = cali_obj.ParamDefs['names']
+
+    # Read observation data just once
+    model_obj = MainSEIMS(args_dict=cali_obj.model.ConfigDict)
+    obs_vars, obs_data_dict = model_obj.ReadOutletObservations(cfg.opt.likelihood_vars)
+
+    sampler = DREAMSampler(cali_obj.ParamDefs['bounds'], cfg.opt.nchains, cfg.opt.delta,
+                           cfg.opt.ncr, burnin=cfg.opt.burnin)
+    # Initial states of chains by Latin-Hypercube sampling
+    init_values = cali_obj.initialize(cfg.opt.nchains)
+    logp, modelruns_time_sum = evaluate_proposals(cfg, cali_obj, init_values,
+                                                  obs_vars, obs_data_dict)
+    sampler.initialize(init_values, logp)
+    write_chain_records(cfg.opt.chainlog, 0, sampler, names, mode='replace')
+    UtilClass.writelog(cfg.opt.rhatlog, 'Iteration\tAcceptance\t%s\n' % '\t'.join(names),
+                       mode='replace')
+
+    rhat = numpy.inf * numpy.ones(len(names))
+    for it in range(1, cfg.opt.max_iters + 1):
+        proposals = sampler.propose()
+        logp, runtime = evaluate_proposals(cfg, cali_obj, proposals.tolist(),
+                                           obs_vars, obs_data_dict)
+        modelruns_time_sum += runtime
+        accepted = sampler.update(proposals, logp)
+        outliers = sampler.remove_outliers(cfg.opt.max_iters)
+        if len(outliers):
+            print_message('Iteration %d: outlier chains %s are reset' %
+                          (it, ','.join(str(i) for i in outliers)))
+        write_chain_records(cfg.opt.chainlog, it, sampler, names, accepted)
+
+        if it % cfg.opt.check_interval != 0 and it != cfg.opt.max_iters:
+            continue
+        rhat = sampler.rhat()
+        rhat_str = '%d\t%.3f\t%s\n' % (it, sampler.acceptance_rate.mean(),
+                                       '\t'.join('%.4f' % v for v in rhat))
+        print_message('Iteration: %d, Max. R-hat: %.4f, Elapsed: %.2fs' %
+                      (it, rhat.max(), time.time() - stime))
+        UtilClass.writelog(cfg.opt.rhatlog, rhat_str, mode='append')
+        if it >= cfg.opt.min_iters and numpy.all(rhat < cfg.opt.rhat_threshold):
+            print_message('Converged at iteration %d!' % it)
+            break
+
+    # Posterior statistics of the latter half of chains
+    samples = numpy.array(sampler.history[len(sampler.history) // 2:]).reshape(-1, len(names))
+    summary = 'Parameter\tMean\tStd\t2.5%\t50%\t97.5%\tR-hat\n'
+    for idx, name in enumerate(names):
+        pcts = numpy.percentile(samples[:, idx], [2.5, 50, 97.5])
+        summary += '%s\t%.4f\t%.4f\t%s\t%.4f\n' % (name, samples[:, idx].mean(),
+                                                   samples[:, idx].std(),
+                                                   '\t'.join('%.4f' % v for v in pcts),
+                                                   rhat[idx])
+    print_message(summary)
+    UtilClass.writelog(cfg.opt.logfile, summary, mode='replace')
+    print_message('Model runs: %d, Sum of model runs timespan: %.4f' %
+                  ((sampler.iteration + 1) * cfg.opt.nchains, modelruns_time_sum))
+    return sampler
+
+
+if __name__ == "__main__":
+    cf, method = get_cali_config()
+    cali_cfg = CaliConfig(cf, method=method)
+
+    print_message('### START TO DREAM SAMPLING ###')
+    startT = time.time()
+
+    main(cali_cfg)
+
+    endT = time.time()
+    print_message('### END OF DREAM SAMPLING ###')
+    print_message('Running time: %.2fs' % (endT - startT))
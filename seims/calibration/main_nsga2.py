@@ -23,51 +23,33 @@ import numpy
 from deap import base
 from deap import creator
 from deap import tools
-from deap.benchmarks.tools import hypervolume
 from copy import deepcopy
 from pygeoc.utils import UtilClass
 
-from scenario_analysis.utility import print_message
+from scenario_analysis.emo import sel_nsga2, HypervolumeIndicator
+from scenario_analysis.utility import print_message, write_population_records
 from scenario_analysis.userdef import initIterateWithCfg, initRepeatWithCfg
 from scenario_analysis.visualization import plot_pareto_front, plot_hypervolume_single
 from calibration.config import CaliConfig, get_cali_config
 from run_seims import MainSEIMS
 
 from calibration.calibrate import Calibration, initialize_calibrations, calibration_objectives
+from calibration.calibrate import queued_calibration_objectives
 from calibration.calibrate import TimeseriesData, ObsSimData
 from calibration.userdef import write_param_values_to_mongodb, output_population_details
+from calibration.userdef import save_pareto_set, load_pareto_set
 
 # Definitions, assignments, operations, etc. that will be executed by each worker
 #    when paralleled by SCOOP.
 # Thus, DEAP related operations (initialize, register, etc.) are better defined here.
 
-object_vars = list()
 object_names = ['NSE', 'RSR', 'PBIAS']
-# step can be one of 'Q', 'SED', 'NUTRIENT'.
-step = 'Q'
 filter_NSE = False  # Filter scenarios which NSE less than 0 for the next generation
-# Multiobjects definition:
-if step == 'Q':
-    # Step 1: Calibrate discharge, max. Nash-Sutcliffe, min. RSR, and min. |PBIAS| (percent)
-    object_vars = ['Q']
-    multi_weight = (2., -1., -1.)  # NSE taken bigger weight (actually used)
-    worse_objects = [-1., 100., 10.]
-elif step == 'SED':
-    # Step 2: Calibration sediment, max. NSE-SED, min. RSR-SED, min. |PBIAS|-SED, and max. NSE-Q
-    object_vars = ['SED', 'Q']
-    multi_weight = (2., -1., -1., 1.)  # NSE of sediment taken a bigger weight
-    worse_objects = [-100., 100., 100., -100.]
-elif step == 'NUTRIENT':
-    # Step 3: Calibration NSE-TN, NSE-TP, NSE-Q, NSE-SED
-    # Or, NSE-TN, RSR-TN, |PBIAS|-TN, NSE-TP, RSR-TP, |PBIAS|-TP, NSE-Q, NSE-SED
-    object_vars = ['CH_TN', 'CH_TP', 'Q', 'SED']
-    multi_weight = (1., 1., 1., 1.)
-    worse_objects = [-100., -100., -100., -100.]
-else:
-    print('The step of calibration should be one of [Q, SED, NUTRIENT]!')
-    exit(0)
-
-creator.create('FitnessMulti', base.Fitness, weights=multi_weight)
+
+# The objectives and weights of each calibration step (e.g., Q, SED, NUTRIENT) are defined
+#   in the configuration file, see `calibration.config.ParseCaliStep`. The weights are set
+#   to FitnessMulti at the beginning of each step, see `run_step()`.
+creator.create('FitnessMulti', base.Fitness, weights=(2., -1., -1.))
 # The FitnessMulti class equals to (as an example):
 # class FitnessMulti(base.Fitness):
 #     weights = (2., -1., -1.)
@@ -94,21 +76,83 @@ toolbox.register('evaluate', calibration_objectives)
 toolbox.register('mate', tools.cxSimulatedBinaryBounded)
 toolbox.register('mutate', tools.mutPolynomialBounded)
 
-toolbox.register('select', tools.selNSGA2)
-
-
-def main(cfg):
-    """Main workflow of NSGA-II based Scenario analysis."""
+toolbox.register('select', sel_nsga2)
+
+
+def step_objectives(ind, objectives):
+    """Objective values and labels of the evaluated individual, e.g., ['SED-NSE', 'Q-NSE']."""
+    values = list()
+    labels = list()
+    for obj in objectives:
+        var, name = obj.rsplit('-', 1)
+        objvs, objlabels = ind.cali.efficiency_values(var, [name])
+        values += objvs
+        labels += objlabels if objlabels else [obj]
+    return values, labels
+
+
+def reuse_seeds(seeds, param_defs, objectives, num):
+    """Create evaluated individuals from the seeds that can be reused without model runs.
+
+    A seed can be reused only if the parameters that not calibrated in the former step
+    are set to the neutral values (i.e., IMPACT) within their bounds, and the statistics
+    of all objectives of current step have been calculated.
+
+    Returns:
+        Reusable individuals, whose fitness values are not set yet.
+    """
+    reused = list()
+    if seeds is None:
+        return reused
+    ncarried = len(seeds['names'])
+    new_values = param_defs['impacts'][ncarried:]
+    bounds = numpy.array(param_defs['bounds'])
+    for values, detail in zip(seeds['values'], seeds['individuals']):
+        if len(reused) >= num:
+            break
+        gene_values = numpy.array(list(values) + list(new_values))
+        if numpy.any(gene_values < bounds[:, 0]) or numpy.any(gene_values > bounds[:, 1]):
+            continue
+        if any(obj not in detail['cali'].objnames for obj in objectives):
+            continue
+        ind = creator.Individual(gene_values.tolist())
+        ind.sim = detail['sim']
+        ind.cali = detail['cali']
+        ind.vali = detail['vali']
+        ind.io_time, ind.comp_time, ind.simu_time, ind.runtime = detail['timing']
+        reused.append(ind)
+    return reused
+
+
+def run_step(cfg, step, obs_vars, obs_data_dict, seeds=None):
+    """Main workflow of NSGA-II based calibration of one step.
+
+    Args:
+        cfg: CaliConfig object.
+        step: ParseCaliStep object.
+        obs_vars: Observed variables, the union of variables of all steps.
+        obs_data_dict: Observed data.
+        seeds: (Optional) Pareto set of the former step loaded by `load_pareto_set`.
+
+    Returns:
+        The final population and logbook.
+    """
     random.seed()
+    print_message('Calibration step: %s, Objectives: %s' % (step.name, ', '.join(step.objectives)))
     print_message('Population: %d, Generation: %d' % (cfg.opt.npop, cfg.opt.ngens))
 
     # Initial timespan variables
     stime = time.time()
+    opt_stime = stime
     plot_time = 0.
     allmodels_exect = list()  # execute time of all model runs
 
+    # Multiobjects definition of current step
+    creator.FitnessMulti.weights = tuple(step.weights)
     # create reference point for hypervolume
-    ref_pt = numpy.array(worse_objects) * multi_weight * -1
+    ref_pt = numpy.array(step.worst_values) * numpy.array(step.weights) * -1
+    hypervolume = HypervolumeIndicator(ref_pt, cfg.opt.hv_samples)
+    toolbox.register('select', sel_nsga2, nd=cfg.opt.nd)
 
     stats = tools.Statistics(lambda sind: sind.fitness.values)
     stats.register('min', numpy.min, axis=0)
@@ -118,25 +162,30 @@ def main(cfg):
     logbook = tools.Logbook()
     logbook.header = 'gen', 'evals', 'min', 'max', 'avg', 'std'
 
-    # read observation data from MongoDB
+    cfg.param_range_def = step.param_range_def
     cali_obj = Calibration(cfg)
 
-    # Read observation data just once
-    model_cfg_dict = cali_obj.model.ConfigDict
-    model_obj = MainSEIMS(args_dict=model_cfg_dict)
-    obs_vars, obs_data_dict = model_obj.ReadOutletObservations(object_vars)
-
-    # Initialize population
-    param_values = cali_obj.initialize(cfg.opt.npop)
+    # Initialize population, the parameters carried by seeds are sampled around them
+    if seeds is None:
+        reused = list()
+        param_values = cali_obj.initialize(cfg.opt.npop)
+    else:
+        cali_obj.merge_param_defs(seeds['names'], seeds['bounds'], seeds['impacts'])
+        reused = reuse_seeds(seeds, cali_obj.ParamDefs, step.objectives, cfg.opt.npop)
+        param_values = cali_obj.initialize_around_seeds(cfg.opt.npop - len(reused),
+                                                        seeds['values'], cfg.seed_radius)
+        print_message('Parameters: %s\n%d seeds reused without model runs.' %
+                      (', '.join(cali_obj.ParamDefs['names']), len(reused)))
     pop = list()
-    for i in range(cfg.opt.npop):
+    for i in range(len(param_values)):
         ind = creator.Individual(param_values[i])
+        pop.append(ind)
+    for i, ind in enumerate(pop + reused):
         ind.gen = 0
         ind.id = i
         ind.obs.vars = obs_vars[:]
         ind.obs.data = deepcopy(obs_data_dict)
-        pop.append(ind)
-    param_values = numpy.array(param_values)
+    param_values = numpy.array([ind[:] for ind in pop + reused])
 
     # Write calibrated values to MongoDB
     # TODO, extract this function, which is same with `Sensitivity::write_param_values_to_mongodb`.
@@ -151,33 +200,29 @@ def main(cfg):
     pop_select_num = int(cfg.opt.npop * cfg.opt.rsel)
     init_time = time.time() - stime
 
+    def set_fitness(evaluated_pops):
+        """Set fitness of individuals according to calibration step."""
+        labels = list()
+        for tmpind in evaluated_pops:
+            tmpind.fitness.values, labels = step_objectives(tmpind, step.objectives)
+        return labels
+
     def evaluate_parallel(invalid_pops):
         """Evaluate model by SCOOP or map, and set fitness of individuals
          according to calibration step."""
         popnum = len(invalid_pops)
-        labels = list()
-        try:  # parallel on multi-processors or clusters using SCOOP
-            from scoop import futures
-            invalid_pops = list(futures.map(toolbox.evaluate, [cali_obj] * popnum, invalid_pops))
-        except ImportError or ImportWarning:  # Python build-in map (serial)
-            invalid_pops = list(toolbox.map(toolbox.evaluate, [cali_obj] * popnum, invalid_pops))
-        for tmpind in invalid_pops:
-            if step == 'Q':  # Step 1 Calibrating discharge
-                tmpind.fitness.values, labels = tmpind.cali.efficiency_values('Q', object_names)
-            elif step == 'SED':  # Step 2 Calibrating sediment
-                sedobjvs, labels = tmpind.cali.efficiency_values('SED', object_names)
-                qobjvs, qobjlabels = ind.cali.efficiency_values('Q', object_names)
-                labels += [qobjlabels[0]]
-                sedobjvs += [qobjvs[0]]
-                tmpind.fitness.values = sedobjvs[:]
-            elif step == 'NUTRIENT':  # Step 3 Calibrating NUTRIENT,TN,TP
-                tnobjvs, tnobjlabels = tmpind.cali.efficiency_values('CH_TN', object_names)
-                tpobjvs, tpobjlabels = tmpind.cali.efficiency_values('CH_TP', object_names)
-                qobjvs, qobjlabels = ind.cali.efficiency_values('Q', object_names)
-                sedobjvs, sedobjlabels = tmpind.cali.efficiency_values('SED', object_names)
-                objvs = [tnobjvs[0], tpobjvs[0], qobjvs[0], sedobjvs[0]]
-                labels = [tnobjlabels[0], tpobjlabels[0], qobjlabels[0], sedobjlabels[0]]
-                tmpind.fitness.values = objvs[:]
+        if popnum > 0 and cfg.run_queue:  # model-run queue served by workers on any node
+            invalid_pops = queued_calibration_objectives(cali_obj, invalid_pops,
+                                                         '%s_%s' % (cfg.opt.dirname, step.name))
+        elif popnum > 0:
+            try:  # parallel on multi-processors or clusters using SCOOP
+                from scoop import futures
+                invalid_pops = list(futures.map(toolbox.evaluate, [cali_obj] * popnum,
+                                                invalid_pops))
+            except ImportError or ImportWarning:  # Python build-in map (serial)
+                invalid_pops = list(toolbox.map(toolbox.evaluate, [cali_obj] * popnum,
+                                                invalid_pops))
+        labels = set_fitness(invalid_pops)
         # NSE > 0 is the preliminary condition to be a valid solution!
         if filter_NSE:
             invalid_pops = [tmpind for tmpind in invalid_pops if tmpind.fitness.values[0] > 0]
@@ -199,6 +244,9 @@ def main(cfg):
     for ind in pop:
         allmodels_exect.append([ind.io_time, ind.comp_time, ind.simu_time, ind.runtime])
         modelruns_time_sum[0] += ind.runtime
+    if reused:
+        plotlables = set_fitness(reused)
+        pop += reused
 
     # currently, len(pop) may less than pop_select_num
     pop = toolbox.select(pop, pop_select_num)
@@ -208,6 +256,8 @@ def main(cfg):
     record = stats.compile(pop)
     logbook.record(gen=0, evals=len(pop), **record)
     print_message(logbook.stream)
+    write_population_records(cfg.opt.jsonlog, 0, pop, plotlables, time.time() - opt_stime,
+                             mode='replace')
 
     # Begin the generational process
     output_str = '### Generation number: %d, Population size: %d ###\n' % (cfg.opt.ngens,
@@ -280,7 +330,7 @@ def main(cfg):
                     'Execute timespan: %.4f, Sum of model run timespan: %.4f, ' \
                     'Hypervolume: %.4f\n' % (gen, invalid_ind_size,
                                              curtimespan, modelruns_time_sum[gen],
-                                             hypervolume(pop, ref_pt))
+                                             hypervolume(pop))
         print_message(hyper_str)
         UtilClass.writelog(cfg.opt.hypervlog, hyper_str, mode='append')
 
@@ -297,65 +347,32 @@ def main(cfg):
                           gen, 'Near Pareto optimal solutions')
         plot_time += time.time() - stime
 
-        # save in file
-        if step == 'Q':  # Step 1 Calibrate discharge
-            output_str += 'generation-calibrationID\t%s' % pop[0].cali.output_header('Q',
-                                                                                     object_names,
-                                                                                     'Cali')
-            if cali_obj.cfg.calc_validation:
-                output_str += pop[0].vali.output_header('Q', object_names, 'Vali')
-        elif step == 'SED':  # Step 2 Calibrate sediment
-            output_str += 'generation-calibrationID\t%s%s' % \
-                          (pop[0].cali.output_header('SED', object_names, 'Cali'),
-                           pop[0].cali.output_header('Q', object_names, 'Cali'))
-            if cali_obj.cfg.calc_validation:
-                output_str += '%s%s' % (pop[0].vali.output_header('SED', object_names, 'Vali'),
-                                        pop[0].vali.output_header('Q', object_names, 'Vali'))
-        elif step == 'NUTRIENT':  # Step 3 Calibrate NUTRIENT,TN,TP
-            output_str += 'generation-calibrationID\t%s%s%s%s' % \
-                          (pop[0].cali.output_header('CH_TN', object_names, 'Cali'),
-                           pop[0].cali.output_header('CH_TP', object_names, 'Cali'),
-                           pop[0].cali.output_header('Q', object_names, 'Cali'),
-                           pop[0].cali.output_header('SED', object_names, 'Cali'))
-            if cali_obj.cfg.calc_validation:
-                output_str += '%s%s%s%s' % (
-                    pop[0].vali.output_header('CH_TN', object_names, 'Vali'),
-                    pop[0].vali.output_header('CH_TP', object_names, 'Vali'),
-                    pop[0].vali.output_header('Q', object_names, 'Vali'),
-                    pop[0].vali.output_header('SED', object_names, 'Vali'))
+        # save in file, e.g., the efficiency values of SED and Q of step SED
+        output_str += 'generation-calibrationID\t%s' % \
+                      ''.join(pop[0].cali.output_header(var, object_names, 'Cali')
+                              for var in step.vars)
+        if cali_obj.cfg.calc_validation:
+            output_str += ''.join(pop[0].vali.output_header(var, object_names, 'Vali')
+                                  for var in step.vars)
         output_str += 'gene_values\n'
         for ind in pop:
-            if step == 'Q':  # Step 1 Calibrate discharge
-                output_str += '%d-%d\t%s' % (ind.gen, ind.id,
-                                             ind.cali.output_efficiency('Q', object_names))
-                if cali_obj.cfg.calc_validation:
-                    output_str += ind.vali.output_efficiency('Q', object_names)
-            elif step == 'SED':  # Step 2 Calibrate sediment
-                output_str += '%d-%d\t%s%s' % (ind.gen, ind.id,
-                                               ind.cali.output_efficiency('SED', object_names),
-                                               ind.cali.output_efficiency('Q', object_names))
-                if cali_obj.cfg.calc_validation:
-                    output_str += '%s%s' % (ind.vali.output_efficiency('SED', object_names),
-                                            ind.vali.output_efficiency('Q', object_names))
-            elif step == 'NUTRIENT':  # Step 3 Calibrate NUTRIENT, i.e., TN and TP
-                output_str += '%d-%d\t%s%s%s%s' % (ind.gen, ind.id,
-                                                   ind.cali.output_efficiency('CH_TN',
-                                                                              object_names),
-                                                   ind.cali.output_efficiency('CH_TP',
-                                                                              object_names),
-                                                   ind.cali.output_efficiency('Q', object_names),
-                                                   ind.cali.output_efficiency('SED', object_names))
-                if cali_obj.cfg.calc_validation:
-                    output_str += '%s%s%s%s' % (ind.vali.output_efficiency('CH_TN', object_names),
-                                                ind.vali.output_efficiency('CH_TP', object_names),
-                                                ind.vali.output_efficiency('Q', object_names),
-                                                ind.vali.output_efficiency('SED', object_names))
+            output_str += '%d-%d\t%s' % (ind.gen, ind.id,
+                                         ''.join(ind.cali.output_efficiency(var, object_names)
+                                                 for var in step.vars))
+            if cali_obj.cfg.calc_validation:
+                output_str += ''.join(ind.vali.output_efficiency(var, object_names)
+                                      for var in step.vars)
             output_str += str(ind)
             output_str += '\n'
         UtilClass.writelog(cfg.opt.logfile, output_str, mode='append')
+        write_population_records(cfg.opt.jsonlog, gen, pop, plotlables,
+                                 time.time() - opt_stime)
 
         # TODO: Figure out if we should terminate the evolution
 
+    # Save the Pareto set to seed the next step
+    save_pareto_set(pop, cali_obj.ParamDefs, cfg.opt.paretofile)
+
     # Plot hypervolume and newly executed model count
     plot_hypervolume_single(cfg.opt.hypervlog, cfg.opt.out_dir)
 
@@ -363,15 +380,16 @@ def main(cfg):
     allmodels_exect = numpy.array(allmodels_exect)
     numpy.savetxt('%s/exec_time_allmodelruns.txt' % cfg.opt.out_dir,
                   allmodels_exect, delimiter=' ', fmt='%.4f')
-    print_message('Running time of all SEIMS models:\n'
-                  '\tIO\tCOMP\tSIMU\tRUNTIME\n'
-                  'MAX\t%s\n'
-                  'MIN\t%s\n'
-                  'AVG\t%s\n'
-                  'SUM\t%s\n' % ('\t'.join('%.3f' % v for v in allmodels_exect.max(0)),
-                                 '\t'.join('%.3f' % v for v in allmodels_exect.min(0)),
-                                 '\t'.join('%.3f' % v for v in allmodels_exect.mean(0)),
-                                 '\t'.join('%.3f' % v for v in allmodels_exect.sum(0))))
+    if allmodels_exect.size:
+        print_message('Running time of all SEIMS models:\n'
+                      '\tIO\tCOMP\tSIMU\tRUNTIME\n'
+                      'MAX\t%s\n'
+                      'MIN\t%s\n'
+                      'AVG\t%s\n'
+                      'SUM\t%s\n' % ('\t'.join('%.3f' % v for v in allmodels_exect.max(0)),
+                                     '\t'.join('%.3f' % v for v in allmodels_exect.min(0)),
+                                     '\t'.join('%.3f' % v for v in allmodels_exect.mean(0)),
+                                     '\t'.join('%.3f' % v for v in allmodels_exect.sum(0))))
 
     exec_time = 0.
     for genid, tmptime in list(modelruns_time.items()):
@@ -392,6 +410,31 @@ def main(cfg):
     return pop, logbook
 
 
+def main(cfg):
+    """Main workflow of multi-step calibration, e.g., Q -> SED -> NUTRIENT.
+
+    The Pareto set of each step seeds the initial population of the next step.
+    """
+    # Read observation data of all steps just once
+    model_obj = MainSEIMS(args_dict=cfg.model.ConfigDict)
+    obs_vars, obs_data_dict = model_obj.ReadOutletObservations(cfg.obs_vars)
+
+    seeds = None
+    if cfg.seed_file is not None:
+        seeds = load_pareto_set(cfg.seed_file)
+    pop = list()
+    logbook = None
+    for step in cfg.steps:
+        if len(cfg.steps) > 1:
+            cfg.opt.set_step(step.name)
+        pop, logbook = run_step(cfg, step, obs_vars, obs_data_dict, seeds)
+        print_message(logbook)
+        with open(cfg.opt.logbookfile, 'w') as f:
+            f.write(logbook.__str__())
+        seeds = load_pareto_set(cfg.opt.paretofile)
+    return pop, logbook
+
+
 if __name__ == "__main__":
     cf, method = get_cali_config()
     cali_cfg = CaliConfig(cf, method=method)
@@ -401,10 +444,6 @@ if __name__ == "__main__":
 
     fpop, fstats = main(cali_cfg)
 
-    fpop.sort(key=lambda x: x.fitness.values)
-    print_message(fstats)
-    with open(cali_cfg.opt.logbookfile, 'w') as f:
-        f.write(fstats.__str__())
     endT = time.time()
     print_message('### END OF CALIBRATION OPTIMIZING ###')
     print_message('Running time: %.2fs' % (endT - startT))
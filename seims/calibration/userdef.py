@@ -43,6 +43,29 @@ def write_param_values_to_mongodb(hostname, port, spatial_db, param_defs, param_
     client.close()
 
 
+def save_pareto_set(pops, param_defs, fname):
+    """Save the Pareto set of current calibration step, which seeds the next step.
+
+    The statistics and simulation data are saved together with parameters values,
+    so that the seeds can be reused by the next step without model runs.
+    """
+    pareto = {'names': param_defs['names'], 'bounds': param_defs['bounds'],
+              'impacts': param_defs['impacts'],
+              'values': [ind[:].tolist() for ind in pops],
+              'individuals': [{'gen': ind.gen, 'id': ind.id, 'sim': ind.sim,
+                               'cali': ind.cali, 'vali': ind.vali,
+                               'timing': [ind.io_time, ind.comp_time,
+                                          ind.simu_time, ind.runtime]} for ind in pops]}
+    with open(fname, 'wb') as f:
+        pickle.dump(pareto, f)
+
+
+def load_pareto_set(fname):
+    """Load the Pareto set saved by `save_pareto_set`."""
+    with open(fname, 'rb') as f:
+        return pickle.load(f)
+
+
 def output_population_details(pops, outdir, gen_num):
     """Output population details, i.e., the simulation data, etc."""
     # Save as json, which can be loaded by json.load()
@@ -116,6 +116,8 @@ class PSAOutputs(object):
         self.output_values_txt = wp + os.path.sep + 'output_values.txt'
         self.psa_si_json = wp + os.path.sep + 'psa_si.json'
         self.psa_si_sort_txt = wp + os.path.sep + 'psa_si_sorted.csv'
+        self.sim_series_npz = wp + os.path.sep + 'simulated_series.npz'
+        self.psa_si_windows_dir = wp + os.path.sep + 'psa_si_windows'
         UtilClass.mkdir(self.output_values_dir)
 
 
@@ -158,6 +160,39 @@ class PSAConfig(object):
             raise ValueError('The time format MUST be"YYYY-MM-DD HH:MM:SS".')
         if self.psa_stime >= self.psa_etime:
             raise ValueError("Wrong time settings in [PSA_Settings]!")
+        # Keep the matched outlet series (runs x time, float32) for time-windowed analysis
+        self.store_sim = False
+        if cf.has_option('PSA_Settings', 'storesimulations'):
+            self.store_sim = cf.getboolean('PSA_Settings', 'storesimulations')
+        # Time windows of the stored series for windowed sensitivity analysis
+        self.window_objectives = list()
+        if cf.has_option('PSA_Settings', 'windowobjectives'):
+            self.window_objectives = StringClass.split_string(cf.get('PSA_Settings',
+                                                                     'windowobjectives'), ',')
+        self.sliding_window = None  # (width, step) counted by time steps
+        if cf.has_option('PSA_Settings', 'slidingwindow'):
+            width_step = StringClass.extract_numeric_values_from_string(
+                cf.get('PSA_Settings', 'slidingwindow'))
+            if len(width_step) != 2:
+                raise ValueError('slidingWindow MUST be <width>,<step>!')
+            self.sliding_window = (int(width_step[0]), int(width_step[1]))
+        self.seasons = dict()  # e.g., {'wet': [5, 6, 7, 8, 9], 'dry': [11, 12, 1, 2, 3]}
+        if cf.has_option('PSA_Settings', 'seasons'):
+            for season_str in StringClass.split_string(cf.get('PSA_Settings', 'seasons'), ';'):
+                name, months = StringClass.split_string(season_str, ':')
+                self.seasons[name] = [int(m) for m in
+                                      StringClass.extract_numeric_values_from_string(months)]
+        self.flow_percentiles = list()  # e.g., [0, 50, 90, 100]
+        if cf.has_option('PSA_Settings', 'flowregimepercentiles'):
+            self.flow_percentiles = StringClass.extract_numeric_values_from_string(
+                cf.get('PSA_Settings', 'flowregimepercentiles'))
+        if self.window_objectives and not (self.sliding_window or self.seasons or
+                                           self.flow_percentiles):
+            print('WARNING: No time windows are specified, windowObjectives is ignored.')
+            self.window_objectives = list()
+        if self.window_objectives and not self.store_sim:
+            print('WARNING: storeSimulations is set to True for windowed sensitivity analysis.')
+            self.store_sim = True
 
         # 3. Parameters settings for specific sensitivity analysis methods
         self.morris = None
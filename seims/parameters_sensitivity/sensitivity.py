@@ -45,6 +45,8 @@ from postprocess.utility import save_png_eps
 
 from parameters_sensitivity.config import PSAConfig
 from parameters_sensitivity.figure import sample_histograms, empirical_cdf
+from parameters_sensitivity.timewindow import observation_series, simulation_matrix, \
+    window_masks, sliding_window_masks, season_masks, flow_regime_masks, windowed_objectives
 from run_seims import create_run_model
 
 
@@ -83,6 +85,7 @@ class Sensitivity(object):
         self.write_param_values_to_mongodb()
         self.evaluate_models()
         self.calculate_sensitivity()
+        self.calculate_configured_windowed_sensitivity()
 
     def plot(self):
         try:
@@ -273,6 +276,10 @@ class Sensitivity(object):
             obs_vars, obs_data_dict = output_models[0].ReadOutletObservations(input_eva_vars)
             if (len(obs_vars)) < 1:  # Make sure the observation data exists.
                 continue
+            obs_series = dict()
+            if self.cfg.store_sim:
+                obs_series = observation_series(obs_vars, obs_data_dict,
+                                                self.cfg.psa_stime, self.cfg.psa_etime)
             # Loop the executed models
             eva_values = list()
             for imod, mod_obj in enumerate(output_models):
@@ -288,6 +295,14 @@ class Sensitivity(object):
                 eva_values.append(obj_values)
                 # delete model output directory for saving storage
                 rmtree(mod_obj.output_dir)
+            if self.cfg.store_sim:
+                series = dict()
+                for var, (times, obs) in obs_series.items():
+                    series['UTCDATETIME_%s' % var] = times
+                    series['Obs_%s' % var] = obs
+                    series['Sim_%s' % var] = simulation_matrix(output_models, var, times)
+                numpy.savez('%s/series_%d.npz' % (self.cfg.outfiles.output_values_dir, idx),
+                            **series)
             if not isinstance(eva_values, numpy.ndarray):
                 eva_values = numpy.array(eva_values)
             numpy.savetxt(cur_out_file, eva_values, delimiter=' ', fmt='%.4f')
@@ -312,6 +327,9 @@ class Sensitivity(object):
         with open('%s/objnames.pickle' % self.cfg.psa_outpath, 'wb') as f:
             pickle.dump(self.objnames, f)
 
+        if self.cfg.store_sim:
+            self.merge_simulated_series(len(split_seqs))
+
         # load the first part of output values
         self.output_values = numpy.loadtxt('%s/outputs_0.txt' % self.cfg.outfiles.output_values_dir)
         if task_num == 0:
@@ -327,6 +345,117 @@ class Sensitivity(object):
         numpy.savetxt(self.cfg.outfiles.output_values_txt,
                       self.output_values, delimiter=' ', fmt='%.4f')
 
+    def merge_simulated_series(self, task_num):
+        """Concatenate the stored series of all partitioned tasks into one *.npz file."""
+        merged = dict()
+        for idx in range(task_num):
+            part_file = '%s/series_%d.npz' % (self.cfg.outfiles.output_values_dir, idx)
+            if not FileClass.is_file_exists(part_file):
+                continue
+            part = numpy.load(part_file)
+            for key in part.files:
+                if key not in merged:
+                    merged[key] = part[key]
+                elif key.startswith('Sim_'):
+                    merged[key] = numpy.concatenate((merged[key], part[key]))
+        if merged:
+            numpy.savez(self.cfg.outfiles.sim_series_npz, **merged)
+
+    def load_simulated_series(self, var):
+        """Load the stored series of `var`.
+
+        Returns:
+            times (datetime64[s]), observations (time,), and simulations (runs x time).
+        """
+        if not FileClass.is_file_exists(self.cfg.outfiles.sim_series_npz):
+            raise IOError('Simulated series are not stored! Please set storeSimulations '
+                          'to True in [PSA_Settings] and rerun models.')
+        series = numpy.load(self.cfg.outfiles.sim_series_npz)
+        if 'Sim_%s' % var not in series.files:
+            raise ValueError('Simulated series of %s is not stored!' % var)
+        return (series['UTCDATETIME_%s' % var], series['Obs_%s' % var],
+                series['Sim_%s' % var])
+
+    def calculate_windowed_sensitivity(self, var, objname, windows, names=None):
+        """Sensitivity analysis of objectives calculated within time windows,
+        based on stored simulations without rerunning models.
+
+        Args:
+            var: Variable name, e.g., 'Q'
+            objname: Objective name supported by `windowed_objectives`, e.g., 'NSE', 'RMSE'
+            windows: List of (start_time, end_time) tuples, or boolean masks (windows x time)
+                     built by `sliding_window_masks`, `season_masks`, `flow_regime_masks`, etc.
+            names: Names of windows, used as keys of the output json file.
+        Returns:
+            dict of sensitivity indexes, key is window name.
+        """
+        if not self.param_defs:
+            self.read_param_ranges()
+        if self.param_values is None or len(self.param_values) == 0:
+            self.generate_samples()
+        times, obs, sim = self.load_simulated_series(var)
+        if len(windows) > 0 and not isinstance(windows[0], numpy.ndarray):
+            masks = window_masks(times, windows)
+        else:
+            masks = numpy.asarray(windows, dtype=bool)
+        if names is None:
+            names = ['%d' % i for i in range(len(masks))]
+        # objective values of all runs and all windows, (runs x windows)
+        obj_values = windowed_objectives(obs, sim, masks, objname)
+        assert (obj_values.shape[0] == self.run_count)
+        psa_si_windows = dict()
+        for i, wname in enumerate(names):
+            if self.cfg.method == 'morris':
+                tmp_Si = morris_alz(self.param_defs, self.param_values, obj_values[:, i],
+                                    conf_level=0.95, print_to_console=False,
+                                    num_levels=self.cfg.morris.num_levels,
+                                    grid_jump=self.cfg.morris.grid_jump)
+            elif self.cfg.method == 'fast':
+                tmp_Si = fast_alz(self.param_defs, obj_values[:, i], print_to_console=False)
+            else:
+                raise ValueError('%s method is not supported now!' % self.cfg.method)
+            psa_si_windows[wname] = tmp_Si
+        UtilClass.mkdir(self.cfg.outfiles.psa_si_windows_dir)
+        json_data = json.dumps(psa_si_windows, indent=4, cls=SpecialJsonEncoder)
+        with open('%s/psa_si_%s-%s.json' % (self.cfg.outfiles.psa_si_windows_dir,
+                                            var, objname), 'w') as f:
+            f.write(json_data)
+        return psa_si_windows
+
+    def configured_window_masks(self, times, obs):
+        """Masks and names of time windows configured in [PSA_Settings]."""
+        masks = list()
+        names = list()
+        if self.cfg.sliding_window:
+            width, step = self.cfg.sliding_window
+            for mask in sliding_window_masks(times, width, step):
+                if not mask.any():
+                    continue
+                masks.append(mask)
+                names.append('sliding_%s' % str(times[mask][0]).replace('T', ' '))
+        if self.cfg.seasons:
+            season_names, season_mask = season_masks(times, self.cfg.seasons)
+            masks += list(season_mask)
+            names += ['season_%s' % name for name in season_names]
+        if self.cfg.flow_percentiles:
+            pcts = self.cfg.flow_percentiles
+            masks += list(flow_regime_masks(obs, pcts))
+            names += ['flow_%s-%s' % (pcts[i], pcts[i + 1]) for i in range(len(pcts) - 1)]
+        return numpy.array(masks, dtype=bool).reshape(len(masks), len(times)), names
+
+    def calculate_configured_windowed_sensitivity(self):
+        """Windowed sensitivity analysis of all evaluated variables and `windowObjectives`
+        configured in [PSA_Settings]."""
+        if not self.cfg.window_objectives:
+            return
+        for var in self.cfg.evaluate_params:
+            times, obs, _ = self.load_simulated_series(var)
+            masks, names = self.configured_window_masks(times, obs)
+            for objname in self.cfg.window_objectives:
+                print('Windowed sensitivity analysis of %s-%s in %d time windows' %
+                      (objname, var, len(names)))
+                self.calculate_windowed_sensitivity(var, objname, masks, names)
+
     def calculate_sensitivity(self):
         """Calculate Morris elementary effects.
            It is worth to be noticed that evaluate_models() allows to return
@@ -0,0 +1,165 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Time-windowed objectives computed from stored simulations of all PSA runs.
+
+    The simulated outlet series of all model runs are stored as a float32 matrix
+    (runs x time) for each variable, together with the matched observations.
+    Objectives of arbitrary windows (e.g., sliding windows, seasons, or flow regimes)
+    are then computed for all runs and all windows in one vectorized pass.
+"""
+from __future__ import absolute_import
+
+import numpy
+
+from preprocess.text import DataValueFields
+
+
+def observation_series(obs_vars, obs_dict, stime, etime):
+    """Extract sorted observation series of each variable within [stime, etime].
+
+    Args:
+        obs_vars: Observed variable list, e.g., ['Q', 'SED']
+        obs_dict: {Datetime: [value_of_var1, value_of_var2, ...], ...}
+        stime: Start time
+        etime: End time
+    Returns:
+        {VarName: (times as datetime64[s] array, observed values as float32 array)}
+    """
+    obs_series = dict()
+    for idx, var in enumerate(obs_vars):
+        times = list()
+        values = list()
+        for obs_date in sorted(obs_dict.keys()):
+            if not stime <= obs_date <= etime:
+                continue
+            obs_values = obs_dict.get(obs_date)
+            if idx >= len(obs_values) or obs_values[idx] is None:
+                continue
+            times.append(obs_date)
+            values.append(obs_values[idx])
+        obs_series[var] = (numpy.array(times, dtype='datetime64[s]'),
+                           numpy.array(values, dtype=numpy.float32))
+    return obs_series
+
+
+def simulation_matrix(models, var, times):
+    """Gather the simulated series of `var` of all models aligned to `times`.
+
+    Args:
+        models: List of MainSEIMS objects after `ReadTimeseriesSimulations()`
+        var: Variable name, e.g., 'Q'
+        times: Reference times, datetime64[s] array
+    Returns:
+        float32 matrix (runs x time), NaN for missing values, e.g., failed model runs.
+    """
+    sim_mtx = numpy.full((len(models), len(times)), numpy.nan, dtype=numpy.float32)
+    if len(times) == 0:
+        return sim_mtx
+    for irun, mod_obj in enumerate(models):
+        if not mod_obj.sim_obs_dict or var not in mod_obj.sim_obs_dict:
+            continue
+        sim_times = numpy.array(mod_obj.sim_obs_dict[var][DataValueFields.utc],
+                                dtype='datetime64[s]')
+        if len(sim_times) == 0:
+            continue
+        sim_values = numpy.array(mod_obj.sim_obs_dict[var]['Sim'], dtype=numpy.float32)
+        pos = numpy.searchsorted(times, sim_times)
+        pos[pos >= len(times)] = 0
+        matched = times[pos] == sim_times
+        sim_mtx[irun, pos[matched]] = sim_values[matched]
+    return sim_mtx
+
+
+def window_masks(times, windows):
+    """Build boolean masks (windows x time) from time periods.
+
+    Args:
+        times: datetime64[s] array
+        windows: List of (start_time, end_time) tuples, both are included.
+    """
+    masks = numpy.zeros((len(windows), len(times)), dtype=bool)
+    for i, (stime, etime) in enumerate(windows):
+        masks[i] = (times >= numpy.datetime64(stime, 's')) & (times <= numpy.datetime64(etime, 's'))
+    return masks
+
+
+def sliding_window_masks(times, width, step):
+    """Masks of sliding windows with `width` and `step` counted by time steps."""
+    starts = numpy.arange(0, max(len(times) - width, 0) + 1, step)
+    idx = numpy.arange(len(times))
+    return (idx >= starts[:, None]) & (idx < starts[:, None] + width)
+
+
+def season_masks(times, seasons):
+    """Masks of seasons, e.g., {'wet': [5, 6, 7, 8, 9], 'dry': [11, 12, 1, 2, 3]}.
+
+    Returns:
+        season names and the corresponding masks (seasons x time).
+    """
+    months = times.astype('datetime64[M]').astype(int) % 12 + 1
+    names = list(seasons.keys())
+    masks = numpy.array([numpy.isin(months, seasons[name]) for name in names], dtype=bool)
+    return names, masks
+
+
+def flow_regime_masks(obs, percentiles):
+    """Masks of flow regimes according to percentiles of observations.
+
+    Args:
+        obs: Observed values
+        percentiles: Ascending percentiles, e.g., [0, 50, 90, 100] means three regimes:
+                     low flow (0~50), medium flow (50~90), and peak flow (90~100).
+    """
+    bounds = numpy.percentile(obs, percentiles)
+    masks = numpy.zeros((len(bounds) - 1, len(obs)), dtype=bool)
+    for i in range(len(bounds) - 1):
+        masks[i] = (obs >= bounds[i]) & (obs <= bounds[i + 1])
+    return masks
+
+
+def windowed_objectives(obs, sim, masks, objname='NSE'):
+    """Calculate objective of all runs for all windows by matrix products.
+
+    Missing simulations (NaN, e.g., failed time steps or runs) are excluded, i.e., the
+    objective of each run and window is calculated from the valid time steps within the
+    window only, and is NaN if there is no valid time step.
+
+    Args:
+        obs: Observed values, shape (time,)
+        sim: Simulated values of all runs, shape (runs, time)
+        masks: Boolean masks, shape (windows, time)
+        objname: 'NSE', 'RMSE', 'PBIAS', or 'RSR', the same as `calculate_statistics`.
+    Returns:
+        Objective values, shape (runs, windows). PBIAS is returned as absolute value.
+    """
+    obs = numpy.asarray(obs, dtype=numpy.float64)
+    sim = numpy.asarray(sim, dtype=numpy.float64)
+    w = numpy.asarray(masks, dtype=numpy.float64)
+    valid = ~numpy.isnan(sim)
+    v = valid.astype(numpy.float64)
+    sim = numpy.where(valid, sim, 0.)
+    # Number of valid time steps (runs x windows)
+    count = v.dot(w.T)
+    count[count == 0] = numpy.nan
+    # Sum of squared errors (runs x windows)
+    sse = (numpy.where(valid, sim - obs, 0.) ** 2).dot(w.T)
+    objname = objname.upper()
+    if objname == 'RMSE':
+        return numpy.sqrt(sse / count)
+    if objname == 'PBIAS':
+        obs_sum = (v * obs).dot(w.T)
+        obs_sum[obs_sum == 0] = numpy.nan
+        return numpy.fabs((v * obs - sim).dot(w.T) * 100. / obs_sum)
+    # Squared deviation of observations from their mean of the valid time steps,
+    #   centered by the mean of each window first to avoid cancellation
+    wcount = w.sum(axis=1)
+    wcount[wcount == 0] = numpy.nan
+    dev = obs - (w.dot(obs) / wcount)[:, None]  # (windows x time)
+    dev = numpy.where(w > 0, dev, 0.)
+    dev_sum = numpy.einsum('rt,wt->rw', v, dev)
+    sdo = numpy.einsum('rt,wt->rw', v, dev ** 2) - dev_sum ** 2 / count
+    if objname == 'NSE':
+        return 1. - sse / sdo
+    if objname == 'RSR':
+        return numpy.sqrt(sse) / numpy.sqrt(sdo)
+    raise ValueError('%s is not supported for windowed objectives!' % objname)
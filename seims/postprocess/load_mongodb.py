@@ -19,6 +19,7 @@ if os.path.abspath(os.path.join(sys.path[0], '..')) not in sys.path:
     sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '..')))
 
 from preprocess.db_mongodb import ConnectMongoDB, MongoQuery
+from preprocess.hydro_climate_buckets import DataBucketStore
 from preprocess.text import DBTableNames, ModelCfgFields, FieldNames, SubbsnStatsName, \
     DataValueFields, DataType, StationFields
 
@@ -122,12 +123,21 @@ class ReadModelData(object):
 
         pcp_dict = OrderedDict()
 
-        for pdata in self.climatedb[DBTableNames.data_values].find(
+        bucket_store = DataBucketStore.detect(self.climatedb, DataType.p)
+        if bucket_store is not None:
+            pcp_data = list()
+            for utcs, values in bucket_store.read(site_list, DataType.p,
+                                                  start_time, end_time).values():
+                pcp_data += zip(utcs.tolist(), values.tolist())
+            pcp_data.sort(key=lambda x: x[0])
+        else:
+            pcp_cursor = self.climatedb[DBTableNames.data_values].find(
                 {DataValueFields.utc: {"$gte": start_time, '$lte': end_time},
                  DataValueFields.type: DataType.p,
-                 DataValueFields.id: {"$in": site_list}}).sort([(DataValueFields.utc, 1)]):
-            curt = pdata[DataValueFields.utc]
-            curv = pdata[DataValueFields.value]
+                 DataValueFields.id: {"$in": site_list}}).sort([(DataValueFields.utc, 1)])
+            pcp_data = ((pdata[DataValueFields.utc], pdata[DataValueFields.value])
+                        for pdata in pcp_cursor)
+        for curt, curv in pcp_data:
             if curt not in pcp_dict:
                 pcp_dict[curt] = 0.
             pcp_dict[curt] += curv
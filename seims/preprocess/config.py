@@ -66,6 +66,16 @@ class SEIMSConfig(object):
         self.Meteo_sites = None
         self.Meteo_data = None
         self.thiessen_field = 'ID'
+        self.weight_debug_txt = False
+        self.itp_method = 'thiessen'  # thiessen, idw, or idw_elev
+        self.idw_power = 2.
+        self.idw_neighbors = 4
+        self.elev_factor = 100.
+        self.clim_incremental = False
+        self.clim_fingerprint_check = False
+        self.data_layout = 'document'  # document or bucket
+        self.bucket_period = 'YEAR'  # YEAR or MONTH
+        self.bucket_storage = 'collection'  # only collection can be read by SEIMS
         # 5. Spatial inputs
         self.prec_sites_thiessen = None
         self.meteo_sites_thiessen = None
@@ -182,6 +192,33 @@ class SEIMSConfig(object):
             self.Meteo_sites = self.clim_dir + os.path.sep + cf.get('CLIMATE', 'meteositefile')
             self.Meteo_data = self.clim_dir + os.path.sep + cf.get('CLIMATE', 'meteodatafile')
             self.thiessen_field = cf.get('CLIMATE', 'thiessenidfield')
+            # Write interpolation weights to txt files for debugging
+            if cf.has_option('CLIMATE', 'weightdebugtxt'):
+                self.weight_debug_txt = cf.getboolean('CLIMATE', 'weightdebugtxt')
+            # Interpolation method of weights and its settings
+            if cf.has_option('CLIMATE', 'interpolationmethod'):
+                self.itp_method = cf.get('CLIMATE', 'interpolationmethod').strip().lower()
+            if cf.has_option('CLIMATE', 'idwpower'):
+                self.idw_power = cf.getfloat('CLIMATE', 'idwpower')
+            if cf.has_option('CLIMATE', 'idwneighbors'):
+                self.idw_neighbors = cf.getint('CLIMATE', 'idwneighbors')
+            if cf.has_option('CLIMATE', 'elevationfactor'):
+                self.elev_factor = cf.getfloat('CLIMATE', 'elevationfactor')
+            # Import the newer climate data only, optionally check the historical data
+            if cf.has_option('CLIMATE', 'incrementalimport'):
+                self.clim_incremental = cf.getboolean('CLIMATE', 'incrementalimport')
+            if cf.has_option('CLIMATE', 'fingerprintcheck'):
+                self.clim_fingerprint_check = cf.getboolean('CLIMATE', 'fingerprintcheck')
+            # Storage layout of climate data, see preprocess.hydro_climate_buckets
+            if cf.has_option('CLIMATE', 'datalayout'):
+                self.data_layout = cf.get('CLIMATE', 'datalayout').strip().lower()
+            if cf.has_option('CLIMATE', 'bucketperiod'):
+                self.bucket_period = cf.get('CLIMATE', 'bucketperiod').strip().upper()
+            if cf.has_option('CLIMATE', 'bucketstorage'):
+                self.bucket_storage = cf.get('CLIMATE', 'bucketstorage').strip().lower()
+            if self.data_layout == 'bucket' and self.bucket_storage != 'collection':
+                raise ValueError('BucketStorage of model input MUST be collection, since SEIMS '
+                                 'reads buckets from the DATA_BUCKETS collection only!')
         else:
             raise ValueError('Climate input file names MUST be provided in [CLIMATE]!')
 
@@ -13,18 +13,60 @@ import sys
 if os.path.abspath(os.path.join(sys.path[0], '..')) not in sys.path:
     sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '..')))
 
-from math import sqrt, pow
-from struct import pack, unpack
+from math import sqrt
+from multiprocessing import Pool
 import copy
+import time
+import traceback
 
+import numpy
 from gridfs import GridFS
-from numpy import zeros as np_zeros
 
-from preprocess.db_mongodb import MongoQuery
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+from preprocess.db_mongodb import ConnectMongoDB, MongoQuery
 from preprocess.text import DBTableNames, RasterMetadata, FieldNames, \
     DataType, StationFields, DataValueFields, SubbsnStatsName
 from preprocess.utility import UTIL_ZERO
 
+# Number of float values written to GridFS at one time
+WEIGHT_CHUNK_SIZE = 1 << 20
+# Interpolation methods of weights
+ITP_METHODS = ['thiessen', 'idw', 'idw_elev']
+# Encodings of weight data, see `ImportWeightData.write_weights`
+ENCODING_DENSE = 'DENSE'
+ENCODING_SPARSE = 'SPARSE'
+
+# MongoDB client of each worker process, see `init_weight_worker`
+_WORKER_CLIENT = None
+
+
+def init_weight_worker(host, port):
+    """Initialize the pooled MongoDB client of current worker process."""
+    global _WORKER_CLIENT
+    _WORKER_CLIENT = ConnectMongoDB(host, port)
+
+
+def subbasin_weight_task(args):
+    """Generate weight data and weight dependent parameters of one subbasin.
+
+    Args:
+        args: (subbasin ID, settings dict of `ImportWeightData.weight_settings`)
+    Returns:
+        subbasin ID, elapsed time (s), and error message (None if succeed)
+    """
+    subbsn_id, settings = args
+    stime = time.time()
+    try:
+        conn = _WORKER_CLIENT.get_conn()
+        ImportWeightData.subbasin_workflow(conn, subbsn_id, settings)
+    except Exception:
+        return subbsn_id, time.time() - stime, traceback.format_exc()
+    return subbsn_id, time.time() - stime, None
+
 
 class ImportWeightData(object):
     """Spatial weight and its related data"""
@@ -37,67 +79,232 @@ class ImportWeightData(object):
         return sqrt(dx * dx + dy * dy)
 
     @staticmethod
-    def idw(x, y, loc_list):
-        """IDW method for weight
-        This function is not used currently"""
-        ex = 2
-        coef_list = list()
-        sum_dist = 0
-        for pt in loc_list:
-            dis = ImportWeightData.cal_dis(x, y, pt[0], pt[1])
-            coef = pow(dis, -ex)
-            coef_list.append(coef)
-            sum_dist += coef
-        weight_list = []
-        for coef in coef_list:
-            weight_list.append(coef / sum_dist)
-        fmt = '%df' % (len(weight_list))
-        s = pack(fmt, *weight_list)
-        return s
+    def site_weights(dist, idx, method='thiessen', power=2.):
+        """Weights of the k-nearest sites of cells.
+
+        Args:
+            dist: Distances to the k-nearest sites sorted ascending, (cells x k).
+            idx: Indexes of the k-nearest sites, (cells x k).
+            method: 'thiessen' uses the nearest site only, otherwise inverse distance weighting.
+            power: Power of inverse distance.
+        Returns:
+            Indexes and weights of sites, (cells x k), k is 1 for 'thiessen'.
+        """
+        if method == 'thiessen':
+            return idx[:, :1], numpy.ones((len(idx), 1), dtype=numpy.float32)
+        with numpy.errstate(divide='ignore'):
+            coef = numpy.power(dist, -power)
+        # cells located at sites take the values of the sites
+        at_site = ~numpy.isfinite(coef[:, 0])
+        coef[at_site] = 0.
+        coef[at_site, 0] = 1.
+        weights = coef / coef.sum(axis=1, keepdims=True)
+        return idx, weights.astype(numpy.float32)
+
+    @staticmethod
+    def read_mask(db_model, subbsn_id, name='MASK'):
+        """Read MASK (or other) raster of the subbasin from MongoDB.
+
+        Returns:
+            File document in GridFS, and the raster data (nrows x ncols).
+        """
+        spatial_gfs = GridFS(db_model, DBTableNames.gridfs_spatial)
+        mask_name = '%d_%s' % (subbsn_id, name)
+        if not spatial_gfs.exists(filename=mask_name):
+            raise RuntimeError('%s is not existed in MongoDB!' % mask_name)
+        mask = db_model[DBTableNames.gridfs_spatial].files.find({'filename': mask_name})[0]
+        ysize = int(mask['metadata'][RasterMetadata.nrows])
+        xsize = int(mask['metadata'][RasterMetadata.ncols])
+        data = numpy.frombuffer(spatial_gfs.get(mask['_id']).read(), dtype=numpy.float32)
+        return mask, data.reshape(ysize, xsize)
+
+    @staticmethod
+    def valid_cell_coordinates(mask, data):
+        """Coordinates of valid cells in row-major order, i.e., the order of weight data.
+
+        Returns:
+            valid flags (nrows x ncols), x and y coordinates of valid cells.
+        """
+        ysize, xsize = data.shape
+        nodata_value = mask['metadata'][RasterMetadata.nodata]
+        dx = mask['metadata'][RasterMetadata.cellsize]
+        xll = mask['metadata'][RasterMetadata.xll]
+        yll = mask['metadata'][RasterMetadata.yll]
+        valid = numpy.abs(data - nodata_value) > UTIL_ZERO
+        rows, cols = numpy.nonzero(valid)
+        return valid, xll + cols * dx, yll + (ysize - rows - 1) * dx
+
+    @staticmethod
+    def nearest_sites(xs, ys, loc_list, k=1):
+        """Distances and indexes of the k-nearest sites of points, sorted by distance.
+
+        The KD-tree of scipy is used if available, otherwise the distances to all sites
+        are calculated by chunks since the number of sites is usually small. The ties are
+        broken by the lower site index, i.e., the same as the former Thiessen polygon loop,
+        hence the points equidistant to the k-th and the (k+1)-th nearest sites found by
+        the KD-tree are calculated by chunks again.
+
+        Returns:
+            distances and indexes, (points x k).
+        """
+        locs = numpy.array(loc_list, dtype=numpy.float64).reshape(-1, 2)
+        pts = numpy.column_stack((xs, ys))
+        k = min(k, len(locs))
+        if cKDTree is None:
+            return ImportWeightData.nearest_sites_by_chunks(pts, locs, k)
+        nquery = min(k + 1, len(locs))
+        dist, idx = cKDTree(locs).query(pts, k=nquery)
+        dist = dist.reshape(len(pts), nquery)
+        idx = idx.reshape(len(pts), nquery)
+        if nquery > k:
+            ties = numpy.nonzero(dist[:, k] - dist[:, k - 1] <=
+                                 UTIL_ZERO * numpy.maximum(1., dist[:, k]))[0]
+            if len(ties):
+                tie_dist, tie_idx = ImportWeightData.nearest_sites_by_chunks(pts[ties], locs, k)
+                dist[ties, :k] = tie_dist
+                idx[ties, :k] = tie_idx
+        return dist[:, :k], idx[:, :k]
+
+    @staticmethod
+    def nearest_sites_by_chunks(pts, locs, k=1):
+        """Distances and indexes of the k-nearest sites by the distances to all sites.
+
+        Args:
+            pts: Coordinates of points, (points x 2).
+            locs: Coordinates of sites, (sites x 2).
+            k: Number of nearest sites, not greater than the number of sites.
+        Returns:
+            distances and indexes, (points x k).
+        """
+        dist = numpy.empty((len(pts), k))
+        idx = numpy.empty((len(pts), k), dtype=numpy.int64)
+        chunk = max(1, WEIGHT_CHUNK_SIZE // len(locs))
+        for start in range(0, len(pts), chunk):
+            end = min(start + chunk, len(pts))
+            tmpdist = numpy.hypot(pts[start:end, 0:1] - locs[:, 0],
+                                  pts[start:end, 1:2] - locs[:, 1])
+            if k == 1:
+                tmpidx = numpy.argmin(tmpdist, axis=1).reshape(-1, 1)
+            else:
+                tmpidx = numpy.argsort(tmpdist, axis=1, kind='mergesort')[:, :k]
+            idx[start:end] = tmpidx
+            dist[start:end] = tmpdist[numpy.arange(end - start).reshape(-1, 1), tmpidx]
+        return dist, idx
+
+    @staticmethod
+    def nearest_sites_elev(xs, ys, zs, loc_list, elev_list, k=1, elev_factor=100.):
+        """Distances and indexes of the k-nearest sites by elevation adjusted distance, i.e.,
+        the elevation difference scaled by `elev_factor` is added to the horizontal distance.
+
+        The distances to all sites are calculated by chunks, and the ties are broken by the
+        lower site index.
+
+        Returns:
+            distances and indexes, (points x k).
+        """
+        locs = numpy.array(loc_list, dtype=numpy.float64).reshape(-1, 2)
+        elevs = numpy.array(elev_list, dtype=numpy.float64)
+        num = len(xs)
+        k = min(k, len(locs))
+        dist = numpy.empty((num, k))
+        idx = numpy.empty((num, k), dtype=numpy.int64)
+        chunk = max(1, WEIGHT_CHUNK_SIZE // len(locs))
+        for start in range(0, num, chunk):
+            end = min(start + chunk, num)
+            dz = elev_factor * (zs[start:end, None] - elevs)
+            tmpdist = numpy.sqrt((xs[start:end, None] - locs[:, 0]) ** 2 +
+                                 (ys[start:end, None] - locs[:, 1]) ** 2 + dz ** 2)
+            tmpidx = numpy.argsort(tmpdist, axis=1, kind='mergesort')[:, :k]
+            idx[start:end] = tmpidx
+            dist[start:end] = tmpdist[numpy.arange(end - start)[:, None], tmpidx]
+        return dist, idx
+
+    @staticmethod
+    def write_weights(spatial_gfs, fname, metadic, idx, weights, num_sites):
+        """Write weights of cells to GridFS by chunks.
+
+        The encoding is recorded in metadata (`RasterMetadata.weight_encoding`):
+
+        - DENSE: (cells x sites) float32 matrix, used if all sites are involved.
+        - SPARSE: (cells x k) int32 site indexes followed by (cells x k) float32 weights,
+          k is `RasterMetadata.neighbor_num`.
+
+        Args:
+            spatial_gfs: GridFS object.
+            fname: File name, e.g., 1_WEIGHT_M.
+            metadic: Metadata.
+            idx: Site indexes of cells, (cells x k).
+            weights: Weights of sites, (cells x k).
+            num_sites: Number of sites.
+        """
+        num, k = idx.shape
+        metadic = copy.deepcopy(metadic)
+        metadic[RasterMetadata.neighbor_num] = k
+        metadic[RasterMetadata.weight_encoding] = ENCODING_DENSE
+        if k < num_sites and k > 1:
+            metadic[RasterMetadata.weight_encoding] = ENCODING_SPARSE
+        myfile = spatial_gfs.new_file(filename=fname, metadata=metadic)
+        if metadic[RasterMetadata.weight_encoding] == ENCODING_SPARSE:
+            chunk = max(1, WEIGHT_CHUNK_SIZE // k)
+            for start in range(0, num, chunk):
+                myfile.write(idx[start:start + chunk].astype(numpy.int32).tobytes())
+            for start in range(0, num, chunk):
+                myfile.write(weights[start:start + chunk].astype(numpy.float32).tobytes())
+        else:
+            chunk = max(1, WEIGHT_CHUNK_SIZE // num_sites)
+            for start in range(0, num, chunk):
+                end = min(start + chunk, num)
+                dense = numpy.zeros((end - start, num_sites), dtype=numpy.float32)
+                rows = numpy.arange(end - start).reshape(-1, 1)
+                dense[rows, idx[start:end]] = weights[start:end]
+                myfile.write(dense.tobytes())
+        myfile.close()
 
     @staticmethod
-    def thiessen(x, y, loc_list):
-        """Thiessen polygon method for weights"""
-        i_min = 0
-        coef_list = list()
-        if len(loc_list) <= 1:
-            coef_list.append(1)
-            fmt = '%df' % 1
-            return pack(fmt, *coef_list), i_min
-
-        dis_min = ImportWeightData.cal_dis(x, y, loc_list[0][0], loc_list[0][1])
-
-        coef_list.append(0)
-
-        for i in range(1, len(loc_list)):
-            coef_list.append(0)
-            dis = ImportWeightData.cal_dis(x, y, loc_list[i][0], loc_list[i][1])
-            # print(x, y, loc_list[i][0], loc_list[i][1], dis)
-            if dis < dis_min:
-                i_min = i
-                dis_min = dis
-        coef_list[i_min] = 1
-        fmt = '%df' % (len(coef_list))
-
-        s = pack(fmt, *coef_list)
-        return s, i_min
+    def read_weights(spatial_gfs, weight_doc):
+        """Read weights written by `write_weights`.
+
+        Returns:
+            Site indexes and weights of cells, (cells x k), k is the number of sites for DENSE.
+        """
+        metadata = weight_doc['metadata']
+        num_cells = int(metadata[RasterMetadata.cellnum])
+        num_sites = int(metadata[RasterMetadata.site_num])
+        buf = spatial_gfs.get(weight_doc['_id']).read()
+        if metadata.get(RasterMetadata.weight_encoding, ENCODING_DENSE) == ENCODING_SPARSE:
+            k = int(metadata[RasterMetadata.neighbor_num])
+            idx = numpy.frombuffer(buf, dtype=numpy.int32, count=num_cells * k)
+            weights = numpy.frombuffer(buf, dtype=numpy.float32, count=num_cells * k,
+                                       offset=num_cells * k * 4)
+            return idx.reshape(num_cells, k), weights.reshape(num_cells, k)
+        weights = numpy.frombuffer(buf, dtype=numpy.float32).reshape(num_cells, -1)
+        idx = numpy.tile(numpy.arange(weights.shape[1], dtype=numpy.int32), (num_cells, 1))
+        return idx, weights
 
     @staticmethod
-    def generate_weight_dependent_parameters(conn, maindb, subbsn_id):
+    def generate_weight_dependent_parameters(conn, maindb, subbsn_id,
+                                             stats_types=(DataType.phu0, DataType.mean_tmp0)):
         """Generate some parameters dependent on weight data and only should be calculated once.
             Such as PHU0 (annual average total potential heat units)
                 TMEAN0 (annual average temperature)
             added by Liangjun, 2016-6-17
+
+        The annual statistics of all meteorology sites form a (sites x statistics) matrix,
+        thus the statistics of all cells are derived by one matrix product with the
+        (cells x sites) weights of WEIGHT_M, or by the weighted sum of the k-nearest
+        sites if WEIGHT_M is stored as SPARSE.
+
+        Args:
+            conn: MongoClient object
+            maindb: Main spatial database
+            subbsn_id: Subbasin ID
+            stats_types: Types of annual statistics stored in `DBTableNames.annual_stats`
         """
         spatial_gfs = GridFS(maindb, DBTableNames.gridfs_spatial)
         # read mask file from mongodb
-        mask_name = '%d_MASK' % subbsn_id
-        # is MASK existed in Database?
-        if not spatial_gfs.exists(filename=mask_name):
-            raise RuntimeError('%s is not existed in MongoDB!' % mask_name)
+        mask, mask_data = ImportWeightData.read_mask(maindb, subbsn_id)
         # read WEIGHT_M file from mongodb
         weight_m_name = '%d_WEIGHT_M' % subbsn_id
-        mask = maindb[DBTableNames.gridfs_spatial].files.find({'filename': mask_name})[0]
         weight_m = maindb[DBTableNames.gridfs_spatial].files.find({'filename': weight_m_name})[0]
         num_cells = int(weight_m['metadata'][RasterMetadata.cellnum])
         num_sites = int(weight_m['metadata'][RasterMetadata.site_num])
@@ -111,90 +318,63 @@ class ImportWeightData(object):
         site_list = m_list.split(',')
         site_list = [int(item) for item in site_list]
 
-        q_dic = {StationFields.id: {'$in': site_list},
-                 StationFields.type: DataType.phu0}
-        cursor = hydro_clim_db[DBTableNames.annual_stats].find(q_dic).sort(StationFields.id, 1)
-
-        q_dic2 = {StationFields.id: {'$in': site_list},
-                  StationFields.type: DataType.mean_tmp0}
-        cursor2 = hydro_clim_db[DBTableNames.annual_stats].find(q_dic2).sort(StationFields.id, 1)
-
-        id_list = list()
-        phu_list = list()
-        for site in cursor:
-            id_list.append(site[StationFields.id])
-            phu_list.append(site[DataValueFields.value])
-
-        id_list2 = list()
-        tmean_list = list()
-        for site in cursor2:
-            id_list2.append(site[StationFields.id])
-            tmean_list.append(site[DataValueFields.value])
-
-        weight_m_data = spatial_gfs.get(weight_m['_id'])
-        total_len = num_cells * num_sites
-        # print(total_len)
-        fmt = '%df' % (total_len,)
-        weight_m_data = unpack(fmt, weight_m_data.read())
-
-        # calculate PHU0
-        phu0_data = np_zeros(num_cells)
-        # calculate TMEAN0
-        tmean0_data = np_zeros(num_cells)
-        for i in range(num_cells):
-            for j in range(num_sites):
-                phu0_data[i] += phu_list[j] * weight_m_data[i * num_sites + j]
-                tmean0_data[i] += tmean_list[j] * weight_m_data[i * num_sites + j]
-        ysize = int(mask['metadata'][RasterMetadata.nrows])
-        xsize = int(mask['metadata'][RasterMetadata.ncols])
+        # annual statistics of sites ordered by site ID, i.e., the same as weight data
+        site_stats = numpy.zeros((num_sites, len(stats_types)))
+        for j, stats_type in enumerate(stats_types):
+            q_dic = {StationFields.id: {'$in': site_list},
+                     StationFields.type: stats_type}
+            cursor = hydro_clim_db[DBTableNames.annual_stats].find(q_dic).sort(StationFields.id, 1)
+            values = [site[DataValueFields.value] for site in cursor]
+            if len(values) != num_sites:
+                raise RuntimeError('%s of %d sites are required for subbasin %d, but %d found!' %
+                                   (stats_type, num_sites, subbsn_id, len(values)))
+            site_stats[:, j] = values
+
+        # statistics of valid cells, (cells x statistics)
+        cell_stats = numpy.empty((num_cells, len(stats_types)))
+        if weight_m['metadata'].get(RasterMetadata.weight_encoding,
+                                    ENCODING_DENSE) == ENCODING_SPARSE:
+            site_idx, weight_m_data = ImportWeightData.read_weights(spatial_gfs, weight_m)
+            chunk = max(1, WEIGHT_CHUNK_SIZE // site_idx.shape[1])
+            for start in range(0, num_cells, chunk):
+                end = min(start + chunk, num_cells)
+                cell_stats[start:end] = numpy.einsum('ck,cks->cs', weight_m_data[start:end],
+                                                     site_stats[site_idx[start:end]])
+        else:
+            weight_m_data = spatial_gfs.get(weight_m['_id']).read()
+            weight_m_data = numpy.frombuffer(weight_m_data, dtype=numpy.float32)
+            weight_m_data = weight_m_data.reshape(num_cells, num_sites)
+            chunk = max(1, WEIGHT_CHUNK_SIZE // num_sites)
+            for start in range(0, num_cells, chunk):
+                end = min(start + chunk, num_cells)
+                cell_stats[start:end] = numpy.dot(weight_m_data[start:end], site_stats)
+
         nodata_value = mask['metadata'][RasterMetadata.nodata]
-        mask_data = spatial_gfs.get(mask['_id'])
-        total_len = xsize * ysize
-        fmt = '%df' % (total_len,)
-        mask_data = unpack(fmt, mask_data.read())
-        fname = '%d_%s' % (subbsn_id, DataType.phu0)
-        fname2 = '%d_%s' % (subbsn_id, DataType.mean_tmp0)
-        if spatial_gfs.exists(filename=fname):
-            x = spatial_gfs.get_version(filename=fname)
-            spatial_gfs.delete(x._id)
-        if spatial_gfs.exists(filename=fname2):
-            x = spatial_gfs.get_version(filename=fname2)
-            spatial_gfs.delete(x._id)
-        meta_dic = copy.deepcopy(mask['metadata'])
-        meta_dic['TYPE'] = DataType.phu0
-        meta_dic['ID'] = fname
-        meta_dic['DESCRIPTION'] = DataType.phu0
-
-        meta_dic2 = copy.deepcopy(mask['metadata'])
-        meta_dic2['TYPE'] = DataType.mean_tmp0
-        meta_dic2['ID'] = fname2
-        meta_dic2['DESCRIPTION'] = DataType.mean_tmp0
-
-        myfile = spatial_gfs.new_file(filename=fname, metadata=meta_dic)
-        myfile2 = spatial_gfs.new_file(filename=fname2, metadata=meta_dic2)
-        vaild_count = 0
-        for i in range(0, ysize):
-            cur_row = list()
-            cur_row2 = list()
-            for j in range(0, xsize):
-                index = i * xsize + j
-                if abs(mask_data[index] - nodata_value) > UTIL_ZERO:
-                    cur_row.append(phu0_data[vaild_count])
-                    cur_row2.append(tmean0_data[vaild_count])
-                    vaild_count += 1
-                else:
-                    cur_row.append(nodata_value)
-                    cur_row2.append(nodata_value)
-            fmt = '%df' % xsize
-            myfile.write(pack(fmt, *cur_row))
-            myfile2.write(pack(fmt, *cur_row2))
-        myfile.close()
-        myfile2.close()
+        valid = numpy.abs(mask_data - nodata_value) > UTIL_ZERO
+        vaild_count = int(valid.sum())
+        if vaild_count != num_cells:
+            raise RuntimeError('Valid cells of %d_MASK (%d) and %s (%d) are not matched!' %
+                               (subbsn_id, vaild_count, weight_m_name, num_cells))
+        for j, stats_type in enumerate(stats_types):
+            fname = '%d_%s' % (subbsn_id, stats_type)
+            if spatial_gfs.exists(filename=fname):
+                x = spatial_gfs.get_version(filename=fname)
+                spatial_gfs.delete(x._id)
+            meta_dic = copy.deepcopy(mask['metadata'])
+            meta_dic['TYPE'] = stats_type
+            meta_dic['ID'] = fname
+            meta_dic['DESCRIPTION'] = stats_type
+
+            raster_data = numpy.full(mask_data.shape, nodata_value, dtype=numpy.float32)
+            raster_data[valid] = cell_stats[:, j]
+            myfile = spatial_gfs.new_file(filename=fname, metadata=meta_dic)
+            myfile.write(raster_data.tobytes())
+            myfile.close()
         print('Valid Cell Number of subbasin %d is: %d' % (subbsn_id, vaild_count))
         return True
 
     @staticmethod
-    def climate_itp_weight_thiessen(conn, db_model, subbsn_id, geodata2dbdir):
+    def climate_itp_weight_thiessen(conn, db_model, subbsn_id, geodata2dbdir, debug_txt=False):
         """Generate and import weight information using Thiessen polygon method.
 
         Args:
@@ -202,44 +382,53 @@ class ImportWeightData(object):
             db_model: workflow database object
             subbsn_id: subbasin id
             geodata2dbdir: directory to store weight data as txt file
+            debug_txt: write weight data to txt file for debugging, default is False
         """
-        spatial_gfs = GridFS(db_model, DBTableNames.gridfs_spatial)
-        # read mask file from mongodb
-        mask_name = str(subbsn_id) + '_MASK'
-        if not spatial_gfs.exists(filename=mask_name):
-            raise RuntimeError('%s is not existed in MongoDB!' % mask_name)
-        mask = db_model[DBTableNames.gridfs_spatial].files.find({'filename': mask_name})[0]
-        ysize = int(mask['metadata'][RasterMetadata.nrows])
-        xsize = int(mask['metadata'][RasterMetadata.ncols])
-        nodata_value = mask['metadata'][RasterMetadata.nodata]
-        dx = mask['metadata'][RasterMetadata.cellsize]
-        xll = mask['metadata'][RasterMetadata.xll]
-        yll = mask['metadata'][RasterMetadata.yll]
+        ImportWeightData.climate_itp_weight(conn, db_model, subbsn_id, geodata2dbdir,
+                                            method='thiessen', debug_txt=debug_txt)
 
-        data = spatial_gfs.get(mask['_id'])
-
-        total_len = xsize * ysize
-        fmt = '%df' % (total_len,)
-        data = unpack(fmt, data.read())
-        # print(data[0], len(data), type(data))
+    @staticmethod
+    def climate_itp_weight(conn, db_model, subbsn_id, geodata2dbdir, method='thiessen',
+                           power=2., neighbors=4, elev_factor=100., debug_txt=False):
+        """Generate and import weight information of hydroclimate sites.
 
+        Args:
+            conn:
+            db_model: workflow database object
+            subbsn_id: subbasin id
+            geodata2dbdir: directory to store weight data as txt file
+            method: 'thiessen', 'idw' (inverse distance weighting of k-nearest sites), or
+                    'idw_elev' (IDW with the elevation difference scaled by `elev_factor`
+                    added to the horizontal distance)
+            power: power of inverse distance
+            neighbors: number of nearest sites used by IDW
+            elev_factor: scale factor of the elevation difference for 'idw_elev'
+            debug_txt: write weight data to txt file for debugging, default is False
+        """
+        if method not in ITP_METHODS:
+            raise ValueError('Interpolation method %s is not supported, '
+                             'available: %s' % (method, ', '.join(ITP_METHODS)))
+        spatial_gfs = GridFS(db_model, DBTableNames.gridfs_spatial)
+        # read mask file from mongodb
+        mask, data = ImportWeightData.read_mask(db_model, subbsn_id)
+        valid, xs, ys = ImportWeightData.valid_cell_coordinates(mask, data)
         # count number of valid cells
-        num = 0
-        for type_i in range(0, total_len):
-            if abs(data[type_i] - nodata_value) > UTIL_ZERO:
-                num += 1
+        num = len(xs)
+        rows, cols = numpy.nonzero(valid)
+        cell_elev = None
+        if method == 'idw_elev':
+            cell_elev = ImportWeightData.read_mask(db_model, subbsn_id, 'DEM')[1][valid]
 
         # read stations information from database
         metadic = {RasterMetadata.subbasin: subbsn_id,
-                   RasterMetadata.cellnum: num}
+                   RasterMetadata.cellnum: num,
+                   RasterMetadata.itp_method: method}
         site_lists = db_model[DBTableNames.main_sitelist].find({FieldNames.subbasin_id: subbsn_id})
         site_list = next(site_lists)
         clim_db_name = site_list[FieldNames.db]
         p_list = site_list.get(FieldNames.site_p)
         m_list = site_list.get(FieldNames.site_m)
         pet_list = site_list.get(FieldNames.site_pet)
-        # print(p_list)
-        # print(m_list)
         hydro_clim_db = conn[clim_db_name]
 
         type_list = [DataType.m, DataType.p, DataType.pet]
@@ -254,72 +443,125 @@ class ImportWeightData(object):
 
         for type_i, type_name in enumerate(type_list):
             fname = '%d_WEIGHT_%s' % (subbsn_id, type_name)
-            # print(fname)
             if spatial_gfs.exists(filename=fname):
                 x = spatial_gfs.get_version(filename=fname)
                 spatial_gfs.delete(x._id)
             site_list = site_lists[type_i]
-            if site_list is not None:
-                site_list = site_list.split(',')
-                # print(site_list)
-                site_list = [int(item) for item in site_list]
-                metadic[RasterMetadata.site_num] = len(site_list)
-                # print(site_list)
-                q_dic = {StationFields.id: {'$in': site_list},
-                         StationFields.type: type_list[type_i]}
+            if site_list is None:
+                continue
+            site_list = [int(item) for item in site_list.split(',')]
+            metadic[RasterMetadata.site_num] = len(site_list)
+            q_dic = {StationFields.id: {'$in': site_list},
+                     StationFields.type: type_list[type_i]}
+            cursor = hydro_clim_db[DBTableNames.sites].find(q_dic).sort(StationFields.id, 1)
+
+            # meteorology station can also be used as precipitation station
+            if cursor.count() == 0 and type_list[type_i] == DataType.p:
+                q_dic = {StationFields.id.upper(): {'$in': site_list},
+                         StationFields.type.upper(): DataType.m}
                 cursor = hydro_clim_db[DBTableNames.sites].find(q_dic).sort(StationFields.id, 1)
 
-                # meteorology station can also be used as precipitation station
-                if cursor.count() == 0 and type_list[type_i] == DataType.p:
-                    q_dic = {StationFields.id.upper(): {'$in': site_list},
-                             StationFields.type.upper(): DataType.m}
-                    cursor = hydro_clim_db[DBTableNames.sites].find(q_dic).sort(StationFields.id, 1)
-
-                # get site locations
-                id_list = list()
-                loc_list = list()
-                for site in cursor:
-                    if site[StationFields.id] in site_list:
-                        id_list.append(site[StationFields.id])
-                        loc_list.append([site[StationFields.x], site[StationFields.y]])
-                # print('loclist', locList)
-                # interpolate using the locations
-                myfile = spatial_gfs.new_file(filename=fname, metadata=metadic)
-                with open(r'%s/weight_%d_%s.txt' % (geodata2dbdir, subbsn_id,
-                                                    type_list[type_i]), 'w') as f_test:
-                    for y in range(0, ysize):
-                        for x in range(0, xsize):
-                            index = int(y * xsize + x)
-                            if abs(data[index] - nodata_value) > UTIL_ZERO:
-                                x_coor = xll + x * dx
-                                y_coor = yll + (ysize - y - 1) * dx
-                                near_index = 0
-                                line, near_index = ImportWeightData.thiessen(x_coor, y_coor,
-                                                                             loc_list)
-                                myfile.write(line)
-                                fmt = '%df' % (len(loc_list))
-                                f_test.write('%f %f ' % (x, y) + unpack(fmt, line).__str__() + '\n')
-                myfile.close()
+            # get site locations
+            loc_list = list()
+            elev_list = list()
+            for site in cursor:
+                if site[StationFields.id] in site_list:
+                    loc_list.append([site[StationFields.x], site[StationFields.y]])
+                    elev_list.append(site.get(StationFields.elev, 0.))
+            num_sites = max(len(loc_list), 1)
+            k = 1 if method == 'thiessen' else max(1, min(neighbors, len(loc_list)))
+            # the k-nearest sites of each valid cell
+            if len(loc_list) > 1 and cell_elev is not None:
+                dist, near_index = ImportWeightData.nearest_sites_elev(xs, ys, cell_elev,
+                                                                       loc_list, elev_list, k,
+                                                                       elev_factor)
+            elif len(loc_list) > 1:
+                dist, near_index = ImportWeightData.nearest_sites(xs, ys, loc_list, k)
+            else:
+                dist = numpy.zeros((num, 1))
+                near_index = numpy.zeros((num, 1), dtype=numpy.int64)
+            near_index, weights = ImportWeightData.site_weights(dist, near_index, method, power)
+
+            ImportWeightData.write_weights(spatial_gfs, fname, metadic, near_index, weights,
+                                           num_sites)
+            if debug_txt:  # columns: col, row, indexes of sites, weights of sites
+                numpy.savetxt(r'%s/weight_%d_%s.txt' % (geodata2dbdir, subbsn_id,
+                                                        type_list[type_i]),
+                              numpy.column_stack((cols, rows, near_index, weights)), fmt='%g')
+
+    @staticmethod
+    def weight_settings(cfg):
+        """Settings used by `subbasin_workflow`, which can be pickled to worker processes."""
+        return {'spatial_db': cfg.spatial_db,
+                'geodata2db': cfg.dirs.geodata2db,
+                'method': cfg.itp_method,
+                'power': cfg.idw_power,
+                'neighbors': cfg.idw_neighbors,
+                'elev_factor': cfg.elev_factor,
+                'debug_txt': cfg.weight_debug_txt}
+
+    @staticmethod
+    def subbasin_workflow(conn, subbsn_id, settings):
+        """Generate weight data and weight dependent parameters of one subbasin."""
+        db_model = conn[settings['spatial_db']]
+        ImportWeightData.climate_itp_weight(conn, db_model, subbsn_id, settings['geodata2db'],
+                                            settings['method'], settings['power'],
+                                            settings['neighbors'], settings['elev_factor'],
+                                            settings['debug_txt'])
+        ImportWeightData.generate_weight_dependent_parameters(conn, db_model, subbsn_id)
 
     @staticmethod
     def workflow(cfg, conn, n_subbasins):
-        """Workflow"""
+        """Workflow
+
+        Subbasins are processed by a pool of `cfg.np` processes, each of which holds its
+        own MongoDB client. Failed subbasins are reported after all subbasins finished.
+        """
         db_model = conn[cfg.spatial_db]
         subbasin_start_id = 0  # default is for OpenMP version
         if n_subbasins > 0:
             subbasin_start_id = 1
             n_subbasins = MongoQuery.get_init_parameter_value(db_model, SubbsnStatsName.subbsn_num)
-
-        for subbsn_id in range(subbasin_start_id, n_subbasins + 1):
-            ImportWeightData.climate_itp_weight_thiessen(conn, db_model, subbsn_id,
-                                                         cfg.dirs.geodata2db)
-            ImportWeightData.generate_weight_dependent_parameters(conn, db_model, subbsn_id)
+        subbsn_ids = list(range(subbasin_start_id, n_subbasins + 1))
+        settings = ImportWeightData.weight_settings(cfg)
+        tasks = [(subbsn_id, settings) for subbsn_id in subbsn_ids]
+        nprocs = max(1, min(cfg.np, len(tasks)))
+
+        stime = time.time()
+        pool = None
+        if nprocs > 1:
+            pool = Pool(nprocs, initializer=init_weight_worker,
+                        initargs=(cfg.hostname, cfg.port))
+            results = pool.imap_unordered(subbasin_weight_task, tasks)
+        else:
+            init_weight_worker(cfg.hostname, cfg.port)
+            results = (subbasin_weight_task(task) for task in tasks)
+        failures = list()
+        try:
+            for finished, (subbsn_id, elapsed, errmsg) in enumerate(results, 1):
+                status = 'finished' if errmsg is None else 'FAILED'
+                print('Weight data of subbasin %d %s in %.2fs (%d/%d)' %
+                      (subbsn_id, status, elapsed, finished, len(tasks)))
+                if errmsg is not None:
+                    failures.append((subbsn_id, errmsg))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            else:
+                _WORKER_CLIENT.close()
+        print('Weight data of %d subbasins generated by %d processes in %.2fs' %
+              (len(tasks), nprocs, time.time() - stime))
+        if failures:
+            for subbsn_id, errmsg in failures:
+                print('Subbasin %d failed:\n%s' % (subbsn_id, errmsg))
+            raise RuntimeError('Generating weight data failed for subbasin(s): %s' %
+                               ', '.join(str(subbsn_id) for subbsn_id, _ in sorted(failures)))
 
 
 def main():
     """TEST CODE"""
     from preprocess.config import parse_ini_configuration
-    from preprocess.db_mongodb import ConnectMongoDB
     seims_cfg = parse_ini_configuration()
     client = ConnectMongoDB(seims_cfg.hostname, seims_cfg.port)
     conn = client.get_conn()
@@ -16,220 +16,282 @@ if os.path.abspath(os.path.join(sys.path[0], '..')) not in sys.path:
     sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '..')))
 
 import time
-from datetime import timedelta
+from multiprocessing import Pool
 
-from pygeoc.utils import DateClass, StringClass
-from pymongo import ASCENDING
+import numpy
+from pygeoc.utils import StringClass
+from pymongo import ASCENDING, ReplaceOne
 
-from preprocess.db_mongodb import MongoUtil
+from preprocess.db_mongodb import ConnectMongoDB, MongoUtil
+from preprocess.hydro_climate_buckets import DataBucketStore
+from preprocess.hydro_climate_incremental import IncrementalImport
 from preprocess.hydro_climate_utility import HydroClimateUtilClass
 from preprocess.text import DBTableNames, DataValueFields, DataType, VariableDesc
 from preprocess.utility import read_data_items_from_txt, DEFAULT_NODATA, PI
 
+# MongoDB client of each worker process, see `init_meteorology_worker`
+_WORKER_CLIENT = None
+
+
+def init_meteorology_worker(host, port):
+    """Initialize the pooled MongoDB client of current worker process."""
+    global _WORKER_CLIENT
+    _WORKER_CLIENT = ConnectMongoDB(host, port)
+
 
 class ClimateStats(object):
-    """Common used annual climate statistics based on mean temperature, e.g. PHU."""
-    _T_BASE = 0.
-
-    def __init__(self, t_base=0.):
-        ClimateStats._T_BASE = t_base
-        self.Count = dict()
-        self.MeanTmp = dict()
-        self.PHUTOT = dict()
-        self.MeanTmp0 = 0.
-        self.PHU0 = 0.
-
-    def add_item(self, item_dict):
-        """Add mean temperature of each day. Dict MUST have {YEAR: 2017, TMEAN: 10.} at least."""
-        if DataValueFields.y not in list(item_dict.keys()):
-            raise ValueError('The hydroClimate dict must have year!')
-        if DataType.mean_tmp not in list(item_dict.keys()):
-            raise ValueError('The hydroClimate dict must have mean temperature!')
-        cur_y = item_dict[DataValueFields.y]
-        cur_tmp = item_dict[DataType.mean_tmp]
-        if cur_y not in list(self.Count.keys()):
-            self.Count[cur_y] = 1
-            self.MeanTmp[cur_y] = cur_tmp
-            if cur_tmp > ClimateStats._T_BASE:
-                self.PHUTOT[cur_y] = cur_tmp
-            else:
-                self.PHUTOT[cur_y] = 0.
-        else:
-            self.Count[cur_y] += 1
-            self.MeanTmp[cur_y] += cur_tmp
-            if cur_tmp > ClimateStats._T_BASE:
-                self.PHUTOT[cur_y] += cur_tmp
-
-    def annual_stats(self):
-        """Calculate annual statistics."""
-        for Y, v in list(self.Count.items()):
-            self.MeanTmp[Y] = round(self.MeanTmp[Y] / v, 1)
-            self.MeanTmp0 += self.MeanTmp[Y]
-            self.PHUTOT[Y] = round(self.PHUTOT[Y], 1)
-            self.PHU0 += self.PHUTOT[Y]
-        self.PHU0 = round(self.PHU0 / len(list(self.Count.keys())), 1)
-        self.MeanTmp0 = round(self.MeanTmp0 / len(list(self.Count.keys())), 1)
+    """Common used annual climate statistics based on mean temperature, e.g. PHU.
+
+    The statistics of all stations and years are calculated at once by grouped reductions
+    of the daily mean temperature arrays.
+    """
+
+    def __init__(self, station_ids, years, mean_tmp, t_base=0.):
+        """Calculate annual statistics.
+
+        Args:
+            station_ids: Station ID of each daily record.
+            years: Year of each daily record.
+            mean_tmp: Mean temperature of each daily record.
+            t_base: Base temperature of potential heat units.
+        """
+        mean_tmp = numpy.asarray(mean_tmp, dtype=numpy.float64)
+        pairs = numpy.column_stack((numpy.asarray(station_ids, dtype=numpy.int64),
+                                    numpy.asarray(years, dtype=numpy.int64)))
+        # (station, year) groups
+        self.station_years, inverse = numpy.unique(pairs, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        count = numpy.bincount(inverse)
+        self.MeanTmp = numpy.round(numpy.bincount(inverse, weights=mean_tmp) / count, 1)
+        self.PHUTOT = numpy.round(numpy.bincount(inverse,
+                                                 weights=numpy.where(mean_tmp > t_base,
+                                                                     mean_tmp, 0.)), 1)
+        # station groups, multiply annual averages
+        self.stations, st_inverse = numpy.unique(self.station_years[:, 0], return_inverse=True)
+        nyears = numpy.bincount(st_inverse)
+        self.MeanTmp0 = numpy.round(numpy.bincount(st_inverse, weights=self.MeanTmp) / nyears, 1)
+        self.PHU0 = numpy.round(numpy.bincount(st_inverse, weights=self.PHUTOT) / nyears, 1)
+
+    def replace_requests(self, station_years=None):
+        """ReplaceOne (upsert) requests of ANNUAL_STATS for `bulk_write`.
+
+        Args:
+            station_years: (Optional) Set of (station, year) to be written, default is all.
+        """
+        items = list()
+        for (s_id, yyyy), phu, tmp in zip(self.station_years.tolist(), self.PHUTOT.tolist(),
+                                          self.MeanTmp.tolist()):
+            if station_years is not None and (s_id, yyyy) not in station_years:
+                continue
+            items.append((s_id, yyyy, DataType.phu_tot, 'heat units', phu))
+            items.append((s_id, yyyy, DataType.mean_tmp, 'deg C', tmp))
+        for s_id, phu0, tmp0 in zip(self.stations.tolist(), self.PHU0.tolist(),
+                                    self.MeanTmp0.tolist()):
+            items.append((s_id, DEFAULT_NODATA, DataType.phu0, 'heat units', phu0))
+            items.append((s_id, DEFAULT_NODATA, DataType.mean_tmp0, 'deg C', tmp0))
+        requests = list()
+        for s_id, yyyy, stats_type, unit, value in items:
+            curfilter = {DataValueFields.id: s_id,
+                         VariableDesc.type: stats_type,
+                         DataValueFields.y: yyyy}
+            cur_dic = {DataValueFields.value: value,
+                       DataValueFields.id: s_id,
+                       DataValueFields.y: yyyy,
+                       VariableDesc.unit: unit,
+                       VariableDesc.type: stats_type}
+            requests.append(ReplaceOne(curfilter, cur_dic, upsert=True))
+        return requests
+
+
+def meteo_documents(station_id, utcs, local_times, tzone, values):
+    """Documents of DATA_VALUES of one station.
+
+    Args:
+        station_id: Station ID.
+        utcs: UTC datetimes, numpy.datetime64 array.
+        local_times: Local datetimes, numpy.datetime64 array.
+        tzone: Time zone.
+        values: {type: values array}, NaN values are ignored.
+    """
+    utcs = utcs.tolist()
+    local_times = local_times.tolist()
+    docs = list()
+    for fld, vals in values.items():
+        for utc, local_time, v in zip(utcs, local_times, vals.tolist()):
+            if v != v:  # NaN
+                continue
+            docs.append({DataValueFields.value: v,
+                         DataValueFields.id: station_id,
+                         DataValueFields.utc: utc,
+                         DataValueFields.time_zone: tzone,
+                         DataValueFields.local_time: local_time,
+                         DataValueFields.type: fld})
+    return docs
+
+
+def insert_station_data(args):
+    """Insert DATA_VALUES of one station by the pooled MongoDB client of current process."""
+    db_name, station_id, utcs, local_times, tzone, values = args
+    coll = _WORKER_CLIENT.get_conn()[db_name][DBTableNames.data_values]
+    count = MongoUtil.insert_many_by_batch(coll, meteo_documents(station_id, utcs, local_times,
+                                                                 tzone, values))
+    return station_id, count
 
 
 class ImportMeteoData(object):
     """Meteorological daily data import, and calculate related statistical values"""
 
     @staticmethod
-    def daily_data_from_txt(climdb, data_txt_file, sites_info_dict):
-        """Import climate data table"""
+    def daily_data_from_txt(climdb, data_txt_file, sites_info_dict, nprocs=1,
+                            incremental=False, check_fingerprint=False, bucket_store=None,
+                            host=None, port=None):
+        """Import climate data table
+
+        The header is resolved into a {field: column} dict once, and the columns are parsed
+        as arrays. Documents of each station are inserted by unordered `insert_many`,
+        by `nprocs` processes if greater than 1, each of which connects to MongoDB by
+        `host` and `port`.
+
+        If `incremental` is True, only the records newer than the stored ones are imported,
+        and the annual statistics of the affected station-years are updated,
+        see `IncrementalImport`.
+
+        If `bucket_store` is specified, the data are stored as buckets, see `DataBucketStore`.
+        """
         tsysin, tzonein = HydroClimateUtilClass.get_time_system_from_data_file(data_txt_file)
         if tsysin == 'UTCTIME':
             tzonein = time.timezone / -3600
         clim_data_items = read_data_items_from_txt(data_txt_file)
         clim_flds = clim_data_items[0]
-        # PHUCalDic is used for Calculating potential heat units (PHU)
-        # for each climate station and each year.
-        # format is {StationID:{Year1:[values],Year2:[Values]...}, ...}
-        # PHUCalDic = {}
-        # format: {StationID1: climateStats1, ...}
-        hydro_climate_stats = dict()
         required_flds = [DataType.max_tmp, DataType.min_tmp, DataType.rm, DataType.ws]
         output_flds = [DataType.mean_tmp, DataType.max_tmp, DataType.min_tmp,
                        DataType.rm, DataType.pet, DataType.ws, DataType.sr]
-        # remove existed records
-        for fld in output_flds:
-            climdb[DBTableNames.data_values].remove({'TYPE': fld})
         for fld in required_flds:
             if not StringClass.string_in_list(fld, clim_flds):
                 raise ValueError('Meteorological Daily data MUST contain %s!' % fld)
-        # Create bulk object
-        bulk = climdb[DBTableNames.data_values].initialize_ordered_bulk_op()
-        count = 0
-        for i, cur_clim_data_item in enumerate(clim_data_items):
-            if i == 0:
-                continue
-            dic = dict()
-            cur_ssd = DEFAULT_NODATA
-
-            for j, clim_data_v in enumerate(cur_clim_data_item):
-                if StringClass.string_match(clim_flds[j], DataValueFields.id):
-                    dic[DataValueFields.id] = int(clim_data_v)
-                elif StringClass.string_match(clim_flds[j], DataType.mean_tmp):
-                    dic[DataType.mean_tmp] = float(clim_data_v)
-                elif StringClass.string_match(clim_flds[j], DataType.min_tmp):
-                    dic[DataType.min_tmp] = float(clim_data_v)
-                elif StringClass.string_match(clim_flds[j], DataType.max_tmp):
-                    dic[DataType.max_tmp] = float(clim_data_v)
-                elif StringClass.string_match(clim_flds[j], DataType.pet):
-                    dic[DataType.pet] = float(clim_data_v)
-                elif StringClass.string_match(clim_flds[j], DataType.sr):
-                    dic[DataType.sr] = float(clim_data_v)
-                elif StringClass.string_match(clim_flds[j], DataType.ws):
-                    dic[DataType.ws] = float(clim_data_v)
-                elif StringClass.string_match(clim_flds[j], DataType.rm):
-                    dic[DataType.rm] = float(clim_data_v) * 0.01
-                elif StringClass.string_match(clim_flds[j], DataType.ssd):
-                    cur_ssd = float(clim_data_v)
-            # Get datetime and utc/local transformation
-            utc_time = HydroClimateUtilClass.get_utcdatetime_from_field_values(clim_flds,
-                                                                               cur_clim_data_item,
-                                                                               tsysin, tzonein)
-            dic[DataValueFields.local_time] = utc_time + timedelta(minutes=tzonein * 60)
-            dic[DataValueFields.time_zone] = tzonein
-            dic[DataValueFields.utc] = utc_time
-            dic[DataValueFields.y] = utc_time.year
-
-            # Do if some of these data are not provided
-            if DataType.mean_tmp not in list(dic.keys()):
-                dic[DataType.mean_tmp] = (dic[DataType.max_tmp] + dic[DataType.min_tmp]) / 2.
-            if DataType.sr not in list(dic.keys()):
-                if cur_ssd == DEFAULT_NODATA:
-                    raise ValueError(DataType.sr + ' or ' + DataType.ssd + ' must be provided!')
-                else:
-                    if dic[DataValueFields.id] in list(sites_info_dict.keys()):
-                        cur_lon, cur_lat = sites_info_dict[dic[DataValueFields.id]].lon_lat()
-                        sr = round(HydroClimateUtilClass.rs(DateClass.day_of_year(utc_time),
-                                                            float(cur_ssd), cur_lat * PI / 180.), 1)
-                        dic[DataType.sr] = sr
+        col_map = HydroClimateUtilClass.field_columns(clim_flds, [DataValueFields.id] +
+                                                      output_flds + [DataType.ssd])
+        data = numpy.array(clim_data_items[1:])
+        station_ids = data[:, col_map[DataValueFields.id]].astype(float).astype(int)
+        values = dict()
+        for fld in output_flds:
+            if fld in col_map:
+                values[fld] = data[:, col_map[fld]].astype(numpy.float64)
+        values[DataType.rm] *= 0.01
+        # Get datetime and utc/local transformation
+        utcs = HydroClimateUtilClass.get_utcdatetimes_from_columns(clim_flds, data,
+                                                                   tsysin, tzonein)
+        local_times = utcs + numpy.timedelta64(int(round(tzonein * 3600)), 's')
+        years = utcs.astype('datetime64[Y]').astype(int) + 1970
+
+        # Do if some of these data are not provided
+        if DataType.mean_tmp not in values:
+            values[DataType.mean_tmp] = (values[DataType.max_tmp] + values[DataType.min_tmp]) / 2.
+        if DataType.sr not in values:
+            ssd = None
+            if DataType.ssd in col_map:
+                ssd = data[:, col_map[DataType.ssd]].astype(numpy.float64)
+            if ssd is None or numpy.any(ssd == DEFAULT_NODATA):
+                raise ValueError(DataType.sr + ' or ' + DataType.ssd + ' must be provided!')
+            # latitude of each record, NaN for stations not in sites_info_dict
+            uniq_ids, inverse = numpy.unique(station_ids, return_inverse=True)
+            lats = numpy.array([sites_info_dict[sid].lon_lat()[1] if sid in sites_info_dict
+                                else numpy.nan for sid in uniq_ids.tolist()])[inverse]
+            doy = (utcs.astype('datetime64[D]') -
+                   utcs.astype('datetime64[Y]').astype('datetime64[D]')).astype(int) + 1
+            values[DataType.sr] = numpy.round(HydroClimateUtilClass.rs_array(doy, ssd,
+                                                                            lats * PI / 180.), 1)
 
+        # remove existed records, or find the newer records if incremental
+        inc = IncrementalImport(climdb, output_flds, incremental, check_fingerprint,
+                                bucket_store)
+        # Split records by station
+        order = numpy.argsort(station_ids, kind='mergesort')
+        uniq_ids, starts = numpy.unique(station_ids[order], return_index=True)
+        ends = numpy.append(starts[1:], len(order))
+        tasks = list()
+        affected = set()  # (station, year) with new mean temperature records
+        for sid, start, end in zip(uniq_ids.tolist(), starts, ends):
+            idx = order[start:end]
+            station_values = dict()
             for fld in output_flds:
-                cur_dic = dict()
-                if fld in list(dic.keys()):
-                    cur_dic[DataValueFields.value] = dic[fld]
-                    cur_dic[DataValueFields.id] = dic[
-                        DataValueFields.id]
-                    cur_dic[DataValueFields.utc] = dic[DataValueFields.utc]
-                    cur_dic[DataValueFields.time_zone] = dic[DataValueFields.time_zone]
-                    cur_dic[DataValueFields.local_time] = dic[DataValueFields.local_time]
-                    cur_dic[DataValueFields.type] = fld
-                    # Old code, insert or update one item a time, which is quite inefficiency
-                    # Update by using bulk operation interface. lj
-                    # # find old records and remove (deprecated because of low efficiency, lj.)
-                    # curfilter = {DataValueFields.type: fld,
-                    #              DataValueFields.utc: dic[DataValueFields.utc]}
-                    # bulk.find(curfilter).upsert().replace_one(cur_dic)
-                    bulk.insert(cur_dic)
-                    count += 1
-                    if count % 500 == 0:  # execute each 500 records
-                        MongoUtil.run_bulk(bulk)
-                        bulk = climdb[DBTableNames.data_values].initialize_ordered_bulk_op()
-
-            if dic[DataValueFields.id] not in list(hydro_climate_stats.keys()):
-                hydro_climate_stats[dic[DataValueFields.id]] = ClimateStats()
-            hydro_climate_stats[dic[DataValueFields.id]].add_item(dic)
-        # execute the remained records
-        if count % 500 != 0:
-            MongoUtil.run_bulk(bulk)
-        for item, cur_climate_stats in list(hydro_climate_stats.items()):
-            cur_climate_stats.annual_stats()
+                if fld not in values:
+                    continue
+                selected = inc.select(sid, fld, utcs[idx], values[fld][idx])
+                station_values[fld] = numpy.where(selected, values[fld][idx], numpy.nan)
+                if fld == DataType.mean_tmp:
+                    affected.update((sid, y) for y in numpy.unique(years[idx][selected]).tolist())
+            tasks.append((climdb.name, sid, utcs[idx], local_times[idx], tzonein,
+                          station_values))
+        if bucket_store is not None:
+            results = list()
+            for task in tasks:
+                sid, cur_utcs, cur_values = task[1], task[2], task[5]
+                results.append((sid, sum(bucket_store.merge_write(sid, fld, cur_utcs, v, tzonein)
+                                         for fld, v in cur_values.items())))
+        elif nprocs > 1 and len(tasks) > 1 and host is not None:
+            pool = Pool(min(nprocs, len(tasks)), initializer=init_meteorology_worker,
+                        initargs=(host, port))
+            results = pool.map(insert_station_data, tasks)
+            pool.close()
+            pool.join()
+        else:
+            coll = climdb[DBTableNames.data_values]
+            results = [(t[1], MongoUtil.insert_many_by_batch(coll, meteo_documents(*t[1:])))
+                       for t in tasks]
+        print('Daily meteorological data of %d stations, %d records imported.' %
+              (len(results), sum(count for _, count in results)))
+
         # Create index
         climdb[DBTableNames.data_values].create_index([(DataValueFields.id, ASCENDING),
                                                        (DataValueFields.type, ASCENDING),
                                                        (DataValueFields.utc, ASCENDING)])
-        # prepare dic for MongoDB
-        for s_id, stats_v in list(hydro_climate_stats.items()):
-            for YYYY in list(stats_v.Count.keys()):
-                cur_dic = dict()
-                cur_dic[DataValueFields.value] = stats_v.PHUTOT[YYYY]
-                cur_dic[DataValueFields.id] = s_id
-                cur_dic[DataValueFields.y] = YYYY
-                cur_dic[VariableDesc.unit] = 'heat units'
-                cur_dic[VariableDesc.type] = DataType.phu_tot
-                curfilter = {DataValueFields.id: s_id,
-                             VariableDesc.type: DataType.phu_tot,
-                             DataValueFields.y: YYYY}
-                climdb[DBTableNames.annual_stats].find_one_and_replace(curfilter, cur_dic,
-                                                                       upsert=True)
-                # import annual mean temperature
-                cur_dic[VariableDesc.type] = DataType.mean_tmp
-                cur_dic[VariableDesc.unit] = 'deg C'
-                cur_dic[DataValueFields.value] = stats_v.MeanTmp[YYYY]
-                curfilter = {DataValueFields.id: s_id,
-                             VariableDesc.type: DataType.mean_tmp,
-                             DataValueFields.y: YYYY}
-                climdb[DBTableNames.annual_stats].find_one_and_replace(curfilter, cur_dic,
-                                                                       upsert=True)
-            cur_dic[DataValueFields.value] = stats_v.PHU0
-            cur_dic[DataValueFields.id] = s_id
-            cur_dic[DataValueFields.y] = DEFAULT_NODATA
-            cur_dic[VariableDesc.unit] = 'heat units'
-            cur_dic[VariableDesc.type] = DataType.phu0
-            curfilter = {DataValueFields.id: s_id,
-                         VariableDesc.type: DataType.phu0,
-                         DataValueFields.y: DEFAULT_NODATA}
-            climdb[DBTableNames.annual_stats].find_one_and_replace(curfilter, cur_dic,
-                                                                   upsert=True)
-            # import annual mean temperature
-            cur_dic[VariableDesc.type] = DataType.mean_tmp0
-            cur_dic[VariableDesc.unit] = 'deg C'
-            cur_dic[DataValueFields.value] = stats_v.MeanTmp0
-            curfilter = {DataValueFields.id: s_id,
-                         VariableDesc.type: DataType.mean_tmp0,
-                         DataValueFields.y: DEFAULT_NODATA}
-            climdb[DBTableNames.annual_stats].find_one_and_replace(curfilter, cur_dic,
-                                                                   upsert=True)
+        inc.commit()
+        # Annual statistics, e.g., PHU, of each station and year
+        if not incremental:
+            hydro_climate_stats = ClimateStats(station_ids, years, values[DataType.mean_tmp])
+            climdb[DBTableNames.annual_stats].bulk_write(hydro_climate_stats.replace_requests(),
+                                                         ordered=False)
+            return
+        if not affected:
+            return
+        # all stored mean temperature of the affected stations
+        affected_ids = sorted(set(sid for sid, _ in affected))
+        if bucket_store is not None:
+            stored_ids, stored_years, stored_tmp = list(), list(), list()
+            for sid, (cur_utcs, cur_tmp) in bucket_store.read(affected_ids,
+                                                              DataType.mean_tmp).items():
+                stored_ids += [sid] * len(cur_utcs)
+                stored_years += (cur_utcs.astype('datetime64[Y]').astype(int) + 1970).tolist()
+                stored_tmp += cur_tmp.tolist()
+        else:
+            cursor = climdb[DBTableNames.data_values].find(
+                {DataValueFields.id: {'$in': affected_ids},
+                 DataValueFields.type: DataType.mean_tmp},
+                {DataValueFields.id: 1, DataValueFields.utc: 1, DataValueFields.value: 1,
+                 '_id': 0})
+            stored = [(doc[DataValueFields.id], doc[DataValueFields.utc].year,
+                       doc[DataValueFields.value]) for doc in cursor]
+            stored_ids, stored_years, stored_tmp = list(), list(), list()
+            if stored:
+                stored_ids, stored_years, stored_tmp = zip(*stored)
+        if not stored_ids:  # e.g., no mean temperature of the affected stations
+            print('WARNING: No mean temperature stored, annual statistics are not updated.')
+            return
+        hydro_climate_stats = ClimateStats(stored_ids, stored_years, stored_tmp)
+        climdb[DBTableNames.annual_stats].bulk_write(hydro_climate_stats.replace_requests(affected),
+                                                     ordered=False)
+        print('Annual statistics of %d station-years updated.' % len(affected))
 
     @staticmethod
     def workflow(cfg, clim_db):
         """Workflow"""
         print('Import Daily Meteorological Data... ')
         site_m_loc = HydroClimateUtilClass.query_climate_sites(clim_db, 'M')
-        ImportMeteoData.daily_data_from_txt(clim_db, cfg.Meteo_data, site_m_loc)
+        ImportMeteoData.daily_data_from_txt(clim_db, cfg.Meteo_data, site_m_loc, cfg.np,
+                                            cfg.clim_incremental, cfg.clim_fingerprint_check,
+                                            DataBucketStore.from_config(cfg, clim_db),
+                                            host=cfg.hostname, port=cfg.port)
 
 
 def main():
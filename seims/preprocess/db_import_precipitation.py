@@ -16,71 +16,134 @@ if os.path.abspath(os.path.join(sys.path[0], '..')) not in sys.path:
     sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '..')))
 
 import time
-from datetime import timedelta
+from multiprocessing import Pool
 
-from pygeoc.utils import StringClass
+import numpy
 from pymongo import ASCENDING
 
-from preprocess.db_mongodb import MongoUtil
+from preprocess.db_mongodb import ConnectMongoDB, MongoUtil
+from preprocess.hydro_climate_buckets import DataBucketStore
+from preprocess.hydro_climate_incremental import IncrementalImport
 from preprocess.hydro_climate_utility import HydroClimateUtilClass
 from preprocess.text import DBTableNames, DataValueFields, DataType
 from preprocess.utility import read_data_items_from_txt
 
 
+# Number of documents of one chunk to be generated and inserted by a worker
+PRECIPITATION_CHUNK = 100000
+
+# MongoDB client of each worker process, see `init_precipitation_worker`
+_WORKER_CLIENT = None
+
+
+def init_precipitation_worker(host, port):
+    """Initialize the pooled MongoDB client of current worker process."""
+    global _WORKER_CLIENT
+    _WORKER_CLIENT = ConnectMongoDB(host, port)
+
+
+def precipitation_documents(station_ids, utcs, local_times, tzone, values):
+    """Documents of DATA_VALUES from a wide precipitation table, i.e., one column per station.
+
+    Args:
+        station_ids: Station IDs of columns.
+        utcs: UTC datetimes of rows, numpy.datetime64 array.
+        local_times: Local datetimes of rows, numpy.datetime64 array.
+        tzone: Time zone.
+        values: 2D array with shape (len(utcs), len(station_ids)), NaN values are ignored.
+    """
+    rows, cols = numpy.nonzero(values == values)
+    utcs = utcs.tolist()
+    local_times = local_times.tolist()
+    return [{DataValueFields.value: v,
+             DataValueFields.id: station_ids[j],
+             DataValueFields.type: DataType.p,
+             DataValueFields.time_zone: tzone,
+             DataValueFields.local_time: local_times[i],
+             DataValueFields.utc: utcs[i]}
+            for i, j, v in zip(rows.tolist(), cols.tolist(), values[rows, cols].tolist())]
+
+
+def insert_precipitation_chunk(args):
+    """Insert DATA_VALUES of a chunk of rows by the pooled MongoDB client of current process."""
+    db_name, station_ids, utcs, local_times, tzone, values = args
+    coll = _WORKER_CLIENT.get_conn()[db_name][DBTableNames.data_values]
+    return MongoUtil.insert_many_by_batch(coll, precipitation_documents(station_ids, utcs,
+                                                                        local_times, tzone,
+                                                                        values))
+
+
 class ImportPrecipitation(object):
     """Import precipitation data, daily or storm."""
 
     @staticmethod
-    def regular_data_from_txt(climdb, data_file):
-        """Regular precipitation data from text file."""
-        # delete existed precipitation data
-        climdb[DBTableNames.data_values].remove({DataValueFields.type: DataType.p})
+    def regular_data_from_txt(climdb, data_file, incremental=False, check_fingerprint=False,
+                              bucket_store=None, nprocs=1, host=None, port=None):
+        """Regular precipitation data from text file.
+
+        The station columns are identified from the header once, and the table is parsed as
+        a 2D array. The rows are split into chunks of about `PRECIPITATION_CHUNK` documents,
+        which are generated and inserted by unordered `insert_many`, by `nprocs` processes
+        if greater than 1, each of which connects to MongoDB by `host` and `port`.
+
+        If `incremental` is True, only the records newer than the stored ones are imported,
+        see `IncrementalImport`.
+
+        If `bucket_store` is specified, the data are stored as buckets, see `DataBucketStore`.
+        """
         tsysin, tzonein = HydroClimateUtilClass.get_time_system_from_data_file(data_file)
         if tsysin == 'UTCTIME':
             tzonein = time.timezone / -3600
         clim_data_items = read_data_items_from_txt(data_file)
         clim_flds = clim_data_items[0]
-        station_id = list()
-        bulk = climdb[DBTableNames.data_values].initialize_ordered_bulk_op()
-        count = 0
-        for fld in clim_flds:
-            if not StringClass.string_in_list(fld,
-                                              [DataValueFields.dt, DataValueFields.y,
-                                               DataValueFields.m,
-                                               DataValueFields.d, DataValueFields.hour,
-                                               DataValueFields.minute, DataValueFields.second]):
-                station_id.append(fld)
-        for i, clim_data_item in enumerate(clim_data_items):
-            if i == 0:
-                continue
-            dic = dict()
-            precipitation = list()
-
-            for j, clim_data_v in enumerate(clim_data_item):
-                if StringClass.string_in_list(clim_flds[j], station_id):
-                    precipitation.append(float(clim_data_v))
-            utc_time = HydroClimateUtilClass.get_utcdatetime_from_field_values(clim_flds,
-                                                                               clim_data_item,
-                                                                               tsysin, tzonein)
-            dic[DataValueFields.local_time] = utc_time + timedelta(minutes=tzonein * 60)
-            dic[DataValueFields.time_zone] = tzonein
-            dic[DataValueFields.utc] = utc_time
+        time_cols = HydroClimateUtilClass.field_columns(clim_flds,
+                                                        [DataValueFields.dt, DataValueFields.y,
+                                                         DataValueFields.m, DataValueFields.d,
+                                                         DataValueFields.hour,
+                                                         DataValueFields.minute,
+                                                         DataValueFields.second]).values()
+        station_cols = [j for j in range(len(clim_flds)) if j not in time_cols]
+        station_id = [int(clim_flds[j]) for j in station_cols]
+        data = numpy.array(clim_data_items[1:]).reshape(len(clim_data_items) - 1,
+                                                        len(clim_flds))
+        precipitation = data[:, station_cols].astype(numpy.float64)
+        utcs = HydroClimateUtilClass.get_utcdatetimes_from_columns(clim_flds, data,
+                                                                   tsysin, tzonein)
+        local_times = utcs + numpy.timedelta64(int(round(tzonein * 3600)), 's')
+        # delete existed precipitation data, or find the newer records if incremental
+        inc = IncrementalImport(climdb, [DataType.p], incremental, check_fingerprint,
+                                bucket_store)
+        selected = numpy.column_stack([inc.select(cur_id, DataType.p, utcs,
+                                                  precipitation[:, j])
+                                       for j, cur_id in enumerate(station_id)])
+        inc.commit()
 
+        if bucket_store is not None:
+            count = 0
             for j, cur_id in enumerate(station_id):
-                cur_dic = dict()
-                cur_dic[DataValueFields.value] = precipitation[j]
-                cur_dic[DataValueFields.id] = int(cur_id)
-                cur_dic[DataValueFields.type] = DataType.p
-                cur_dic[DataValueFields.time_zone] = dic[DataValueFields.time_zone]
-                cur_dic[DataValueFields.local_time] = dic[DataValueFields.local_time]
-                cur_dic[DataValueFields.utc] = dic[DataValueFields.utc]
-                bulk.insert(cur_dic)
-                count += 1
-                if count % 500 == 0:  # execute each 500 records
-                    MongoUtil.run_bulk(bulk)
-                    bulk = climdb[DBTableNames.data_values].initialize_ordered_bulk_op()
-        if count % 500 != 0:
-            MongoUtil.run_bulk(bulk)
+                count += bucket_store.merge_write(cur_id, DataType.p, utcs[selected[:, j]],
+                                                  precipitation[selected[:, j], j], tzonein)
+            print('Precipitation data of %d stations, %d records imported as buckets.' %
+                  (len(station_id), count))
+            return
+
+        precipitation = numpy.where(selected, precipitation, numpy.nan)
+        chunk_rows = max(1, PRECIPITATION_CHUNK // max(1, len(station_id)))
+        tasks = [(climdb.name, station_id, utcs[i:i + chunk_rows],
+                  local_times[i:i + chunk_rows], tzonein, precipitation[i:i + chunk_rows])
+                 for i in range(0, len(utcs), chunk_rows)]
+        if nprocs > 1 and len(tasks) > 1 and host is not None:
+            pool = Pool(min(nprocs, len(tasks)), initializer=init_precipitation_worker,
+                        initargs=(host, port))
+            count = sum(pool.imap_unordered(insert_precipitation_chunk, tasks))
+            pool.close()
+            pool.join()
+        else:
+            coll = climdb[DBTableNames.data_values]
+            count = sum(MongoUtil.insert_many_by_batch(coll, precipitation_documents(*t[1:]))
+                        for t in tasks)
+        print('Precipitation data of %d stations, %d records imported.' % (len(station_id),
+                                                                          count))
         # Create index
         climdb[DBTableNames.data_values].create_index([(DataValueFields.id, ASCENDING),
                                                        (DataValueFields.type, ASCENDING),
@@ -90,7 +153,12 @@ class ImportPrecipitation(object):
     def workflow(cfg, clim_db):
         """Workflow"""
         print('Import Daily Precipitation Data... ')
-        ImportPrecipitation.regular_data_from_txt(clim_db, cfg.prec_data)
+        ImportPrecipitation.regular_data_from_txt(clim_db, cfg.prec_data,
+                                                  cfg.clim_incremental,
+                                                  cfg.clim_fingerprint_check,
+                                                  DataBucketStore.from_config(cfg, clim_db),
+                                                  nprocs=cfg.np, host=cfg.hostname,
+                                                  port=cfg.port)
 
 
 def main():
@@ -0,0 +1,124 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Migrate hydro-climate data between the document layout (DATA_VALUES) and the bucket layout
+    (DATA_BUCKETS), see `preprocess.hydro_climate_buckets`.
+
+        python db_migrate_data_buckets.py -db demo_dianbu2_HydroClimate -period YEAR
+        python db_migrate_data_buckets.py -db demo_dianbu2_HydroClimate -reverse
+
+    Irregular time series, e.g., storm precipitation, are kept in DATA_VALUES.
+    Buckets stored in GridFS can only be converted back to DATA_VALUES, since SEIMS reads
+    buckets from the DATA_BUCKETS collection only.
+"""
+from __future__ import absolute_import
+
+import argparse
+import os
+import sys
+import time
+if os.path.abspath(os.path.join(sys.path[0], '..')) not in sys.path:
+    sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '..')))
+
+import numpy
+
+from preprocess.db_mongodb import ConnectMongoDB, MongoUtil
+from preprocess.hydro_climate_buckets import DataBucketStore, unpack_bucket, series_interval, \
+    value_documents, BUCKET_YEAR, BUCKET_MONTH, STORAGE_COLLECTION, STORAGE_GRIDFS
+from preprocess.text import DBTableNames, DataValueFields
+
+
+def documents_to_buckets(climdb, store, types=None, drop=False):
+    """Convert the documents of DATA_VALUES to buckets.
+
+    Args:
+        climdb: Hydro-climate database.
+        store: `DataBucketStore` object.
+        types: (Optional) Data types to be converted, default is all.
+        drop: Remove the converted documents from DATA_VALUES.
+    """
+    coll = climdb[DBTableNames.data_values]
+    if types is None:
+        types = coll.distinct(DataValueFields.type)
+    for data_type in types:
+        for sid in coll.distinct(DataValueFields.id, {DataValueFields.type: data_type}):
+            query = {DataValueFields.id: sid, DataValueFields.type: data_type}
+            docs = list(coll.find(query, {DataValueFields.utc: 1, DataValueFields.value: 1,
+                                          DataValueFields.time_zone: 1, '_id': 0}
+                                  ).sort(DataValueFields.utc, 1))
+            utcs = numpy.array([doc[DataValueFields.utc] for doc in docs], dtype='datetime64[s]')
+            values = numpy.array([doc[DataValueFields.value] for doc in docs], dtype=float)
+            tzone = docs[0].get(DataValueFields.time_zone, 0)
+            try:
+                series_interval(utcs)
+            except ValueError as err:
+                print('WARNING: Station %s, type %s is kept in %s. %s' %
+                      (sid, data_type, DBTableNames.data_values, err))
+                continue
+            store.remove([data_type], sid)
+            count = store.merge_write(sid, data_type, utcs, values, tzone)
+            if drop:
+                coll.delete_many(query)
+            print('Station %s, type %s: %d records converted to buckets.' % (sid, data_type,
+                                                                              count))
+
+
+def buckets_to_documents(climdb, store, types=None, drop=False):
+    """Convert the buckets to documents of DATA_VALUES.
+
+    Args:
+        climdb: Hydro-climate database.
+        store: `DataBucketStore` object.
+        types: (Optional) Data types to be converted, default is all.
+        drop: Remove the converted buckets.
+    """
+    coll = climdb[DBTableNames.data_values]
+    if types is None:
+        types = store.coll.distinct('%s%s' % (store.prefix, DataValueFields.type))
+    for data_type in types:
+        count = 0
+        coll.delete_many({DataValueFields.type: data_type})
+        for doc, packed in store.find({DataValueFields.type: data_type}):
+            utcs, values = unpack_bucket(doc, packed)
+            docs = value_documents(doc[DataValueFields.id], data_type, utcs, values,
+                                   doc.get(DataValueFields.time_zone, 0))
+            count += MongoUtil.insert_many_by_batch(coll, docs)
+        if drop:
+            store.remove([data_type])
+        print('Type %s: %d records converted to documents.' % (data_type, count))
+
+
+def main():
+    """Migration tool entrance."""
+    parser = argparse.ArgumentParser(description='Migrate hydro-climate data between '
+                                                 'DATA_VALUES and DATA_BUCKETS.')
+    parser.add_argument('-host', type=str, default='127.0.0.1', help='MongoDB host')
+    parser.add_argument('-port', type=int, default=27017, help='MongoDB port')
+    parser.add_argument('-db', type=str, required=True, help='Hydro-climate database name')
+    parser.add_argument('-period', type=str, default=BUCKET_YEAR,
+                        choices=[BUCKET_YEAR, BUCKET_MONTH], help='Bucket period')
+    parser.add_argument('-storage', type=str, default=STORAGE_COLLECTION,
+                        choices=[STORAGE_COLLECTION, STORAGE_GRIDFS],
+                        help='Bucket storage, gridfs is allowed with -reverse only')
+    parser.add_argument('-types', type=str, nargs='*', help='Data types, default is all')
+    parser.add_argument('-drop', action='store_true', help='Remove the converted data')
+    parser.add_argument('-reverse', action='store_true',
+                        help='Convert buckets to documents of DATA_VALUES')
+    args = parser.parse_args()
+    if args.storage == STORAGE_GRIDFS and not args.reverse:
+        parser.error('SEIMS reads buckets from the DATA_BUCKETS collection only, '
+                     'buckets can not be written to GridFS.')
+
+    stime = time.time()
+    client = ConnectMongoDB(args.host, args.port)
+    climdb = client.get_conn()[args.db]
+    store = DataBucketStore(climdb, args.storage, args.period)
+    if args.reverse:
+        buckets_to_documents(climdb, store, args.types, args.drop)
+    else:
+        documents_to_buckets(climdb, store, args.types, args.drop)
+    client.close()
+    print('Migration done, time-consuming: %.2f seconds.' % (time.time() - stime))
+
+
+if __name__ == "__main__":
+    main()
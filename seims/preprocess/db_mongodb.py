@@ -14,7 +14,7 @@ if os.path.abspath(os.path.join(sys.path[0], '..')) not in sys.path:
     sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '..')))
 
 from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, InvalidOperation
+from pymongo.errors import BulkWriteError, ConnectionFailure, InvalidOperation
 
 from preprocess.text import DBTableNames, ModelParamFields
 
@@ -64,3 +64,21 @@ class MongoUtil(object):
             bulk.execute()
         except InvalidOperation:
             print('WARNING: %s' % errmsg)
+
+    @staticmethod
+    def insert_many_by_batch(coll, docs, batch_size=20000, errmsg=''):
+        """Insert documents by unordered `insert_many` of batches, do not raise exception.
+
+        Returns:
+            Number of inserted documents.
+        """
+        count = 0
+        for start in range(0, len(docs), batch_size):
+            try:
+                count += len(coll.insert_many(docs[start:start + batch_size],
+                                              ordered=False).inserted_ids)
+            except BulkWriteError as err:
+                count += err.details.get('nInserted', 0)
+                print('WARNING: %s %d documents failed to insert!' %
+                      (errmsg, len(err.details.get('writeErrors', list()))))
+        return count
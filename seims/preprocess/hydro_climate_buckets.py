@@ -0,0 +1,385 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Bucketed storage of hydro-climate time series, an alternative layout of DATA_VALUES.
+
+    One document per (station, type, year or month) bucket holds the packed float32 values
+    of a regular time series with the start time and the interval, i.e.,
+
+        {STATIONID: 1, TYPE: 'P', BUCKET: 2012, UTCSTART: datetime, UTCEND: datetime,
+         INTERVAL: 86400, NUM: 366, UTCOFFSET: 8, VALUES: <float32 binary>}
+
+    where the missing values inside a bucket are NaN. The buckets are stored in the
+    DATA_BUCKETS collection, or in the DATA_BUCKETS GridFS with the other fields as metadata.
+    Note that SEIMS reads buckets from the DATA_BUCKETS collection only, the GridFS storage is
+    read by the Python tools only and can not be used as the model input.
+
+    Irregular time series, e.g., storm precipitation, can not be packed, which are stored
+    as documents of DATA_VALUES and read along with the buckets.
+
+    Related settings in [CLIMATE] section of preprocess configuration:
+    `DataLayout` (document or bucket), `BucketPeriod` (YEAR or MONTH), and
+    `BucketStorage` (only collection is allowed for the model input).
+"""
+from __future__ import absolute_import
+
+import os
+import sys
+if os.path.abspath(os.path.join(sys.path[0], '..')) not in sys.path:
+    sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '..')))
+
+import numpy
+from bson import Binary
+from gridfs import GridFS
+from pymongo import ASCENDING, ReplaceOne
+
+from preprocess.db_mongodb import MongoUtil
+from preprocess.text import DBTableNames, DataValueFields, DataBucketFields
+
+LAYOUT_DOCUMENT = 'document'
+LAYOUT_BUCKET = 'bucket'
+BUCKET_YEAR = 'YEAR'
+BUCKET_MONTH = 'MONTH'
+STORAGE_COLLECTION = 'collection'
+STORAGE_GRIDFS = 'gridfs'
+
+
+def bucket_keys(utcs, period=BUCKET_YEAR):
+    """Bucket key of each time, i.e., year (e.g., 2012) or year and month (e.g., 201202)."""
+    utcs = numpy.asarray(utcs, dtype='datetime64[s]')
+    years = utcs.astype('datetime64[Y]').astype(numpy.int64) + 1970
+    if period == BUCKET_YEAR:
+        return years
+    months = utcs.astype('datetime64[M]').astype(numpy.int64) % 12 + 1
+    return years * 100 + months
+
+
+def series_interval(utcs, default=86400):
+    """Interval (seconds) of a regular time series, raise ValueError if irregular."""
+    diffs = numpy.diff(numpy.asarray(utcs, dtype='datetime64[s]').astype(numpy.int64))
+    if len(diffs) == 0:
+        return default
+    if numpy.any(diffs <= 0):
+        raise ValueError('Time series MUST be sorted and without duplicated time!')
+    interval = int(diffs.min())
+    if numpy.any(diffs % interval != 0):
+        raise ValueError('Only regular time series can be stored as buckets!')
+    return interval
+
+
+def pack_buckets(station_id, data_type, utcs, values, tzone, period=BUCKET_YEAR,
+                 interval=None):
+    """Pack a regular time series of one station and type into bucket documents.
+
+    Args:
+        station_id: Station ID.
+        data_type: Data type, e.g., DataType.p.
+        utcs: Sorted UTC times, numpy.datetime64 array.
+        values: Values, NaN for missing values.
+        tzone: Time zone, i.e., UTCOFFSET of DATA_VALUES.
+        period: BUCKET_YEAR or BUCKET_MONTH.
+        interval: (Optional) Interval in seconds, derived from `utcs` by default.
+    """
+    utcs = numpy.asarray(utcs, dtype='datetime64[s]')
+    values = numpy.asarray(values, dtype=numpy.float64)
+    if interval is None:
+        interval = series_interval(utcs)
+    keys = bucket_keys(utcs, period)
+    docs = list()
+    for key in numpy.unique(keys).tolist():
+        selected = keys == key
+        cur_utcs = utcs[selected]
+        offsets = (cur_utcs - cur_utcs[0]).astype(numpy.int64)
+        if numpy.any(offsets % interval != 0):
+            raise ValueError('Only regular time series can be stored as buckets!')
+        pos = offsets // interval
+        packed = numpy.full(pos[-1] + 1, numpy.nan, dtype='<f4')
+        packed[pos] = values[selected]
+        docs.append({DataValueFields.id: station_id,
+                     DataValueFields.type: data_type,
+                     DataBucketFields.bucket: key,
+                     DataBucketFields.utc_start: cur_utcs[0].tolist(),
+                     DataBucketFields.utc_end: cur_utcs[-1].tolist(),
+                     DataBucketFields.interval: interval,
+                     DataBucketFields.num: len(packed),
+                     DataValueFields.time_zone: tzone,
+                     DataBucketFields.values: Binary(packed.tobytes())})
+    return docs
+
+
+def value_documents(station_id, data_type, utcs, values, tzone):
+    """Documents of DATA_VALUES of one station and type, the missing values (NaN) are excluded.
+    """
+    utcs = numpy.asarray(utcs, dtype='datetime64[s]')
+    values = numpy.asarray(values, dtype=numpy.float64)
+    valid = values == values
+    local_times = utcs[valid] + numpy.timedelta64(int(round(tzone * 3600)), 's')
+    return [{DataValueFields.value: v,
+             DataValueFields.id: station_id,
+             DataValueFields.type: data_type,
+             DataValueFields.utc: utc,
+             DataValueFields.time_zone: tzone,
+             DataValueFields.local_time: local_time}
+            for utc, local_time, v in zip(utcs[valid].tolist(), local_times.tolist(),
+                                          values[valid].tolist())]
+
+
+def unpack_bucket(doc, values=None):
+    """UTC times and values of a bucket document.
+
+    Args:
+        doc: Bucket document.
+        values: (Optional) Packed values, read from GridFS.
+    """
+    if values is None:
+        values = doc[DataBucketFields.values]
+    values = numpy.frombuffer(bytes(values), dtype='<f4').astype(numpy.float64)
+    start = numpy.datetime64(doc[DataBucketFields.utc_start], 's')
+    utcs = start + numpy.arange(len(values)) * int(doc[DataBucketFields.interval])
+    return utcs, values
+
+
+class DataBucketStore(object):
+    """Read and write bucket documents of hydro-climate data."""
+
+    def __init__(self, climdb, storage=STORAGE_COLLECTION, period=BUCKET_YEAR):
+        """Initialization.
+
+        Args:
+            climdb: Hydro-climate database.
+            storage: STORAGE_COLLECTION or STORAGE_GRIDFS.
+            period: Bucket period of the written data, BUCKET_YEAR or BUCKET_MONTH.
+        """
+        self.climdb = climdb
+        self.storage = storage
+        self.period = period
+        self.gfs = None
+        self.prefix = ''
+        self.indexed = False
+        if storage == STORAGE_GRIDFS:
+            self.gfs = GridFS(climdb, DBTableNames.data_buckets)
+            self.coll = climdb['%s.files' % DBTableNames.data_buckets]
+            self.prefix = 'metadata.'
+        else:
+            self.coll = climdb[DBTableNames.data_buckets]
+
+    def create_indexes(self):
+        """Create indexes of buckets, only before writing, since readers may be read-only."""
+        if self.indexed:
+            return
+        self.coll.create_index([('%s%s' % (self.prefix, DataValueFields.id), ASCENDING),
+                                ('%s%s' % (self.prefix, DataValueFields.type), ASCENDING),
+                                ('%s%s' % (self.prefix, DataBucketFields.bucket), ASCENDING)])
+        self.indexed = True
+
+    @staticmethod
+    def from_config(cfg, climdb):
+        """Bucket store if DataLayout is bucket in preprocess configuration, otherwise None."""
+        if cfg.data_layout != LAYOUT_BUCKET:
+            return None
+        return DataBucketStore(climdb, cfg.bucket_storage, cfg.bucket_period)
+
+    @staticmethod
+    def detect(climdb, data_type):
+        """Bucket store of the given type if existed in database, otherwise None.
+
+        Only queries are executed, so that it can be used on a read-only database.
+        """
+        for storage, coll_name in [(STORAGE_COLLECTION, DBTableNames.data_buckets),
+                                   (STORAGE_GRIDFS, '%s.files' % DBTableNames.data_buckets)]:
+            prefix = 'metadata.' if storage == STORAGE_GRIDFS else ''
+            if climdb[coll_name].find_one({'%s%s' % (prefix, DataValueFields.type): data_type},
+                                          {'_id': 1}) is not None:
+                return DataBucketStore(climdb, storage)
+        return None
+
+    def _query(self, query):
+        """Add the prefix of metadata to field names of query for GridFS."""
+        return dict(('%s%s' % (self.prefix, k), v) for k, v in query.items())
+
+    def find(self, query, sort=None):
+        """Bucket documents and the packed values of query.
+
+        Returns:
+            List of (bucket document, packed values).
+        """
+        cursor = self.coll.find(self._query(query))
+        if sort is not None:
+            cursor = cursor.sort([('%s%s' % (self.prefix, k), v) for k, v in sort])
+        results = list()
+        for doc in cursor:
+            if self.gfs is None:
+                results.append((doc, doc[DataBucketFields.values]))
+            else:
+                results.append((doc['metadata'], self.gfs.get(doc['_id']).read()))
+        return results
+
+    def remove(self, types, station_id=None):
+        """Remove buckets of the given types, and station if specified."""
+        query = {DataValueFields.type: {'$in': list(types)}}
+        if station_id is not None:
+            query[DataValueFields.id] = station_id
+        if self.gfs is None:
+            self.coll.delete_many(query)
+            return
+        for doc in self.coll.find(self._query(query), {'_id': 1}):
+            self.gfs.delete(doc['_id'])
+
+    def write(self, docs):
+        """Write (replace) bucket documents."""
+        if not docs:
+            return
+        self.create_indexes()
+        if self.gfs is None:
+            requests = list()
+            for doc in docs:
+                curfilter = {DataValueFields.id: doc[DataValueFields.id],
+                             DataValueFields.type: doc[DataValueFields.type],
+                             DataBucketFields.bucket: doc[DataBucketFields.bucket]}
+                requests.append(ReplaceOne(curfilter, doc, upsert=True))
+            self.coll.bulk_write(requests, ordered=False)
+            return
+        for doc in docs:
+            curfilter = {DataValueFields.id: doc[DataValueFields.id],
+                         DataValueFields.type: doc[DataValueFields.type],
+                         DataBucketFields.bucket: doc[DataBucketFields.bucket]}
+            for old in self.coll.find(self._query(curfilter), {'_id': 1}):
+                self.gfs.delete(old['_id'])
+            metadata = dict((k, v) for k, v in doc.items() if k != DataBucketFields.values)
+            fname = '%d_%s_%d' % (doc[DataValueFields.id], doc[DataValueFields.type],
+                                  doc[DataBucketFields.bucket])
+            self.gfs.put(bytes(doc[DataBucketFields.values]), filename=fname,
+                         metadata=metadata)
+
+    def merge_write(self, station_id, data_type, utcs, values, tzone):
+        """Merge the records into the existed buckets of the same keys and write.
+
+        If the merged series is irregular, e.g., storm precipitation, the records of the station
+        and type are written to DATA_VALUES instead, the same as the migration tool.
+
+        Returns:
+            Number of written records (not NaN).
+        """
+        utcs = numpy.asarray(utcs, dtype='datetime64[s]')
+        values = numpy.asarray(values, dtype=numpy.float64)
+        valid = values == values
+        utcs = utcs[valid]
+        values = values[valid]
+        if len(utcs) == 0:
+            return 0
+        keys = numpy.unique(bucket_keys(utcs, self.period)).tolist()
+        old_utcs = [numpy.array([], dtype='datetime64[s]')]
+        old_values = [numpy.array([], dtype=numpy.float64)]
+        for doc, packed in self.find({DataValueFields.id: station_id,
+                                      DataValueFields.type: data_type,
+                                      DataBucketFields.bucket: {'$in': keys}}):
+            cur_utcs, cur_values = unpack_bucket(doc, packed)
+            old_utcs.append(cur_utcs)
+            old_values.append(cur_values)
+        # the new records override the existed ones at the same time
+        all_utcs = numpy.concatenate(old_utcs + [utcs])
+        all_values = numpy.concatenate(old_values + [values])
+        order = numpy.argsort(all_utcs, kind='mergesort')[::-1]
+        uniq_utcs, first = numpy.unique(all_utcs[order], return_index=True)
+        merged = all_values[order][first]
+        valid = merged == merged
+        uniq_utcs = uniq_utcs[valid]
+        merged = merged[valid]
+        coll = self.climdb[DBTableNames.data_values]
+        docs = None
+        if coll.find_one({DataValueFields.id: station_id, DataValueFields.type: data_type},
+                         {'_id': 1}) is None:
+            try:
+                docs = pack_buckets(station_id, data_type, uniq_utcs, merged, tzone, self.period)
+            except ValueError as err:
+                print('WARNING: Station %s, type %s is stored in %s. %s' %
+                      (station_id, data_type, DBTableNames.data_values, err))
+        if docs is None:  # irregular, or stored in DATA_VALUES already
+            # move the other buckets of the station and type to DATA_VALUES too
+            for doc, packed in self.find({DataValueFields.id: station_id,
+                                          DataValueFields.type: data_type,
+                                          DataBucketFields.bucket: {'$nin': keys}}):
+                cur_utcs, cur_values = unpack_bucket(doc, packed)
+                uniq_utcs = numpy.concatenate((uniq_utcs, cur_utcs))
+                merged = numpy.concatenate((merged, cur_values))
+            order = numpy.argsort(uniq_utcs, kind='mergesort')
+            uniq_utcs = uniq_utcs[order]
+            merged = merged[order]
+            self.remove([data_type], station_id)
+            coll.delete_many({DataValueFields.id: station_id, DataValueFields.type: data_type,
+                              DataValueFields.utc: {'$gte': uniq_utcs[0].tolist(),
+                                                    '$lte': uniq_utcs[-1].tolist()}})
+            MongoUtil.insert_many_by_batch(coll, value_documents(station_id, data_type,
+                                                                 uniq_utcs, merged, tzone))
+            return len(values)
+        self.write(docs)
+        return len(values)
+
+    def read(self, station_ids, data_type, start_time=None, end_time=None):
+        """Read the time series of stations, the missing values (NaN) are excluded.
+
+        The stations without buckets are read from DATA_VALUES, e.g., irregular time series.
+
+        Returns:
+            {station ID: (UTC times as numpy.datetime64 array, values)}
+        """
+        query = {DataValueFields.id: {'$in': list(station_ids)},
+                 DataValueFields.type: data_type}
+        if start_time is not None:
+            query[DataBucketFields.utc_end] = {'$gte': start_time}
+        if end_time is not None:
+            query[DataBucketFields.utc_start] = {'$lte': end_time}
+        series = dict()
+        for doc, packed in self.find(query, sort=[(DataBucketFields.utc_start, ASCENDING)]):
+            cur_utcs, cur_values = unpack_bucket(doc, packed)
+            series.setdefault(doc[DataValueFields.id], list()).append((cur_utcs, cur_values))
+        for sid, parts in series.items():
+            utcs = numpy.concatenate([p[0] for p in parts])
+            values = numpy.concatenate([p[1] for p in parts])
+            selected = values == values
+            if start_time is not None:
+                selected &= utcs >= numpy.datetime64(start_time, 's')
+            if end_time is not None:
+                selected &= utcs <= numpy.datetime64(end_time, 's')
+            series[sid] = (utcs[selected], values[selected])
+        others = [sid for sid in station_ids if sid not in series]
+        if not others:
+            return series
+        query = {DataValueFields.id: {'$in': others}, DataValueFields.type: data_type}
+        if start_time is not None or end_time is not None:
+            query[DataValueFields.utc] = dict()
+        if start_time is not None:
+            query[DataValueFields.utc]['$gte'] = start_time
+        if end_time is not None:
+            query[DataValueFields.utc]['$lte'] = end_time
+        records = dict()
+        for doc in self.climdb[DBTableNames.data_values].find(
+                query, {DataValueFields.id: 1, DataValueFields.utc: 1,
+                        DataValueFields.value: 1, '_id': 0}).sort(DataValueFields.utc, ASCENDING):
+            records.setdefault(doc[DataValueFields.id], list()).append(
+                (doc[DataValueFields.utc], doc[DataValueFields.value]))
+        for sid, items in records.items():
+            series[sid] = (numpy.array([t for t, _ in items], dtype='datetime64[s]'),
+                           numpy.array([v for _, v in items], dtype=numpy.float64))
+        return series
+
+    def last_utc(self, types):
+        """Last UTC time of each station and type, including the ones stored in DATA_VALUES.
+
+        Returns:
+            {(station ID, type): datetime}
+        """
+        pipeline = [{'$match': self._query({DataValueFields.type: {'$in': list(types)}})},
+                    {'$group': {'_id': {'id': '$%s%s' % (self.prefix, DataValueFields.id),
+                                        'type': '$%s%s' % (self.prefix, DataValueFields.type)},
+                                'last': {'$max': '$%s%s' % (self.prefix,
+                                                            DataBucketFields.utc_end)}}}]
+        last = dict()
+        for doc in self.coll.aggregate(pipeline, allowDiskUse=True):
+            last[(doc['_id']['id'], doc['_id']['type'])] = doc['last']
+        pipeline = [{'$match': {DataValueFields.type: {'$in': list(types)}}},
+                    {'$group': {'_id': {'id': '$%s' % DataValueFields.id,
+                                        'type': '$%s' % DataValueFields.type},
+                                'last': {'$max': '$%s' % DataValueFields.utc}}}]
+        for doc in self.climdb[DBTableNames.data_values].aggregate(pipeline, allowDiskUse=True):
+            last.setdefault((doc['_id']['id'], doc['_id']['type']), doc['last'])
+        return last
@@ -3,25 +3,180 @@
 """Interpolate hydro-climate data from not regular observed data to desired time interval.
    This script is not intended to be integrated into SEIMS preprocess workflow.
    This function can be integrated into HydroClimateUtilClass in the future.
+
+        python hydro_climate_data_itp.py -in <data file> -interval 60 1440
+                                         -start "2011-01-01 00:00:00"
+                                         -end "2011-12-31 23:59:59"
+
     @author   : Liangjun Zhu
     @changelog: 17-07-25  lj - initial implementation
                 18-02-08  lj - compatible with Python3.\n
 """
 from __future__ import absolute_import
 
+import argparse
 import time
-from collections import OrderedDict
-from datetime import timedelta
 import os
 import sys
 if os.path.abspath(os.path.join(sys.path[0], '..')) not in sys.path:
     sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '..')))
 
+import numpy
 from pygeoc.utils import FileClass, StringClass, MathClass
 
 from preprocess.hydro_climate_utility import HydroClimateUtilClass
 from preprocess.utility import read_data_items_from_txt
 
+# available field
+AVAILABLE_FIELDS = ['FLOW', 'SED', 'PCP']
+
+
+def check_available_field(cur_fld):
+    """Check if the given field name is supported."""
+    for fff in AVAILABLE_FIELDS:
+        if fff.lower() in cur_fld.lower():
+            return True
+    return False
+
+
+def regular_interval_starts(stime, etime, time_interval, day_divided_hour=0):
+    """Start datetimes of regular time intervals from `stime` to `etime` (inclusive).
+
+    Args:
+        stime: Start time, numpy.datetime64[s].
+        etime: End time, numpy.datetime64[s].
+        time_interval: Time interval, unit is minute.
+        day_divided_hour: Divided hour of day, works when time_interval is N*1440.
+    Returns:
+        numpy.datetime64[s] array.
+    """
+    if time_interval % 1440 == 0:
+        stime = stime.astype('datetime64[D]').astype('datetime64[s]') + \
+                numpy.timedelta64(day_divided_hour * 3600, 's')
+    delta = numpy.timedelta64(time_interval * 60, 's')
+    if etime < stime:
+        return numpy.array([], dtype='datetime64[s]')
+    num = (etime - stime) // delta + 1
+    return stime + numpy.arange(num) * delta
+
+
+def resample_regular_intervals(times, values, flds, time_intervals, stime, etime,
+                               eliminate_zero=False, day_divided_hour=0):
+    """Resample not regular observed data to one or more regular time intervals.
+
+    The observed values are regarded as step functions, i.e., each value holds until the next
+    record. For each time interval [s, e), records within it and at most one preceding record
+    that is less than one time interval before s are taken into account, the time interval
+    without records is 0 (or eliminated).
+
+      - PCP (mm/h) is integrated over time, i.e., the output is mm.
+      - FLOW (m3/s) is averaged over the whole time interval.
+      - SED (g/L) is weighted by FLOW, which must be provided.
+
+    The cumulative integrals of all fields are computed once, and the bounds of time intervals
+    are located by `numpy.searchsorted`, therefore the cost is linear to the number of records
+    and time intervals.
+
+    Args:
+        times: Datetimes of records, numpy.datetime64[s] array-like.
+        values: Values of records, 2D array-like, with shape (len(times), len(flds)).
+        flds: Field names, the unsupported fields are output as 0.
+        time_intervals: Time interval(s), unit is minute.
+        stime: Start time, datetime or numpy.datetime64.
+        etime: End time, see also stime.
+        eliminate_zero: Boolean flag. If true, the time interval without original records will
+                        not be output.
+        day_divided_hour: See `interpolate_observed_data_to_regular_interval()`.
+    Returns:
+        {time_interval: (start datetimes (numpy.datetime64[s]), values (2D numpy array))}
+    """
+    if not 0 <= day_divided_hour <= 23:
+        raise ValueError('Day divided hour must range from 0 to 23!')
+    if isinstance(time_intervals, (int, float)):
+        time_intervals = [time_intervals]
+    times = numpy.asarray(times, dtype='datetime64[s]')
+    values = numpy.asarray(values, dtype=float).reshape(len(times), len(flds))
+    # sort by time, and the last one is kept for duplicated times
+    order = numpy.argsort(times, kind='mergesort')
+    times = times[order]
+    values = values[order]
+    keep = numpy.append(times[1:] != times[:-1], True) if len(times) else numpy.array([], bool)
+    times = times[keep]
+    values = values[keep]
+    secs = (times - numpy.datetime64(0, 's')).astype(numpy.int64).astype(float)
+
+    # integrands of supported fields, and the auxiliary FLOW for SED
+    flow_idx = -1
+    for v_idx, v_name in enumerate(flds):
+        if 'FLOW' in v_name.upper():
+            flow_idx = v_idx
+            break
+    integrands = numpy.zeros((len(times), len(flds) + 1))
+    for v_idx, v_name in enumerate(flds):
+        if not check_available_field(v_name):
+            continue
+        if 'SED' in v_name.upper():
+            if flow_idx < 0:
+                raise RuntimeError('To interpolate SED, FLOW must be provided!')
+            integrands[:, v_idx] = values[:, v_idx] * values[:, flow_idx]
+        else:
+            integrands[:, v_idx] = values[:, v_idx]
+    if flow_idx >= 0:
+        integrands[:, -1] = values[:, flow_idx]
+    # cumulative integrals at each record, i.e., cum[j] = integral from times[0] to times[j]
+    cum = numpy.zeros_like(integrands)
+    if len(times) > 1:
+        cum[1:] = numpy.cumsum(integrands[:-1] * numpy.diff(secs)[:, numpy.newaxis], axis=0)
+
+    def integral_to(idx, secs_to):
+        """Integrals from times[0] to `secs_to`, where `idx` is the index of preceding record."""
+        return cum[idx] + integrands[idx] * (secs_to - secs[idx])[:, numpy.newaxis]
+
+    stime = numpy.datetime64(stime, 's')
+    etime = numpy.datetime64(etime, 's')
+    results = dict()
+    for time_interval in time_intervals:
+        starts = regular_interval_starts(stime, etime, time_interval, day_divided_hour)
+        delta_secs = time_interval * 60.
+        s_secs = (starts - numpy.datetime64(0, 's')).astype(numpy.int64).astype(float)
+        e_secs = s_secs + delta_secs
+        lo = numpy.searchsorted(secs, s_secs, side='left')
+        hi = numpy.searchsorted(secs, e_secs, side='left')
+        has_rec = hi > lo
+        itp = numpy.zeros((len(starts), len(flds)))
+        if has_rec.any():
+            lo = lo[has_rec]
+            hi = hi[has_rec]
+            s_rec = s_secs[has_rec]
+            prev = numpy.maximum(lo - 1, 0)
+            pre_added = (lo > 0) & (secs[prev] < s_rec) & (s_rec < secs[lo]) & \
+                        (s_rec - secs[prev] < delta_secs)
+            begin_idx = numpy.where(pre_added, prev, lo)
+            begin_secs = numpy.where(pre_added, s_rec, secs[lo])
+            sums = integral_to(hi - 1, e_secs[has_rec]) - integral_to(begin_idx, begin_secs)
+            cur = numpy.zeros((len(lo), len(flds)))
+            for v_idx, v_name in enumerate(flds):
+                if not check_available_field(v_name):
+                    continue
+                if 'SED' in v_name.upper():
+                    zero_flow = numpy.isclose(sums[:, -1], 0.)
+                    for dt in starts[has_rec][zero_flow].tolist():
+                        print('WARNING: Flow is 0 for %s, please check!' %
+                              dt.strftime('%Y-%m-%d %H:%M:%S'))
+                    cur[:, v_idx] = numpy.where(zero_flow, 0.,
+                                                sums[:, v_idx] / numpy.where(zero_flow, 1.,
+                                                                             sums[:, -1]))
+                elif 'FLOW' in v_name.upper():
+                    cur[:, v_idx] = sums[:, v_idx] / delta_secs
+                elif 'PCP' in v_name.upper():  # the input is mm/h, and output is mm
+                    cur[:, v_idx] = sums[:, v_idx] / 3600.
+            itp[has_rec] = numpy.round(cur, 4)
+        if eliminate_zero:
+            starts = starts[has_rec]
+            itp = itp[has_rec]
+        results[time_interval] = (starts, itp)
+    return results
+
 
 def interpolate_observed_data_to_regular_interval(in_file, time_interval, start_time, end_time,
                                                   eliminate_zero=False,
@@ -37,7 +192,8 @@ def interpolate_observed_data_to_regular_interval(in_file, time_interval, start_
                  ...
                  Field name can be PCP, FLOW, SED
                  the unit is mm/h, m3/s, g/L (i.e., kg/m3), respectively.
-        time_interval: time interval, unit is minute, e.g., daily output is 1440
+        time_interval: time interval, unit is minute, e.g., daily output is 1440.
+                       A list of time intervals is also supported, e.g., [60, 1440].
         start_time: start time, the format must be 'YYYY-mm-dd HH:MM:SS', and the time system
                     is based on time_sys.
         end_time: end time, see also start_time.
@@ -58,6 +214,7 @@ def interpolate_observed_data_to_regular_interval(in_file, time_interval, start_
         The output data files are located in the same directory with the input file.
         The nomenclature is: <field name>_<time system>_<time interval>_<nonzero>, e.g.,
         pcp_utctime_1440_nonzero.txt, flow_localtime_60.txt
+        The list of output files is returned.
     """
     FileClass.check_file_exists(in_file)
     time_sys_input, time_zone_input = HydroClimateUtilClass.get_time_system_from_data_file(in_file)
@@ -68,22 +225,9 @@ def interpolate_observed_data_to_regular_interval(in_file, time_interval, start_
         raise ValueError('Day divided hour must range from 0 to 23!')
     try:
         date_idx = flds.index('DATETIME')
-        flds.remove('DATETIME')
     except ValueError:
         raise ValueError('DATETIME must be one of the fields!')
-    # available field
-    available_flds = ['FLOW', 'SED', 'PCP']
-
-    def check_avaiable_field(cur_fld):
-        """Check if the given field name is supported."""
-        support_flag = False
-        for fff in available_flds:
-            if fff.lower() in cur_fld.lower():
-                support_flag = True
-                break
-        return support_flag
-
-    ord_data = OrderedDict()
+
     time_zone_output = time.timezone / -3600
     if time_sys_output.lower().find('local') >= 0:
         tmpstrs = StringClass.split_string(time_sys_output, [' '])
@@ -93,140 +237,77 @@ def interpolate_observed_data_to_regular_interval(in_file, time_interval, start_
     else:
         time_sys_output = 'UTCTIME'
         time_zone_output = 0
-    for item in data_items:
-        org_datetime = StringClass.get_datetime(item[date_idx])
-        if time_sys_input == 'LOCALTIME':
-            org_datetime -= timedelta(hours=time_zone_input)
-        # now, org_datetime is UTC time.
-        if time_sys_output == 'LOCALTIME':
-            org_datetime += timedelta(hours=time_zone_output)
-        # now, org_datetime is consistent with the output time system
-        ord_data[org_datetime] = list()
-        for i, v in enumerate(item):
-            if i == date_idx:
-                continue
-            if MathClass.isnumerical(v):
-                ord_data[org_datetime].append(float(v))
-            else:
-                ord_data[org_datetime].append(v)
-    # print(ord_data)
-    itp_data = OrderedDict()
-    out_time_delta = timedelta(minutes=time_interval)
-    sdatetime = StringClass.get_datetime(start_time)
-    edatetime = StringClass.get_datetime(end_time)
-    item_dtime = sdatetime
-    if time_interval % 1440 == 0:
-        item_dtime = sdatetime.replace(hour=0, minute=0, second=0) + \
-                     timedelta(minutes=day_divided_hour * 60)
-    while item_dtime <= edatetime:
-        # print(item_dtime)
-        # if item_dtime.month == 12 and item_dtime.day == 31:
-        #     print("debug")
-        sdt = item_dtime  # start datetime of records
-        edt = item_dtime + out_time_delta  # end datetime of records
-        # get original data items
-        org_items = list()
-        pre_dt = list(ord_data.keys())[0]
-        pre_added = False
-        for i, v in list(ord_data.items()):
-            if sdt <= i < edt:
-                if not pre_added and pre_dt < sdt < i and sdt - pre_dt < out_time_delta:
-                    # only add one item that less than sdt.
-                    org_items.append([pre_dt] + ord_data.get(pre_dt))
-                    pre_added = True
-                org_items.append([i] + v)
-            if i > edt:
-                break
-            pre_dt = i
-        if len(org_items) > 0:
-            org_items.append([edt])  # Just add end time for compute convenient
-            if org_items[0][0] < sdt:
-                org_items[0][0] = sdt  # set the begin datetime of current time interval
-        # if eliminate time interval without original records
-        # initial interpolated list
-        itp_data[item_dtime] = [0.] * len(flds)
-        if len(org_items) == 0:
-            if eliminate_zero:
-                itp_data.popitem()
-            item_dtime += out_time_delta
-            continue
-        # core interpolation code
-        flow_idx = -1
-        for v_idx, v_name in enumerate(flds):
-            if not check_avaiable_field(v_name):
-                continue
-            if 'SED' in v_name.upper():  # FLOW must be existed
-                for v_idx2, v_name2 in enumerate(flds):
-                    if 'FLOW' in v_name2.upper():
-                        flow_idx = v_idx2
-                        break
-                if flow_idx < 0:
-                    raise RuntimeError('To interpolate SED, FLOW must be provided!')
-        for v_idx, v_name in enumerate(flds):
-            if not check_avaiable_field(v_name):
-                continue
-            itp_value = 0.
-            itp_auxiliary_value = 0.
-            for org_item_idx, org_item_dtv in enumerate(org_items):
-                if org_item_idx == 0:
-                    continue
-                org_item_dt = org_item_dtv[0]
-                pre_item_dtv = org_items[org_item_idx - 1]
-                pre_item_dt = pre_item_dtv[0]
-                tmp_delta_dt = org_item_dt - pre_item_dt
-                tmp_delta_secs = tmp_delta_dt.days * 86400 + tmp_delta_dt.seconds
-                if 'SED' in v_name.upper():
-                    itp_value += pre_item_dtv[v_idx + 1] * pre_item_dtv[flow_idx + 1] * \
-                                 tmp_delta_secs
-                    itp_auxiliary_value += pre_item_dtv[flow_idx + 1] * tmp_delta_secs
-                else:
-                    itp_value += pre_item_dtv[v_idx + 1] * tmp_delta_secs
-            if 'SED' in v_name.upper():
-                if MathClass.floatequal(itp_auxiliary_value, 0.):
-                    itp_value = 0.
-                    print('WARNING: Flow is 0 for %s, please check!' %
-                          item_dtime.strftime('%Y-%m-%d %H:%M:%S'))
-                itp_value /= itp_auxiliary_value
-            elif 'FLOW' in v_name.upper():
-                itp_value /= (out_time_delta.days * 86400 + out_time_delta.seconds)
-            elif 'PCP' in v_name.upper():  # the input is mm/h, and output is mm
-                itp_value /= 3600.
-            itp_data[item_dtime][v_idx] = round(itp_value, 4)
-        item_dtime += out_time_delta
-
-    # for i, v in itp_data.items():
-    #     print(i, v)
+    # datetimes consistent with the output time system
+    org_datetimes = HydroClimateUtilClass.get_utcdatetimes_from_columns(flds, data_items,
+                                                                        time_sys_input,
+                                                                        time_zone_input)
+    org_datetimes += numpy.timedelta64(int(round(time_zone_output * 3600)), 's')
+    val_idxs = [i for i in range(len(flds)) if i != date_idx]
+    val_flds = [flds[i] for i in val_idxs]
+    org_values = numpy.array([[float(item[i]) if MathClass.isnumerical(item[i]) else 0.
+                               for i in val_idxs] for item in data_items],
+                             dtype=float).reshape(len(data_items), len(val_flds))
+
+    if isinstance(time_interval, (int, float)):
+        time_interval = [time_interval]
+    itp_data = resample_regular_intervals(org_datetimes, org_values, val_flds, time_interval,
+                                          StringClass.get_datetime(start_time),
+                                          StringClass.get_datetime(end_time),
+                                          eliminate_zero, day_divided_hour)
     # output to files
     work_path = os.path.dirname(in_file)
     header_str = '#' + time_sys_output
     if time_sys_output == 'LOCALTIME':
         header_str = header_str + ' ' + str(time_zone_output)
-    for idx, fld in enumerate(flds):
-        if not check_avaiable_field(fld):
-            continue
-        file_name = fld + '_' + time_sys_output + '_' + str(time_interval)
-        if eliminate_zero:
-            file_name += '_nonzero'
-        file_name += '.txt'
-        out_file = work_path + os.path.sep + file_name
-        with open(out_file, 'w') as f:
-            f.write(header_str + '\n')
-            f.write('DATETIME,' + fld + '\n')
-            for i, v in list(itp_data.items()):
-                cur_line = i.strftime('%Y-%m-%d %H:%M:%S') + ',' + str(v[idx]) + '\n'
-                f.write(cur_line)
+    out_files = list()
+    for interval in time_interval:
+        starts, values = itp_data[interval]
+        dt_strs = numpy.datetime_as_string(starts, unit='s')
+        for idx, fld in enumerate(val_flds):
+            if not check_available_field(fld):
+                continue
+            file_name = fld + '_' + time_sys_output + '_' + str(interval)
+            if eliminate_zero:
+                file_name += '_nonzero'
+            file_name += '.txt'
+            out_file = work_path + os.path.sep + file_name
+            with open(out_file, 'w') as f:
+                f.write(header_str + '\n')
+                f.write('DATETIME,' + fld + '\n')
+                f.write(''.join('%s,%s\n' % (dt_str.replace('T', ' '), str(v))
+                                for dt_str, v in zip(dt_strs, values[:, idx].tolist())))
+            out_files.append(out_file)
+    return out_files
+
 
 def main():
-    """TEST CODE"""
-    data_file = r'C:\z_data\ChangTing\observed\HE3520133140\2011\2011_flowsed_storm_not_regular.txt'
-    time_interval = 1440
-    stime = '2011-01-01 00:00:00'
-    etime = '2011-12-31 23:59:59'
-    elim_zero = False
-    out_time_system = 'UTCTIME'
-    divided_hour = 0
-    interpolate_observed_data_to_regular_interval(data_file, time_interval, stime, etime,
-                                                  elim_zero, out_time_system, divided_hour)
+    """Command line entrance."""
+    parser = argparse.ArgumentParser(description='Interpolate not regular observed data to '
+                                                 'regular time interval data.')
+    parser.add_argument('-in', dest='in_file', type=str, required=True,
+                        help='Input data file, e.g., flowsed_storm_not_regular.txt')
+    parser.add_argument('-interval', type=int, nargs='+', default=[1440],
+                        help='Time interval(s) in minute, e.g., 60 1440')
+    parser.add_argument('-start', type=str, required=True,
+                        help='Start time, e.g., "2011-01-01 00:00:00"')
+    parser.add_argument('-end', type=str, required=True,
+                        help='End time, e.g., "2011-12-31 23:59:59"')
+    parser.add_argument('-nonzero', action='store_true',
+                        help='Eliminate the time intervals without original records')
+    parser.add_argument('-timesys', type=str, default='UTCTIME',
+                        help='Output time system, e.g., UTCTIME, "LOCALTIME 8"')
+    parser.add_argument('-dayhour', type=int, default=0,
+                        help='Day divided hour for N*1440 time interval')
+    args = parser.parse_args()
+
+    stime = time.time()
+    out_files = interpolate_observed_data_to_regular_interval(args.in_file, args.interval,
+                                                              args.start, args.end,
+                                                              args.nonzero, args.timesys,
+                                                              args.dayhour)
+    for out_file in out_files:
+        print('Output: %s' % out_file)
+    print('Time-consuming: %.2f seconds.' % (time.time() - stime))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,161 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Incremental import of hydro-climate data, e.g., daily meteorological and precipitation data.
+
+    Only the records newer than the last stored UTC time of each station and type
+    are imported. Optionally, the fingerprint (MD5 of UTC times and values) of the historical
+    records stored in `DATA_FINGERPRINTS` is compared with the historical rows of the data
+    file, and the series is fully re-imported if any historical row has been edited.
+"""
+from __future__ import absolute_import
+
+import hashlib
+import os
+import sys
+if os.path.abspath(os.path.join(sys.path[0], '..')) not in sys.path:
+    sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '..')))
+
+import numpy
+from pymongo import ASCENDING, ReplaceOne
+
+from preprocess.text import DBTableNames, DataValueFields, DataFingerprintFields
+
+
+def series_fingerprint(utcs, values):
+    """MD5 fingerprint of a time series, NaN values are ignored.
+
+    Args:
+        utcs: UTC times, numpy.datetime64 array.
+        values: Values, numpy array.
+    """
+    values = numpy.asarray(values, dtype=numpy.float64)
+    valid = values == values
+    md5 = hashlib.md5()
+    md5.update(numpy.asarray(utcs, dtype='datetime64[s]')[valid].astype(numpy.int64).tobytes())
+    md5.update(values[valid].tobytes())
+    return md5.hexdigest()
+
+
+class IncrementalImport(object):
+    """Select the records to be imported of each station and type.
+
+    Usage:
+        inc = IncrementalImport(climdb, [DataType.p], incremental=True, check_fingerprint=True)
+        selected = inc.select(station_id, DataType.p, utcs, values)
+        ... insert values[selected] ...
+        inc.commit()
+    """
+
+    def __init__(self, climdb, types, incremental=False, check_fingerprint=False,
+                 bucket_store=None):
+        """Initialization.
+
+        Args:
+            climdb: Hydro-climate database.
+            types: Data types, e.g., [DataType.p].
+            incremental: Import newer records only, otherwise remove all records of `types`.
+            check_fingerprint: Check the fingerprints of historical records (incremental only).
+            bucket_store: (Optional) `DataBucketStore` if the bucket layout is used.
+        """
+        self.climdb = climdb
+        self.bucket_store = bucket_store
+        self.types = list(types)
+        self.incremental = incremental
+        self.check_fingerprint = incremental and check_fingerprint
+        self.last_utc = dict()  # {(station, type): last UTC time}
+        self.fingerprints = dict()  # {(station, type): fingerprint document}
+        self.reimported = list()  # [(station, type)] re-imported since historical rows edited
+        self.requests = list()  # fingerprints to be updated
+        coll = climdb[DBTableNames.data_values]
+        if not incremental:
+            for data_type in self.types:
+                coll.delete_many({DataValueFields.type: data_type})
+            if bucket_store is not None:
+                bucket_store.remove(self.types)
+            climdb[DBTableNames.data_fingerprints].delete_many({DataValueFields.type:
+                                                                    {'$in': self.types}})
+            return
+        pipeline = [{'$match': {DataValueFields.type: {'$in': self.types}}},
+                    {'$group': {'_id': {'id': '$%s' % DataValueFields.id,
+                                        'type': '$%s' % DataValueFields.type},
+                                'last': {'$max': '$%s' % DataValueFields.utc}}}]
+        if bucket_store is not None:
+            self.last_utc = bucket_store.last_utc(self.types)
+        else:
+            for doc in coll.aggregate(pipeline, allowDiskUse=True):
+                self.last_utc[(doc['_id']['id'], doc['_id']['type'])] = doc['last']
+        if self.check_fingerprint:
+            for doc in climdb[DBTableNames.data_fingerprints].find(
+                    {DataValueFields.type: {'$in': self.types}}):
+                self.fingerprints[(doc[DataValueFields.id], doc[DataValueFields.type])] = doc
+
+    def historical_rows_edited(self, key, utcs, values):
+        """Check whether the historical rows differ from the stored fingerprint."""
+        doc = self.fingerprints.get(key)
+        if doc is None:
+            print('WARNING: No fingerprint of station %s, type %s, skip checking.' % key)
+            return False
+        first = numpy.datetime64(doc[DataFingerprintFields.first_utc], 's')
+        last = numpy.datetime64(doc[DataFingerprintFields.last_utc], 's')
+        if len(utcs) == 0 or utcs.min() > first:
+            # the data file does not cover the history, e.g., only the latest records
+            return False
+        old = (utcs >= first) & (utcs <= last)
+        return series_fingerprint(utcs[old], values[old]) != doc[DataFingerprintFields.fingerprint]
+
+    def select(self, station_id, data_type, utcs, values):
+        """Records of one station and type to be imported.
+
+        Args:
+            station_id: Station ID.
+            data_type: Data type.
+            utcs: UTC times of all records in data file, numpy.datetime64 array.
+            values: Values of all records in data file.
+        Returns:
+            Boolean array, True means the record should be imported.
+        """
+        utcs = numpy.asarray(utcs, dtype='datetime64[s]')
+        values = numpy.asarray(values, dtype=numpy.float64)
+        key = (station_id, data_type)
+        selected = numpy.ones(len(utcs), dtype=bool)
+        last = self.last_utc.get(key)
+        if self.incremental and last is not None:
+            if self.check_fingerprint and self.historical_rows_edited(key, utcs, values):
+                print('Historical records of station %s, type %s are edited, '
+                      're-import all records.' % key)
+                self.climdb[DBTableNames.data_values].delete_many(
+                    {DataValueFields.id: station_id, DataValueFields.type: data_type})
+                if self.bucket_store is not None:
+                    self.bucket_store.remove([data_type], station_id)
+                self.reimported.append(key)
+            else:
+                selected = utcs > numpy.datetime64(last, 's')
+        self.update_fingerprint(key, utcs, values, selected)
+        return selected
+
+    def update_fingerprint(self, key, utcs, values, selected):
+        """Prepare the fingerprint of the series after importing."""
+        if not selected.any() and key in self.fingerprints:
+            return
+        if len(utcs) == 0:
+            return
+        doc = self.fingerprints.get(key)
+        if doc is not None and not selected.all() and utcs.min() > numpy.datetime64(
+                doc[DataFingerprintFields.first_utc], 's'):
+            # the history is not in data file, the fingerprint can not be updated
+            return
+        curfilter = {DataValueFields.id: key[0], DataValueFields.type: key[1]}
+        cur_dic = {DataValueFields.id: key[0], DataValueFields.type: key[1],
+                   DataFingerprintFields.first_utc: utcs.min().tolist(),
+                   DataFingerprintFields.last_utc: utcs.max().tolist(),
+                   DataFingerprintFields.fingerprint: series_fingerprint(utcs, values)}
+        self.requests.append(ReplaceOne(curfilter, cur_dic, upsert=True))
+
+    def commit(self):
+        """Write the updated fingerprints."""
+        if not self.requests:
+            return
+        coll = self.climdb[DBTableNames.data_fingerprints]
+        coll.bulk_write(self.requests, ordered=False)
+        coll.create_index([(DataValueFields.id, ASCENDING), (DataValueFields.type, ASCENDING)])
+        self.requests = list()
@@ -16,6 +16,7 @@ import sys
 if os.path.abspath(os.path.join(sys.path[0], '..')) not in sys.path:
     sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '..')))
 
+import numpy
 from pygeoc.utils import StringClass, MathClass
 
 from preprocess.text import DBTableNames, StationFields, DataValueFields
@@ -60,6 +61,23 @@ class HydroClimateUtilClass(object):
              (w * math.sin(lat) * math.sin(d) + math.cos(lat) * math.cos(d) * math.sin(w))
         return (a + b * n / nn) * ra
 
+    @staticmethod
+    def rs_array(doy, n, lat):
+        """Vectorized version of `rs()`, all arguments can be numpy arrays."""
+        doy = numpy.asarray(doy, dtype=numpy.float64)
+        lat = numpy.asarray(lat, dtype=numpy.float64) * math.pi / 180.
+        a = 0.25
+        b = 0.5
+        d = 0.409 * numpy.sin(2. * math.pi * doy / 365. - 1.39)
+        x = 1. - numpy.tan(lat) ** 2. * numpy.tan(d) ** 2.
+        x = numpy.where(x < 0, 0.00001, x)
+        w = 0.5 * math.pi - numpy.arctan(-numpy.tan(lat) * numpy.tan(d) / numpy.sqrt(x))
+        nn = 24. * w / math.pi
+        dr = 1. + 0.033 * numpy.cos(2. * math.pi * doy / 365.)
+        ra = (24. * 60. * 0.082 * dr / math.pi) * \
+             (w * numpy.sin(lat) * numpy.sin(d) + numpy.cos(lat) * numpy.cos(d) * numpy.sin(w))
+        return (a + b * numpy.asarray(n, dtype=numpy.float64) / nn) * ra
+
     @staticmethod
     def query_climate_sites(clim_db, site_type):
         """Query climate sites information, return a dict with stationID as key."""
@@ -147,6 +165,83 @@ class HydroClimateUtilClass(object):
             dt -= timedelta(minutes=tzone * 60)
         return dt
 
+    @staticmethod
+    def field_columns(flds, candidates):
+        """Resolve the header into a {field: column index} dict once.
+
+        Args:
+            flds: Header fields of data file.
+            candidates: Field names to be matched (case insensitive).
+        """
+        col_map = dict()
+        for j, fld in enumerate(flds):
+            for cand in candidates:
+                if cand not in col_map and StringClass.string_match(fld, cand):
+                    col_map[cand] = j
+                    break
+        return col_map
+
+    @staticmethod
+    def get_utcdatetimes_from_columns(flds, data_items, tsys, tzone=None):
+        """Vectorized version of `get_utcdatetime_from_field_values()` for rows of data.
+
+        Args:
+            flds: Header fields.
+            data_items: Data rows (without header), or 2D string array.
+            tsys: Time system, i.e., 'UTCTIME' or 'LOCALTIME'.
+            tzone: Time zone, positive value for EAST.
+        Returns:
+            UTC datetimes as numpy.datetime64[s] array.
+        """
+        time_flds = [DataValueFields.dt, DataValueFields.y, DataValueFields.m, DataValueFields.d,
+                     DataValueFields.hour, DataValueFields.minute, DataValueFields.second]
+        col_map = HydroClimateUtilClass.field_columns(flds, time_flds)
+        data = numpy.asarray(data_items, dtype=object).reshape(len(data_items), -1)
+        if DataValueFields.dt in col_map:
+            # parse each distinct string only once
+            col = data[:, col_map[DataValueFields.dt]]
+            uniq, inverse = numpy.unique(col.astype(str), return_inverse=True)
+            parsed = numpy.array([StringClass.get_datetime(v) for v in uniq],
+                                 dtype='datetime64[s]')
+            dts = parsed[inverse]
+        else:
+            if DataValueFields.y not in col_map or DataValueFields.m not in col_map \
+                    or DataValueFields.d not in col_map:
+                raise ValueError("Can not find TIME information from "
+                                 "fields: %s" % ' '.join(fld for fld in flds))
+            ints = dict()
+            for fld in time_flds[1:]:
+                if fld in col_map:
+                    ints[fld] = data[:, col_map[fld]].astype(float).astype(numpy.int64)
+                else:
+                    ints[fld] = numpy.zeros(len(data), dtype=numpy.int64)
+            if len(data) and ints[DataValueFields.y].min() < 1900:
+                raise ValueError("Can not find TIME information from "
+                                 "fields: %s" % ' '.join(fld for fld in flds))
+            months = (ints[DataValueFields.y] - 1970).astype('datetime64[Y]')
+            months = months.astype('datetime64[M]') + (ints[DataValueFields.m] - 1)
+            days_in_month = ((months + 1).astype('datetime64[D]') -
+                             months.astype('datetime64[D]')).astype(numpy.int64)
+            # out-of-range values are not rolled over, same as `datetime`
+            invalid = (ints[DataValueFields.m] < 1) | (ints[DataValueFields.m] > 12) | \
+                      (ints[DataValueFields.d] < 1) | (ints[DataValueFields.d] > days_in_month) | \
+                      (ints[DataValueFields.hour] < 0) | (ints[DataValueFields.hour] > 23) | \
+                      (ints[DataValueFields.minute] < 0) | (ints[DataValueFields.minute] > 59) | \
+                      (ints[DataValueFields.second] < 0) | (ints[DataValueFields.second] > 59)
+            if invalid.any():
+                irow = int(numpy.argmax(invalid))
+                raise ValueError('Invalid TIME of row %d: %s' %
+                                 (irow, ' '.join(str(ints[fld][irow])
+                                                 for fld in time_flds[1:])))
+            dts = months.astype('datetime64[D]') + (ints[DataValueFields.d] - 1)
+            dts = dts.astype('datetime64[s]') + ints[DataValueFields.hour] * 3600 + \
+                ints[DataValueFields.minute] * 60 + ints[DataValueFields.second]
+        if not StringClass.string_match(tsys, 'UTCTIME'):
+            if tzone is None:
+                tzone = time.timezone // -3600  # positive value for EAST
+            dts = dts - numpy.timedelta64(int(round(tzone * 3600)), 's')
+        return dts
+
 
 def main():
     """TEST CODE"""
@@ -198,6 +198,23 @@ class DataValueFields(object):
     value = 'VALUE'
 
 
+class DataFingerprintFields(object):
+    """DATA_FINGERPRINTS collection, fingerprint of each station and type of DATA_VALUES"""
+    first_utc = 'FIRSTUTC'
+    last_utc = 'LASTUTC'
+    fingerprint = 'FINGERPRINT'
+
+
+class DataBucketFields(object):
+    """DATA_BUCKETS collection, packed values of one station and type in a year or month"""
+    bucket = 'BUCKET'
+    utc_start = 'UTCSTART'
+    utc_end = 'UTCEND'
+    interval = 'INTERVAL'
+    num = 'NUM'
+    values = 'VALUES'
+
+
 class VariableDesc(object):
     """Variable description"""
     id = 'ID'
@@ -377,6 +394,9 @@ class RasterMetadata(object):
     cellnum = 'NUM_CELLS'
     # for weight data
     site_num = 'NUM_SITES'
+    neighbor_num = 'NUM_NEIGHBORS'
+    weight_encoding = 'ENCODING'
+    itp_method = 'ITP_METHOD'
     srs = 'SRS'
 
 
@@ -391,6 +411,8 @@ class DBTableNames(object):
     main_scenario = 'BMPDATABASE'
     # hydro-climate database
     data_values = 'DATA_VALUES'
+    data_fingerprints = 'DATA_FINGERPRINTS'
+    data_buckets = 'DATA_BUCKETS'
     annual_stats = 'ANNUAL_STATS'
     observes = 'MEASUREMENT'
     var_desc = 'VARIABLES'
@@ -0,0 +1,319 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Distributed model-run queue backed by MongoDB.
+
+    Drivers (e.g., calibration, sensitivity analysis, and scenario analysis) enqueue run
+    specifications into the `MODEL_RUN_QUEUE` collection of the model database, and
+    long-lived workers on any node claim tasks atomically, run `MainSEIMS`, and post the
+    simulations and statistics back. Each claimed task holds a lease which is renewed by the
+    heartbeat of the worker, so that the tasks of crashed workers are requeued after the
+    lease expired, and retried until no attempts left.
+
+    Start a worker (the [SEIMS_Model] section of the configuration file provides the
+    node-local settings, e.g., BIN_DIR, threadsNum, and processNum):
+
+        python run_queue.py -ini <config file> -lease 300 -idle 3600
+
+    The calibration drivers (NSGA-II and DREAM) enqueue their model runs if `RunQueue = True`
+    in the [CALI_Settings] section. Enqueue and wait in other drivers:
+
+        queue = ModelRunQueue(host, port, db_name)
+        results = queue.map([{'calibration_id': i, 'outputs': ['Q']} for i in range(n)])
+
+    Note that the simulation period is read by SEIMS from the model database, the time
+    window of a task only limits the simulations and statistics posted back.
+"""
+from __future__ import absolute_import
+
+import argparse
+import os
+import shutil
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+try:
+    from ConfigParser import ConfigParser  # py2
+except ImportError:
+    from configparser import ConfigParser  # py3
+
+from pymongo import ASCENDING, ReturnDocument
+from pygeoc.utils import FileClass
+
+if os.path.abspath(os.path.join(sys.path[0], '..')) not in sys.path:
+    sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '..')))
+
+from preprocess.db_mongodb import ConnectMongoDB
+from postprocess.utility import read_simulation_from_txt, match_simulation_observation
+from run_seims import ParseSEIMSConfig, MainSEIMS
+
+
+class TaskStatus(object):
+    """Status of tasks in the queue."""
+    pending = 'pending'
+    running = 'running'
+    done = 'done'
+    failed = 'failed'
+
+
+class ModelRunQueue(object):
+    """Model-run queue in a MongoDB collection.
+
+    The fields of one task:
+        RUN: Name of the batch, e.g., 'Cali_NSGA2_Gen_3', used to query and clean up.
+        SCENARIO_ID, CALIBRATION_ID: IDs passed to SEIMS.
+        TIME_START, TIME_END: (Optional) Time window of outputs and statistics.
+        OUTPUTS: Requested output variables at the outlet, e.g., ['Q', 'SED'].
+        CLEANUP: Delete the output directory after posting results.
+        STATUS, WORKER, ATTEMPTS, ATTEMPTS_LEFT, LEASE_EXPIRE, CREATED, FINISHED, ERROR.
+        RESULT: {'SIM_VARS', 'SIM_DATES', 'SIM_VALUES', 'OBJ_NAMES', 'OBJ_VALUES', 'TIMESPAN'}
+    """
+
+    def __init__(self, host, port, db_name, coll_name='MODEL_RUN_QUEUE'):
+        self.host = host
+        self.port = port
+        self.db_name = db_name
+        self.coll_name = coll_name
+        self.client = None
+        coll = self._collection()
+        coll.create_index([('STATUS', ASCENDING), ('CREATED', ASCENDING)])
+        coll.create_index([('RUN', ASCENDING)])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['client'] = None  # MongoClient is not picklable
+        return state
+
+    def _collection(self):
+        if self.client is None:
+            self.client = ConnectMongoDB(self.host, self.port)
+        return self.client.get_conn()[self.db_name][self.coll_name]
+
+    def enqueue(self, specs, run_name='', max_attempts=3):
+        """Enqueue run specifications.
+
+        Args:
+            specs: List of dict, keys are scenario_id, calibration_id, time_start, time_end,
+                   outputs, and cleanup, all are optional.
+            run_name: Name of the batch.
+            max_attempts: Maximum attempts of each task.
+        Returns:
+            IDs of tasks in the same order of `specs`.
+        """
+        now = datetime.utcnow()
+        docs = list()
+        for spec in specs:
+            docs.append({'RUN': run_name,
+                         'SCENARIO_ID': spec.get('scenario_id', -1),
+                         'CALIBRATION_ID': spec.get('calibration_id', -1),
+                         'TIME_START': spec.get('time_start'),
+                         'TIME_END': spec.get('time_end'),
+                         'OUTPUTS': list(spec.get('outputs', list())),
+                         'CLEANUP': spec.get('cleanup', True),
+                         'STATUS': TaskStatus.pending, 'WORKER': None,
+                         'ATTEMPTS': 0, 'ATTEMPTS_LEFT': max_attempts,
+                         'LEASE_EXPIRE': None, 'CREATED': now})
+        if not docs:
+            return list()
+        return self._collection().insert_many(docs, ordered=True).inserted_ids
+
+    def claim(self, worker, lease=300.):
+        """Claim one pending task or a task with an expired lease atomically.
+
+        Returns:
+            The claimed task document, or None if no task available.
+        """
+        now = datetime.utcnow()
+        coll = self._collection()
+        # Tasks of crashed workers without attempts left are failed
+        coll.update_many({'STATUS': TaskStatus.running, 'LEASE_EXPIRE': {'$lt': now},
+                          'ATTEMPTS_LEFT': {'$lte': 0}},
+                         {'$set': {'STATUS': TaskStatus.failed, 'FINISHED': now,
+                                   'ERROR': 'Lease expired'}})
+        query = {'$or': [{'STATUS': TaskStatus.pending},
+                         {'STATUS': TaskStatus.running, 'LEASE_EXPIRE': {'$lt': now},
+                          'ATTEMPTS_LEFT': {'$gt': 0}}]}
+        update = {'$set': {'STATUS': TaskStatus.running, 'WORKER': worker,
+                           'LEASE_EXPIRE': now + timedelta(seconds=lease)},
+                  '$inc': {'ATTEMPTS': 1, 'ATTEMPTS_LEFT': -1}}
+        return coll.find_one_and_update(query, update, sort=[('CREATED', ASCENDING)],
+                                        return_document=ReturnDocument.AFTER)
+
+    def heartbeat(self, task_id, worker, lease=300.):
+        """Renew the lease, return False if the task is no longer owned by the worker."""
+        res = self._collection().update_one(
+            {'_id': task_id, 'WORKER': worker, 'STATUS': TaskStatus.running},
+            {'$set': {'LEASE_EXPIRE': datetime.utcnow() + timedelta(seconds=lease)}})
+        return res.matched_count > 0
+
+    def complete(self, task_id, worker, result):
+        """Post the result of a finished task."""
+        self._collection().update_one({'_id': task_id, 'WORKER': worker},
+                                      {'$set': {'STATUS': TaskStatus.done, 'RESULT': result,
+                                                'FINISHED': datetime.utcnow()}})
+
+    def fail(self, task_id, worker, error=''):
+        """Requeue the failed task if attempts remain, otherwise mark it as failed."""
+        coll = self._collection()
+        task = coll.find_one({'_id': task_id, 'WORKER': worker})
+        if task is None:
+            return
+        status = TaskStatus.pending
+        if task['ATTEMPTS_LEFT'] <= 0:
+            status = TaskStatus.failed
+        coll.update_one({'_id': task_id, 'WORKER': worker},
+                        {'$set': {'STATUS': status, 'WORKER': None, 'LEASE_EXPIRE': None,
+                                  'ERROR': error, 'FINISHED': datetime.utcnow()}})
+
+    def wait(self, task_ids, timeout=None, interval=2.):
+        """Wait until all tasks are done or failed.
+
+        Returns:
+            Task documents in the same order of `task_ids`, None for the unfinished ones.
+        """
+        stime = time.time()
+        coll = self._collection()
+        finished = dict()
+        remains = list(task_ids)
+        while remains:
+            for doc in coll.find({'_id': {'$in': remains},
+                                  'STATUS': {'$in': [TaskStatus.done, TaskStatus.failed]}}):
+                finished[doc['_id']] = doc
+            remains = [tid for tid in remains if tid not in finished]
+            if not remains or (timeout is not None and time.time() - stime > timeout):
+                break
+            time.sleep(interval)
+        return [finished.get(tid) for tid in task_ids]
+
+    def map(self, specs, run_name='', max_attempts=3, timeout=None):
+        """Enqueue run specifications and wait for their results, like `futures.map`.
+
+        Returns:
+            List of `RESULT` of tasks, None for the failed ones.
+        """
+        docs = self.wait(self.enqueue(specs, run_name, max_attempts), timeout)
+        return [doc.get('RESULT') if doc is not None else None for doc in docs]
+
+    def clear(self, run_name=None):
+        """Remove the tasks of the batch, or all tasks if `run_name` is None."""
+        query = dict() if run_name is None else {'RUN': run_name}
+        self._collection().delete_many(query)
+
+
+def run_task(model_cfg_dict, task):
+    """Run SEIMS model of a task, return the result to be posted back."""
+    args = dict(model_cfg_dict)
+    args['scenario_id'] = task['SCENARIO_ID']
+    args['calibration_id'] = task['CALIBRATION_ID']
+    model_obj = MainSEIMS(args_dict=args)
+    stime = task.get('TIME_START') or model_obj.start_time
+    etime = task.get('TIME_END') or model_obj.end_time
+    outputs = task.get('OUTPUTS') or list()
+    if outputs:
+        model_obj.ReadOutletObservations(outputs)
+    if not model_obj.run():
+        raise RuntimeError('Run SEIMS model failed!')
+    result = {'SIM_VARS': list(), 'SIM_DATES': list(), 'SIM_VALUES': list(),
+              'OBJ_NAMES': list(), 'OBJ_VALUES': list(),
+              'TIMESPAN': model_obj.GetTimespan()}
+    if outputs:
+        sim_vars, sim_value = read_simulation_from_txt(model_obj.output_dir, outputs,
+                                                       model_obj.outlet_id, stime, etime)
+        result['SIM_VARS'] = sim_vars
+        result['SIM_DATES'] = list(sim_value.keys())
+        result['SIM_VALUES'] = [list(v) for v in sim_value.values()]
+        if model_obj.obs_vars and sim_vars:
+            model_obj.sim_obs_dict = match_simulation_observation(sim_vars, sim_value,
+                                                                  model_obj.obs_vars,
+                                                                  model_obj.obs_value)
+            objnames, objvalues = model_obj.CalcTimeseriesStatistics(
+                model_obj.ExtractSimObsData(stime, etime), stime, etime)
+            if objnames and objvalues:
+                result['OBJ_NAMES'] = objnames
+                result['OBJ_VALUES'] = [float(v) for v in objvalues]
+    if task.get('CLEANUP', True) and os.path.isdir(model_obj.output_dir):
+        shutil.rmtree(model_obj.output_dir)
+    return result
+
+
+class QueueWorker(object):
+    """Long-lived worker that claims and runs tasks until idle timeout."""
+
+    def __init__(self, model_cfg, lease=300., poll=5., idle=None, name=None):
+        """Initialization.
+
+        Args:
+            model_cfg: ParseSEIMSConfig object of current node.
+            lease: Lease of claimed task in seconds, renewed every lease / 3 seconds.
+            poll: Interval of polling the queue when no task available.
+            idle: (Optional) Exit if no task available for `idle` seconds.
+            name: (Optional) Worker name, default is <hostname>-<pid>.
+        """
+        self.model_cfg_dict = model_cfg.ConfigDict
+        self.queue = ModelRunQueue(model_cfg.host, model_cfg.port, model_cfg.db_name)
+        self.lease = lease
+        self.poll = poll
+        self.idle = idle
+        self.name = name if name else '%s-%d' % (socket.gethostname(), os.getpid())
+
+    def _heartbeat(self, task_id, stop_event):
+        while not stop_event.wait(self.lease / 3.):
+            if not self.queue.heartbeat(task_id, self.name, self.lease):
+                print('WARNING: Lease of task %s is lost by %s!' % (task_id, self.name))
+                break
+
+    def run_once(self):
+        """Claim and run one task, return False if no task available."""
+        task = self.queue.claim(self.name, self.lease)
+        if task is None:
+            return False
+        stop_event = threading.Event()
+        beat = threading.Thread(target=self._heartbeat, args=(task['_id'], stop_event))
+        beat.daemon = True
+        beat.start()
+        try:
+            result = run_task(self.model_cfg_dict, task)
+        except Exception as err:
+            stop_event.set()
+            print('Task %s failed on %s: %s' % (task['_id'], self.name, str(err)))
+            self.queue.fail(task['_id'], self.name, str(err))
+        else:
+            stop_event.set()
+            self.queue.complete(task['_id'], self.name, result)
+        beat.join()
+        return True
+
+    def serve(self):
+        """Claim and run tasks until idle timeout."""
+        print('Worker %s started.' % self.name)
+        last_task = time.time()
+        while True:
+            if self.run_once():
+                last_task = time.time()
+                continue
+            if self.idle is not None and time.time() - last_task > self.idle:
+                break
+            time.sleep(self.poll)
+        print('Worker %s exited.' % self.name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run SEIMS model-run queue worker.')
+    parser.add_argument('-ini', type=str, help='Full path of configuration file')
+    parser.add_argument('-lease', type=float, default=300., help='Lease of task in seconds')
+    parser.add_argument('-poll', type=float, default=5., help='Polling interval in seconds')
+    parser.add_argument('-idle', type=float, default=None, help='Exit after idle seconds')
+    parser.add_argument('-name', type=str, default=None, help='Worker name')
+    args = parser.parse_args()
+    if not FileClass.is_file_exists(args.ini):
+        raise ImportError('Configuration file is not existed: %s' % args.ini)
+    cf = ConfigParser()
+    cf.read(args.ini)
+    worker = QueueWorker(ParseSEIMSConfig(cf), args.lease, args.poll, args.idle, args.name)
+    worker.serve()
+
+
+if __name__ == '__main__':
+    main()
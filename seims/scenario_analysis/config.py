@@ -41,6 +41,34 @@ class SAConfig(object):
             raise ValueError('[NSGA2] section MUST be existed in *.ini file.')
         if self.nsga2_npop % 4 != 0:
             raise ValueError('PopulationSize must be a multiple of 4.')
+        # Non-dominated sorting method, and sample budget of Monte Carlo hypervolume
+        self.nsga2_nd = 'standard'
+        self.hv_samples = 100000
+        if cf.has_option('NSGA2', 'nondominatedsort'):
+            self.nsga2_nd = cf.get('NSGA2', 'nondominatedsort').lower()
+        if cf.has_option('NSGA2', 'hypervolumesamples'):
+            self.hv_samples = cf.getint('NSGA2', 'hypervolumesamples')
+        if self.nsga2_nd not in ['standard', 'log', 'efficient']:
+            raise ValueError('NonDominatedSort must be one of standard, log, and efficient.')
+        # Island model, each island evolves a sub-population of PopulationSize.
+        #   island_id is specified by the command line of each island, -1 means not island model.
+        self.island_id = -1
+        self.islands = 1
+        self.migration_interval = 5
+        self.migration_size = 2
+        self.migration_timeout = 600.  # seconds of waiting for immigrants
+        if cf.has_option('NSGA2', 'island_id'):
+            self.island_id = cf.getint('NSGA2', 'island_id')
+        if cf.has_option('NSGA2', 'islands'):
+            self.islands = cf.getint('NSGA2', 'islands')
+        if cf.has_option('NSGA2', 'migrationinterval'):
+            self.migration_interval = cf.getint('NSGA2', 'migrationinterval')
+        if cf.has_option('NSGA2', 'migrationsize'):
+            self.migration_size = cf.getint('NSGA2', 'migrationsize')
+        if cf.has_option('NSGA2', 'migrationtimeout'):
+            self.migration_timeout = cf.getfloat('NSGA2', 'migrationtimeout')
+        if self.island_id >= self.islands:
+            raise ValueError('island_id must be less than the number of islands.')
         # 2. MongoDB
         self.hostname = '127.0.0.1'  # localhost by default
         self.port = 27017
@@ -102,15 +130,44 @@ class SAConfig(object):
         self.worst_econ = 0
         self.worst_env = 0
         self.runtime_years = 0
+        # Pre-screening scenarios by economy before running SEIMS, None means not screened.
+        #   budget: Scenarios whose economy exceed the budget will not be evaluated.
+        #   upper_environment: Upper bound of environmental effectiveness, scenarios that are
+        #                      dominated by evaluated ones even with this value will be skipped.
+        self.budget = None
+        self.upper_env = None
         if 'Effectiveness' in cf.sections():
             self.worst_econ = cf.getfloat('Effectiveness', 'worst_economy')
             self.worst_env = cf.getfloat('Effectiveness', 'worst_environment')
             self.runtime_years = cf.getfloat('Effectiveness', 'runtime_years')
-            self.runtime_years = cf.getfloat('Effectiveness', 'runtime_years')
+            if cf.has_option('Effectiveness', 'budget'):
+                self.budget = cf.getfloat('Effectiveness', 'budget')
+            if cf.has_option('Effectiveness', 'upper_environment'):
+                self.upper_env = cf.getfloat('Effectiveness', 'upper_environment')
+
+        # 6. Optional section [Surrogate], see `scenario_analysis.surrogate`
+        self.surrogate = False
+        self.surrogate_ratio = 0.5  # ratio of offspring evaluated by SEIMS
+        self.surrogate_alpha = 1.  # L2 regularization coefficient
+        self.surrogate_min_samples = 2 * self.nsga2_npop
+        self.surrogate_max_samples = 1000
+        if 'Surrogate' in cf.sections():
+            self.surrogate = cf.getboolean('Surrogate', 'enable')
+            if cf.has_option('Surrogate', 'evaluate_ratio'):
+                self.surrogate_ratio = cf.getfloat('Surrogate', 'evaluate_ratio')
+            if cf.has_option('Surrogate', 'alpha'):
+                self.surrogate_alpha = cf.getfloat('Surrogate', 'alpha')
+            if cf.has_option('Surrogate', 'min_samples'):
+                self.surrogate_min_samples = cf.getint('Surrogate', 'min_samples')
+            if cf.has_option('Surrogate', 'max_samples'):
+                self.surrogate_max_samples = cf.getint('Surrogate', 'max_samples')
 
-        # 6. define gene_values
+        # 7. define gene_values
         fn = 'Gen_%d_Pop_%d' % (self.nsga2_ngens, self.nsga2_npop)
         fn += '_rule' if self.bmps_rule else '_random'
+        self.nsga2_fn = fn
+        if self.island_id >= 0:
+            fn += '_island%d' % self.island_id
         self.nsga2_dir = self.model_dir + os.path.sep + 'NSGA2_OUTPUT' + os.path.sep + fn
         self.scenario_dir = self.nsga2_dir + os.path.sep + 'Scenarios'
         UtilClass.rmmkdir(self.nsga2_dir)
@@ -118,7 +175,9 @@ class SAConfig(object):
         self.hypervlog = self.nsga2_dir + os.path.sep + 'hypervolume.txt'
         self.scenariolog = self.nsga2_dir + os.path.sep + 'scenarios_info.txt'
         self.logfile = self.nsga2_dir + os.path.sep + 'runtime.log'
+        self.jsonlog = self.nsga2_dir + os.path.sep + 'runtime.jsonl'
         self.logbookfile = self.nsga2_dir + os.path.sep + 'logbook.txt'
+        self.surrogatelog = self.nsga2_dir + os.path.sep + 'surrogate.txt'
 
 
 if __name__ == '__main__':
@@ -0,0 +1,215 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Configurable non-dominated sorting and hypervolume indicator for NSGA-II.
+
+    Non-dominated sorting (`NonDominatedSort` in [NSGA2] section):
+
+    - standard: `deap.tools.sortNondominated`, O(MN^2).
+    - log: `deap.tools.sortLogNondominated`, generalized reduced run-time complexity
+      non-dominated sorting by Fortin et al. (2013).
+    - efficient: efficient non-dominated sort with sequential search (ENS-SS)
+      by Zhang et al. (2015), see `sort_efficient_nondominated`.
+
+    Hypervolume (`HypervolumeSamples` in [NSGA2] section):
+
+    - exact for 2 objectives by a sweep, and for 3 objectives by
+      `deap.benchmarks.tools.hypervolume` (or `deap.tools._hypervolume` of deap<1.4).
+    - Monte Carlo approximate for 4 or more objectives with a fixed sample budget. The
+      dominated samples of each point are cached (bit-packed) and only the newly entered
+      points are evaluated in the next generation.
+"""
+from __future__ import absolute_import
+
+from itertools import chain
+from operator import attrgetter
+
+import numpy
+from deap import tools
+from deap.benchmarks.tools import hypervolume
+from deap.tools.emo import assignCrowdingDist
+
+try:
+    # try importing the C version of deap<1.4
+    from deap.tools._hypervolume import hv
+except ImportError:
+    try:
+        # fallback on python version of deap<1.4
+        from deap.tools._hypervolume import pyhv as hv
+    except ImportError:
+        # deap>=1.4, use the public `deap.benchmarks.tools.hypervolume`
+        hv = None
+
+ND_SORTS = ['standard', 'log', 'efficient']
+
+
+def sort_efficient_nondominated(individuals, k, first_front_only=False):
+    """Efficient non-dominated sort with sequential search (ENS-SS).
+
+    Individuals are sorted lexicographically by weighted fitness values (descending,
+    i.e., better first), so that an individual can only be dominated by the former ones.
+    Each individual is assigned to the first front without any member dominates it,
+    and the dominance checks against one front are vectorized.
+
+    Args:
+        individuals: A list of individuals to sort.
+        k: The number of individuals to select.
+        first_front_only: If True sort only the first front and exit.
+    Returns:
+        A list of Pareto fronts (lists), the same as `deap.tools.sortNondominated`.
+    """
+    if k == 0 or not individuals:
+        return []
+    wobj = numpy.array([ind.fitness.wvalues for ind in individuals])
+    order = numpy.lexsort(-wobj.T[::-1])
+    fronts = list()  # individual indexes of each front
+    front_objs = list()  # weighted fitness values of each front
+    for idx in order:
+        obj = wobj[idx]
+        found = False
+        for fidx, fobj in enumerate(front_objs):
+            fobj = numpy.asarray(fobj)
+            dominated = numpy.any(numpy.all(fobj >= obj, axis=1) & numpy.any(fobj > obj, axis=1))
+            if not dominated:
+                fronts[fidx].append(idx)
+                front_objs[fidx].append(obj)
+                found = True
+                break
+        if not found:
+            if first_front_only and fronts:
+                continue
+            fronts.append([idx])
+            front_objs.append([obj])
+    if first_front_only:
+        return [[individuals[i] for i in fronts[0]]]
+    pareto_fronts = list()
+    count = 0
+    for front in fronts:
+        pareto_fronts.append([individuals[i] for i in front])
+        count += len(front)
+        if count >= min(k, len(individuals)):
+            break
+    return pareto_fronts
+
+
+def sort_nondominated(individuals, k, first_front_only=False, nd='standard'):
+    """Non-dominated sorting by the specified method, see `ND_SORTS`."""
+    if nd == 'log':
+        fronts = tools.sortLogNondominated(individuals, k, first_front_only)
+        # the first front only is returned directly by `deap.tools.sortLogNondominated`
+        return [fronts] if first_front_only else fronts
+    if nd == 'efficient':
+        return sort_efficient_nondominated(individuals, k, first_front_only)
+    return tools.sortNondominated(individuals, k, first_front_only)
+
+
+def sel_nsga2(individuals, k, nd='standard'):
+    """NSGA-II selection, the same as `deap.tools.selNSGA2` with more sorting methods."""
+    pareto_fronts = sort_nondominated(individuals, k, nd=nd)
+    for front in pareto_fronts:
+        assignCrowdingDist(front)
+    chosen = list(chain(*pareto_fronts[:-1]))
+    k = k - len(chosen)
+    if k > 0:
+        sorted_front = sorted(pareto_fronts[-1], key=attrgetter('fitness.crowding_dist'),
+                              reverse=True)
+        chosen.extend(sorted_front[:k])
+    return chosen
+
+
+def hypervolume_2d(points, ref):
+    """Exact hypervolume of 2D points (minimization) by a sweep."""
+    points = points[numpy.all(points < ref, axis=1)]
+    if len(points) == 0:
+        return 0.
+    points = points[numpy.lexsort((points[:, 1], points[:, 0]))]
+    best_y = numpy.minimum.accumulate(points[:, 1])
+    prev_y = numpy.concatenate(([ref[1]], best_y[:-1]))
+    return float(numpy.sum((ref[0] - points[:, 0]) * numpy.maximum(prev_y - points[:, 1], 0.)))
+
+
+class MinimizedPoint(object):
+    """A point in the minimization space with the `fitness.wvalues` of an individual."""
+
+    def __init__(self, point):
+        self.fitness = self
+        self.wvalues = tuple(-v for v in point)
+
+
+def hypervolume_3d(points, ref):
+    """Exact hypervolume of 3D points (minimization)."""
+    if len(points) == 0:
+        return 0.
+    if hv is not None:
+        return hv.hypervolume(points, ref)
+    return float(hypervolume([MinimizedPoint(pt) for pt in points], ref))
+
+
+class HypervolumeIndicator(object):
+    """Hypervolume of individuals with respect to the reference point.
+
+    The reference point is in the minimization space, i.e., the same as
+    `deap.benchmarks.tools.hypervolume`: worst fitness values multiplied by -weights.
+    """
+
+    def __init__(self, ref, samples=100000, seed=None):
+        """Initialization.
+
+        Args:
+            ref: Reference point.
+            samples: Sample budget of Monte Carlo approximation for 4 or more objectives.
+            seed: (Optional) Random seed of samples.
+        """
+        self.ref = numpy.array(ref, dtype=numpy.float64)
+        self.samples = samples
+        self.rng = numpy.random.RandomState(seed)
+        self.lower = None  # lower bound of the sampling box
+        self.sample_points = None
+        self.masks = dict()  # key: point tuple, value: packed bits of dominated samples
+        self.last_key = None
+        self.last_value = 0.
+
+    def __call__(self, individuals):
+        points = numpy.array([ind.fitness.wvalues for ind in individuals],
+                             dtype=numpy.float64) * -1
+        return self.calculate(points)
+
+    def calculate(self, points):
+        """Hypervolume of points in the minimization space."""
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, len(self.ref))
+        key = frozenset(map(tuple, points))
+        if key == self.last_key:  # the same front as the last generation
+            return self.last_value
+        nobj = len(self.ref)
+        if nobj == 2:
+            value = hypervolume_2d(points, self.ref)
+        elif nobj == 3:
+            value = hypervolume_3d(points, self.ref)
+        else:
+            value = self._monte_carlo(points)
+        self.last_key = key
+        self.last_value = value
+        return value
+
+    def _monte_carlo(self, points):
+        points = points[numpy.all(points < self.ref, axis=1)]
+        if len(points) == 0:
+            return 0.
+        lower = points.min(axis=0)
+        if self.lower is None or numpy.any(lower < self.lower):
+            # (re)build the sampling box, with a margin to reduce rebuilding
+            self.lower = lower - 0.1 * (self.ref - lower)
+            self.sample_points = self.lower + self.rng.random_sample(
+                (self.samples, len(self.ref))) * (self.ref - self.lower)
+            self.masks = dict()
+        dominated = numpy.zeros((self.samples + 7) // 8, dtype=numpy.uint8)
+        masks = dict()
+        for pt in map(tuple, points):
+            if pt not in masks:
+                mask = self.masks.get(pt)
+                if mask is None:  # newly entered point
+                    mask = numpy.packbits(numpy.all(self.sample_points >= pt, axis=1))
+                masks[pt] = mask
+            dominated |= masks[pt]
+        self.masks = masks  # keep points of current front only
+        ratio = numpy.unpackbits(dominated)[:self.samples].sum() / float(self.samples)
+        return float(ratio * numpy.prod(self.ref - self.lower))
@@ -0,0 +1,183 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Evaluators of environmental effectiveness from SEIMS outputs.
+
+    An evaluator reduces the output file of one model run (e.g., `ENVEVAL` in `bmps_info`)
+    to the total amount of the evaluated variable during the simulation period, e.g.,
+    soil erosion of the whole basin or sediment at the outlet.
+
+    - `RasterSumEvaluator`: sum of all valid cells of a raster output.
+    - `MaskedRasterEvaluator`: only the cells of the affected zones (e.g., subbasins where
+      BMPs are configured) are read within their bounding window, and the other zones
+      use the amounts of the base scenario.
+    - `OutletSeriesEvaluator`: sum of a time series output at the outlet, e.g., SED.txt.
+"""
+from __future__ import absolute_import
+
+import os
+import sys
+import time
+
+import numpy
+from osgeo import gdal
+
+if os.path.abspath(os.path.join(sys.path[0], '..')) not in sys.path:
+    sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '..')))
+
+from postprocess.utility import read_simulation_from_txt
+
+
+def wait_for_output(fpath, timeout=10., interval=0.1):
+    """Poll until the output file exists and its size stops changing.
+
+    Returns:
+        True if the file is ready, False if timeout.
+    """
+    stime = time.time()
+    last_size = -1
+    while True:
+        if os.path.isfile(fpath):
+            cur_size = os.path.getsize(fpath)
+            if cur_size > 0 and cur_size == last_size:
+                return True
+            last_size = cur_size
+        if time.time() - stime > timeout:
+            return False
+        time.sleep(interval)
+
+
+def read_raster_window(fpath, xoff=0, yoff=0, xsize=None, ysize=None):
+    """Read a window of the first band of raster, return data and nodata value."""
+    ds = gdal.Open(fpath)
+    if ds is None:
+        return None, None
+    band = ds.GetRasterBand(1)
+    if xsize is None:
+        xsize = ds.RasterXSize - xoff
+    if ysize is None:
+        ysize = ds.RasterYSize - yoff
+    data = band.ReadAsArray(xoff, yoff, xsize, ysize)
+    nodata = band.GetNoDataValue()
+    ds = None
+    return data, nodata
+
+
+class EffectivenessEvaluator(object):
+    """Base class of evaluators."""
+
+    def amount(self, fpath, zones=None):
+        """Total amount of the evaluated variable of one model run.
+
+        Args:
+            fpath: Full path of the output file.
+            zones: (Optional) IDs of zones affected by the scenario.
+        Returns:
+            Total amount during the simulation period, None if failed.
+        """
+        raise NotImplementedError('amount() should be overridden in inherited class.')
+
+
+class RasterSumEvaluator(EffectivenessEvaluator):
+    """Sum of all valid cells of a raster output."""
+
+    def amount(self, fpath, zones=None):
+        data, nodata = read_raster_window(fpath)
+        if data is None:
+            return None
+        if nodata is not None:
+            data = data[data != nodata]
+        return float(data.sum())
+
+
+class MaskedRasterEvaluator(RasterSumEvaluator):
+    """Sum of raster output restricted to the cells of affected zones.
+
+    Cells of each zone are sorted once, so that the cells of affected zones can be gathered
+    from the bounding window of them without reading the whole raster.
+    """
+
+    def __init__(self, zones, zone_idx, base_data, base_nodata=None):
+        """Initialization.
+
+        Args:
+            zones: Sorted zone IDs, e.g., subbasin IDs.
+            zone_idx: Index of each cell in `zones`, -1 means the cell out of any zone.
+            base_data: Raster output of the base scenario, the same shape with `zone_idx`.
+            base_nodata: Nodata value of `base_data`.
+        """
+        self.zones = numpy.asarray(zones)
+        self.nrows, self.ncols = zone_idx.shape
+        flat_idx = zone_idx.ravel()
+        valid = flat_idx >= 0
+        base_data = numpy.asarray(base_data, dtype=numpy.float64).ravel()
+        base_valid = valid.copy()
+        if base_nodata is not None:
+            base_valid &= base_data != base_nodata
+        self.base_zone_sum = numpy.bincount(flat_idx[base_valid], weights=base_data[base_valid],
+                                            minlength=len(self.zones))
+        self.base_sum = float(self.base_zone_sum.sum())
+        # Cells of each zone, i.e., cells[starts[i]:starts[i + 1]]
+        cells = numpy.where(valid)[0]
+        self.cells = cells[numpy.argsort(flat_idx[cells], kind='mergesort')]
+        self.starts = numpy.searchsorted(flat_idx[self.cells], numpy.arange(len(self.zones) + 1))
+        rows = self.cells // self.ncols
+        cols = self.cells % self.ncols
+        nonempty = self.starts[:-1] < self.starts[1:]
+        self.row_min = numpy.zeros(len(self.zones), dtype=numpy.int64)
+        self.row_max = numpy.zeros(len(self.zones), dtype=numpy.int64)
+        self.col_min = numpy.zeros(len(self.zones), dtype=numpy.int64)
+        self.col_max = numpy.zeros(len(self.zones), dtype=numpy.int64)
+        if len(self.cells):
+            starts = self.starts[:-1][nonempty]
+            self.row_min[nonempty] = numpy.minimum.reduceat(rows, starts)
+            self.row_max[nonempty] = numpy.maximum.reduceat(rows, starts)
+            self.col_min[nonempty] = numpy.minimum.reduceat(cols, starts)
+            self.col_max[nonempty] = numpy.maximum.reduceat(cols, starts)
+        self.nonempty = nonempty
+
+    def amount(self, fpath, zones=None):
+        if zones is None:
+            return RasterSumEvaluator.amount(self, fpath)
+        zones = numpy.unique(numpy.asarray(zones, dtype=self.zones.dtype))
+        idx = numpy.searchsorted(self.zones, zones)
+        idx[idx >= len(self.zones)] = 0
+        idx = idx[(self.zones[idx] == zones) & self.nonempty[idx]]
+        if len(idx) == 0:
+            return self.base_sum
+        r0 = int(self.row_min[idx].min())
+        r1 = int(self.row_max[idx].max())
+        c0 = int(self.col_min[idx].min())
+        c1 = int(self.col_max[idx].max())
+        data, nodata = read_raster_window(fpath, c0, r0, c1 - c0 + 1, r1 - r0 + 1)
+        if data is None:
+            return None
+        cells = numpy.concatenate([self.cells[self.starts[i]:self.starts[i + 1]] for i in idx])
+        values = data[cells // self.ncols - r0, cells % self.ncols - c0]
+        if nodata is not None:
+            values = values[values != nodata]
+        return self.base_sum - float(self.base_zone_sum[idx].sum()) + float(values.sum())
+
+
+class OutletSeriesEvaluator(EffectivenessEvaluator):
+    """Sum of time series output at the outlet, e.g., SED.txt."""
+
+    def __init__(self, outlet_id, stime, etime):
+        """Initialization.
+
+        Args:
+            outlet_id: Subbasin ID of the outlet.
+            stime: Start time of the simulation period.
+            etime: End time of the simulation period.
+        """
+        self.outlet_id = outlet_id
+        self.stime = stime
+        self.etime = etime
+
+    def amount(self, fpath, zones=None):
+        ws, fname = os.path.split(fpath)
+        var = os.path.splitext(fname)[0]
+        sim_vars, sim_dict = read_simulation_from_txt(ws, [var], self.outlet_id,
+                                                      self.stime, self.etime)
+        if var not in sim_vars:
+            return None
+        return float(sum(values[0] for values in sim_dict.values()))
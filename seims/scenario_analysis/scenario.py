@@ -51,6 +51,7 @@ class Scenario(object):
         self.environment = 0.
         self.worst_econ = cfg.worst_econ
         self.worst_env = cfg.worst_env
+        self.budget = cfg.budget
 
         self.gene_num = 0
         self.gene_values = list()
@@ -76,9 +77,9 @@ class Scenario(object):
         # predefined directories
         self.scenario_dir = cfg.scenario_dir
 
-    def set_unique_id(self):
-        """Set unique ID."""
-        self.ID = next(generate_uniqueid())
+    def set_unique_id(self, sid=None):
+        """Set unique ID, or the given `sid` which has been assigned, e.g., by the driver."""
+        self.ID = next(generate_uniqueid()) if sid is None else sid
         self.modelout_dir = '%s/OUTPUT%d' % (self.model_dir, self.ID)
         self.read_simulation_timerange()
         return self.ID
@@ -132,15 +133,15 @@ class Scenario(object):
         db = conn[self.scenario_db]
         collection = db['BMP_SCENARIOS']
         try:
-            # find ScenarioID, remove if existed.
-            if collection.find({'ID': self.ID}, no_cursor_timeout=True).count():
-                collection.remove({'ID': self.ID})
+            # remove ScenarioID if existed.
+            collection.delete_many({'ID': self.ID})
         except NetworkTimeout or Exception:
             # In case of unexpected raise
             pass
         for objid, bmp_item in self.bmp_items.items():
             bmp_item['_id'] = ObjectId()
-            collection.insert_one(bmp_item)
+        if self.bmp_items:
+            collection.insert_many(list(self.bmp_items.values()), ordered=False)
         client.close()
 
     def export_scenario_to_txt(self):
@@ -202,6 +203,10 @@ class Scenario(object):
         """Calculate environment effectiveness, which is application specified."""
         pass
 
+    def exceed_budget(self):
+        """Check if the economy calculated by `calculate_economy` exceeds the budget."""
+        return self.budget is not None and self.economy > self.budget
+
     def execute_seims_model(self):
         """Run SEIMS for evaluating environmental effectiveness.
         If execution fails, the `self.economy` and `self.environment` will be set the worst values.
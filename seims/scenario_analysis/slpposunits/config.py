@@ -14,6 +14,8 @@ import json
 import operator
 from collections import OrderedDict
 
+import numpy
+
 if os.path.abspath(os.path.join(sys.path[0], '../..')) not in sys.path:
     sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '../..')))
 
@@ -32,7 +34,22 @@ class SASPUConfig(SAConfig):
             e.g., {16: 'valley', 1: 'summit', 4: 'backslope'}
         slppos_tagnames(list): Slope position tags and names along the hillslope sequence.
             e.g., [(1, 'summit'), (4, 'backslope'), (16, 'valley')]
-
+        landuse_ids(list): Sorted landuse IDs occurred in all slope position units.
+        unit_lu_area(numpy.ndarray): Areas of landuse (column, same order as `landuse_ids`)
+            within each slope position unit (row, same order as gene index).
+        bmps_cost(numpy.ndarray): Cost per unit area of each BMP (row, 0 means no BMP)
+            on each landuse (column), i.e., CAPEX + (OPEX - INCOME) * runtime_years.
+        bmps_cost_lut(numpy.ndarray): Lookup table from BMP ID to row index of `bmps_cost`.
+        unit_bmp_cost(numpy.ndarray): Cost of each BMP (column) configured on each slope
+            position unit (row), i.e., `unit_lu_area` dot transposed `bmps_cost`.
+        gene_tags(numpy.ndarray): Slope position tag of each gene.
+        gene_upslope(numpy.ndarray): Gene index of the upslope unit of each gene, -1 if none.
+        gene_downslope(numpy.ndarray): Gene index of the downslope unit of each gene, -1 if none.
+        bmp_choices(numpy.ndarray): Sorted candidate gene values, i.e., 0 and all BMP IDs.
+        slppos_suit_mask(dict): Bitmask (boolean array, same order as `bmp_choices`) of
+            suitable BMPs of each slope position tag, no-BMP (i.e., 0) is always suitable.
+        gene_suit_mask(numpy.ndarray): Suitable BMPs bitmask of each gene, (genes x choices).
+        gene_subbasins(list): Subbasin IDs of each gene.
     """
 
     def __init__(self, cf):
@@ -99,6 +116,24 @@ class SASPUConfig(SAConfig):
         self.read_bmp_parameters()
         self.get_suitable_bmps_for_slppos()
 
+        # 5. Unit-by-landuse area matrix and BMPs cost vectors for economy evaluation
+        self.landuse_ids = list()
+        self.unit_lu_area = None
+        self.bmps_cost = None
+        self.bmps_cost_lut = None
+        self.unit_bmp_cost = None
+        self.construct_economy_matrix()
+
+        # 6. Array-encoded hillslope topology and suitable BMPs bitmasks
+        self.gene_tags = None
+        self.gene_upslope = None
+        self.gene_downslope = None
+        self.bmp_choices = None
+        self.slppos_suit_mask = dict()
+        self.gene_suit_mask = None
+        self.gene_subbasins = None
+        self.compile_topology()
+
     def read_bmp_parameters(self):
         """Read BMP configuration from MongoDB."""
         client = ConnectMongoDB(self.hostname, self.port)
@@ -152,6 +187,77 @@ class SASPUConfig(SAConfig):
                 elif bid not in self.slppos_suit_bmps[sp]:
                     self.slppos_suit_bmps[sp].append(bid)
 
+    def construct_economy_matrix(self):
+        """Precompute the (unit x landuse) area matrix and the per-BMP cost vectors.
+
+        Then the economy of a population of gene arrays can be calculated by
+        `SPScenario.calculate_economy_population()` as one matrix operation.
+        """
+        unit_lu = dict()
+        for spname, spunits in self.units_infos.items():
+            if spname == 'overview':
+                continue
+            for uid, udict in spunits.items():
+                if uid in self.slppos_to_gene:
+                    unit_lu[uid] = udict.get('landuse', dict())
+        self.landuse_ids = sorted(set(luid for ludict in unit_lu.values() for luid in ludict))
+        lu_idx = dict((luid, i) for i, luid in enumerate(self.landuse_ids))
+
+        self.unit_lu_area = numpy.zeros((self.slppos_unit_num, len(self.landuse_ids)))
+        for uid, ludict in unit_lu.items():
+            gidx = self.slppos_to_gene[uid]
+            for luid, luarea in ludict.items():
+                self.unit_lu_area[gidx][lu_idx[luid]] = luarea
+
+        bmpids = sorted(self.bmps_params.keys())
+        self.bmps_cost = numpy.zeros((len(bmpids) + 1, len(self.landuse_ids)))
+        self.bmps_cost_lut = numpy.zeros(max(bmpids + [0]) + 1, dtype=numpy.int32)
+        for i, bid in enumerate(bmpids):
+            bparam = self.bmps_params[bid]
+            self.bmps_cost_lut[bid] = i + 1
+            cost = bparam['CAPEX'] + (bparam['OPEX'] - bparam['INCOME']) * self.runtime_years
+            if bparam.get('LANDUSE') is None:
+                self.bmps_cost[i + 1, :] = cost
+                continue
+            for luid in bparam['LANDUSE']:
+                if luid in lu_idx:
+                    self.bmps_cost[i + 1][lu_idx[luid]] = cost
+        self.unit_bmp_cost = self.unit_lu_area.dot(self.bmps_cost.T)
+
+    def compile_topology(self):
+        """Compile the topology of `UPDOWNJSON` into flat integer arrays indexed by gene,
+        and the suitable BMPs of each slope position tag into bitmasks.
+        """
+        self.gene_tags = numpy.zeros(self.slppos_unit_num, dtype=numpy.int32)
+        self.gene_upslope = numpy.full(self.slppos_unit_num, -1, dtype=numpy.int32)
+        self.gene_downslope = numpy.full(self.slppos_unit_num, -1, dtype=numpy.int32)
+        self.gene_subbasins = [list() for _ in range(self.slppos_unit_num)]
+        for tag, spname in self.slppos_tagnames:
+            for uid, udict in self.units_infos[spname].items():
+                if uid not in self.slppos_to_gene:
+                    continue
+                gidx = self.slppos_to_gene[uid]
+                self.gene_tags[gidx] = tag
+                if udict['upslope'] in self.slppos_to_gene:
+                    self.gene_upslope[gidx] = self.slppos_to_gene[udict['upslope']]
+                if udict['downslope'] in self.slppos_to_gene:
+                    self.gene_downslope[gidx] = self.slppos_to_gene[udict['downslope']]
+                subbsns = udict.get('subbasin', list())
+                if not isinstance(subbsns, list):
+                    subbsns = [subbsns]
+                self.gene_subbasins[gidx] = [int(v) for v in subbsns]
+
+        self.bmp_choices = numpy.array(sorted(set([0] + list(self.bmps_params.keys()))))
+        nochoice = numpy.zeros(len(self.bmp_choices), dtype=bool)
+        nochoice[0] = True
+        for tag, spname in self.slppos_tagnames:
+            self.slppos_suit_mask[tag] = nochoice.copy()
+            if tag in self.slppos_suit_bmps:
+                self.slppos_suit_mask[tag] |= numpy.isin(self.bmp_choices,
+                                                         self.slppos_suit_bmps[tag])
+        self.gene_suit_mask = numpy.array([self.slppos_suit_mask.get(tag, nochoice)
+                                           for tag in self.gene_tags], dtype=bool)
+
 
 if __name__ == '__main__':
     cf = get_config_parser()
@@ -0,0 +1,225 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Island-model NSGA-II for BMPs optimization based on slope position units.
+
+    Several sub-populations (islands) evolve independently, each on its own node or
+    worker group, e.g., launched by SCOOP with different host files:
+
+        python -m scoop --hostfile hosts0 -n 16 island.py -ini <config file> -island 0
+        python -m scoop --hostfile hosts1 -n 16 island.py -ini <config file> -island 1
+
+    Every `MigrationInterval` generations, the best `MigrationSize` individuals (by
+    non-dominated rank and crowding distance) of each island migrate to the next island
+    in a ring topology through MongoDB. The immigrants carry their fitness values,
+    so no extra model runs are needed. The latest unconsumed emigrants of the source island
+    (not later than the current generation) are received, hence the emigrants of a slower
+    island that arrive after `MigrationTimeout` are received by the next migration.
+    The fronts of all islands are merged by island 0 for hypervolume reporting.
+
+    Related settings in [NSGA2] section: `Islands`, `MigrationInterval`, `MigrationSize`,
+    and `MigrationTimeout`.
+"""
+from __future__ import absolute_import
+
+import argparse
+import os
+import sys
+import time
+
+try:
+    from ConfigParser import ConfigParser  # py2
+except ImportError:
+    from configparser import ConfigParser  # py3
+
+import numpy
+from deap import creator
+from pygeoc.utils import FileClass, UtilClass
+
+if os.path.abspath(os.path.join(sys.path[0], '../..')) not in sys.path:
+    sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '../..')))
+
+from preprocess.db_mongodb import ConnectMongoDB
+from scenario_analysis.emo import sel_nsga2, sort_nondominated, HypervolumeIndicator
+from scenario_analysis.slpposunits.config import SASPUConfig
+from scenario_analysis.slpposunits.main import main, multi_weight
+from scenario_analysis.utility import print_message
+from scenario_analysis.visualization import plot_pareto_front
+
+
+def get_island_config():
+    """Parse arguments.
+    Returns:
+        cf: ConfigParse object of *.ini file with the island ID set in [NSGA2] section.
+    """
+    parser = argparse.ArgumentParser(description='Run one island of island-model NSGA-II.')
+    parser.add_argument('-ini', type=str, help='Full path of configuration file')
+    parser.add_argument('-island', type=int, default=0, help='Island ID, 0 ~ Islands - 1')
+    args = parser.parse_args()
+    if not FileClass.is_file_exists(args.ini):
+        raise ImportError('Configuration file is not existed: %s' % args.ini)
+    cf = ConfigParser()
+    cf.read(args.ini)
+    cf.set('NSGA2', 'island_id', str(args.island))
+    return cf
+
+
+def create_individual(genes, fitness, sid=-1):
+    """Create an evaluated individual from gene values and fitness values."""
+    ind = creator.Individual(genes)
+    ind.fitness.values = tuple(fitness)
+    ind.id = sid
+    return ind
+
+
+class IslandMigration(object):
+    """Migrate individuals among islands through MongoDB, and publish fronts of each island.
+
+    The instance is passed to `main()` as the `migration` hook.
+    """
+
+    def __init__(self, cfg):
+        """Initialization."""
+        self.cfg = cfg
+        self.island_id = cfg.island_id
+        self.islands = cfg.islands
+        self.interval = cfg.migration_interval
+        self.size = cfg.migration_size
+        self.timeout = cfg.migration_timeout
+        self.run_name = cfg.nsga2_fn  # distinguish optimizations with different settings
+        self.source = (self.island_id - 1) % self.islands  # ring topology
+        self.merged_dir = '%s/NSGA2_OUTPUT/%s_islands' % (cfg.model_dir, self.run_name)
+        self.nd = cfg.nsga2_nd
+        self.hypervolume = HypervolumeIndicator(numpy.array([cfg.worst_econ, cfg.worst_env]) *
+                                                multi_weight * -1, cfg.hv_samples)
+        # Remove the outdated records of current island
+        client = ConnectMongoDB(cfg.hostname, cfg.port)
+        db = client.get_conn()[cfg.bmp_scenario_db]
+        for coll in ['ISLAND_MIGRANTS', 'ISLAND_FRONTS']:
+            db[coll].create_index([('RUN', 1), ('ISLAND', 1), ('GEN', 1)])
+            db[coll].delete_many({'RUN': self.run_name, 'ISLAND': self.island_id})
+        client.close()
+
+    def __call__(self, gen, pop):
+        """Publish the front of current generation, and migrate if needed."""
+        self.publish_front(gen, pop)
+        if self.islands < 2 or gen % self.interval != 0:
+            return pop
+        # Emigrate the best individuals by non-dominated rank and crowding distance
+        emigrants = sel_nsga2(pop, min(self.size, len(pop)), self.nd)
+        docs = [{'RUN': self.run_name, 'ISLAND': self.island_id, 'GEN': gen,
+                 'GENES': list(ind), 'FITNESS': list(ind.fitness.values), 'ID': ind.id,
+                 'CONSUMED': False}
+                for ind in emigrants]
+        client = ConnectMongoDB(self.cfg.hostname, self.cfg.port)
+        coll = client.get_conn()[self.cfg.bmp_scenario_db]['ISLAND_MIGRANTS']
+        coll.insert_many(docs)
+        # Wait for immigrants from the source island
+        immigrants = list()
+        stime = time.time()
+        while True:
+            immigrants = self.receive_immigrants(coll, gen)
+            if immigrants or time.time() - stime >= self.timeout:
+                break
+            time.sleep(1)
+        client.close()
+        if not immigrants:
+            print_message('Island %d, Gen %d: no immigrants from island %d' %
+                          (self.island_id, gen, self.source))
+            return pop
+        immigrants = [create_individual(doc['GENES'], doc['FITNESS'], doc['ID'])
+                      for doc in immigrants]
+        print_message('Island %d, Gen %d: %d immigrants from island %d' %
+                      (self.island_id, gen, len(immigrants), self.source))
+        if self.island_id == 0:
+            self.report_merged_front(gen)
+        return sel_nsga2(pop + immigrants, len(pop), self.nd)
+
+    def receive_immigrants(self, coll, gen):
+        """Receive the latest unconsumed emigrants of the source island no later than `gen`,
+        and mark them and the older ones as consumed.
+
+        Returns:
+            Documents of immigrants, empty if no emigrants are available.
+        """
+        query = {'RUN': self.run_name, 'ISLAND': self.source, 'GEN': {'$lte': gen},
+                 'CONSUMED': False}
+        latest = coll.find_one(query, sort=[('GEN', -1)])
+        if latest is None:
+            return list()
+        query['GEN'] = latest['GEN']
+        immigrants = list(coll.find(query))
+        query['GEN'] = {'$lte': latest['GEN']}
+        coll.update_many(query, {'$set': {'CONSUMED': True}})
+        return immigrants
+
+    def publish_front(self, gen, pop):
+        """Write the non-dominated front of current generation to MongoDB."""
+        front = sort_nondominated(pop, len(pop), True, self.nd)[0]
+        client = ConnectMongoDB(self.cfg.hostname, self.cfg.port)
+        coll = client.get_conn()[self.cfg.bmp_scenario_db]['ISLAND_FRONTS']
+        coll.insert_one({'RUN': self.run_name, 'ISLAND': self.island_id, 'GEN': gen,
+                         'GENES': [list(ind) for ind in front],
+                         'FITNESS': [list(ind.fitness.values) for ind in front],
+                         'ID': [ind.id for ind in front]})
+        client.close()
+
+    def merge_fronts(self, gen, wait=False):
+        """Merge the fronts of all islands at generation `gen`.
+
+        Args:
+            gen: Generation number.
+            wait: Wait for the fronts of all islands until timeout, otherwise use available ones.
+        Returns:
+            Merged non-dominated individuals, and the number of islands merged.
+        """
+        client = ConnectMongoDB(self.cfg.hostname, self.cfg.port)
+        coll = client.get_conn()[self.cfg.bmp_scenario_db]['ISLAND_FRONTS']
+        query = {'RUN': self.run_name, 'GEN': gen}
+        docs = list(coll.find(query))
+        stime = time.time()
+        while wait and len(docs) < self.islands and time.time() - stime < self.timeout:
+            time.sleep(1)
+            docs = list(coll.find(query))
+        client.close()
+        inds = list()
+        for doc in docs:
+            inds += [create_individual(g, f, i) for g, f, i in zip(doc['GENES'], doc['FITNESS'],
+                                                                   doc['ID'])]
+        if not inds:
+            return inds, 0
+        return sort_nondominated(inds, len(inds), True, self.nd)[0], len(docs)
+
+    def report_merged_front(self, gen, wait=False):
+        """Log hypervolume and plot the merged front of all islands."""
+        front, nislands = self.merge_fronts(gen, wait)
+        if not front:
+            return front
+        UtilClass.mkdir(self.merged_dir)
+        hyper_str = 'Gen: %d, islands: %d, merged front size: %d, hypervolume: %f\n' % \
+                    (gen, nislands, len(front), self.hypervolume(front))
+        print_message(hyper_str)
+        UtilClass.writelog(self.merged_dir + os.path.sep + 'hypervolume.txt', hyper_str,
+                           mode='append')
+        plot_pareto_front(numpy.array([ind.fitness.values for ind in front]),
+                          ['Economic effectiveness', 'Environmental effectiveness'],
+                          self.merged_dir, gen, 'Merged Pareto frontier of all islands')
+        return front
+
+
+if __name__ == "__main__":
+    cfg = SASPUConfig(get_island_config())
+
+    print_message('### START TO SCENARIOS OPTIMIZING ON ISLAND %d/%d ###' % (cfg.island_id,
+                                                                           cfg.islands))
+    startT = time.time()
+
+    migration = IslandMigration(cfg)
+    fpop, fstats = main(cfg, migration)
+    print_message(fstats)
+    with open(cfg.logbookfile, 'w') as f:
+        f.write(fstats.__str__())
+    if cfg.island_id == 0:
+        migration.report_merged_front(cfg.nsga2_ngens, wait=True)
+
+    endT = time.time()
+    print_message('Running time: %.2fs' % (endT - startT))
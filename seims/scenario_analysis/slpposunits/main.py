@@ -22,17 +22,21 @@ import numpy
 from deap import base
 from deap import creator
 from deap import tools
-from deap.benchmarks.tools import hypervolume
 from pygeoc.utils import UtilClass, get_config_parser
 
 if os.path.abspath(os.path.join(sys.path[0], '../..')) not in sys.path:
     sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '../..')))
 
 from scenario_analysis.slpposunits.config import SASPUConfig
-from scenario_analysis.slpposunits.scenario import initialize_scenario, scenario_effectiveness
-from scenario_analysis.slpposunits.userdef import crossover_slppos, crossover_rdm, mutate_rdm, mutate_slppos
+from scenario_analysis.slpposunits.scenario import initialize_scenario, scenario_effectiveness, \
+    prescreen_scenarios, decode_scenarios
+from scenario_analysis.slpposunits.userdef import crossover_slppos, crossover_rdm, mutate_rdm, \
+    mutate_slppos, population_to_matrix, crossover_matrix, mutate_matrix_rdm, mutate_matrix_slppos
+from scenario_analysis.emo import sel_nsga2, HypervolumeIndicator
 from scenario_analysis.userdef import initIterateWithCfg, initRepeatWithCfg
-from scenario_analysis.utility import print_message, delete_model_outputs
+from scenario_analysis.surrogate import AdditiveSurrogate, select_for_evaluation
+from scenario_analysis.utility import print_message, ScenarioRepository, \
+    write_population_records
 from scenario_analysis.visualization import plot_pareto_front
 
 # Definitions, assignments, operations, etc. that will be executed by each worker
@@ -57,20 +61,122 @@ toolbox.register('mutate_rule', mutate_slppos)
 # random-based mate and mutate
 toolbox.register('mate_rdn', crossover_rdm)
 toolbox.register('mutate_rdm', mutate_rdm)
+# population-level mate and mutate on gene matrix
+toolbox.register('mate_matrix', crossover_matrix)
+toolbox.register('mutate_matrix_rule', mutate_matrix_slppos)
+toolbox.register('mutate_matrix_rdm', mutate_matrix_rdm)
+
+toolbox.register('select', sel_nsga2)
+
+
+def vary_offspring(cfg, parents, possible_gene_values):
+    """Crossover and mutate the selected parents as a compact gene matrix.
+
+    Paired rows are crossed with the probability of `nsga2_rcross` and then mutated,
+    the same as the pairwise operators, e.g., `crossover_slppos` and `mutate_slppos`.
+    Individuals are created from the varied rows, except the unchanged ones which are
+    cloned with their evaluated fitness values.
+    """
+    targets = cfg.bmp_choices if cfg.bmps_rule else possible_gene_values
+    genes = population_to_matrix(parents, targets)
+    varied = genes.copy()
+    npaired = len(varied) // 2 * 2
+    if npaired >= 2:  # when offspring size greater than 2, mate can be done
+        paired = varied[:npaired]  # view, varied in place
+        block = len(cfg.slppos_tagnames) if cfg.bmps_rule else 1
+        toolbox.mate_matrix(paired, cfg.nsga2_rcross, block)
+        if cfg.bmps_rule:
+            toolbox.mutate_matrix_rule(cfg, paired, cfg.nsga2_pmut, cfg.nsga2_rmut,
+                                       cfg.rule_method)
+        else:
+            toolbox.mutate_matrix_rdm(possible_gene_values, paired, cfg.nsga2_pmut,
+                                      cfg.nsga2_rmut)
+    offspring = list()
+    for ind, old, new in zip(parents, genes, varied):
+        if numpy.array_equal(old, new):
+            offspring.append(toolbox.clone(ind))
+        else:
+            offspring.append(creator.Individual(new.tolist()))
+    return offspring
+
+
+def evaluate_scenarios(cfg, repository, individuals, evaluated=None, surrogate=None):
+    """Evaluate individuals by SEIMS, except those pre-screened by economy or by
+    the surrogate, which are assigned the worst values directly.
+    The scenarios to be evaluated are written to MongoDB in one batch by `repository`.
+
+    Returns:
+        The number of model runs.
+    """
+    need_run, econ = prescreen_scenarios(cfg, individuals, evaluated)
+    pred_env = None
+    if surrogate is not None and surrogate.fitted and any(need_run):
+        cand = numpy.where(need_run)[0]
+        pred_env, pred_std = surrogate.predict([individuals[i] for i in cand])
+        eval_fits = [ind.fitness.values for ind in evaluated] if evaluated else list()
+        selected = select_for_evaluation(econ[cand], pred_env, pred_std, eval_fits,
+                                         cfg.surrogate_ratio)
+        for i, sel in zip(cand, selected):
+            need_run[i] = bool(sel)
+        pred_env = dict((i, v) for i, v, sel in zip(cand, pred_env, selected) if sel)
+    run_ind = list()
+    for ind, run in zip(individuals, need_run):
+        if run:
+            run_ind.append(ind)
+            continue
+        ind.fitness.values = (cfg.worst_econ, cfg.worst_env)
+        ind.id = -1
+    if len(run_ind) < len(individuals):
+        print_message('Pre-screened scenarios without model runs: %d' %
+                      (len(individuals) - len(run_ind)))
+    scenarios = decode_scenarios(cfg, run_ind)
+    repository.insert_scenarios(scenarios)
+    sids = [sce.ID for sce in scenarios]
+    bmp_items = [sce.bmp_items for sce in scenarios]
+    try:
+        # parallel on multiprocesor or clusters using SCOOP
+        from scoop import futures
+        fitnesses = futures.map(toolbox.evaluate, [cfg] * len(run_ind), run_ind, sids,
+                                bmp_items)
+    except ImportError or ImportWarning:
+        # serial
+        fitnesses = toolbox.map(toolbox.evaluate, [cfg] * len(run_ind), run_ind, sids,
+                                bmp_items)
 
-toolbox.register('select', tools.selNSGA2)
-
+    for ind, fit in zip(run_ind, fitnesses):
+        ind.fitness.values = fit[:2]
+        ind.id = fit[2]
 
-def main(cfg):
-    """Main workflow of NSGA-II based Scenario analysis."""
+    if surrogate is not None:
+        # Predicted vs. actual environmental effectiveness of the real model runs
+        valid = [(i, ind) for i, ind in enumerate(individuals)
+                 if need_run[i] and ind.id >= 0 and ind.fitness.values[1] != cfg.worst_env]
+        if pred_env is not None and valid:
+            actual = numpy.array([ind.fitness.values[1] for i, ind in valid])
+            pred = numpy.array([pred_env[i] for i, ind in valid])
+            err_str = 'Surrogate, evaluated: %d, samples: %d, MAE: %f, RMSE: %f\n' % \
+                      (len(valid), len(surrogate.genes), numpy.mean(numpy.fabs(pred - actual)),
+                       numpy.sqrt(numpy.mean((pred - actual) ** 2)))
+            print_message(err_str)
+            UtilClass.writelog(cfg.surrogatelog, err_str, mode='append')
+        surrogate.add([ind for i, ind in valid], [ind.fitness.values[1] for i, ind in valid])
+        surrogate.fit()
+    return len(run_ind)
+
+
+def main(cfg, migration=None):
+    """Main workflow of NSGA-II based Scenario analysis.
+
+    Args:
+        cfg: SASPUConfig object.
+        migration: Callable with arguments (gen, pop) that returns the new population after
+                   exchanging individuals with other islands, e.g., `IslandMigration`.
+    """
     random.seed()
+    stime = time.time()
     pop_size = cfg.nsga2_npop
     gen_num = cfg.nsga2_ngens
     rule_cfg = cfg.bmps_rule
-    rule_mth = cfg.rule_method
-    cx_rate = cfg.nsga2_rcross
-    mut_perc = cfg.nsga2_pmut
-    mut_rate = cfg.nsga2_rmut
     sel_rate = cfg.nsga2_rsel
     ws = cfg.nsga2_dir
     worst_econ = cfg.worst_econ
@@ -78,17 +184,15 @@ def main(cfg):
     # available gene value list
     possible_gene_values = list(cfg.bmps_params.keys())
     possible_gene_values.append(0)
-    units_info = cfg.units_infos
-    slppos_tagnames = cfg.slppos_tagnames
-    suit_bmps = cfg.slppos_suit_bmps
-    gene_to_unit = cfg.gene_to_slppos
-    unit_to_gene = cfg.slppos_to_gene
 
     print_message('Population: %d, Generation: %d' % (pop_size, gen_num))
     print_message('BMPs configure method: %s' % ('rule-based' if rule_cfg else 'random-based'))
+    obj_labels = ['economy', 'environment']
 
     # create reference point for hypervolume
     ref_pt = numpy.array([worst_econ, worst_env]) * multi_weight * -1
+    hypervolume = HypervolumeIndicator(ref_pt, cfg.hv_samples)
+    toolbox.register('select', sel_nsga2, nd=cfg.nsga2_nd)
 
     stats = tools.Statistics(lambda sind: sind.fitness.values)
     stats.register('min', numpy.min, axis=0)
@@ -102,27 +206,21 @@ def main(cfg):
     pop = toolbox.population(cfg, n=pop_size)
     # Evaluate the individuals with an invalid fitness
     invalid_ind = [ind for ind in pop if not ind.fitness.valid]
-
-    try:
-        # parallel on multiprocesor or clusters using SCOOP
-        from scoop import futures
-        fitnesses = futures.map(toolbox.evaluate, [cfg] * len(invalid_ind), invalid_ind)
-        # print('parallel-fitnesses: ', fitnesses)
-    except ImportError or ImportWarning:
-        # serial
-        fitnesses = toolbox.map(toolbox.evaluate, [cfg] * len(invalid_ind), invalid_ind)
-        # print('serial-fitnesses: ', fitnesses)
-
-    for ind, fit in zip(invalid_ind, fitnesses):
-        ind.fitness.values = fit[:2]
-        ind.id = fit[2]
+    repository = ScenarioRepository(cfg.hostname, cfg.port, cfg.bmp_scenario_db)
+    surrogate = None
+    if cfg.surrogate:
+        surrogate = AdditiveSurrogate(possible_gene_values, cfg.surrogate_alpha,
+                                      cfg.surrogate_min_samples, cfg.surrogate_max_samples)
+    nevals = evaluate_scenarios(cfg, repository, invalid_ind, surrogate=surrogate)
 
     # This is just to assign the crowding distance to the individuals
     # no actual selection is done
     pop = toolbox.select(pop, pop_size)
     record = stats.compile(pop)
-    logbook.record(gen=0, evals=len(invalid_ind), **record)
+    logbook.record(gen=0, evals=nevals, **record)
     print_message(logbook.stream)
+    write_population_records(cfg.jsonlog, 0, pop, obj_labels, time.time() - stime,
+                             mode='replace')
 
     # Begin the generational process
     output_str = '### Generation number: %d, Population size: %d ###\n' % (gen_num, pop_size)
@@ -134,50 +232,24 @@ def main(cfg):
         print_message(output_str)
         # Vary the population
         offspring = tools.selTournamentDCD(pop, int(pop_size * sel_rate))
-        offspring = [toolbox.clone(ind) for ind in offspring]
-        # print_message('Offspring size: %d' % len(offspring))
-        if len(offspring) >= 2:  # when offspring size greater than 2, mate can be done
-            for ind1, ind2 in zip(offspring[::2], offspring[1::2]):
-                if random.random() <= cx_rate:
-                    if rule_cfg:
-                        toolbox.mate_rule(slppos_tagnames, ind1, ind2)
-                    else:
-                        toolbox.mate_rdn(ind1, ind2)
-                if rule_cfg:
-                    toolbox.mutate_rule(units_info, gene_to_unit, unit_to_gene, slppos_tagnames,
-                                        suit_bmps, ind1,
-                                        perc=mut_perc, indpb=mut_rate, method=rule_mth)
-                    toolbox.mutate_rule(units_info, gene_to_unit, unit_to_gene, slppos_tagnames,
-                                        suit_bmps, ind2,
-                                        perc=mut_perc, indpb=mut_rate, method=rule_mth)
-                else:
-                    toolbox.mutate_rdm(possible_gene_values, ind1, perc=mut_perc, indpb=mut_rate)
-                    toolbox.mutate_rdm(possible_gene_values, ind2, perc=mut_perc, indpb=mut_rate)
-                del ind1.fitness.values, ind2.fitness.values
+        offspring = vary_offspring(cfg, offspring, possible_gene_values)
 
         # Evaluate the individuals with an invalid fitness
         invalid_ind = [ind for ind in offspring if not ind.fitness.valid]
-        invalid_ind_size = len(invalid_ind)
-        # print_message('Evaluate pop size: %d' % invalid_ind_size)
-        try:
-            from scoop import futures
-            fitnesses = futures.map(toolbox.evaluate, [cfg] * invalid_ind_size, invalid_ind)
-        except ImportError or ImportWarning:
-            fitnesses = toolbox.map(toolbox.evaluate, [cfg] * invalid_ind_size, invalid_ind)
-
-        for ind, fit in zip(invalid_ind, fitnesses):
-            ind.fitness.values = fit[:2]
-            ind.id = fit[2]
+        # print_message('Evaluate pop size: %d' % len(invalid_ind))
+        nevals = evaluate_scenarios(cfg, repository, invalid_ind, pop, surrogate)
 
         # Select the next generation population
         pop = toolbox.select(pop + offspring, pop_size)
+        if migration is not None:
+            pop = migration(gen, pop)
 
-        hyper_str = 'Gen: %d, hypervolume: %f\n' % (gen, hypervolume(pop, ref_pt))
+        hyper_str = 'Gen: %d, hypervolume: %f\n' % (gen, hypervolume(pop))
         print_message(hyper_str)
         UtilClass.writelog(cfg.hypervlog, hyper_str, mode='append')
 
         record = stats.compile(pop)
-        logbook.record(gen=gen, evals=len(invalid_ind), **record)
+        logbook.record(gen=gen, evals=nevals, **record)
         print_message(logbook.stream)
 
         # Create plot
@@ -191,9 +263,10 @@ def main(cfg):
                                                 indi.fitness.values[1],
                                                 str(indi))
         UtilClass.writelog(cfg.logfile, output_str, mode='append')
+        write_population_records(cfg.jsonlog, gen, pop, obj_labels, time.time() - stime)
 
         # Delete SEIMS output files, and BMP Scenario database of current generation
-        delete_model_outputs(cfg.model_dir, cfg.hostname, cfg.port, cfg.bmp_scenario_db)
+        repository.delete_scenarios()
 
     return pop, logbook
 
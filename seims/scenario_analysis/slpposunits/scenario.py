@@ -8,11 +8,16 @@
 """
 from __future__ import absolute_import
 
+import atexit
 import os
 import sys
 import random
-import time
-from struct import unpack
+import threading
+
+try:
+    from Queue import Queue  # py2
+except ImportError:
+    from queue import Queue  # py3
 
 import numpy
 from gridfs import GridFS
@@ -26,11 +31,152 @@ if os.path.abspath(os.path.join(sys.path[0], '../..')) not in sys.path:
 
 from preprocess.db_mongodb import ConnectMongoDB
 from preprocess.text import DBTableNames, RasterMetadata
-from postprocess.utility import read_simulation_from_txt
+from postprocess.load_mongodb import ReadModelData
+from scenario_analysis.evaluator import RasterSumEvaluator, MaskedRasterEvaluator, \
+    OutletSeriesEvaluator, read_raster_window, wait_for_output
 from scenario_analysis.scenario import Scenario
+from scenario_analysis.utility import generate_uniqueid
 from scenario_analysis.slpposunits.config import SASPUConfig
 
 
+# Slope position units raster read from MongoDB, which is cached once per worker process.
+#   key: (hostname, port, dbname, filename)
+#   value: dict of unit IDs array, geotransform, srs, nodata value, and compact unit index
+_slppos_raster_cache = dict()
+
+
+def read_slppos_raster(hostname, port, dbname, dist_name):
+    """Read slope position units raster (or other zones raster, e.g., subbasins)
+    from MongoDB GridFS, and cache it.
+
+    Returns:
+        dict with keys: 'data', 'geotrans', 'srs', 'nodata', 'units', and 'unit_idx'.
+        'units' is the sorted unit IDs, and 'unit_idx' is the index of each cell in 'units',
+        -1 means the cell does not belong to any unit.
+    """
+    key = (hostname, port, dbname, dist_name)
+    if key in _slppos_raster_cache:
+        return _slppos_raster_cache[key]
+    client = ConnectMongoDB(hostname, port)
+    conn = client.get_conn()
+    maindb = conn[dbname]
+    spatial_gfs = GridFS(maindb, DBTableNames.gridfs_spatial)
+    if not spatial_gfs.exists(filename=dist_name):
+        print('WARNING: %s is not existed in %s!' % (dist_name, dbname))
+        client.close()
+        return None
+    try:
+        slpposf = maindb[DBTableNames.gridfs_spatial].files.find({'filename': dist_name},
+                                                                 no_cursor_timeout=True)[0]
+    except NetworkTimeout or Exception:
+        # In case of unexpected raise
+        client.close()
+        return None
+
+    ysize = int(slpposf['metadata'][RasterMetadata.nrows])
+    xsize = int(slpposf['metadata'][RasterMetadata.ncols])
+    xll = slpposf['metadata'][RasterMetadata.xll]
+    yll = slpposf['metadata'][RasterMetadata.yll]
+    cellsize = slpposf['metadata'][RasterMetadata.cellsize]
+    nodata_value = slpposf['metadata'][RasterMetadata.nodata]
+    srs = slpposf['metadata'][RasterMetadata.srs]
+    if isinstance(srs, text_type):
+        srs = str(srs)
+    srs = osr.GetUserInputAsWKT(srs)
+    geotransform = [0] * 6
+    geotransform[0] = xll - 0.5 * cellsize
+    geotransform[1] = cellsize
+    geotransform[3] = yll + (ysize - 0.5) * cellsize  # yMax
+    geotransform[5] = -cellsize
+
+    slppos_data = spatial_gfs.get(slpposf['_id'])
+    slppos_data = numpy.frombuffer(slppos_data.read(), dtype=numpy.float32,
+                                   count=xsize * ysize).reshape((ysize, xsize))
+    client.close()
+
+    units = numpy.unique(slppos_data[slppos_data != nodata_value])
+    unit_idx = numpy.searchsorted(units, slppos_data)
+    unit_idx[slppos_data == nodata_value] = -1
+    unit_idx = unit_idx.astype(numpy.int32)
+    _slppos_raster_cache[key] = {'data': slppos_data, 'geotrans': geotransform, 'srs': srs,
+                                 'nodata': nodata_value, 'units': units, 'unit_idx': unit_idx}
+    return _slppos_raster_cache[key]
+
+
+class BackgroundGTiffWriter(object):
+    """Write GeoTIFF files in a background thread to keep them off the evaluation path."""
+
+    def __init__(self):
+        self.queue = Queue()
+        self.thread = None
+
+    def write(self, *args):
+        """Queue the arguments of `RasterUtilClass.write_gtiff_file`."""
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._work)
+            self.thread.daemon = True
+            self.thread.start()
+            atexit.register(self.join)
+        self.queue.put(args)
+
+    def _work(self):
+        while True:
+            args = self.queue.get()
+            try:
+                RasterUtilClass.write_gtiff_file(*args)
+            except Exception as e:
+                print('WARNING: Write %s failed: %s' % (args[0], str(e)))
+            finally:
+                self.queue.task_done()
+
+    def join(self):
+        """Block until all queued files have been written."""
+        self.queue.join()
+
+
+_gtiff_writer = BackgroundGTiffWriter()
+
+# Environmental effectiveness evaluators, which are created once per worker process.
+#   key: (hostname, port, dbname, ENVEVAL, BASE_ENVEVAL)
+_env_evaluator_cache = dict()
+
+
+def get_environment_evaluator(hostname, port, dbname, enveval, base_enveval=None):
+    """Get the evaluator according to the type of `ENVEVAL` output.
+
+    - Raster (*.tif): If the output of base scenario `BASE_ENVEVAL` is provided, only the
+      cells of subbasins where BMPs are configured are read, see `MaskedRasterEvaluator`.
+    - Time series (*.txt): Sum of the simulation at the outlet, e.g., SED.txt.
+
+    Returns:
+        `EffectivenessEvaluator` object, None if the type of output is not supported.
+    """
+    key = (hostname, port, dbname, enveval, base_enveval)
+    if key in _env_evaluator_cache:
+        return _env_evaluator_cache[key]
+    evaluator = None
+    suffix = enveval.split('.')[-1]
+    if StringClass.string_match(suffix, 'tif'):
+        evaluator = RasterSumEvaluator()
+        if base_enveval and FileClass.is_file_exists(base_enveval):
+            subbsn_r = read_slppos_raster(hostname, port, dbname,
+                                          '0_%s' % RasterMetadata.subbasin)
+            base_data, base_nodata = read_raster_window(base_enveval)
+            if subbsn_r is not None and base_data is not None and \
+                    base_data.shape == subbsn_r['unit_idx'].shape:
+                evaluator = MaskedRasterEvaluator(subbsn_r['units'], subbsn_r['unit_idx'],
+                                                  base_data, base_nodata)
+            else:
+                print('WARNING: %s does not match the subbasin raster, '
+                      'the whole output raster will be evaluated.' % base_enveval)
+    elif StringClass.string_match(suffix, 'txt'):
+        read_model = ReadModelData(hostname, port, dbname)
+        stime, etime = read_model.SimulationPeriod
+        evaluator = OutletSeriesEvaluator(read_model.OutletID, stime, etime)
+    _env_evaluator_cache[key] = evaluator
+    return evaluator
+
+
 class SPScenario(Scenario):
     """Scenario analysis based on slope position units."""
 
@@ -48,78 +194,43 @@ class SPScenario(Scenario):
         self.unit_to_gene = cf.slppos_to_gene
         self.gene_to_unit = cf.gene_to_slppos
         self.cfg_years = cf.runtime_years
+        self.unit_bmp_cost = cf.unit_bmp_cost
+        self.bmps_cost_lut = cf.bmps_cost_lut
+        self.gene_tags = cf.gene_tags
+        self.gene_upslope = cf.gene_upslope
+        self.gene_downslope = cf.gene_downslope
+        self.gene_suit_mask = cf.gene_suit_mask
+        self.bmp_choices = cf.bmp_choices
+        self.gene_subbasins = cf.gene_subbasins
+        self.eval_timeout = self.bmps_info.get('ENVEVAL_TIMEOUT', 10.)
 
     def rule_based_config(self, conf_rate=0.5):
-        # from the bottom slope position of each hillslope, trace upslope
-        #    to config BMPs.
-        # Method 1: Config each slope position unit by corresponding suitable BMPs separately.
-        # Method 2: If downslope unit is not configured, the upslope unit should choose one BMP.
-        # Method 3: Based method 2, the base scheme shoule be upBMPID <= midBMPID <= downBMPID.
-        def config_bmp_for_unit(unit_id, slppostag, upsid, upgid, downsid, downgid, method=1):
-            """Config suitable BMP for the given slope position unit.
-            Args:
-                unit_id(int): Slope position unit ID
-                slppostag(int): Slope positon tag, e.g. 1, 4, 16
-                force(boolean): Force to config BMP
-                method(int): Domain knowledge based rule method.
-            Returns:
-                If configured, return (True, BMPID), otherwise return (False, 0).
-            """
-            # print('slppos: %d, unit: %d' % (slppostag, unit_id))
-            genidx = self.unit_to_gene[unit_id]
-
-            bmps = get_potential_bmps(self.suit_bmps, slppostag, upsid, upgid,
-                                      downsid, downgid, method)
-            # print('Config for unit: %d' % unitid)
-            configed = False
-            cfg_bmp = 0
-            if random.random() > conf_rate:
-                # Do not config BMP according to probability
-                # But if no-BMP (i.e., 0) is not allowed for current unit,
-                #    it is forced to config BMP.
-                if 0 in bmps:
-                    return configed, cfg_bmp
-
-            # config BMP
-            if len(bmps) >= 1:
-                cfg_bmp = bmps[random.randint(0, len(bmps) - 1)]
-                self.gene_values[genidx] = cfg_bmp
-                if cfg_bmp != 0:
-                    configed = True
-            # print('Config for unit: %d, slppos: %d, upgv: %d, downgv: %d, potBMPs: %s, '
-            #       'select: %d' % (unit_id, slppostag, upgid, downgid, bmps.__str__(), cfg_bmp))
-            # else:
-            #     print('No suitable BMP for unit: %d, slppos: %d, upgv: %d, downgv: %d'
-            #           % (unit_id, slppostag, upgid, downgid))
-            return configed, cfg_bmp
-
-        spname = self.slppos_tagnames[-1][1]  # the bottom slope position
-        for unitid, spdict in self.units_infos[spname].items():
-            up_spid = spdict['upslope']
-            down_spid = spdict['downslope']
-            spidx = len(self.slppos_tagnames) - 1
-            sptag = self.slppos_tagnames[spidx][0]
-            up_gv = 0
-            down_gv = -1
-            config_bmp_for_unit(unitid, sptag, up_spid, up_gv, down_spid, down_gv, self.rule_mtd)
-            while True:  # trace upstream units
-                if up_spid < 0:
-                    break
-                unitid = up_spid
-                up_gv = -1
-                down_gv = -1
-                spidx -= 1
-                sptag = self.slppos_tagnames[spidx][0]
-                spname = self.slppos_tagnames[spidx][1]
-                spdict = self.units_infos[spname][up_spid]
-                up_spid = spdict['upslope']
-                down_spid = spdict['downslope']
-                if up_spid >= 0:
-                    up_gv = self.gene_values[self.unit_to_gene[up_spid]]
-                if down_spid >= 0:
-                    down_gv = self.gene_values[self.unit_to_gene[down_spid]]
-                config_bmp_for_unit(unitid, sptag, up_spid, up_gv,
-                                    down_spid, down_gv, self.rule_mtd)
+        """Config BMPs from the bottom slope position of all hillslopes, and trace upslope.
+
+        Units of the same slope position are configured together since they belong to
+        different hillslopes, i.e., the upslope units have not been configured (0) and
+        the downslope units have been configured.
+
+        Method 1: Config each slope position unit by corresponding suitable BMPs separately.
+        Method 2: If downslope unit is not configured, the upslope unit should choose one BMP.
+        Method 3: Based method 2, the base scheme shoule be upBMPID <= midBMPID <= downBMPID.
+        """
+        genes = numpy.zeros((1, self.gene_num), dtype=numpy.int32)
+        for sptag, spname in reversed(self.slppos_tagnames):
+            cols = numpy.where(self.gene_tags == sptag)[0]
+            if len(cols) == 0:
+                continue
+            rows = numpy.zeros(len(cols), dtype=numpy.int32)
+            bmps = potential_bmps_mask(self.gene_suit_mask, self.gene_upslope,
+                                       self.gene_downslope, self.bmp_choices,
+                                       genes, rows, cols, self.rule_mtd)
+            # Do not config BMP according to probability, but if no-BMP (i.e., 0) is
+            #   not allowed for current unit, it is forced to config BMP.
+            skip = (numpy.random.random(len(cols)) > conf_rate) & bmps[:, 0]
+            chosen = choose_from_mask(bmps)
+            cfg_idx = (~skip) & (chosen >= 0)
+            genes[0, cols[cfg_idx]] = self.bmp_choices[chosen[cfg_idx]]
+        self.gene_values = genes[0].tolist()
 
     def random_based_config(self, conf_rate=0.5):
         pot_bmps = self.bmp_ids[:]
@@ -171,64 +282,60 @@ class SPScenario(Scenario):
         pass
 
     def calculate_economy(self):
-        self.economy = 0.
-        capex = 0.
-        opex = 0.
-        income = 0.
-        for idx, gene_v in enumerate(self.gene_values):
-            if gene_v == 0:
-                continue
-            unit_id = self.gene_to_unit[idx]
-            unit_lu = dict()
-            for spname, spunits in self.units_infos.items():
-                if unit_id in spunits:
-                    unit_lu = spunits[unit_id]['landuse']
-                    break
-            bmpparam = self.bmp_params[gene_v]
-            for luid, luarea in unit_lu.items():
-                if luid in bmpparam['LANDUSE'] or bmpparam['LANDUSE'] is None:
-                    capex += luarea * bmpparam['CAPEX']
-                    opex += luarea * bmpparam['OPEX'] * self.cfg_years
-                    income += luarea * bmpparam['INCOME'] * self.cfg_years
-
-        # self.economy = capex
-        # self.economy = capex + opex
-        self.economy = capex + opex - income
+        """Economy equals to capex + opex - income, see `SASPUConfig.bmps_cost`."""
+        self.economy = float(economy_of_genes(self.unit_bmp_cost, self.bmps_cost_lut,
+                                              self.gene_values)[0])
+
+    def affected_subbasins(self):
+        """Subbasin IDs where BMPs are configured."""
+        subbsns = set()
+        for i, gene_v in enumerate(self.gene_values):
+            if gene_v != 0:
+                subbsns.update(self.gene_subbasins[i])
+        return sorted(subbsns)
 
     def calculate_environment(self):
+        """Reduction rate of the annual amount of `ENVEVAL` compared with `BASE_ENV`.
+
+        The output is polled for readiness until `ENVEVAL_TIMEOUT` (default 10 s),
+        and then reduced by the evaluator, see `get_environment_evaluator`.
+        """
         if not self.modelrun:  # no evaluate done
             self.economy = self.worst_econ
             self.environment = self.worst_env
             return
         rfile = self.modelout_dir + os.path.sep + self.bmps_info['ENVEVAL']
-
-        if not FileClass.is_file_exists(rfile):
-            time.sleep(5)  # sleep 5 seconds wait for the ouput
-        if not FileClass.is_file_exists(rfile):
+        evaluator = get_environment_evaluator(self.hostname, self.port, self.main_db,
+                                              self.bmps_info['ENVEVAL'],
+                                              self.bmps_info.get('BASE_ENVEVAL'))
+        if evaluator is None:
+            print('WARNING: The type of output: %s is not supported!' % rfile)
+            self.economy = self.worst_econ
+            self.environment = self.worst_env
+            return
+        if not wait_for_output(rfile, self.eval_timeout):
             print('WARNING: Although SEIMS model runs successfully, the desired output: %s'
                   ' cannot be found!' % rfile)
             self.economy = self.worst_econ
             self.environment = self.worst_env
             return
 
-        base_amount = self.bmps_info['BASE_ENV']
-        if StringClass.string_match(rfile.split('.')[-1], 'tif'):  # Raster data
-            rr = RasterUtilClass.read_raster(rfile)
-            soil_erosion_amount = rr.get_sum() / self.timerange  # unit: year
-            # reduction rate of soil erosion
-            self.environment = (base_amount - soil_erosion_amount) / base_amount
-        elif StringClass.string_match(rfile.split('.')[-1], 'txt'):  # Time series data
-            sed_sum = read_simulation_from_txt(self.modelout_dir)  # TODO, fix it later, lj
-            self.environment = (base_amount - sed_sum) / base_amount
-        else:
+        amount = evaluator.amount(rfile, self.affected_subbasins())
+        if amount is None:
             self.economy = self.worst_econ
             self.environment = self.worst_env
             return
+        base_amount = self.bmps_info['BASE_ENV']
+        env_amount = amount / self.timerange  # unit: year
+        # reduction rate of the evaluated variable, e.g., soil erosion
+        self.environment = (base_amount - env_amount) / base_amount
 
     def export_scenario_to_gtiff(self, outpath=None):
         """Export scenario to GTiff.
 
-        TODO: Read Raster from MongoDB should be extracted to pygeoc.
+        The slope position units raster is read from MongoDB only once per worker process,
+        and the gene values are mapped to each cell by one lookup-table gather.
+        Writing GTiff is deferred to a background thread.
         """
         if not self.export_sce_tif:
             return
@@ -236,56 +343,76 @@ class SPScenario(Scenario):
         dist_list = StringClass.split_string(dist, '|')
         if len(dist_list) >= 2 and dist_list[0] == 'RASTER':
             dist_name = '0_' + dist_list[1]  # prefix 0_ means the whole basin
-            # read dist_name from MongoDB
-            client = ConnectMongoDB(self.hostname, self.port)
-            conn = client.get_conn()
-            maindb = conn[self.main_db]
-            spatial_gfs = GridFS(maindb, DBTableNames.gridfs_spatial)
-            # read file from mongodb
-            if not spatial_gfs.exists(filename=dist_name):
-                print('WARNING: %s is not existed, export scenario failed!' % dist_name)
-                return
-            try:
-                slpposf = maindb[DBTableNames.gridfs_spatial].files.find({'filename': dist_name},
-                                                                         no_cursor_timeout=True)[0]
-            except NetworkTimeout or Exception:
-                # In case of unexpected raise
-                client.close()
+            slppos_r = read_slppos_raster(self.hostname, self.port, self.main_db, dist_name)
+            if slppos_r is None:
                 return
-
-            ysize = int(slpposf['metadata'][RasterMetadata.nrows])
-            xsize = int(slpposf['metadata'][RasterMetadata.ncols])
-            xll = slpposf['metadata'][RasterMetadata.xll]
-            yll = slpposf['metadata'][RasterMetadata.yll]
-            cellsize = slpposf['metadata'][RasterMetadata.cellsize]
-            nodata_value = slpposf['metadata'][RasterMetadata.nodata]
-            srs = slpposf['metadata'][RasterMetadata.srs]
-            if isinstance(srs, text_type):
-                srs = str(srs)
-            srs = osr.GetUserInputAsWKT(srs)
-            geotransform = [0] * 6
-            geotransform[0] = xll - 0.5 * cellsize
-            geotransform[1] = cellsize
-            geotransform[3] = yll + (ysize - 0.5) * cellsize  # yMax
-            geotransform[5] = -cellsize
-
-            slppos_data = spatial_gfs.get(slpposf['_id'])
-            total_len = xsize * ysize
-            fmt = '%df' % (total_len,)
-            slppos_data = unpack(fmt, slppos_data.read())
-            slppos_data = numpy.reshape(slppos_data, (ysize, xsize))
-
-            v_dict = dict()
-            for idx, gene_v in enumerate(self.gene_values):
-                v_dict[self.gene_to_unit[idx]] = gene_v
-
-            for k, v in v_dict.items():
-                slppos_data[slppos_data == k] = v
+            # lookup table from compact unit index to gene value, unconfigured units keep IDs
+            units = slppos_r['units']
+            gene_units = numpy.array([self.gene_to_unit[i] for i in range(self.gene_num)])
+            gene_values = numpy.asarray(self.gene_values, dtype=numpy.float32)
+            uidx = numpy.searchsorted(units, gene_units)
+            uidx[uidx >= len(units)] = 0
+            matched = units[uidx] == gene_units
+            lut = units.copy()
+            lut[uidx[matched]] = gene_values[matched]
+            lut = numpy.append(lut, slppos_r['nodata']).astype(numpy.float32)
+            sce_data = numpy.take(lut, slppos_r['unit_idx'])  # -1 refers to nodata
             if outpath is None:
                 outpath = self.scenario_dir + os.path.sep + 'Scenario_%d.tif' % self.ID
-            RasterUtilClass.write_gtiff_file(outpath, ysize, xsize, slppos_data, geotransform,
-                                             srs, nodata_value)
-            client.close()
+            ysize, xsize = sce_data.shape
+            _gtiff_writer.write(outpath, ysize, xsize, sce_data, slppos_r['geotrans'],
+                                slppos_r['srs'], slppos_r['nodata'])
+
+
+def potential_bmps_mask(suit_mask, upslope, downslope, choices, genes, rows, cols, method=1):
+    """Vectorized `get_potential_bmps` for several genes of one or more individuals.
+
+    Args:
+        suit_mask: Suitable BMPs bitmask of each gene, (genes x choices), see `SASPUConfig`.
+        upslope: Gene index of the upslope unit of each gene, -1 if none.
+        downslope: Gene index of the downslope unit of each gene, -1 if none.
+        choices: Sorted candidate gene values, i.e., 0 and all BMP IDs.
+        genes: Gene values of individuals, (individuals x genes).
+        rows: Individual index of each gene to be configured.
+        cols: Gene index of each gene to be configured.
+        method: Domain knowledge based rule method.
+    Returns:
+        Bitmask (boolean array, same order as `choices`) of potential BMPs, (len(cols) x choices)
+    """
+    genes = numpy.asarray(genes)
+    rows = numpy.asarray(rows, dtype=numpy.int64)
+    cols = numpy.asarray(cols, dtype=numpy.int64)
+    bmps = suit_mask[cols].copy()
+    up_gid = upslope[cols]
+    down_gid = downslope[cols]
+    has_up = up_gid >= 0
+    has_down = down_gid >= 0
+    up_gv = numpy.where(has_up, genes[rows, up_gid], -1)
+    down_gv = numpy.where(has_down, genes[rows, down_gid], -1)
+    if method == 2:
+        # If not bottom slppos and the downslope unit is configured BMP, then remove 0
+        bmps[:, 0] &= ~(has_down & (down_gv == 0))
+    elif method == 3:
+        cv = choices[None, :]
+        top = (~has_up & (down_gv > 0))[:, None]  # the top slppos, and downslope with BMP
+        bottom = (~has_down & (up_gv > 0))[:, None]  # the bottom slppos, and upslope with BMP
+        middle = (has_up & has_down)[:, None]  # middle slppos
+        new_bmps = bmps & ((top & (cv <= down_gv[:, None])) |
+                           (bottom & (up_gv[:, None] <= cv)) |
+                           (middle & (up_gv[:, None] <= cv) &
+                            ((down_gv[:, None] == 0) | (cv <= down_gv[:, None]))))
+        replaced = new_bmps.any(axis=1)
+        bmps[replaced] = new_bmps[replaced]
+    return bmps
+
+
+def choose_from_mask(mask):
+    """Randomly choose one True column of each row, -1 if no True column."""
+    counts = mask.sum(axis=1)
+    kth = numpy.floor(numpy.random.random(len(counts)) * counts)
+    chosen = numpy.argmax(numpy.cumsum(mask, axis=1) > kth[:, None], axis=1)
+    chosen[counts == 0] = -1
+    return chosen
 
 
 def get_potential_bmps(suitbmps, sptag, up_sid, up_gvalue, down_sid, down_gvalue, method=1):
@@ -322,25 +449,112 @@ def get_potential_bmps(suitbmps, sptag, up_sid, up_gvalue, down_sid, down_gvalue
     return bmps
 
 
+def economy_of_genes(unit_bmp_cost, bmps_cost_lut, gene_values):
+    """Calculate economy of one or more gene arrays by one matrix operation.
+
+    Args:
+        unit_bmp_cost: Cost of each BMP on each slope position unit, (genes x BMPs).
+        bmps_cost_lut: Lookup table from BMP ID to column index of `unit_bmp_cost`.
+        gene_values: Gene array, or population of gene arrays (individuals x genes).
+    Returns:
+        Economy array with the length of individuals.
+    """
+    genes = numpy.asarray(gene_values, dtype=numpy.int32)
+    if genes.ndim == 1:
+        genes = genes.reshape(1, -1)
+    cost_idx = bmps_cost_lut[genes]
+    return unit_bmp_cost[numpy.arange(genes.shape[1]), cost_idx].sum(axis=1)
+
+
+def calculate_economy_population(cf, individuals):
+    """Calculate economy of a whole population, e.g., for pre-screening scenarios."""
+    return economy_of_genes(cf.unit_bmp_cost, cf.bmps_cost_lut, individuals)
+
+
+def prescreen_scenarios(cf, individuals, evaluated=None):
+    """Pre-screen scenarios by economy before decoding and running SEIMS.
+
+    A scenario does not need to be evaluated by SEIMS if:
+      1. its economy exceeds the budget (`cf.budget`), or
+      2. it is dominated by any evaluated scenario even if its environmental
+         effectiveness reaches the upper bound (`cf.upper_env`).
+
+    Args:
+        cf: SASPUConfig object.
+        individuals: Gene arrays to be evaluated.
+        evaluated: Evaluated individuals with valid fitness values, e.g., the parent population.
+    Returns:
+        Boolean list, True means the model run is required, and the economy array.
+    """
+    econ = calculate_economy_population(cf, individuals)
+    need_run = numpy.ones(len(econ), dtype=bool)
+    if cf.budget is not None:
+        need_run &= econ <= cf.budget
+    if cf.upper_env is not None and evaluated:
+        fits = numpy.array([ind.fitness.values for ind in evaluated if ind.fitness.valid])
+        if len(fits) > 0:
+            # minimize economy, and maximize environment
+            no_worse = (fits[:, 0] <= econ[:, None]) & (fits[:, 1] >= cf.upper_env)
+            better = (fits[:, 0] < econ[:, None]) | (fits[:, 1] > cf.upper_env)
+            need_run &= ~numpy.any(no_worse & better, axis=1)
+    return need_run.tolist(), econ
+
+
+def decode_scenarios(cf, individuals):
+    """Assign unique IDs and decode gene arrays to scenarios,
+    which can be written to MongoDB in one batch by `ScenarioRepository`.
+
+    Returns:
+        List of decoded `SPScenario` objects.
+    """
+    scenarios = list()
+    uid_gen = generate_uniqueid()
+    for individual in individuals:
+        sce = SPScenario(cf)
+        sce.ID = next(uid_gen)
+        sce.modelout_dir = '%s/OUTPUT%d' % (sce.model_dir, sce.ID)
+        setattr(sce, 'gene_values', individual)
+        sce.decoding()
+        scenarios.append(sce)
+    return scenarios
+
+
 def initialize_scenario(cf):
     sce = SPScenario(cf)
     return sce.initialize()
 
 
-def scenario_effectiveness(cf, individual):
+def scenario_effectiveness(cf, individual, sid=None, bmp_items=None):
+    """Evaluate the effectiveness of one individual.
+
+    Args:
+        cf: SASPUConfig object.
+        individual: Gene array.
+        sid: Scenario ID if the scenario has been written to MongoDB, e.g., by the driver
+             via `ScenarioRepository`, otherwise, it will be written by this function.
+        bmp_items: Decoded BMP items of the scenario, e.g., by `decode_scenarios` on the
+                   driver, otherwise, the gene array will be decoded by this function.
+    """
     # 1. instantiate the inherited Scenario class.
     sce = SPScenario(cf)
-    curid = sce.set_unique_id()
     setattr(sce, 'gene_values', individual)
-    # 2. decoding gene values to BMP items and exporting to MongoDB.
-    sce.decoding()
-    sce.export_to_mongodb()
-    # 3. execute SEIMS model
-    sce.execute_seims_model()
-    # 4. calculate scenario effectiveness
+    # 2. calculate economy first, and skip the model run if the budget is exceeded.
     sce.calculate_economy()
+    if sce.exceed_budget():
+        return sce.worst_econ, sce.worst_env, sce.ID
+    curid = sce.set_unique_id(sid)
+    # 3. decoding gene values to BMP items and exporting to MongoDB.
+    if bmp_items is None:
+        sce.decoding()
+    else:
+        sce.bmp_items = bmp_items
+    if sid is None:
+        sce.export_to_mongodb()
+    # 4. execute SEIMS model
+    sce.execute_seims_model()
+    # 5. calculate scenario environmental effectiveness
     sce.calculate_environment()
-    # 5. Export scenarios information
+    # 6. Export scenarios information
     sce.export_scenario_to_txt()
     sce.export_scenario_to_gtiff()
 
@@ -12,13 +12,15 @@ import os
 import sys
 import random
 
+import numpy
 from pygeoc.utils import get_config_parser
 
 if os.path.abspath(os.path.join(sys.path[0], '../..')) not in sys.path:
     sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '../..')))
 
 from scenario_analysis.slpposunits.config import SASPUConfig
-from scenario_analysis.slpposunits.scenario import SPScenario, initialize_scenario, get_potential_bmps
+from scenario_analysis.slpposunits.scenario import SPScenario, initialize_scenario, \
+    potential_bmps_mask, choose_from_mask
 
 
 #                                       #
@@ -95,19 +97,17 @@ def crossover_rdm(ind1, ind2):
 #               Mutate                  #
 #                                       #
 
-def mutate_slppos(unitsinfo, gene2unit, unit2gene, tagnames, suitbmps, individual,
-                  perc, indpb, method=1):
+def mutate_slppos(cf, individual, perc, indpb, method=1):
     """
     Mutation Gene values based on slope position rules.
     Old gene value is excluded from target values.
 
+    The slope position tag, upslope and downslope genes of all mutation points are
+    looked up from the array-encoded topology, see more detail on `SASPUConfig`.
+    Potential BMPs of all mutation points are derived from the gene values before mutation.
+
     Args:
-        unitsinfo(dict): Slope position units information, see more detail on `SASPUConfig`.
-        gene2unit(dict): Gene index to slope position unit ID.
-        unit2gene(dict): Slope position unit ID to gene index.
-        tagnames(list): slope position tags and names, from up to bottom of hillslope.
-                        The format is [(tag, name),...].
-        suitbmps(dict): key is slope position tag, and value is available BMPs IDs list.
+        cf(SASPUConfig): Configuration of scenario analysis based on slope position units.
         individual(list or tuple): Individual to be mutated.
         perc(float): percent of gene length for mutate, default is 0.02
         indpb(float): Independent probability for each attribute to be mutated.
@@ -125,58 +125,23 @@ def mutate_slppos(unitsinfo, gene2unit, unit2gene, tagnames, suitbmps, individua
     except ValueError or Exception:
         return individual
     # print('Max mutate num: %d' % mut_num)
-    muted = list()
-    for m in range(mut_num):
-        if random.random() > indpb:
-            continue
-        # mutate will happen
-        mpoint = random.randint(0, len(individual) - 1)
-        while mpoint in muted:
-            mpoint = random.randint(0, len(individual) - 1)
-
-        oldgenev = individual[mpoint]
-        unitid = gene2unit[mpoint]
-        # begin to mutate on unitid
-        # 1. get slope position tag, and upslope and downslope unit IDs
-        sptag = -1
-        down_sid = -1  # slppos unit ID
-        down_gid = -1  # gene index
-        down_gvalue = -1  # gene value
-        up_sid = -1
-        up_gid = -1
-        up_gvalue = -1
-        for spid, spdict in unitsinfo.items():
-            if unitid not in spdict:
-                continue
-            for t, n in tagnames:
-                if spid == n:
-                    sptag = t
-                    break
-            down_sid = spdict[unitid]['downslope']
-            up_sid = spdict[unitid]['upslope']
-            if down_sid > 0:
-                down_gid = unit2gene[down_sid]
-                down_gvalue = individual[down_gid]
-            if up_sid > 0:
-                up_gid = unit2gene[up_sid]
-                up_gvalue = individual[up_gid]
-        if sptag < 0:  # this circumstance may not happen, just in case.
-            continue
-
-        # print('  Mutate on slppos: %d (unit: %d, oldgene: %d), upgene: %d, downgene: %d' %
-        #       (sptag, unitid, oldgenev, up_gvalue, down_gvalue))
-        # get the potential BMP IDs
-
-        bmps = get_potential_bmps(suitbmps, sptag, up_sid, up_gvalue, down_sid, down_gvalue, method)
-        # Get new BMP ID for current unit.
-        if oldgenev in bmps:
-            bmps.remove(oldgenev)
-        # print('    method: %d, potBMPs: %s' % (method, bmps.__str__()))
-        if len(bmps) > 0:
-            individual[mpoint] = bmps[random.randint(0, len(bmps) - 1)]
-            muted.append(mpoint)
-        else:  # No available BMP
-            pass
+    mut_num = sum(1 for _ in range(mut_num) if random.random() <= indpb)
+    if mut_num == 0:
+        return individual
+    mpoints = numpy.array(random.sample(range(len(individual)), mut_num))
+    genes = numpy.array(individual, dtype=numpy.int32).reshape(1, -1)
+    bmps = potential_bmps_mask(cf.gene_suit_mask, cf.gene_upslope, cf.gene_downslope,
+                               cf.bmp_choices, genes, numpy.zeros(mut_num, dtype=numpy.int32),
+                               mpoints, method)
+    # Get new BMP ID for current unit.
+    old_idx = numpy.searchsorted(cf.bmp_choices, genes[0, mpoints])
+    old_idx[old_idx >= len(cf.bmp_choices)] = 0
+    is_old = cf.bmp_choices[old_idx] == genes[0, mpoints]
+    bmps[numpy.where(is_old)[0], old_idx[is_old]] = False
+    chosen = choose_from_mask(bmps)
+    for mpoint, cidx in zip(mpoints, chosen):
+        if cidx >= 0:  # otherwise, no available BMP
+            individual[mpoint] = cf.bmp_choices[cidx]
     return individual
 
 
@@ -202,22 +167,141 @@ def mutate_rdm(bmps_mut_target, individual, perc, indpb):
         mut_num = random.randint(1, int(len(individual) * perc))
     except ValueError or Exception:
         return individual
-    muted = list()
-    for m in range(mut_num):
-        if random.random() < indpb:
-            mpoint = random.randint(0, len(individual) - 1)
-            while mpoint in muted:
-                mpoint = random.randint(0, len(individual) - 1)
-            muted.append(mpoint)
-            target = bmps_mut_target[:]
-            target = list(set(target))
-            if individual[mpoint] in target:
-                target.remove(individual[mpoint])
-            ind = random.randint(0, len(target) - 1)
-            individual[mpoint] = target[ind]
+    mut_num = sum(1 for _ in range(mut_num) if random.random() < indpb)
+    if mut_num == 0:
+        return individual
+    targets = sorted(set(bmps_mut_target))
+    for mpoint in random.sample(range(len(individual)), mut_num):
+        target = [v for v in targets if v != individual[mpoint]]
+        individual[mpoint] = target[random.randint(0, len(target) - 1)]
     return individual
 
 
+#                                       #
+#     Population-level on gene matrix   #
+#                                       #
+
+def population_to_matrix(individuals, targets=None):
+    """Convert individuals to a compact integer matrix (individuals x genes).
+
+    The narrowest integer type of int8, int16, int32, and int64 that holds all gene values
+    and all possible target values (e.g., BMP IDs of mutation) is used, so that
+    the values assigned to the matrix later will not overflow.
+
+    Args:
+        individuals: List of gene arrays.
+        targets: (Optional) All values that may be assigned to the matrix, e.g.,
+                 `possible_gene_values` of `mutate_matrix_rdm` or `cf.bmp_choices` of
+                 `mutate_matrix_slppos`.
+    """
+    genes = numpy.array(individuals)
+    values = numpy.concatenate((genes.ravel(), numpy.asarray(targets if targets is not None
+                                                             else [], dtype=numpy.int64)))
+    dtype = numpy.int64
+    if values.size:
+        for cur_type in [numpy.int8, numpy.int16, numpy.int32]:
+            if numpy.iinfo(cur_type).min <= values.min() and \
+                    values.max() <= numpy.iinfo(cur_type).max:
+                dtype = cur_type
+                break
+    return genes.astype(dtype)
+
+
+def sample_mutation_points(rows, size, perc, indpb):
+    """Draw mutation points of all rows in bulk, the same distribution as `mutate_rdm`,
+    i.e., randint(1, size * perc) tries, each succeeds with the probability of `indpb`.
+
+    Returns:
+        Row and column indexes of mutation points.
+    """
+    perc = min(max(perc, 0.01), 0.5)
+    max_num = int(size * perc)
+    if rows == 0 or max_num < 1:
+        return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64)
+    tries = numpy.random.randint(1, max_num + 1, rows)
+    success = numpy.random.random((rows, max_num)) < indpb
+    mut_num = numpy.sum(success & (numpy.arange(max_num) < tries[:, None]), axis=1)
+    # distinct points of each row, i.e., the first `mut_num` of a random permutation
+    points = numpy.argsort(numpy.random.random((rows, size)), axis=1)[:, :max_num]
+    selected = numpy.arange(max_num) < mut_num[:, None]
+    return numpy.nonzero(selected)[0], points[selected]
+
+
+def crossover_matrix(genes, cx_rate, block=1):
+    """Two-point crossover of paired rows (0 and 1, 2 and 3, ...) of gene matrix in place.
+
+    Args:
+        genes: Gene matrix (individuals x genes).
+        cx_rate: Probability of crossover of each pair.
+        block: Crossover points are aligned to multiples of `block`, e.g., the number of
+               slope positions for `crossover_slppos`, and 1 for `crossover_rdm`.
+    Returns:
+        Boolean array, True means the pair has been crossed.
+    """
+    npairs = len(genes) // 2
+    size = genes.shape[1]
+    crossed = numpy.random.random(npairs) <= cx_rate
+    nblocks = size // block
+    if not crossed.any() or nblocks < 2:
+        return numpy.zeros(npairs, dtype=bool)
+    pairs = numpy.where(crossed)[0]
+    start = numpy.zeros(len(pairs), dtype=numpy.int64)
+    end = numpy.full(len(pairs), nblocks, dtype=numpy.int64)
+    redraw = numpy.ones(len(pairs), dtype=bool)
+    while redraw.any():  # avoid change the entire genes
+        num = int(redraw.sum())
+        p1 = numpy.random.randint(0, nblocks, num)
+        p2 = numpy.random.randint(1, nblocks + 1, num)
+        start[redraw] = numpy.minimum(p1, p2)
+        end[redraw] = numpy.maximum(numpy.maximum(p1, p2), numpy.minimum(p1, p2) + 1)
+        redraw = (start == 0) & (end == nblocks)
+    start *= block
+    end = numpy.where(end == nblocks, size, end * block)
+    idx = numpy.arange(size)
+    mask = (idx >= start[:, None]) & (idx < end[:, None])
+    rows1 = genes[pairs * 2]
+    rows2 = genes[pairs * 2 + 1]
+    genes[pairs * 2] = numpy.where(mask, rows2, rows1)
+    genes[pairs * 2 + 1] = numpy.where(mask, rows1, rows2)
+    return crossed
+
+
+def mutate_matrix_rdm(bmps_mut_target, genes, perc, indpb):
+    """Mutate all rows of gene matrix randomly in place, see `mutate_rdm`."""
+    targets = numpy.array(sorted(set(list(bmps_mut_target) + [0])))
+    rows, cols = sample_mutation_points(len(genes), genes.shape[1], perc, indpb)
+    if len(rows) == 0 or len(targets) < 2:
+        return genes
+    old = genes[rows, cols]
+    old_idx = numpy.searchsorted(targets, old)
+    old_idx[old_idx >= len(targets)] = 0
+    is_old = targets[old_idx] == old
+    # draw from targets except the old value
+    tidx = numpy.random.randint(0, len(targets) - 1, len(rows))
+    tidx[is_old & (tidx >= old_idx)] += 1
+    genes[rows, cols] = targets[tidx]
+    return genes
+
+
+def mutate_matrix_slppos(cf, genes, perc, indpb, method=1):
+    """Mutate all rows of gene matrix in place based on slope position rules,
+    see `mutate_slppos`."""
+    rows, cols = sample_mutation_points(len(genes), genes.shape[1], perc, indpb)
+    if len(rows) == 0:
+        return genes
+    bmps = potential_bmps_mask(cf.gene_suit_mask, cf.gene_upslope, cf.gene_downslope,
+                               cf.bmp_choices, genes, rows, cols, method)
+    old = genes[rows, cols]
+    old_idx = numpy.searchsorted(cf.bmp_choices, old)
+    old_idx[old_idx >= len(cf.bmp_choices)] = 0
+    is_old = cf.bmp_choices[old_idx] == old
+    bmps[numpy.where(is_old)[0], old_idx[is_old]] = False
+    chosen = choose_from_mask(bmps)
+    valid = chosen >= 0  # otherwise, no available BMP
+    genes[rows[valid], cols[valid]] = cf.bmp_choices[chosen[valid]]
+    return genes
+
+
 if __name__ == '__main__':
     cf = get_config_parser()
     cfg = SASPUConfig(cf)
@@ -225,11 +309,6 @@ if __name__ == '__main__':
     # print(cfg.gene_to_slppos)
     # print(cfg.slppos_suit_bmps)
 
-    units_info = cfg.units_infos
-    slppos_tagnames = cfg.slppos_tagnames
-    suit_bmps = cfg.slppos_suit_bmps
-    gene_to_unit = cfg.gene_to_slppos
-    unit_to_gene = cfg.slppos_to_gene
     init_gene_values = initialize_scenario(cfg)
     # print('Initial genes: %s' % init_gene_values.__str__())sce = SPScenario(cfg)
     sce = SPScenario(cfg)
@@ -237,8 +316,7 @@ if __name__ == '__main__':
     setattr(sce, 'gene_values', init_gene_values)
     sce.calculate_economy()
     inicost = sce.economy
-    mutate_slppos(units_info, gene_to_unit, unit_to_gene, slppos_tagnames, suit_bmps,
-                  init_gene_values, 0.2, 0.3, method=1)
+    mutate_slppos(cfg, init_gene_values, 0.2, 0.3, method=1)
     # print('Mutated genes: %s' % init_gene_values.__str__())
     setattr(sce, 'gene_values', init_gene_values)
     sce.calculate_economy()
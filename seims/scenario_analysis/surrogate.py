@@ -0,0 +1,142 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Additive response surrogate for pre-screening scenarios before running SEIMS.
+
+    The environmental effectiveness of BMPs configured on spatial units is assumed to be
+    approximately additive, i.e.,
+
+        env(genes) = b + sum_i w[i, genes[i]], where w[i, 0] = 0 (no BMP).
+
+    The contribution `w` of each (unit, BMP) pair is fitted by ridge regression on the one-hot
+    gene encodings of the evaluated scenarios, and the intercept `b` is not regularized.
+    Since the number of evaluated scenarios is far less than the number of (unit, BMP) pairs,
+    the regression is solved in the dual form with the centered kernel.
+"""
+from __future__ import absolute_import
+
+import math
+
+import numpy
+
+
+class AdditiveSurrogate(object):
+    """Additive per-(unit, BMP) surrogate of environmental effectiveness.
+
+    Attributes:
+        values(numpy.ndarray): Gene values except 0, i.e., BMP IDs.
+        alpha(float): L2 regularization coefficient.
+        min_samples(int): Minimum evaluated scenarios before the surrogate is used.
+        max_samples(int): Maximum latest evaluated scenarios used for fitting.
+    """
+
+    def __init__(self, values, alpha=1., min_samples=8, max_samples=1000):
+        """Initialization."""
+        self.values = numpy.array(sorted(set(v for v in values if v != 0)))
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.genes = list()
+        self.env = list()
+        # fitted model
+        self.train = None
+        self.dual_coef = None
+        self.kernel_inv = None
+        self.kernel_mean = None  # column means of the kernel of training scenarios
+        self.intercept = 0.
+        self.sigma2 = 0.
+
+    @property
+    def fitted(self):
+        return self.dual_coef is not None
+
+    def add(self, genes, env):
+        """Add evaluated scenarios."""
+        for g, e in zip(genes, env):
+            self.genes.append(numpy.array(g, dtype=numpy.int32))
+            self.env.append(e)
+        if len(self.genes) > self.max_samples:
+            self.genes = self.genes[-self.max_samples:]
+            self.env = self.env[-self.max_samples:]
+
+    def _kernel(self, genes_a, genes_b):
+        """Inner products of one-hot encodings, i.e., count of the same (unit, BMP) pairs."""
+        k = numpy.zeros((len(genes_a), len(genes_b)))
+        for v in self.values:
+            k += numpy.dot((genes_a == v).astype(numpy.float64),
+                           (genes_b == v).astype(numpy.float64).T)
+        return k
+
+    def fit(self):
+        """Fit the surrogate by ridge regression, return False if samples are not enough."""
+        if len(self.genes) < self.min_samples:
+            return False
+        self.train = numpy.array(self.genes)
+        y = numpy.array(self.env, dtype=numpy.float64)
+        kernel = self._kernel(self.train, self.train)
+        self.kernel_mean = kernel.mean(axis=0)
+        centered = kernel - self.kernel_mean - self.kernel_mean[:, None] + self.kernel_mean.mean()
+        self.kernel_inv = numpy.linalg.inv(centered + self.alpha * numpy.eye(len(y)))
+        self.dual_coef = self.kernel_inv.dot(y - y.mean())
+        self.intercept = y.mean() - self.kernel_mean.dot(self.dual_coef)
+        residual = y - self.intercept - kernel.dot(self.dual_coef)
+        self.sigma2 = float(numpy.mean(residual ** 2))
+        return True
+
+    def predict(self, genes):
+        """Predict environmental effectiveness and its standard deviation."""
+        genes = numpy.asarray(genes, dtype=numpy.int32)
+        k = self._kernel(genes, self.train)
+        mean = self.intercept + k.dot(self.dual_coef)
+        kxx = numpy.zeros(len(genes))
+        for v in self.values:
+            kxx += (genes == v).sum(axis=1)
+        # centered by the mean encoding of training scenarios
+        k_mean = k.mean(axis=1)
+        kc = k - k_mean[:, None] - self.kernel_mean + self.kernel_mean.mean()
+        var = kxx - 2. * k_mean + self.kernel_mean.mean() - \
+            numpy.sum(kc.dot(self.kernel_inv) * kc, axis=1)
+        std = numpy.sqrt(self.sigma2 * (1. + numpy.maximum(var, 0.) / self.alpha))
+        return mean, std
+
+    def contributions(self):
+        """Contribution of each (unit, BMP) pair, (genes x values), same order as `values`."""
+        return numpy.array([numpy.dot((self.train == v).T.astype(numpy.float64),
+                                      self.dual_coef) for v in self.values]).T
+
+
+def select_for_evaluation(econ, pred_env, pred_std, evaluated_fits, ratio=0.5):
+    """Select the most promising and the least certain candidates for model runs.
+
+    Half of the selected candidates are the least dominated ones by the evaluated
+    individuals and other candidates with optimistic environment (mean + std),
+    the others are the ones with the largest uncertainty. The non-dominated candidates
+    are always selected unless there are more of them than the selected candidates.
+
+    Args:
+        econ: Economy of candidates (minimized).
+        pred_env: Predicted environmental effectiveness of candidates (maximized).
+        pred_std: Standard deviation of the prediction.
+        evaluated_fits: Fitness values of evaluated individuals, (n x 2).
+        ratio: Ratio of candidates to be evaluated by model.
+    Returns:
+        Boolean array, True means the candidate should be evaluated by model.
+    """
+    num = len(econ)
+    nsel = min(num, int(math.ceil(num * ratio)))
+    selected = numpy.zeros(num, dtype=bool)
+    if nsel == 0:
+        return selected
+    optimistic = pred_env + pred_std
+    ref = numpy.concatenate((numpy.array(evaluated_fits, dtype=numpy.float64).reshape(-1, 2),
+                             numpy.column_stack((econ, optimistic))))
+    no_worse = (ref[:, 0] <= econ[:, None]) & (ref[:, 1] >= optimistic[:, None])
+    better = (ref[:, 0] < econ[:, None]) | (ref[:, 1] > optimistic[:, None])
+    dominated_count = numpy.sum(no_worse & better, axis=1)
+    order = numpy.lexsort((-optimistic, dominated_count))
+    npromising = max(int(math.ceil(nsel / 2.)), min(nsel, int(numpy.sum(dominated_count == 0))))
+    selected[order[:npromising]] = True
+    for idx in numpy.argsort(-pred_std):
+        if selected.sum() >= nsel:
+            break
+        selected[idx] = True
+    return selected
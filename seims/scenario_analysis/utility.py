@@ -8,13 +8,14 @@
 """
 from __future__ import absolute_import
 
+import json
 import os
 import sys
 import shutil
 import uuid
 
 import scoop
-from pygeoc.utils import MathClass
+from bson.objectid import ObjectId
 
 if os.path.abspath(os.path.join(sys.path[0], '..')) not in sys.path:
     sys.path.insert(0, os.path.abspath(os.path.join(sys.path[0], '..')))
@@ -41,29 +42,102 @@ def print_message(msg):
         print(msg)
 
 
+def write_population_records(jsonfile, gen, pop, labels, elapsed=None, mode='append'):
+    """Write one JSON record per individual of the population, e.g.,
+
+        {"gen": 3, "id": 165392731, "objectives": {"economy": 23.5, "environment": 0.31},
+         "genes": [0, 1, 3, ...], "elapsed": 512.3}
+
+    The generation the individual was created at (`born`) and the timespans of its model
+    run (`timing`) are recorded if the individual has the corresponding attributes,
+    e.g., individuals of calibration.
+
+    Args:
+        jsonfile: Full path of the JSON-lines file.
+        gen: Current generation number.
+        pop: Evaluated individuals.
+        labels: Names of fitness values, the same order as `fitness.values`.
+        elapsed: (Optional) Elapsed time since the beginning of optimization.
+        mode: 'append' or 'replace'.
+    """
+    lines = list()
+    for ind in pop:
+        record = {'gen': gen, 'id': int(ind.id),
+                  'objectives': dict((name, float(v)) for name, v in zip(labels,
+                                                                         ind.fitness.values)),
+                  'genes': [float(v) for v in ind]}
+        if hasattr(ind, 'gen'):
+            record['born'] = int(ind.gen)
+        if hasattr(ind, 'runtime'):
+            record['timing'] = {'io': ind.io_time, 'comp': ind.comp_time,
+                                'simu': ind.simu_time, 'runtime': ind.runtime}
+        if elapsed is not None:
+            record['elapsed'] = elapsed
+        lines.append(json.dumps(record))
+    with open(jsonfile, 'w' if mode == 'replace' else 'a') as f:
+        f.write('\n'.join(lines) + '\n' if lines else '')
+
+
 def delete_scenarios_by_ids(hostname, port, dbname, sids):
     """Delete scenario data by ID in MongoDB."""
     client = ConnectMongoDB(hostname, port)
     conn = client.get_conn()
     db = conn[dbname]
     collection = db['BMP_SCENARIOS']
-    for _id in sids:
-        collection.remove({'ID': _id})
-        print('Delete scenario: %d in MongoDB completed!' % _id)
+    collection.delete_many({'ID': {'$in': list(sids)}})
+    print('Delete %d scenarios in MongoDB completed!' % len(sids))
     client.close()
 
 
-def delete_model_outputs(model_workdir, hostname, port, dbname):
-    """Delete model outputs and scenario in MongoDB."""
-    f_list = os.listdir(model_workdir)
-    sids = list()
-    for f in f_list:
-        outfilename = model_workdir + os.path.sep + f
-        if os.path.isdir(outfilename):
-            if len(f) > 9:
-                if MathClass.isnumerical(f[-9:]):
-                    shutil.rmtree(outfilename)
-                    sid = int(f[-9:])
-                    sids.append(sid)
-    if len(sids) > 0:
-        delete_scenarios_by_ids(hostname, port, dbname, sids)
+class ScenarioRepository(object):
+    """Batched scenario writes and deletes in the BMP scenario database.
+
+    Scenarios of one generation are written by one `insert_many`, and removed by one
+    `delete_many` together with the explicitly tracked model output directories.
+    """
+
+    def __init__(self, hostname, port, dbname):
+        """Initialize and create index on `ID` of BMP_SCENARIOS collection."""
+        self.hostname = hostname
+        self.port = port
+        self.dbname = dbname
+        self.outputs = dict()  # key: Scenario ID, value: model output directory
+        client = ConnectMongoDB(self.hostname, self.port)
+        conn = client.get_conn()
+        conn[self.dbname]['BMP_SCENARIOS'].create_index('ID')
+        client.close()
+
+    def insert_scenarios(self, scenarios):
+        """Write decoded scenarios (i.e., `Scenario` objects) to MongoDB in one batch.
+        The existed items with the same IDs will be deleted first.
+        """
+        sids = list()
+        items = list()
+        for sce in scenarios:
+            sids.append(sce.ID)
+            for bmp_item in sce.bmp_items.values():
+                bmp_item = dict(bmp_item)
+                bmp_item['_id'] = ObjectId()
+                items.append(bmp_item)
+            self.outputs[sce.ID] = sce.modelout_dir
+        if not sids:
+            return
+        client = ConnectMongoDB(self.hostname, self.port)
+        conn = client.get_conn()
+        collection = conn[self.dbname]['BMP_SCENARIOS']
+        collection.delete_many({'ID': {'$in': sids}})
+        if items:
+            collection.insert_many(items, ordered=False)
+        client.close()
+
+    def delete_scenarios(self, sids=None):
+        """Delete scenarios and model outputs by IDs, all tracked scenarios by default."""
+        if sids is None:
+            sids = list(self.outputs.keys())
+        if not sids:
+            return
+        for sid in sids:
+            outdir = self.outputs.pop(sid, None)
+            if outdir is not None and os.path.isdir(outdir):
+                shutil.rmtree(outdir, ignore_errors=True)
+        delete_scenarios_by_ids(self.hostname, self.port, self.dbname, sids)
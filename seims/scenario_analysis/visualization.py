@@ -9,6 +9,7 @@
 """
 from __future__ import absolute_import
 
+import json
 import sys
 from collections import OrderedDict
 
@@ -373,17 +374,88 @@ def read_pareto_popsize_from_txt(txt_file, sce_name='scenario'):
         # now append the real Pareto front point data
         pareto_popnum[cur_gen].append(int(values[iden_idx]))
 
-    all_sceids = list()
+    all_sceids = set()
     acc_num = list()
     genids = sorted(list(pareto_popnum.keys()))
     for idx, genid in enumerate(genids):
-        for _id in pareto_popnum[genid]:
-            if _id not in all_sceids:
-                all_sceids.append(_id)
+        all_sceids.update(pareto_popnum[genid])
         acc_num.append(len(all_sceids))
     return genids, acc_num
 
 
+def load_population_records(jsonfile, headers):
+    """Load the JSON-lines log written by `write_population_records` as arrays.
+
+    Args:
+        jsonfile: Full path of `runtime.jsonl`.
+        headers: Objective names to be loaded, case insensitive as `read_pareto_points_from_txt`.
+
+    Returns:
+        gens: Generation numbers, int array (n,)
+        idens: Identities of individuals, int array (n, 2), i.e., (born generation, ID),
+               the born generation is -1 if not recorded.
+        objs: Objective values, float array (n, len(headers)), NaN if absent.
+    """
+    gens = list()
+    idens = list()
+    objs = list()
+    new_headers = [hd.upper() for hd in headers]
+    with open(jsonfile, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            rec = json.loads(line)
+            gens.append(rec['gen'])
+            idens.append((rec.get('born', -1), rec['id']))
+            rec_objs = dict((k.upper(), v) for k, v in rec['objectives'].items())
+            objs.append([rec_objs.get(hd, numpy.nan) for hd in new_headers])
+    return (numpy.array(gens, dtype=numpy.int64),
+            numpy.array(idens, dtype=numpy.int64).reshape(-1, 2),
+            numpy.array(objs, dtype=numpy.float64).reshape(-1, len(headers)))
+
+
+def read_pareto_from_jsonl(jsonfile, headers):
+    """Read Pareto points and accumulated population size from `runtime.jsonl`.
+
+    The initial population (generation 0) is excluded, which is not logged in `runtime.log`,
+    so that the return values are the same as `read_pareto_from_txt`.
+
+    Returns:
+        pareto_points: `OrderedDict`, key is generation ID,
+                       value is dict of objective arrays with `headers` as keys.
+        (genids, acc_num): Generation IDs and accumulated number of distinct individuals.
+    """
+    gens, idens, objs = load_population_records(jsonfile, headers)
+    evolved = gens > 0
+    gens = gens[evolved]
+    idens = idens[evolved]
+    objs = objs[evolved]
+    order = numpy.argsort(gens, kind='mergesort')
+    gens = gens[order]
+    idens = idens[order]
+    objs = objs[order]
+    genids, starts = numpy.unique(gens, return_index=True)
+    pareto_points = OrderedDict()
+    for genid, gen_objs in zip(genids, numpy.split(objs, starts[1:])):
+        pareto_points[int(genid)] = dict((hd, gen_objs[:, i]) for i, hd in enumerate(headers))
+    # The generation each distinct individual first appears at
+    _, first_idx = numpy.unique(idens, axis=0, return_index=True)
+    first_gens = numpy.sort(gens[first_idx])
+    acc_num = numpy.searchsorted(first_gens, genids, side='right')
+    return pareto_points, (genids.tolist(), acc_num.tolist())
+
+
+def read_pareto_from_txt(txt_file, sce_name, headers):
+    """Read Pareto points and accumulated population size from `runtime.log`,
+    the same return values as `read_pareto_from_jsonl`."""
+    points, _ = read_pareto_points_from_txt(txt_file, sce_name, headers)
+    pareto_points = OrderedDict()
+    for genid, gen_points in points.items():
+        gen_points = numpy.array(gen_points, dtype=numpy.float64).reshape(-1, len(headers))
+        pareto_points[genid] = dict((hd, gen_points[:, i]) for i, hd in enumerate(headers))
+    return pareto_points, read_pareto_popsize_from_txt(txt_file, sce_name)
+
+
 def plot_pareto_fronts_fromfile(method_paths, sce_name, xname, yname, gens, ws):
     """
     Plot Pareto fronts of different method at a same generation for comparision.
@@ -399,8 +471,14 @@ def plot_pareto_fronts_fromfile(method_paths, sce_name, xname, yname, gens, ws):
     pareto_data = OrderedDict()
     acc_pop_size = OrderedDict()
     for k, v in method_paths.items():
-        v = v + os.path.sep + 'runtime.log'
-        pareto_data[k], acc_pop_size[k] = read_pareto_points_from_txt(v, sce_name, xname, yname)
+        jsonfile = v + os.path.sep + 'runtime.jsonl'
+        if os.path.exists(jsonfile):
+            pareto_data[k], acc_pop_size[k] = read_pareto_from_jsonl(jsonfile,
+                                                                     [xname[0], yname[0]])
+        else:
+            txtfile = v + os.path.sep + 'runtime.log'
+            pareto_data[k], acc_pop_size[k] = read_pareto_from_txt(txtfile, sce_name,
+                                                                   [xname[0], yname[0]])
     # print(pareto_data)
     ylabel_str = yname[1]
     xlabel_str = xname[1]
@@ -424,7 +502,6 @@ def plot_pareto_fronts_fromfile(method_paths, sce_name, xname, yname, gens, ws):
     for method, gen_popsize in acc_pop_size.items():
         xdata = gen_popsize[0]
         ydata = gen_popsize[1]
-        print(ydata)
         print('Evaluated pop size: %s - %d' % (method, ydata[-1]))
         plt.plot(xdata, ydata, linestyle=linestyles[mark_idx], color='black',
                  label=method, linewidth=2)
@@ -453,11 +530,8 @@ def plot_pareto_fronts_fromfile(method_paths, sce_name, xname, yname, gens, ws):
     mark_idx = 0
     for method, gen_popsize in pareto_data.items():
         fig, ax = plt.subplots(figsize=(9, 8))
-        xdata = list()
-        ydata = list()
-        for gen, gendata in gen_popsize.items():
-            xdata += gen_popsize[gen][xname[0]]
-            ydata += gen_popsize[gen][yname[0]]
+        xdata = numpy.concatenate([gendata[xname[0]] for gendata in gen_popsize.values()])
+        ydata = numpy.concatenate([gendata[yname[0]] for gendata in gen_popsize.values()])
         plt.scatter(xdata, ydata, marker=markers[mark_idx], s=20,
                     color=colors[mark_idx], label=method)
         mark_idx += 1
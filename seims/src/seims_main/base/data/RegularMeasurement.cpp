@@ -2,6 +2,9 @@
 
 #include <sstream>
 #include <memory>
+#include <algorithm>
+#include <cmath>
+#include <cstring>
 
 #include "text.h"
 #include "utils_time.h"
@@ -94,6 +97,13 @@ RegularMeasurement::RegularMeasurement(MongoClient* conn, const string& hydroDBN
         m_siteData[index][iSite] = value;
         index++;
     }
+    if (iSite < 0) {
+        /// No data in DATA_VALUES, try the bucket layout
+        bson_destroy(query);
+        mongoc_cursor_destroy(cursor);
+        ReadFromBuckets(hydroDBName, siteType, nRecords);
+        return;
+    }
     if (CVT_INT(index) < nRecords) {
         std::ostringstream oss;
         oss << "There are no adequate data of " << siteType << " for sites:[" << sitesList << "] in database:" <<
@@ -112,6 +122,101 @@ RegularMeasurement::RegularMeasurement(MongoClient* conn, const string& hydroDBN
     mongoc_cursor_destroy(cursor);
 }
 
+void RegularMeasurement::ReadFromBuckets(const string& hydroDBName, const string& siteType,
+                                         const int nRecords) {
+    int nSites = CVT_INT(m_siteIDList.size());
+    for (int i = 0; i < nRecords; i++) {
+        float* tmpData = nullptr;
+        utils_array::Initialize1DArray(nSites, tmpData, 0.f);
+        m_siteData.emplace_back(tmpData);
+    }
+    /// build query statement, buckets overlapped with the simulation period
+    bson_t* query = bson_new();
+    bson_t* child = bson_new();
+    bson_t* child2 = bson_new();
+    bson_t* child3 = bson_new();
+    BSON_APPEND_DOCUMENT_BEGIN(query, "$query", child);
+    BSON_APPEND_DOCUMENT_BEGIN(child, MONG_HYDRO_DATA_SITEID, child2);
+    BSON_APPEND_ARRAY_BEGIN(child2, "$in", child3);
+    std::ostringstream ossIndex;
+    for (int i = 0; i < nSites; i++) {
+        ossIndex.str("");
+        ossIndex << i;
+        BSON_APPEND_INT32(child3, ossIndex.str().c_str(), m_siteIDList[i]);
+    }
+    bson_append_array_end(child2, child3);
+    bson_append_document_end(child, child2);
+    bson_destroy(child2);
+    bson_destroy(child3);
+    BSON_APPEND_UTF8(child, MONG_HYDRO_SITE_TYPE, siteType.c_str());
+    child2 = bson_new();
+    BSON_APPEND_DOCUMENT_BEGIN(child, MONG_HYDRO_BUCKET_UTCEND, child2);
+    BSON_APPEND_TIME_T(child2, "$gte", m_startTime);
+    bson_append_document_end(child, child2);
+    bson_destroy(child2);
+    child2 = bson_new();
+    BSON_APPEND_DOCUMENT_BEGIN(child, MONG_HYDRO_BUCKET_UTCSTART, child2);
+    BSON_APPEND_TIME_T(child2, "$lte", m_endTime);
+    bson_append_document_end(child, child2);
+    bson_destroy(child2);
+    bson_append_document_end(query, child);
+    bson_destroy(child);
+
+    std::unique_ptr<MongoCollection> collection(new MongoCollection(m_conn->GetCollection(hydroDBName,
+                                                                                          DB_TAB_DATABUCKETS)));
+    mongoc_cursor_t* cursor = collection->ExecuteQuery(query);
+
+    vector<int> counts(nSites, 0);
+    const bson_t* doc;
+    while (mongoc_cursor_more(cursor) && mongoc_cursor_next(cursor, &doc)) {
+        bson_iter_t iter;
+        int stationID = -1;
+        int interval = 0;
+        time_t startTime = 0;
+        bson_subtype_t subtype;
+        uint32_t length = 0;
+        const uint8_t* packed = nullptr;
+        if (bson_iter_init_find(&iter, doc, MONG_HYDRO_DATA_SITEID)) {
+            GetNumericFromBsonIterator(&iter, stationID);
+        }
+        if (bson_iter_init_find(&iter, doc, MONG_HYDRO_BUCKET_INTERVAL)) {
+            GetNumericFromBsonIterator(&iter, interval);
+        }
+        if (bson_iter_init_find(&iter, doc, MONG_HYDRO_BUCKET_UTCSTART) && BSON_ITER_HOLDS_DATE_TIME(&iter)) {
+            startTime = static_cast<time_t>(bson_iter_date_time(&iter) / 1000);
+        }
+        if (bson_iter_init_find(&iter, doc, MONG_HYDRO_BUCKET_VALUES) && BSON_ITER_HOLDS_BINARY(&iter)) {
+            bson_iter_binary(&iter, &subtype, &length, &packed);
+        }
+        auto it = std::find(m_siteIDList.begin(), m_siteIDList.end(), stationID);
+        if (it == m_siteIDList.end() || interval <= 0 || nullptr == packed) {
+            throw ModelException("RegularMeasurement", "ReadFromBuckets",
+                                 "Invalid bucket document in " + string(DB_TAB_DATABUCKETS) + ".");
+        }
+        int iSite = CVT_INT(it - m_siteIDList.begin());
+        float value;
+        for (uint32_t k = 0; k < length / sizeof(float); k++) {
+            time_t t = startTime + static_cast<time_t>(k) * interval;
+            if (t < m_startTime || t > m_endTime || (t - m_startTime) % m_interval != 0) continue;
+            memcpy(&value, packed + k * sizeof(float), sizeof(float));
+            if (std::isnan(value)) continue;
+            m_siteData[CVT_INT((t - m_startTime) / m_interval)][iSite] = value;
+            counts[iSite]++;
+        }
+    }
+    bson_destroy(query);
+    mongoc_cursor_destroy(cursor);
+    for (int i = 0; i < nSites; i++) {
+        if (counts[i] < nRecords) {
+            std::ostringstream oss;
+            oss << "There are no adequate data of " << siteType << " for site " << m_siteIDList[i] <<
+                    " in database:" << hydroDBName << " during " << ConvertToString2(m_startTime) << " to " <<
+                    ConvertToString2(m_endTime) << "You may want to check the database or the input simulation period!";
+            throw ModelException("RegularMeasurement", "ReadFromBuckets", oss.str());
+        }
+    }
+}
+
 RegularMeasurement::~RegularMeasurement() {
     for (auto it = m_siteData.begin(); it != m_siteData.end();) {
         if (*it != nullptr) {
@@ -43,6 +43,16 @@ public:
     float* GetSiteDataByTime(time_t t) OVERRIDE;
 
 private:
+    /*!
+     * \brief Read data from DATA_BUCKETS, i.e., packed float32 values of one station and type
+     *        in a year or month with start time and interval
+     *
+     * \param[in] hydroDBName \a string, HydroClimate database name
+     * \param[in] siteType \a string, site type
+     * \param[in] nRecords \a int, number of records during the simulation period
+     */
+    void ReadFromBuckets(const string& hydroDBName, const string& siteType, int nRecords);
+
     vector<float *> m_siteData; ///< data array ordered by sites
     time_t m_interval;          ///< data record interval
 };
@@ -60,13 +60,32 @@ bool ItpWeightData::ReadFromMongoDB(MongoGridFs* gfs, const string& filename) {
     char* databuf = nullptr;
     size_t datalength;
     gfs->GetStreamData(wfilename, databuf, datalength);
-    if (nullptr == databuf) false;
+    if (nullptr == databuf) return false;
 
-    itp_weight_data_ = reinterpret_cast<float *>(databuf); // deprecate C-style: (float *) databuf
     /// Get metadata
     bson_t* md = gfs->GetFileMetadata(wfilename);
     /// Get value of given keys
     GetNumericFromBson(md, MONG_GRIDFS_WEIGHT_CELLS, n_rows_);
     GetNumericFromBson(md, MONG_GRIDFS_WEIGHT_SITES, n_cols_);
+    /// Sparse weights of k-nearest sites: (cells x k) int32 site indexes followed by
+    ///   (cells x k) float32 weights, which are expanded to the dense (cells x sites) array.
+    bson_iter_t iter;
+    if (bson_iter_init_find(&iter, md, MONG_GRIDFS_WEIGHT_ENCODING) &&
+        StringMatch(GetStringFromBsonIterator(&iter), MONG_GRIDFS_WEIGHT_SPARSE)) {
+        int n_neighbors = 0;
+        GetNumericFromBson(md, MONG_GRIDFS_WEIGHT_NEIGHBORS, n_neighbors);
+        int* site_idx = reinterpret_cast<int *>(databuf);
+        float* weights = reinterpret_cast<float *>(databuf + sizeof(int) * n_rows_ * n_neighbors);
+        Initialize1DArray(n_rows_ * n_cols_, itp_weight_data_, 0.f);
+        for (int i = 0; i < n_rows_; i++) {
+            for (int j = 0; j < n_neighbors; j++) {
+                int index = i * n_neighbors + j;
+                itp_weight_data_[i * n_cols_ + site_idx[index]] += weights[index];
+            }
+        }
+        free(databuf);
+        return true;
+    }
+    itp_weight_data_ = reinterpret_cast<float *>(databuf); // deprecate C-style: (float *) databuf
     return true;
 }
@@ -177,6 +177,7 @@
 #define DB_TAB_SPATIAL                         "SPATIAL"  /// i.e., spatial.files
 #define DB_TAB_SITES                           "SITES"
 #define DB_TAB_DATAVALUES                      "DATA_VALUES" // hydroClimate data values
+#define DB_TAB_DATABUCKETS                     "DATA_BUCKETS" // hydroClimate data buckets
 #define DB_TAB_MEASUREMENT                     "MEASUREMENT"
 #define DB_TAB_ANNSTAT                         "ANNUAL_STATS"
 #define DB_TAB_OUT_SPATIAL                     "OUTPUT"
@@ -1944,6 +1945,9 @@
 #define MONG_GRIDFS_FN                         "filename"
 #define MONG_GRIDFS_WEIGHT_CELLS               "NUM_CELLS"
 #define MONG_GRIDFS_WEIGHT_SITES               "NUM_SITES"
+#define MONG_GRIDFS_WEIGHT_NEIGHBORS           "NUM_NEIGHBORS"
+#define MONG_GRIDFS_WEIGHT_ENCODING            "ENCODING"
+#define MONG_GRIDFS_WEIGHT_SPARSE              "SPARSE"
 #define MONG_GRIDFS_ID                         "ID"
 #define MONG_GRIDFS_SUBBSN                     "SUBBASIN"
 #define MONG_HYDRO_SITE_TYPE                   "TYPE"
@@ -1953,6 +1957,10 @@
 #define MONG_HYDRO_DATA_UTC                    "UTCDATETIME"
 #define MONG_HYDRO_DATA_LOCALT                 "LOCALDATETIME"
 #define MONG_HYDRO_DATA_VALUE                  "VALUE"
+#define MONG_HYDRO_BUCKET_UTCSTART             "UTCSTART"
+#define MONG_HYDRO_BUCKET_UTCEND               "UTCEND"
+#define MONG_HYDRO_BUCKET_INTERVAL             "INTERVAL"
+#define MONG_HYDRO_BUCKET_VALUES               "VALUES"
 #define MONG_SITELIST_SUBBSN                   "SUBBASINID"
 #define MONG_SITELIST_DB                       "DB"
 
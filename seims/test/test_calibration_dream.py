@@ -0,0 +1,96 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  Unittest of the DREAM sampler of Bayesian calibration.
+"""
+from __future__ import absolute_import
+
+import os
+import sys
+import unittest
+
+if os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) not in sys.path:
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy
+
+from calibration.dream import DREAMSampler, gelman_rubin, gaussian_loglikelihood
+
+MEAN = numpy.array([2., -1.])
+STD = numpy.array([0.5, 1.])
+
+
+def target_logp(values):
+    """Log-density of independent normal distribution, (samples x parameters)."""
+    return -0.5 * numpy.sum(((numpy.atleast_2d(values) - MEAN) / STD) ** 2, axis=1)
+
+
+class TestGelmanRubin(unittest.TestCase):
+    """R-hat of mixed and separated chains."""
+
+    def test_mixed_chains(self):
+        rng = numpy.random.RandomState(39)
+        rhat = gelman_rubin(rng.normal(0., 1., (4, 2000, 2)))
+        self.assertTrue((numpy.fabs(rhat - 1.) < 0.01).all())
+
+    def test_separated_chains(self):
+        rng = numpy.random.RandomState(39)
+        chains = rng.normal(0., 1., (4, 100, 1))
+        chains[0] += 10.
+        self.assertGreater(gelman_rubin(chains)[0], 2.)
+
+    def test_too_few_iterations(self):
+        self.assertTrue(numpy.isinf(gelman_rubin(numpy.zeros((4, 1, 3)))).all())
+
+
+class TestLogLikelihood(unittest.TestCase):
+    """Gaussian log-likelihood with the error variance integrated out."""
+
+    def test_loglikelihood(self):
+        data = {'Q': {'Obs': [1., 2., 3., 4.], 'Sim': [1., 2., 3., 6.]}}
+        self.assertAlmostEqual(gaussian_loglikelihood(data, ['Q']), -2. * numpy.log(4.))
+        self.assertEqual(gaussian_loglikelihood(data, ['Q', 'SED']), -numpy.inf)
+        data['Q']['Sim'][0] = numpy.nan
+        self.assertEqual(gaussian_loglikelihood(data, ['Q']), -numpy.inf)
+
+
+class TestDREAMSampler(unittest.TestCase):
+    """Sample a known posterior by batches of proposals, as `main_dream` does."""
+
+    def setUp(self):
+        self.bounds = [[-5., 10.], [-10., 10.]]
+        self.sampler = DREAMSampler(self.bounds, 8, seed=39)
+        rng = numpy.random.RandomState(39)
+        init = rng.uniform([-5., -10.], [10., 10.], (8, 2))
+        self.sampler.initialize(init, target_logp(init))
+
+    def test_proposals_within_bounds(self):
+        for _ in range(50):
+            proposals = self.sampler.propose()
+            self.assertEqual(proposals.shape, (8, 2))
+            self.assertTrue((proposals >= [-5., -10.]).all())
+            self.assertTrue((proposals < [10., 10.]).all())
+            self.sampler.update(proposals, target_logp(proposals))
+
+    def test_reject_failed_runs(self):
+        states = self.sampler.states.copy()
+        accept = self.sampler.update(self.sampler.propose(), numpy.full(8, -numpy.inf))
+        self.assertFalse(accept.any())
+        numpy.testing.assert_array_equal(self.sampler.states, states)
+
+    def test_posterior(self):
+        niters = 3000
+        for _ in range(niters):
+            proposals = self.sampler.propose()
+            self.sampler.update(proposals, target_logp(proposals))
+            self.sampler.remove_outliers(niters)
+        self.assertTrue((self.sampler.rhat() < 1.2).all())
+        samples = numpy.array(self.sampler.history[niters // 2:]).reshape(-1, 2)
+        numpy.testing.assert_allclose(samples.mean(axis=0), MEAN, atol=0.2)
+        numpy.testing.assert_allclose(samples.std(axis=0), STD, rtol=0.2)
+        rate = self.sampler.acceptance_rate
+        self.assertTrue(((rate > 0.05) & (rate < 0.9)).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
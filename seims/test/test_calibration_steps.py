@@ -0,0 +1,125 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  Unittest of the warm-started staged calibration, e.g., Q -> SED -> NUTRIENT.
+"""
+from __future__ import absolute_import
+
+import os
+import sys
+import unittest
+
+if os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) not in sys.path:
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy
+
+try:
+    from calibration.calibrate import Calibration, ObsSimData
+except ImportError as err:  # e.g., pygeoc or pymongo is not installed
+    raise unittest.SkipTest('Calibration is not available: %s' % err)
+
+try:
+    from calibration.main_nsga2 import reuse_seeds
+except ImportError:  # e.g., SALib is not installed
+    reuse_seeds = None
+
+
+def calibration_object(names, bounds, impacts):
+    """Calibration object with the parameters of current step, without MongoDB."""
+    cali = Calibration.__new__(Calibration)
+    cali.param_defs = {'names': list(names), 'bounds': [list(b) for b in bounds],
+                       'num_vars': len(names), 'impacts': list(impacts)}
+    return cali
+
+
+class TestMergeParamDefs(unittest.TestCase):
+    """Parameters carried by seeds are placed first, the current bounds take precedence."""
+
+    def test_merge(self):
+        cali = calibration_object(['C', 'A', 'D'], [[0., 1.], [10., 20.], [-1., 1.]],
+                                  [0.5, 15., 0.])
+        defs = cali.merge_param_defs(['A', 'B'], [[0., 5.], [1., 2.]], [1., 1.5])
+        self.assertEqual(defs['names'], ['A', 'B', 'C', 'D'])
+        self.assertEqual(defs['bounds'], [[10., 20.], [1., 2.], [0., 1.], [-1., 1.]])
+        self.assertEqual(defs['impacts'], [15., 1.5, 0.5, 0.])
+        self.assertEqual(defs['num_vars'], 4)
+        self.assertIs(cali.ParamDefs, defs)
+
+
+class TestInitializeAroundSeeds(unittest.TestCase):
+    """Samples are within the radius around seeds and the global bounds."""
+
+    def setUp(self):
+        numpy.random.seed(38)
+        self.cali = calibration_object(['A', 'B', 'C'], [[0., 10.], [-1., 1.], [5., 6.]],
+                                       [5., 0., 5.5])
+
+    def test_around_seeds(self):
+        # the second seed is close to the bounds, the third one is out of bounds
+        seeds = numpy.array([[5., 0.], [0.2, 0.95], [12., -2.]])
+        radius = 0.1
+        samples = numpy.array(self.cali.initialize_around_seeds(60, seeds, radius))
+        self.assertEqual(samples.shape, (60, 3))
+        bounds = numpy.array(self.cali.ParamDefs['bounds'])
+        self.assertTrue(numpy.all(samples >= bounds[:, 0]))
+        self.assertTrue(numpy.all(samples <= bounds[:, 1]))
+        # the seeds are assigned in turn
+        clipped = numpy.clip(seeds, bounds[:2, 0], bounds[:2, 1])[numpy.arange(60) % 3]
+        delta = radius * (bounds[:2, 1] - bounds[:2, 0])
+        self.assertTrue(numpy.all(numpy.fabs(samples[:, :2] - clipped) <= delta + 1.e-12))
+        # the new parameter is sampled within the entire range
+        self.assertGreater(numpy.ptp(samples[:, 2]), 0.5)
+
+    def test_without_seeds(self):
+        self.assertEqual(self.cali.initialize_around_seeds(0, [[5., 0.]]), list())
+        samples = numpy.array(self.cali.initialize_around_seeds(40, numpy.zeros((0, 2))))
+        self.assertEqual(samples.shape, (40, 3))
+        self.assertGreater(numpy.ptp(samples[:, 0]), 5.)
+
+
+@unittest.skipIf(reuse_seeds is None, 'NSGA-II calibration is not available')
+class TestReuseSeeds(unittest.TestCase):
+    """Seeds are reused without model runs only if valid in current step."""
+
+    def setUp(self):
+        self.param_defs = {'names': ['A', 'B', 'C'], 'bounds': [[0., 10.], [-1., 1.], [5., 6.]],
+                           'num_vars': 3, 'impacts': [5., 0., 5.5]}
+        self.seeds = {'names': ['A', 'B'], 'values': [[1., 0.5], [2., -0.5], [3., 0.]],
+                      'individuals': [self.detail(['Q-NSE', 'SED-NSE']) for _ in range(3)]}
+
+    @staticmethod
+    def detail(objnames):
+        cali = ObsSimData()
+        cali.objnames = list(objnames)
+        cali.objvalues = [0.5] * len(objnames)
+        return {'sim': None, 'cali': cali, 'vali': ObsSimData(), 'timing': (1., 2., 3., 4.)}
+
+    def test_reuse(self):
+        reused = reuse_seeds(self.seeds, self.param_defs, ['SED-NSE'], 10)
+        self.assertEqual([list(ind) for ind in reused], [[1., 0.5, 5.5], [2., -0.5, 5.5],
+                                                          [3., 0., 5.5]])
+        self.assertIs(reused[0].cali, self.seeds['individuals'][0]['cali'])
+        self.assertEqual(reused[0].runtime, 4.)
+        self.assertFalse(reused[0].fitness.valid)
+        self.assertEqual(len(reuse_seeds(self.seeds, self.param_defs, ['SED-NSE'], 2)), 2)
+        self.assertEqual(reuse_seeds(None, self.param_defs, ['SED-NSE'], 2), list())
+
+    def test_impact_out_of_bounds(self):
+        self.param_defs['impacts'][2] = 7.
+        self.assertEqual(reuse_seeds(self.seeds, self.param_defs, ['SED-NSE'], 10), list())
+
+    def test_seed_out_of_bounds(self):
+        self.param_defs['bounds'][0] = [1.5, 10.]
+        reused = reuse_seeds(self.seeds, self.param_defs, ['SED-NSE'], 10)
+        self.assertEqual([ind[0] for ind in reused], [2., 3.])
+
+    def test_missing_statistics(self):
+        self.seeds['individuals'][1] = self.detail(['Q-NSE'])
+        reused = reuse_seeds(self.seeds, self.param_defs, ['SED-NSE', 'Q-NSE'], 10)
+        self.assertEqual([ind[0] for ind in reused], [1., 3.])
+        self.assertEqual(reuse_seeds(self.seeds, self.param_defs, ['TN-NSE'], 10), list())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  Unittest of annual climate statistics of meteorological data.
+"""
+from __future__ import absolute_import
+
+import os
+import sys
+import unittest
+
+if os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) not in sys.path:
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy
+
+try:
+    from preprocess.db_import_meteorology import ClimateStats
+    from preprocess.text import DataValueFields, DataType, VariableDesc
+    from preprocess.utility import DEFAULT_NODATA
+except ImportError as err:  # e.g., pygeoc or pymongo is not installed
+    raise unittest.SkipTest('Meteorological data import is not available: %s' % err)
+
+
+def reference_stats(years, mean_tmp, t_base=0.):
+    """Annual statistics of one station by accumulating daily records one by one."""
+    count = dict()
+    tmp_sum = dict()
+    phu = dict()
+    for yyyy, tmp in zip(years, mean_tmp):
+        count[yyyy] = count.get(yyyy, 0) + 1
+        tmp_sum[yyyy] = tmp_sum.get(yyyy, 0.) + tmp
+        phu[yyyy] = phu.get(yyyy, 0.) + (tmp if tmp > t_base else 0.)
+    annual_tmp = dict()
+    annual_phu = dict()
+    for yyyy in count:
+        annual_tmp[yyyy] = round(tmp_sum[yyyy] / count[yyyy], 1)
+        annual_phu[yyyy] = round(phu[yyyy], 1)
+    tmp0 = round(sum(annual_tmp.values()) / len(count), 1)
+    phu0 = round(sum(annual_phu.values()) / len(count), 1)
+    return annual_tmp, annual_phu, tmp0, phu0
+
+
+class TestClimateStats(unittest.TestCase):
+    """Grouped reductions are the same as accumulating records of each station."""
+
+    def setUp(self):
+        rng = numpy.random.RandomState(46)
+        self.station_ids = list()
+        self.years = list()
+        self.mean_tmp = list()
+        # stations of different periods, records are not sorted
+        for sid, (syear, eyear) in zip([57, 3, 12], [(2010, 2012), (2011, 2011), (2009, 2013)]):
+            for yyyy in range(syear, eyear + 1):
+                ndays = rng.randint(300, 366)
+                self.station_ids += [sid] * ndays
+                self.years += [yyyy] * ndays
+                self.mean_tmp += (rng.randn(ndays) * 10. + 5.).tolist()
+        order = rng.permutation(len(self.years))
+        self.station_ids = numpy.array(self.station_ids)[order]
+        self.years = numpy.array(self.years)[order]
+        self.mean_tmp = numpy.array(self.mean_tmp)[order]
+
+    def test_same_as_accumulation(self):
+        for t_base in [0., 5.]:
+            stats = ClimateStats(self.station_ids, self.years, self.mean_tmp, t_base)
+            for sid in [3, 12, 57]:
+                sel = self.station_ids == sid
+                annual_tmp, annual_phu, tmp0, phu0 = reference_stats(self.years[sel].tolist(),
+                                                                     self.mean_tmp[sel].tolist(),
+                                                                     t_base)
+                groups = self.station_years_of(stats, sid)
+                self.assertEqual(sorted(annual_tmp.keys()), [yyyy for _, yyyy in groups])
+                for idx, yyyy in self.indexes_of(stats, sid):
+                    self.assertAlmostEqual(stats.MeanTmp[idx], annual_tmp[yyyy], places=6)
+                    self.assertAlmostEqual(stats.PHUTOT[idx], annual_phu[yyyy], places=6)
+                sidx = stats.stations.tolist().index(sid)
+                self.assertAlmostEqual(stats.MeanTmp0[sidx], tmp0, places=6)
+                self.assertAlmostEqual(stats.PHU0[sidx], phu0, places=6)
+
+    def test_replace_requests(self):
+        stats = ClimateStats(self.station_ids, self.years, self.mean_tmp)
+        # 3 + 1 + 5 station-years, 3 stations, two types of each
+        self.assertEqual(len(stats.replace_requests()), (9 + 3) * 2)
+        requests = stats.replace_requests({(12, 2010)})
+        self.assertEqual(len(requests), (1 + 3) * 2)
+        docs = [req._doc for req in requests]
+        self.assertEqual(sorted((doc[DataValueFields.id], doc[DataValueFields.y],
+                                 doc[VariableDesc.type]) for doc in docs),
+                         sorted([(12, 2010, DataType.phu_tot), (12, 2010, DataType.mean_tmp)] +
+                                [(sid, DEFAULT_NODATA, tp) for sid in [3, 12, 57]
+                                 for tp in [DataType.phu0, DataType.mean_tmp0]]))
+
+    @staticmethod
+    def station_years_of(stats, sid):
+        return [tuple(sy) for sy in stats.station_years.tolist() if sy[0] == sid]
+
+    @staticmethod
+    def indexes_of(stats, sid):
+        return [(idx, sy[1]) for idx, sy in enumerate(stats.station_years.tolist())
+                if sy[0] == sid]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  Unittest of non-dominated sorting and hypervolume indicator for NSGA-II.
+"""
+from __future__ import absolute_import
+
+import os
+import random
+import sys
+import unittest
+
+if os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) not in sys.path:
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy
+
+try:
+    from deap import base, tools
+    from deap.benchmarks.tools import hypervolume
+    from scenario_analysis.emo import sort_efficient_nondominated, sort_nondominated, \
+        sel_nsga2, hypervolume_2d, HypervolumeIndicator
+except ImportError as err:  # e.g., deap is not installed
+    raise unittest.SkipTest('Multi-objective utilities are not available: %s' % err)
+
+
+class FitnessMaxMin(base.Fitness):
+    weights = (1., -1.)
+
+
+class FitnessMin3(base.Fitness):
+    weights = (-1., -1., -1.)
+
+
+class FitnessMin4(base.Fitness):
+    weights = (-1., -1., -1., -1.)
+
+
+class Individual(object):
+    """Individual with fitness only."""
+
+    def __init__(self, fitness_class, values):
+        self.fitness = fitness_class(values)
+
+
+def population(fitness_class, num, nobj, levels=None):
+    """Random population, the fitness values are integers of `levels` to create ties."""
+    if levels is None:
+        return [Individual(fitness_class, tuple(random.random() for _ in range(nobj)))
+                for _ in range(num)]
+    return [Individual(fitness_class, tuple(float(random.randint(0, levels))
+                                            for _ in range(nobj)))
+            for _ in range(num)]
+
+
+def front_ids(fronts):
+    return [sorted(id(ind) for ind in front) for front in fronts]
+
+
+class TestNondominatedSort(unittest.TestCase):
+    """Efficient non-dominated sort returns the same fronts as deap."""
+
+    def setUp(self):
+        random.seed(37)
+
+    def assert_same_fronts(self, pop, k, first_front_only=False):
+        expected = tools.sortNondominated(pop, k, first_front_only)
+        self.assertEqual(front_ids(sort_efficient_nondominated(pop, k, first_front_only)),
+                         front_ids(expected))
+        self.assertEqual(front_ids(sort_nondominated(pop, k, first_front_only, 'log')),
+                         front_ids(expected))
+
+    def test_same_as_deap(self):
+        for fitness_class, nobj in [(FitnessMaxMin, 2), (FitnessMin3, 3), (FitnessMin4, 4)]:
+            for levels in [None, 3]:  # continuous, and ties
+                pop = population(fitness_class, 60, nobj, levels)
+                for k in [0, 1, 25, 60]:
+                    self.assert_same_fronts(pop, k)
+                self.assert_same_fronts(pop, 60, True)
+
+    def test_duplicate_fitnesses(self):
+        pop = population(FitnessMin3, 20, 3, 2)
+        pop += [Individual(FitnessMin3, ind.fitness.values) for ind in pop[:10]]
+        self.assert_same_fronts(pop, len(pop))
+        fronts = sort_efficient_nondominated(pop, len(pop))
+        self.assertEqual(sum(len(front) for front in fronts), len(pop))
+
+    def test_sel_nsga2(self):
+        pop = population(FitnessMaxMin, 50, 2, 5)
+        self.assertEqual([id(ind) for ind in sel_nsga2(pop, 20)],
+                         [id(ind) for ind in tools.selNSGA2(pop, 20)])
+        chosen = sel_nsga2(pop, 20, 'efficient')
+        self.assertEqual(len(chosen), 20)
+        self.assertEqual(len(set(id(ind) for ind in chosen)), 20)
+        # the first front is chosen entirely if it is not larger than k
+        first = tools.sortNondominated(pop, 20, True)[0]
+        if len(first) <= 20:
+            self.assertTrue(set(id(ind) for ind in first) <= set(id(ind) for ind in chosen))
+
+
+class TestHypervolume(unittest.TestCase):
+    """Exact hypervolume of 2 and 3 objectives, and the cached Monte Carlo estimate."""
+
+    def setUp(self):
+        random.seed(37)
+        numpy.random.seed(37)
+
+    def test_2d_sweep(self):
+        for levels in [None, 4]:
+            pop = population(FitnessMaxMin, 40, 2, levels)
+            ref = numpy.array([0., 5.])  # minimization space, i.e., -weights * worst
+            points = numpy.array([ind.fitness.wvalues for ind in pop]) * -1
+            self.assertAlmostEqual(hypervolume_2d(points, ref), hypervolume(pop, ref))
+            self.assertAlmostEqual(HypervolumeIndicator(ref)(pop), hypervolume(pop, ref))
+        self.assertEqual(hypervolume_2d(numpy.array([[1., 1.]]), numpy.array([0.5, 2.])), 0.)
+
+    def test_3d(self):
+        pop = population(FitnessMin3, 40, 3)
+        ref = numpy.array([1.1, 1.1, 1.1])
+        self.assertAlmostEqual(HypervolumeIndicator(ref)(pop), hypervolume(pop, ref))
+        points = [[1., 1., 1.], [0.5, 2., 2.]]
+        self.assertAlmostEqual(HypervolumeIndicator([3., 3., 3.]).calculate(points), 8.5)
+
+    def test_monte_carlo_generations(self):
+        ref = numpy.array([1., 1., 1., 1.])
+        indicator = HypervolumeIndicator(ref, samples=20000, seed=37)
+        points = numpy.random.random_sample((30, 4)) * 0.8 + 0.1
+        for _ in range(5):
+            value = indicator.calculate(points)
+            # the cached masks give the same estimate as evaluating all points again
+            dominated = numpy.zeros(indicator.samples, dtype=bool)
+            for pt in points:
+                dominated |= numpy.all(indicator.sample_points >= pt, axis=1)
+            fresh = dominated.mean() * numpy.prod(ref - indicator.lower)
+            self.assertAlmostEqual(value, fresh)
+            self.assertEqual(set(indicator.masks.keys()), set(map(tuple, points)))
+            # and close to the exact value
+            pop = [Individual(FitnessMin4, tuple(pt)) for pt in points]
+            self.assertAlmostEqual(value, hypervolume(pop, ref), delta=0.01)
+            # the same front
+            self.assertEqual(indicator.calculate(points[::-1]), value)
+            # a few points change in the next generation
+            points = points.copy()
+            points[numpy.random.choice(len(points), 3, replace=False)] = \
+                numpy.random.random_sample((3, 4)) * 0.8 + 0.1
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  Unittest of population-level crossover and mutation on gene matrix.
+"""
+from __future__ import absolute_import
+
+import os
+import sys
+import unittest
+
+if os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) not in sys.path:
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy
+
+try:
+    from scenario_analysis.slpposunits.userdef import population_to_matrix, \
+        sample_mutation_points, crossover_matrix, mutate_matrix_rdm, mutate_matrix_slppos
+except ImportError as err:  # e.g., GDAL is not installed
+    raise unittest.SkipTest('Scenario analysis is not available: %s' % err)
+
+
+class SlpPosConfig(object):
+    """Minimum configuration of slope position units used by `mutate_matrix_slppos`."""
+
+    def __init__(self, bmp_choices, size):
+        self.bmp_choices = numpy.array(bmp_choices)
+        self.gene_suit_mask = numpy.ones((size, len(bmp_choices)), dtype=bool)
+        self.gene_upslope = numpy.full(size, -1, dtype=numpy.int32)
+        self.gene_downslope = numpy.full(size, -1, dtype=numpy.int32)
+
+
+class TestPopulationToMatrix(unittest.TestCase):
+    """The matrix type holds both current genes and all possible target values."""
+
+    def test_narrowest_type(self):
+        self.assertEqual(population_to_matrix([[0, 1, 2]]).dtype, numpy.int8)
+        self.assertEqual(population_to_matrix([[0, 1, 2]], [0, 1, 2, 3]).dtype, numpy.int8)
+        self.assertEqual(population_to_matrix([[0, 1, 2]], [0, 200]).dtype, numpy.int16)
+        self.assertEqual(population_to_matrix([[0, 1, 2]], [0, 10001, 40000]).dtype,
+                         numpy.int32)
+        self.assertEqual(population_to_matrix([[0, 300]], [0, 1]).dtype, numpy.int16)
+
+    def test_mutate_rdm_no_overflow(self):
+        numpy.random.seed(36)
+        targets = [200, 10001, 40000]
+        genes = population_to_matrix([[0] * 20 for _ in range(10)], targets)
+        mutate_matrix_rdm(targets, genes, 0.5, 1.)
+        self.assertTrue(set(numpy.unique(genes).tolist()) <= {0, 200, 10001, 40000})
+        self.assertTrue((genes != 0).any())
+
+    def test_mutate_slppos_no_overflow(self):
+        numpy.random.seed(36)
+        cfg = SlpPosConfig([0, 10001, 10002], 20)
+        genes = population_to_matrix([[0] * 20 for _ in range(10)], cfg.bmp_choices)
+        mutate_matrix_slppos(cfg, genes, 0.5, 1.)
+        self.assertTrue(set(numpy.unique(genes).tolist()) <= {0, 10001, 10002})
+        self.assertTrue((genes != 0).any())
+
+
+class TestMatrixOperators(unittest.TestCase):
+    """Crossover and mutation points of gene matrix."""
+
+    def test_sample_mutation_points(self):
+        numpy.random.seed(36)
+        rows, cols = sample_mutation_points(100, 30, 0.2, 1.)
+        self.assertEqual(len(rows), len(cols))
+        counts = numpy.bincount(rows, minlength=100)
+        self.assertTrue((counts >= 1).all() and (counts <= 6).all())
+        for irow in range(100):  # distinct points of each row
+            row_cols = cols[rows == irow]
+            self.assertEqual(len(numpy.unique(row_cols)), len(row_cols))
+        self.assertTrue(((cols >= 0) & (cols < 30)).all())
+        rows, cols = sample_mutation_points(100, 30, 0.2, 0.)
+        self.assertEqual(len(rows), 0)
+
+    def test_crossover_matrix(self):
+        numpy.random.seed(36)
+        size = 12
+        genes = numpy.vstack([numpy.arange(size) + i * 100 for i in range(6)])
+        origin = genes.copy()
+        crossed = crossover_matrix(genes, 1., block=3)
+        self.assertTrue(crossed.all())
+        for ipair in range(3):
+            row1, row2 = genes[ipair * 2], genes[ipair * 2 + 1]
+            ori1, ori2 = origin[ipair * 2], origin[ipair * 2 + 1]
+            # genes are swapped column by column, not the entire genes
+            self.assertTrue(((row1 == ori1) & (row2 == ori2) |
+                             (row1 == ori2) & (row2 == ori1)).all())
+            swapped = numpy.where(row1 == ori2)[0]
+            self.assertTrue(0 < len(swapped) < size)
+            self.assertEqual(swapped[0] % 3, 0)
+            self.assertEqual(len(swapped), swapped[-1] - swapped[0] + 1)
+        genes = origin.copy()
+        self.assertFalse(crossover_matrix(genes, 0.).any())
+        numpy.testing.assert_array_equal(genes, origin)
+
+
+if __name__ == '__main__':
+    unittest.main()
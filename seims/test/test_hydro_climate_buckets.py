@@ -0,0 +1,110 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  Unittest of the bucketed storage of hydro-climate data.
+"""
+from __future__ import absolute_import
+
+import os
+import sys
+import unittest
+from datetime import datetime
+
+try:
+    from unittest import mock  # py3
+except ImportError:
+    import mock  # py2
+
+if os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) not in sys.path:
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy
+
+try:
+    import mongomock
+    from pymongo import ReplaceOne
+    from preprocess.hydro_climate_buckets import DataBucketStore, pack_buckets, unpack_bucket, \
+        series_interval, BUCKET_MONTH
+    from preprocess.text import DBTableNames, DataValueFields
+except ImportError as err:  # e.g., mongomock or pymongo is not installed
+    raise unittest.SkipTest('Bucket storage is not available: %s' % err)
+
+
+def daily(start, num):
+    return numpy.datetime64(start, 's') + numpy.arange(num) * 86400
+
+
+class TestPackBuckets(unittest.TestCase):
+    """Pack regular time series into buckets, and unpack."""
+
+    def test_pack_and_unpack(self):
+        utcs = daily('2012-12-30', 5)
+        values = numpy.array([1., numpy.nan, 3., 4., 5.])
+        docs = pack_buckets(1, 'P', utcs, values, 8)
+        self.assertEqual([doc['BUCKET'] for doc in docs], [2012, 2013])
+        cur_utcs, cur_values = unpack_bucket(docs[1])
+        numpy.testing.assert_array_equal(cur_utcs, utcs[2:])
+        numpy.testing.assert_array_equal(cur_values, values[2:])
+        self.assertTrue(numpy.isnan(unpack_bucket(docs[0])[1][1]))
+
+    def test_irregular_series(self):
+        utcs = numpy.array(['2012-07-01T00:00', '2012-07-01T00:10', '2012-07-01T00:25'],
+                           dtype='datetime64[s]')
+        self.assertRaises(ValueError, series_interval, utcs)
+        self.assertEqual(series_interval(utcs[:2]), 600)
+
+
+class TestDataBucketStore(unittest.TestCase):
+    """Read and write buckets, the irregular series are stored in DATA_VALUES."""
+
+    def setUp(self):
+        self.climdb = mongomock.MongoClient().db
+        self.store = DataBucketStore(self.climdb, period=BUCKET_MONTH)
+        try:
+            self.climdb['PROBE'].bulk_write([ReplaceOne({'_id': 1}, {'_id': 1}, upsert=True)])
+        except TypeError as err:  # mongomock is older than pymongo
+            self.skipTest('bulk_write is not supported by mongomock: %s' % err)
+
+    def test_detect_without_writing(self):
+        self.assertIsNone(DataBucketStore.detect(self.climdb, 'P'))
+        self.store.merge_write(1, 'P', daily('2012-01-01', 10), numpy.ones(10), 8)
+        self.climdb[DBTableNames.data_buckets].drop_indexes()
+        with mock.patch.object(mongomock.Collection, 'create_index') as create_index:
+            store = DataBucketStore.detect(self.climdb, 'P')
+            self.assertIsNotNone(store)
+            store.read([1], 'P')
+            store.last_utc(['P'])
+        create_index.assert_not_called()
+
+    def test_merge_write_and_read(self):
+        self.store.merge_write(1, 'P', daily('2012-01-25', 10), numpy.arange(10.), 8)
+        # the new records override the existed ones
+        self.store.merge_write(1, 'P', daily('2012-02-01', 5), numpy.arange(10., 15.), 8)
+        utcs, values = self.store.read([1], 'P')[1]
+        numpy.testing.assert_array_equal(utcs, daily('2012-01-25', 12))
+        numpy.testing.assert_array_equal(values, list(range(7)) + list(range(10, 15)))
+        self.assertEqual(self.climdb[DBTableNames.data_values].count_documents({}), 0)
+        self.assertEqual(self.store.last_utc(['P']), {(1, 'P'): datetime(2012, 2, 5)})
+
+    def test_irregular_to_values(self):
+        self.store.merge_write(1, 'P', daily('2012-01-25', 10), numpy.arange(10.), 8)
+        storm = numpy.array(['2012-02-05T00:10', '2012-02-05T00:25'], dtype='datetime64[s]')
+        self.store.merge_write(1, 'P', storm, [1.5, 2.5], 8)
+        # all records of the station are moved to DATA_VALUES
+        self.assertEqual(self.climdb[DBTableNames.data_buckets].count_documents({}), 0)
+        coll = self.climdb[DBTableNames.data_values]
+        self.assertEqual(coll.count_documents({DataValueFields.id: 1}), 12)
+        utcs, values = self.store.read([1], 'P')[1]
+        numpy.testing.assert_array_equal(utcs[-2:], storm)
+        numpy.testing.assert_array_equal(values, list(range(10)) + [1.5, 2.5])
+        self.assertEqual(self.store.last_utc(['P']), {(1, 'P'): datetime(2012, 2, 5, 0, 25)})
+        # the later records of the station are stored in DATA_VALUES too
+        self.store.merge_write(1, 'P', daily('2012-02-06', 2), [7., 8.], 8)
+        self.assertEqual(self.climdb[DBTableNames.data_buckets].count_documents({}), 0)
+        self.assertEqual(coll.count_documents({DataValueFields.id: 1}), 14)
+        self.store.merge_write(2, 'P', daily('2012-02-06', 2), [7., 8.], 8)
+        self.assertEqual(sorted(self.store.read([1, 2], 'P').keys()), [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  Unittest of resampling not regular observed data to regular time intervals.
+"""
+from __future__ import absolute_import
+
+import os
+import random
+import sys
+import unittest
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+if os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) not in sys.path:
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy
+
+try:
+    from preprocess.hydro_climate_data_itp import resample_regular_intervals, \
+        regular_interval_starts
+except ImportError as err:  # e.g., pygeoc is not installed
+    raise unittest.SkipTest('Hydro-climate data interpolation is not available: %s' % err)
+
+
+def loop_resample(ord_data, flds, time_interval, sdatetime, edatetime, eliminate_zero=False,
+                  day_divided_hour=0):
+    """Interval-by-interval scan of all records, the former implementation."""
+    itp_data = OrderedDict()
+    out_time_delta = timedelta(minutes=time_interval)
+    item_dtime = sdatetime
+    if time_interval % 1440 == 0:
+        item_dtime = sdatetime.replace(hour=0, minute=0, second=0) + \
+                     timedelta(minutes=day_divided_hour * 60)
+    flow_idx = [idx for idx, fld in enumerate(flds) if 'FLOW' in fld.upper()][0]
+    while item_dtime <= edatetime:
+        sdt = item_dtime
+        edt = item_dtime + out_time_delta
+        org_items = list()
+        pre_dt = list(ord_data.keys())[0]
+        pre_added = False
+        for i, v in ord_data.items():
+            if sdt <= i < edt:
+                if not pre_added and pre_dt < sdt < i and sdt - pre_dt < out_time_delta:
+                    org_items.append([pre_dt] + ord_data.get(pre_dt))
+                    pre_added = True
+                org_items.append([i] + v)
+            if i > edt:
+                break
+            pre_dt = i
+        if org_items:
+            org_items.append([edt])
+            if org_items[0][0] < sdt:
+                org_items[0][0] = sdt
+        itp_data[item_dtime] = [0.] * len(flds)
+        if not org_items:
+            if eliminate_zero:
+                itp_data.popitem()
+            item_dtime += out_time_delta
+            continue
+        for v_idx, v_name in enumerate(flds):
+            if not any(fld in v_name.upper() for fld in ['FLOW', 'SED', 'PCP']):
+                continue
+            itp_value = 0.
+            itp_auxiliary_value = 0.
+            for k in range(1, len(org_items)):
+                pre = org_items[k - 1]
+                delta = org_items[k][0] - pre[0]
+                secs = delta.days * 86400 + delta.seconds
+                if 'SED' in v_name.upper():
+                    itp_value += pre[v_idx + 1] * pre[flow_idx + 1] * secs
+                    itp_auxiliary_value += pre[flow_idx + 1] * secs
+                else:
+                    itp_value += pre[v_idx + 1] * secs
+            if 'SED' in v_name.upper():
+                itp_value = 0. if itp_auxiliary_value == 0. else itp_value / itp_auxiliary_value
+            elif 'FLOW' in v_name.upper():
+                itp_value /= (out_time_delta.days * 86400 + out_time_delta.seconds)
+            elif 'PCP' in v_name.upper():
+                itp_value /= 3600.
+            itp_data[item_dtime][v_idx] = round(itp_value, 4)
+        item_dtime += out_time_delta
+    return itp_data
+
+
+class TestResampleRegularIntervals(unittest.TestCase):
+    """The vectorized resampler is the same as the interval-by-interval loop."""
+
+    def setUp(self):
+        random.seed(49)
+        self.flds = ['PCP', 'FLOW', 'SED', 'OTHER']
+        self.records = OrderedDict()
+        cur_time = datetime(2011, 1, 1, 3)
+        for _ in range(1000):
+            # gaps shorter and longer than the output intervals
+            cur_time += timedelta(minutes=random.choice([1, 5, 17, 60, 300, 2000, 6000]))
+            self.records[cur_time] = [random.random() * 10., random.random() * 5.,
+                                      random.random() * 3., 7.]
+        self.times = numpy.array(list(self.records.keys()), dtype='datetime64[s]')
+        self.values = numpy.array(list(self.records.values()))
+        self.stime = datetime(2011, 1, 1, 0, 7)
+        self.etime = datetime(2011, 4, 30, 23, 59, 59)
+
+    def test_same_as_loop(self):
+        intervals = [15, 60, 1440, 2880]
+        for eliminate_zero in [False, True]:
+            for day_divided_hour in [0, 8]:
+                resampled = resample_regular_intervals(self.times, self.values, self.flds,
+                                                       intervals, self.stime, self.etime,
+                                                       eliminate_zero, day_divided_hour)
+                self.assertEqual(sorted(resampled.keys()), intervals)
+                for interval in intervals:
+                    expected = loop_resample(self.records, self.flds, interval, self.stime,
+                                             self.etime, eliminate_zero, day_divided_hour)
+                    starts, values = resampled[interval]
+                    self.assertEqual(starts.tolist(), list(expected.keys()))
+                    numpy.testing.assert_allclose(values, list(expected.values()),
+                                                  rtol=0., atol=1.1e-4)
+
+    def test_regular_interval_starts(self):
+        starts = regular_interval_starts(numpy.datetime64('2011-01-01T03:07:00'),
+                                         numpy.datetime64('2011-01-03T00:00:00'), 1440, 8)
+        self.assertEqual(starts.astype(str).tolist(), ['2011-01-01T08:00:00',
+                                                       '2011-01-02T08:00:00'])
+        starts = regular_interval_starts(numpy.datetime64('2011-01-01T03:07:00'),
+                                         numpy.datetime64('2011-01-01T04:07:00'), 30)
+        self.assertEqual(len(starts), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,216 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  Unittest of the incremental import of hydro-climate data.
+"""
+from __future__ import absolute_import
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+if os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) not in sys.path:
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy
+
+try:
+    import mongomock
+    from pymongo import ReplaceOne
+    from preprocess.hydro_climate_incremental import IncrementalImport, series_fingerprint
+    from preprocess.db_import_meteorology import ImportMeteoData
+    from preprocess.text import DBTableNames, DataValueFields, DataFingerprintFields, \
+        DataType, VariableDesc
+except ImportError as err:  # e.g., mongomock or pygeoc is not installed
+    raise unittest.SkipTest('Incremental import is not available: %s' % err)
+
+
+def daily(start, num):
+    return numpy.datetime64(start, 's') + numpy.arange(num) * 86400
+
+
+class IncrementalTestCase(unittest.TestCase):
+    """Hydro-climate database of mongomock."""
+
+    def setUp(self):
+        self.climdb = mongomock.MongoClient().db
+        try:
+            self.climdb['PROBE'].bulk_write([ReplaceOne({'_id': 1}, {'_id': 1}, upsert=True)])
+        except TypeError as err:  # mongomock is older than pymongo
+            self.skipTest('bulk_write is not supported by mongomock: %s' % err)
+
+    def store(self, station_id, data_type, utcs, values, fingerprint=True):
+        """Store records in DATA_VALUES, and their fingerprint."""
+        self.climdb[DBTableNames.data_values].insert_many(
+            [{DataValueFields.id: station_id, DataValueFields.type: data_type,
+              DataValueFields.utc: utc, DataValueFields.value: v}
+             for utc, v in zip(utcs.tolist(), values)])
+        if fingerprint:
+            self.climdb[DBTableNames.data_fingerprints].insert_one(
+                {DataValueFields.id: station_id, DataValueFields.type: data_type,
+                 DataFingerprintFields.first_utc: utcs.min().tolist(),
+                 DataFingerprintFields.last_utc: utcs.max().tolist(),
+                 DataFingerprintFields.fingerprint: series_fingerprint(utcs, values)})
+
+    def count(self, station_id, data_type=DataType.p):
+        return self.climdb[DBTableNames.data_values].count_documents(
+            {DataValueFields.id: station_id, DataValueFields.type: data_type})
+
+    def fingerprint(self, station_id, data_type=DataType.p):
+        return self.climdb[DBTableNames.data_fingerprints].find_one(
+            {DataValueFields.id: station_id, DataValueFields.type: data_type})
+
+
+class TestIncrementalImport(IncrementalTestCase):
+    """Select the records to be imported of each station and type."""
+
+    def setUp(self):
+        IncrementalTestCase.setUp(self)
+        self.utcs = daily('2012-01-01', 10)
+        self.values = numpy.arange(10.)
+        self.store(1, DataType.p, self.utcs[:5], self.values[:5])
+        self.store(2, DataType.p, self.utcs[:5], self.values[:5])
+
+    def test_no_stored_data(self):
+        inc = IncrementalImport(self.climdb, [DataType.p, DataType.pet], incremental=True,
+                                check_fingerprint=True)
+        selected = inc.select(1, DataType.pet, self.utcs, self.values)
+        self.assertTrue(selected.all())
+        inc.commit()
+        doc = self.fingerprint(1, DataType.pet)
+        self.assertEqual(doc[DataFingerprintFields.fingerprint],
+                         series_fingerprint(self.utcs, self.values))
+        self.assertEqual(doc[DataFingerprintFields.last_utc], datetime(2012, 1, 10))
+
+    def test_not_incremental(self):
+        inc = IncrementalImport(self.climdb, [DataType.p])
+        self.assertEqual(self.count(1) + self.count(2), 0)
+        self.assertIsNone(self.fingerprint(1))
+        self.assertTrue(inc.select(1, DataType.p, self.utcs, self.values).all())
+
+    def test_newer_rows(self):
+        inc = IncrementalImport(self.climdb, [DataType.p], incremental=True)
+        self.assertEqual(inc.last_utc[(1, DataType.p)], datetime(2012, 1, 5))
+        selected = inc.select(1, DataType.p, self.utcs, self.values)
+        numpy.testing.assert_array_equal(selected, [False] * 5 + [True] * 5)
+        # the records of the data file are not in order
+        order = numpy.arange(10)[::-1]
+        selected = inc.select(1, DataType.p, self.utcs[order], self.values[order])
+        numpy.testing.assert_array_equal(selected, [True] * 5 + [False] * 5)
+        self.assertEqual(self.count(1), 5)
+
+    def test_edited_history(self):
+        inc = IncrementalImport(self.climdb, [DataType.p], incremental=True,
+                                check_fingerprint=True)
+        values = self.values.copy()
+        values[2] = 100.
+        selected = inc.select(1, DataType.p, self.utcs, values)
+        # all records of the station are removed and re-imported
+        self.assertTrue(selected.all())
+        self.assertEqual(inc.reimported, [(1, DataType.p)])
+        self.assertEqual(self.count(1), 0)
+        self.assertEqual(self.count(2), 5)
+        # unedited history, only the newer rows
+        selected = inc.select(2, DataType.p, self.utcs, self.values)
+        self.assertEqual(selected.sum(), 5)
+        inc.commit()
+        self.assertEqual(self.fingerprint(1)[DataFingerprintFields.fingerprint],
+                         series_fingerprint(self.utcs, values))
+        self.assertEqual(self.fingerprint(2)[DataFingerprintFields.fingerprint],
+                         series_fingerprint(self.utcs, self.values))
+
+    def test_edited_history_without_check(self):
+        inc = IncrementalImport(self.climdb, [DataType.p], incremental=True)
+        values = self.values.copy()
+        values[2] = 100.
+        self.assertEqual(inc.select(1, DataType.p, self.utcs, values).sum(), 5)
+        self.assertEqual(self.count(1), 5)
+
+    def test_recent_rows_only(self):
+        old = self.fingerprint(1)
+        inc = IncrementalImport(self.climdb, [DataType.p], incremental=True,
+                                check_fingerprint=True)
+        # the data file holds the latest records only, its history can not be checked
+        selected = inc.select(1, DataType.p, self.utcs[3:], self.values[3:] + 1.)
+        numpy.testing.assert_array_equal(selected, [False] * 2 + [True] * 5)
+        self.assertEqual(inc.reimported, list())
+        inc.commit()
+        self.assertEqual(self.fingerprint(1), old)
+        self.assertEqual(self.count(1), 5)
+
+    def test_no_fingerprint(self):
+        self.store(3, DataType.p, self.utcs[:5], self.values[:5], fingerprint=False)
+        inc = IncrementalImport(self.climdb, [DataType.p], incremental=True,
+                                check_fingerprint=True)
+        values = self.values.copy()
+        values[2] = 100.
+        self.assertEqual(inc.select(3, DataType.p, self.utcs, values).sum(), 5)
+        self.assertEqual(self.count(3), 5)
+
+
+class TestIncrementalMeteorology(IncrementalTestCase):
+    """Incremental import of daily meteorological data updates the affected station-years."""
+
+    def setUp(self):
+        IncrementalTestCase.setUp(self)
+        self.workspace = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workspace)
+        self.rng = numpy.random.RandomState(47)
+
+    def write_data(self, name, rows):
+        data_file = os.path.join(self.workspace, name)
+        with open(data_file, 'w') as f:
+            f.write('#UTCTIME\n')
+            f.write('StationID,DATETIME,TMEAN,TMAX,TMIN,RM,WS,SR\n')
+            for sid, dt, tmean in rows:
+                f.write('%d,%s 12:00:00,%.1f,%.1f,%.1f,70,2.0,10.0\n' %
+                        (sid, dt, tmean, tmean + 5., tmean - 5.))
+        return data_file
+
+    def rows(self, sid, start, num):
+        return [(sid, str(d)[:10], t) for d, t in zip(daily(start, num).tolist(),
+                                                       self.rng.random_sample(num) * 20.)]
+
+    def annual(self, sid, year, stats_type=DataType.mean_tmp):
+        return self.climdb[DBTableNames.annual_stats].find_one(
+            {DataValueFields.id: sid, DataValueFields.y: year,
+             VariableDesc.type: stats_type})[DataValueFields.value]
+
+    def stored_mean(self, sid, year):
+        values = [doc[DataValueFields.value] for doc in self.climdb[
+            DBTableNames.data_values].find({DataValueFields.id: sid,
+                                            DataValueFields.type: DataType.mean_tmp})
+                  if doc[DataValueFields.utc].year == year]
+        return round(sum(values) / len(values), 1)
+
+    def test_affected_station_years(self):
+        rows = self.rows(1, '2011-12-20', 20) + self.rows(2, '2011-12-20', 20)
+        ImportMeteoData.daily_data_from_txt(self.climdb, self.write_data('m1.txt', rows), {})
+        self.assertEqual(self.annual(1, 2012), self.stored_mean(1, 2012))
+        # mark the annual statistics to find the updated ones
+        coll = self.climdb[DBTableNames.annual_stats]
+        coll.update_many({}, {'$set': {DataValueFields.value: -1.}})
+        # new records of station 1 in 2012
+        rows += self.rows(1, '2012-01-09', 10)
+        ImportMeteoData.daily_data_from_txt(self.climdb, self.write_data('m2.txt', rows), {},
+                                            incremental=True, check_fingerprint=True)
+        self.assertEqual(self.count(1, DataType.mean_tmp), 30)
+        self.assertEqual(self.count(2, DataType.mean_tmp), 20)
+        self.assertEqual(self.annual(1, 2012), self.stored_mean(1, 2012))
+        self.assertNotEqual(self.annual(1, 2012, DataType.phu_tot), -1.)
+        self.assertNotEqual(self.annual(1, -9999, DataType.phu0), -1.)
+        for sid, year in [(1, 2011), (2, 2011), (2, 2012)]:
+            self.assertEqual(self.annual(sid, year), -1.)
+        self.assertEqual(self.annual(2, -9999, DataType.mean_tmp0), -1.)
+        # nothing new
+        ImportMeteoData.daily_data_from_txt(self.climdb, self.write_data('m3.txt', rows), {},
+                                            incremental=True)
+        self.assertEqual(self.count(1, DataType.mean_tmp), 30)
+        self.assertEqual(self.annual(1, 2011), -1.)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  Unittest of parsing UTC datetimes from columns of hydro-climate data.
+"""
+from __future__ import absolute_import
+
+import os
+import sys
+import unittest
+
+if os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) not in sys.path:
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy
+
+try:
+    from preprocess.hydro_climate_utility import HydroClimateUtilClass
+except ImportError as err:  # e.g., pygeoc is not installed
+    raise unittest.SkipTest('Hydro-climate utility is not available: %s' % err)
+
+
+class TestUTCDatetimesFromColumns(unittest.TestCase):
+    """The vectorized version is the same as `get_utcdatetime_from_field_values`."""
+
+    def setUp(self):
+        self.flds = ['StationID', 'Y', 'M', 'D', 'HH', 'MM', 'Value']
+        self.rows = [['1', '2012', '2', '29', '23', '59', '1.5'],
+                     ['1', '2013', '1', '1', '0', '0', '2.'],
+                     ['1', '2013', '12', '31', '12', '30', '0.']]
+
+    def expected(self, rows, tsys, tzone):
+        return numpy.array([HydroClimateUtilClass.get_utcdatetime_from_field_values(
+            self.flds, row, tsys, tzone) for row in rows], dtype='datetime64[s]')
+
+    def test_same_as_rows(self):
+        for tsys, tzone in [('UTCTIME', None), ('LOCALTIME', 8), ('LOCALTIME', -5.5)]:
+            dts = HydroClimateUtilClass.get_utcdatetimes_from_columns(self.flds, self.rows,
+                                                                      tsys, tzone)
+            numpy.testing.assert_array_equal(dts, self.expected(self.rows, tsys, tzone))
+
+    def test_datetime_column(self):
+        flds = ['StationID', 'DATETIME', 'Value']
+        rows = [['1', '2013-01-01 08:00:00', '1.'], ['1', '2013-01-02', '2.'],
+                ['1', '2013-01-01 08:00:00', '3.']]
+        dts = HydroClimateUtilClass.get_utcdatetimes_from_columns(flds, rows, 'LOCALTIME', 8)
+        self.assertEqual(dts.astype(str).tolist(), ['2013-01-01T00:00:00',
+                                                    '2013-01-01T16:00:00',
+                                                    '2013-01-01T00:00:00'])
+
+    def test_invalid_values(self):
+        invalid_rows = [['1', '2011', '2', '29', '0', '0', '1.'],  # not a leap year
+                        ['1', '2012', '2', '30', '0', '0', '1.'],
+                        ['1', '2012', '13', '1', '0', '0', '1.'],
+                        ['1', '2012', '0', '1', '0', '0', '1.'],
+                        ['1', '2012', '4', '31', '0', '0', '1.'],
+                        ['1', '2012', '4', '0', '0', '0', '1.'],
+                        ['1', '2012', '4', '1', '24', '0', '1.'],
+                        ['1', '2012', '4', '1', '0', '60', '1.']]
+        for row in invalid_rows:
+            # the row-by-row version raises too
+            self.assertRaises(ValueError, HydroClimateUtilClass.get_utcdatetime_from_field_values,
+                              self.flds, row, 'UTCTIME')
+            self.assertRaises(ValueError, HydroClimateUtilClass.get_utcdatetimes_from_columns,
+                              self.flds, self.rows + [row], 'UTCTIME')
+
+
+if __name__ == '__main__':
+    unittest.main()
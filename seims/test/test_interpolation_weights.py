@@ -0,0 +1,371 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  Unittest of the interpolation weights of hydro-climate sites.
+"""
+from __future__ import absolute_import
+
+import os
+import sys
+import unittest
+from math import sqrt
+
+try:
+    from unittest import mock  # py3
+except ImportError:
+    import mock  # py2
+
+if os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) not in sys.path:
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy
+
+try:
+    import preprocess.db_import_interpolation_weights as itp_weights
+    from preprocess.db_import_interpolation_weights import ImportWeightData, \
+        ENCODING_DENSE, ENCODING_SPARSE
+    from preprocess.text import RasterMetadata, DBTableNames, FieldNames, StationFields, \
+        DataValueFields, DataType
+except ImportError as err:  # e.g., pymongo is not installed
+    raise unittest.SkipTest('Interpolation weights are not available: %s' % err)
+
+try:
+    import mongomock
+    import mongomock.gridfs
+    from gridfs import GridFS
+except ImportError:  # the tests of weight dependent parameters are skipped
+    mongomock = None
+
+
+class MemoryFile(object):
+    """File of `MemoryGridFS`."""
+
+    def __init__(self, files, filename, metadata):
+        self.files = files
+        self.doc = {'_id': len(files), 'filename': filename, 'metadata': metadata}
+        self.data = list()
+
+    def write(self, data):
+        self.data.append(data)
+
+    def close(self):
+        self.files[self.doc['_id']] = (self.doc, b''.join(self.data))
+
+    def read(self):
+        return self.files[self.doc['_id']][1]
+
+
+class MemoryGridFS(object):
+    """The GridFS methods used by writing and reading weights, without MongoDB."""
+
+    def __init__(self):
+        self.files = dict()
+
+    def new_file(self, filename, metadata):
+        return MemoryFile(self.files, filename, metadata)
+
+    def get(self, file_id):
+        memfile = MemoryFile(self.files, '', None)
+        memfile.doc['_id'] = file_id
+        return memfile
+
+    def find_one(self, filename):
+        for doc, _ in self.files.values():
+            if doc['filename'] == filename:
+                return doc
+
+
+def thiessen_loop(x, y, loc_list):
+    """Index of the nearest site, the former Thiessen polygon method of each cell."""
+    i_min = 0
+    dis_min = ImportWeightData.cal_dis(x, y, loc_list[0][0], loc_list[0][1])
+    for i in range(1, len(loc_list)):
+        dis = ImportWeightData.cal_dis(x, y, loc_list[i][0], loc_list[i][1])
+        if dis < dis_min:
+            i_min = i
+            dis_min = dis
+    return i_min
+
+
+def mask_raster(nrows=7, ncols=9, cellsize=1.):
+    """MASK document and data with nodata cells."""
+    mask = {'metadata': {RasterMetadata.nodata: -9999., RasterMetadata.cellsize: cellsize,
+                         RasterMetadata.xll: 0., RasterMetadata.yll: 0.,
+                         RasterMetadata.nrows: nrows, RasterMetadata.ncols: ncols}}
+    data = numpy.ones((nrows, ncols), dtype=numpy.float32)
+    data[0, :3] = -9999.
+    data[-1, -2:] = -9999.
+    return mask, data
+
+
+def expand_weights(idx, weights, num_sites):
+    """Dense (cells x sites) weights, the same as `ItpWeightData::ReadFromMongoDB`."""
+    dense = numpy.zeros((len(idx), num_sites), dtype=numpy.float32)
+    numpy.add.at(dense, (numpy.arange(len(idx))[:, None], idx), weights)
+    return dense
+
+
+class TestThiessenWeights(unittest.TestCase):
+    """Thiessen weights are the same as the former per-cell loop."""
+
+    def setUp(self):
+        # cells at the middle of two or four sites are equidistant
+        self.loc_list = [[6., 4.], [2., 2.], [2., 6.], [6., 0.], [4., 4.]]
+        self.mask, self.data = mask_raster()
+
+    def check_thiessen(self):
+        valid, xs, ys = ImportWeightData.valid_cell_coordinates(self.mask, self.data)
+        self.assertEqual(len(xs), valid.sum())
+        dist, idx = ImportWeightData.nearest_sites(xs, ys, self.loc_list, 1)
+        idx, weights = ImportWeightData.site_weights(dist, idx, 'thiessen')
+        self.assertEqual(idx.shape, (len(xs), 1))
+        expected = numpy.zeros((len(xs), len(self.loc_list)), dtype=numpy.float32)
+        for i, (x, y) in enumerate(zip(xs, ys)):
+            expected[i, thiessen_loop(x, y, self.loc_list)] = 1.
+        numpy.testing.assert_array_equal(expand_weights(idx, weights, len(self.loc_list)),
+                                         expected)
+        # equidistant cells exist
+        all_dist = numpy.hypot(xs[:, None] - numpy.array(self.loc_list)[:, 0],
+                               ys[:, None] - numpy.array(self.loc_list)[:, 1])
+        self.assertTrue(numpy.any(numpy.sum(all_dist == all_dist.min(axis=1)[:, None],
+                                            axis=1) > 1))
+
+    def test_kdtree(self):
+        if itp_weights.cKDTree is None:
+            self.skipTest('scipy is not installed')
+        self.check_thiessen()
+
+    def test_chunks(self):
+        with mock.patch.object(itp_weights, 'cKDTree', None), \
+                mock.patch.object(itp_weights, 'WEIGHT_CHUNK_SIZE', 16):
+            self.check_thiessen()
+
+    def test_random_ties(self):
+        if itp_weights.cKDTree is None:
+            self.skipTest('scipy is not installed')
+        rng = numpy.random.RandomState(41)
+        xs, ys = [v.ravel() for v in numpy.meshgrid(numpy.arange(0., 10., 0.5),
+                                                    numpy.arange(0., 10., 0.5))]
+        for _ in range(20):
+            locs = numpy.unique(rng.randint(0, 10, (20, 2)).astype(float), axis=0)
+            rng.shuffle(locs)
+            idx = ImportWeightData.nearest_sites(xs, ys, locs, 1)[1][:, 0]
+            expected = [thiessen_loop(x, y, locs) for x, y in zip(xs, ys)]
+            numpy.testing.assert_array_equal(idx, expected)
+
+
+class TestWriteReadWeights(unittest.TestCase):
+    """Weights written as DENSE or SPARSE are read the same, also by the C++ reader."""
+
+    def setUp(self):
+        rng = numpy.random.RandomState(41)
+        self.num_cells = 50
+        self.num_sites = 6
+        self.metadic = {RasterMetadata.subbasin: 1, RasterMetadata.cellnum: self.num_cells,
+                        RasterMetadata.site_num: self.num_sites}
+        self.idx = numpy.array([rng.choice(self.num_sites, 3, replace=False)
+                                for _ in range(self.num_cells)])
+        weights = rng.random_sample((self.num_cells, 3))
+        self.weights = (weights / weights.sum(axis=1, keepdims=True)).astype(numpy.float32)
+
+    def write_read(self, idx, weights, fname='1_WEIGHT_M'):
+        gfs = MemoryGridFS()
+        with mock.patch.object(itp_weights, 'WEIGHT_CHUNK_SIZE', 20):  # several chunks
+            ImportWeightData.write_weights(gfs, fname, self.metadic, idx, weights,
+                                           self.num_sites)
+        doc = gfs.find_one(fname)
+        return doc, ImportWeightData.read_weights(gfs, doc)
+
+    def test_sparse(self):
+        doc, (idx, weights) = self.write_read(self.idx, self.weights)
+        self.assertEqual(doc['metadata'][RasterMetadata.weight_encoding], ENCODING_SPARSE)
+        self.assertEqual(doc['metadata'][RasterMetadata.neighbor_num], 3)
+        self.assertEqual(doc['metadata'][RasterMetadata.cellnum], self.num_cells)
+        self.assertEqual(doc['metadata'][RasterMetadata.site_num], self.num_sites)
+        self.assertNotIn(RasterMetadata.weight_encoding, self.metadic)
+        numpy.testing.assert_array_equal(idx, self.idx)
+        numpy.testing.assert_array_equal(weights, self.weights)
+        self.assertEqual(idx.dtype, numpy.int32)
+        self.assertEqual(weights.dtype, numpy.float32)
+
+    def test_dense(self):
+        dense = expand_weights(self.idx, self.weights, self.num_sites)
+        all_idx = numpy.tile(numpy.arange(self.num_sites), (self.num_cells, 1))
+        for idx, weights in [(self.idx[:, :1], numpy.ones((self.num_cells, 1))),
+                             (all_idx, dense)]:
+            doc, (read_idx, read_weights) = self.write_read(idx, weights)
+            self.assertEqual(doc['metadata'][RasterMetadata.weight_encoding], ENCODING_DENSE)
+            self.assertEqual(doc['metadata'][RasterMetadata.neighbor_num], idx.shape[1])
+            numpy.testing.assert_array_equal(read_idx, all_idx)
+            numpy.testing.assert_array_equal(read_weights,
+                                             expand_weights(idx, weights, self.num_sites))
+
+    def test_same_as_dense(self):
+        _, (idx, weights) = self.write_read(self.idx, self.weights)
+        dense = expand_weights(self.idx, self.weights, self.num_sites)
+        # DENSE data are read directly as (cells x sites) by the C++ reader
+        gfs = MemoryGridFS()
+        all_idx = numpy.tile(numpy.arange(self.num_sites), (self.num_cells, 1))
+        ImportWeightData.write_weights(gfs, '1_WEIGHT_P', self.metadic, all_idx, dense,
+                                       self.num_sites)
+        raw = gfs.get(gfs.find_one('1_WEIGHT_P')['_id']).read()
+        numpy.testing.assert_array_equal(numpy.frombuffer(raw, dtype=numpy.float32),
+                                         dense.ravel())
+        numpy.testing.assert_array_equal(expand_weights(idx, weights, self.num_sites), dense)
+
+
+class TestIDWWeights(unittest.TestCase):
+    """Inverse distance weights of the k-nearest sites, optionally elevation adjusted."""
+
+    def setUp(self):
+        self.loc_list = [[0., 0.], [3., 1.], [1., 4.], [5., 5.], [4., 2.]]
+        self.elev_list = [100., 300., 200., 500., 250.]
+        self.mask, data = mask_raster(6, 6)
+        _, self.xs, self.ys = ImportWeightData.valid_cell_coordinates(self.mask, data)
+        rng = numpy.random.RandomState(43)
+        self.zs = rng.random_sample(len(self.xs)) * 400. + 100.
+
+    def test_weights(self):
+        dist, idx = ImportWeightData.nearest_sites(self.xs, self.ys, self.loc_list, 3)
+        idx, weights = ImportWeightData.site_weights(dist, idx, 'idw', 2.)
+        self.assertEqual(weights.shape, (len(self.xs), 3))
+        numpy.testing.assert_allclose(weights.sum(axis=1), 1., rtol=1.e-6)
+        # all sites are located at valid cells
+        on_site = numpy.nonzero(dist[:, 0] == 0.)[0]
+        self.assertEqual(len(on_site), 5)
+        self.assertTrue(numpy.all(weights[on_site, 0] == 1.))
+        self.assertTrue(numpy.all(weights[on_site, 1:] == 0.))
+        locs = numpy.array(self.loc_list)
+        numpy.testing.assert_array_equal(locs[idx[on_site, 0]],
+                                         numpy.column_stack((self.xs, self.ys))[on_site])
+        # the other cells, inverse distance weighting
+        off_site = numpy.nonzero(dist[:, 0] > 0.)[0]
+        coef = dist[off_site] ** -2.
+        numpy.testing.assert_allclose(weights[off_site],
+                                      coef / coef.sum(axis=1, keepdims=True), rtol=1.e-6)
+
+    def test_clamp_neighbors(self):
+        for k in [5, 10]:
+            dist, idx = ImportWeightData.nearest_sites(self.xs, self.ys, self.loc_list, k)
+            self.assertEqual(idx.shape, (len(self.xs), 5))
+            self.assertTrue(numpy.all(numpy.sort(idx, axis=1) == numpy.arange(5)))
+            self.assertTrue(numpy.all(numpy.diff(dist, axis=1) >= 0.))
+            dist, idx = ImportWeightData.nearest_sites_elev(self.xs, self.ys, self.zs,
+                                                            self.loc_list, self.elev_list, k)
+            self.assertEqual(idx.shape, (len(self.xs), 5))
+            idx, weights = ImportWeightData.site_weights(dist, idx, 'idw')
+            numpy.testing.assert_allclose(weights.sum(axis=1), 1., rtol=1.e-6)
+            gfs = MemoryGridFS()
+            ImportWeightData.write_weights(gfs, '1_WEIGHT_M', {}, idx, weights, 5)
+            metadata = gfs.find_one('1_WEIGHT_M')['metadata']
+            self.assertEqual(metadata[RasterMetadata.weight_encoding], ENCODING_DENSE)
+            self.assertEqual(metadata[RasterMetadata.neighbor_num], 5)
+
+    def test_elev_factor_zero(self):
+        expected = ImportWeightData.site_weights(
+            *ImportWeightData.nearest_sites(self.xs, self.ys, self.loc_list, 3), method='idw')
+        with mock.patch.object(itp_weights, 'WEIGHT_CHUNK_SIZE', 20):  # several chunks
+            weights = ImportWeightData.site_weights(
+                *ImportWeightData.nearest_sites_elev(self.xs, self.ys, self.zs, self.loc_list,
+                                                     self.elev_list, 3, elev_factor=0.),
+                method='idw')
+        numpy.testing.assert_allclose(expand_weights(weights[0], weights[1], 5),
+                                      expand_weights(expected[0], expected[1], 5), rtol=1.e-6)
+
+    def test_elev_adjusted(self):
+        # the point (0, 5) is closer to site 2 horizontally, but at the elevation of site 0
+        dist, idx = ImportWeightData.nearest_sites_elev(numpy.array([0.]), numpy.array([5.]),
+                                                        numpy.array([100.]), self.loc_list,
+                                                        self.elev_list, 2, 1.)
+        self.assertEqual(idx.tolist(), [[0, 2]])
+        self.assertAlmostEqual(dist[0, 0], 5.)
+        self.assertAlmostEqual(dist[0, 1], sqrt(1. + 1. + 100. ** 2))
+
+
+@unittest.skipIf(mongomock is None, 'mongomock is not installed')
+class TestWeightDependentParameters(unittest.TestCase):
+    """PHU0 and TMEAN0 by matrix product are the same as the former per-cell sum."""
+
+    def setUp(self):
+        mongomock.gridfs.enable_gridfs_integration()
+        client = mongomock.MongoClient()
+        self.maindb = client['model']
+        climdb = client['climate']
+        self.gfs = GridFS(self.maindb, DBTableNames.gridfs_spatial)
+        self.mask, data = mask_raster()
+        mask_file = self.gfs.new_file(filename='1_MASK', metadata=self.mask['metadata'])
+        mask_file.write(data.tobytes())
+        mask_file.close()
+        self.valid = data != -9999.
+        self.num_cells = int(self.valid.sum())
+        self.site_ids = [3, 8, 12, 20, 31]
+        self.maindb[DBTableNames.main_sitelist].insert_one(
+            {FieldNames.subbasin_id: 1, FieldNames.db: 'climate',
+             FieldNames.site_m: ','.join(str(sid) for sid in self.site_ids[::-1])})
+        rng = numpy.random.RandomState(42)
+        self.phu = rng.random_sample(len(self.site_ids)) * 3000.
+        self.tmean = rng.random_sample(len(self.site_ids)) * 20.
+        # stored in a different order of site IDs, and the sites of other subbasins
+        for sid, phu, tmean in list(zip(self.site_ids, self.phu, self.tmean))[::-1]:
+            climdb[DBTableNames.annual_stats].insert_many(
+                [{StationFields.id: sid, StationFields.type: DataType.phu0,
+                  DataValueFields.value: phu},
+                 {StationFields.id: sid, StationFields.type: DataType.mean_tmp0,
+                  DataValueFields.value: tmean}])
+        climdb[DBTableNames.annual_stats].insert_one({StationFields.id: 99,
+                                                      StationFields.type: DataType.phu0,
+                                                      DataValueFields.value: 1.})
+        self.rng = rng
+
+    def generate(self, idx, weights):
+        metadic = {RasterMetadata.subbasin: 1, RasterMetadata.cellnum: self.num_cells,
+                   RasterMetadata.site_num: len(self.site_ids)}
+        ImportWeightData.write_weights(self.gfs, '1_WEIGHT_M', metadic, idx, weights,
+                                       len(self.site_ids))
+        self.assertTrue(ImportWeightData.generate_weight_dependent_parameters(
+            self.maindb.client, self.maindb, 1))
+        # the former per-cell sum of the flat (cells x sites) weights
+        weight_m_data = expand_weights(idx, weights, len(self.site_ids)).ravel()
+        num_sites = len(self.site_ids)
+        phu0_data = numpy.zeros(self.num_cells)
+        tmean0_data = numpy.zeros(self.num_cells)
+        for i in range(self.num_cells):
+            for j in range(num_sites):
+                phu0_data[i] += self.phu[j] * weight_m_data[i * num_sites + j]
+                tmean0_data[i] += self.tmean[j] * weight_m_data[i * num_sites + j]
+        for stats_type, expected in [(DataType.phu0, phu0_data),
+                                     (DataType.mean_tmp0, tmean0_data)]:
+            raster = numpy.frombuffer(self.gfs.get_version(filename='1_%s' % stats_type).read(),
+                                      dtype=numpy.float32).reshape(self.valid.shape)
+            numpy.testing.assert_allclose(raster[self.valid], expected, rtol=1.e-6)
+            self.assertTrue(numpy.all(raster[~self.valid] == -9999.))
+
+    def test_dense(self):
+        weights = self.rng.random_sample((self.num_cells, len(self.site_ids)))
+        weights /= weights.sum(axis=1, keepdims=True)
+        idx = numpy.tile(numpy.arange(len(self.site_ids)), (self.num_cells, 1))
+        self.generate(idx, weights.astype(numpy.float32))
+
+    def test_sparse(self):
+        idx = numpy.array([self.rng.choice(len(self.site_ids), 2, replace=False)
+                           for _ in range(self.num_cells)])
+        weights = self.rng.random_sample((self.num_cells, 2))
+        weights /= weights.sum(axis=1, keepdims=True)
+        with mock.patch.object(itp_weights, 'WEIGHT_CHUNK_SIZE', 10):  # several chunks
+            self.generate(idx, weights.astype(numpy.float32))
+        self.assertEqual(self.gfs.get_version(filename='1_WEIGHT_M').metadata[
+            RasterMetadata.weight_encoding], ENCODING_SPARSE)
+
+    def test_thiessen(self):
+        # regenerated, the former rasters are replaced
+        self.generate(numpy.zeros((self.num_cells, 1), dtype=numpy.int64),
+                      numpy.ones((self.num_cells, 1), dtype=numpy.float32))
+        self.gfs.delete(self.gfs.get_version(filename='1_WEIGHT_M')._id)
+        self.generate(numpy.full((self.num_cells, 1), 4, dtype=numpy.int64),
+                      numpy.ones((self.num_cells, 1), dtype=numpy.float32))
+        self.assertEqual(self.maindb[DBTableNames.gridfs_spatial].files.count_documents(
+            {'filename': '1_PHU0'}), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
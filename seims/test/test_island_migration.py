@@ -0,0 +1,151 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  Unittest of receiving immigrants of island-model NSGA-II.
+"""
+from __future__ import absolute_import
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+try:
+    from unittest import mock  # py3
+except ImportError:
+    import mock  # py2
+
+if os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) not in sys.path:
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+try:
+    import mongomock
+    from osgeo import gdal
+except ImportError as err:  # e.g., mongomock or GDAL is not installed
+    raise unittest.SkipTest('Island migration is not available: %s' % err)
+
+import numpy
+
+from scenario_analysis.emo import HypervolumeIndicator
+from scenario_analysis.slpposunits.island import IslandMigration, create_individual
+
+
+class TestReceiveImmigrants(unittest.TestCase):
+    """Immigrants of a slower island are received by the later migration."""
+
+    def setUp(self):
+        self.coll = mongomock.MongoClient().db['ISLAND_MIGRANTS']
+        self.migration = IslandMigration.__new__(IslandMigration)
+        self.migration.run_name = 'test'
+        self.migration.source = 1
+
+    def emigrate(self, gen, num=2, island=1):
+        self.coll.insert_many([{'RUN': 'test', 'ISLAND': island, 'GEN': gen,
+                                'GENES': [gen, i], 'FITNESS': [1., 2.], 'ID': i,
+                                'CONSUMED': False} for i in range(num)])
+
+    def test_no_emigrants(self):
+        self.emigrate(5, island=2)
+        self.assertEqual(self.migration.receive_immigrants(self.coll, 5), list())
+
+    def test_late_emigrants(self):
+        # island 1 has not reached generation 5 yet
+        self.emigrate(0)
+        docs = self.migration.receive_immigrants(self.coll, 5)
+        self.assertEqual([doc['GEN'] for doc in docs], [0, 0])
+        # the emigrants are consumed only once
+        self.assertEqual(self.migration.receive_immigrants(self.coll, 5), list())
+
+    def test_latest_emigrants(self):
+        self.emigrate(5)
+        self.emigrate(10)
+        self.emigrate(15)  # later than current generation
+        docs = self.migration.receive_immigrants(self.coll, 10)
+        self.assertEqual([doc['GEN'] for doc in docs], [10, 10])
+        # the older emigrants are superseded
+        self.assertEqual(self.coll.count_documents({'GEN': 5, 'CONSUMED': False}), 0)
+        docs = self.migration.receive_immigrants(self.coll, 15)
+        self.assertEqual([doc['GEN'] for doc in docs], [15, 15])
+
+
+class TestRingMigration(unittest.TestCase):
+    """Emigrate, immigrate, and merge the fronts of two islands through MongoDB."""
+
+    def setUp(self):
+        self.db = mongomock.MongoClient().db
+        client = mock.MagicMock()
+        client.get_conn.return_value = {'BMP_SCENARIOS': self.db}
+        patcher = mock.patch('scenario_analysis.slpposunits.island.ConnectMongoDB',
+                             return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('scenario_analysis.slpposunits.island.plot_pareto_front')
+        self.plot = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.merged_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.merged_dir)
+        self.islands = [self.create_island(i) for i in range(2)]
+
+    def create_island(self, island_id):
+        migration = IslandMigration.__new__(IslandMigration)
+        migration.cfg = mock.MagicMock(bmp_scenario_db='BMP_SCENARIOS')
+        migration.island_id = island_id
+        migration.islands = 2
+        migration.interval = 5
+        migration.size = 2
+        migration.timeout = 0
+        migration.run_name = 'test'
+        migration.source = (island_id - 1) % 2
+        migration.merged_dir = self.merged_dir
+        migration.nd = 'standard'
+        migration.hypervolume = HypervolumeIndicator([10., 0.])
+        return migration
+
+    @staticmethod
+    def population(island_id, num=4):
+        # minimize economic cost, maximize environmental effectiveness
+        return [create_individual([island_id, i], [1. + i + island_id, 0.5 * i + island_id],
+                                  island_id * 10 + i)
+                for i in range(num)]
+
+    def test_migration(self):
+        pop0 = self.population(0)
+        pop1 = self.population(1)
+        # no migration out of the interval
+        self.assertIs(self.islands[1](3, pop1), pop1)
+        self.assertEqual(self.db['ISLAND_MIGRANTS'].count_documents({}), 0)
+        # island 1 emigrates first, and no immigrants from island 0 within timeout
+        self.assertIs(self.islands[1](5, pop1), pop1)
+        self.assertEqual(self.db['ISLAND_MIGRANTS'].count_documents({'ISLAND': 1}), 2)
+        # island 0 receives the emigrants of island 1
+        new_pop0 = self.islands[0](5, pop0)
+        self.assertEqual(len(new_pop0), len(pop0))
+        self.assertIn(13, [ind.id for ind in new_pop0])
+        self.assertEqual(self.db['ISLAND_MIGRANTS'].count_documents({'ISLAND': 1,
+                                                                     'CONSUMED': False}), 0)
+        # the late emigrants of island 0 are received by the next migration of island 1
+        new_pop1 = self.islands[1](10, pop1)
+        self.assertIn(0, [ind.id for ind in new_pop1])
+        self.assertEqual(self.db['ISLAND_MIGRANTS'].count_documents({'ISLAND': 0,
+                                                                     'CONSUMED': False}), 0)
+        # island 0 reports the merged front of generation 5
+        self.plot.assert_called_once()
+        with open(os.path.join(self.merged_dir, 'hypervolume.txt')) as f:
+            self.assertIn('Gen: 5, islands: 2', f.read())
+
+    def test_merge_fronts(self):
+        self.assertEqual(self.islands[0].merge_fronts(5), (list(), 0))
+        for island in self.islands:
+            island.publish_front(5, self.population(island.island_id))
+        front, nislands = self.islands[0].merge_fronts(5)
+        self.assertEqual(nislands, 2)
+        # island 1 dominates island 0 except the cheapest one
+        self.assertEqual(sorted(ind.id for ind in front), [0, 10, 11, 12, 13])
+        self.assertEqual(sorted(tuple(ind.fitness.values) for ind in front)[0], (1., 0.))
+        self.assertAlmostEqual(self.islands[0].hypervolume(front),
+                               numpy.sum([8. * 1., 7. * 0.5, 6. * 0.5, 5. * 0.5]))
+
+
+if __name__ == '__main__':
+    unittest.main()
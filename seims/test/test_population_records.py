@@ -0,0 +1,78 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  Unittest of reading Pareto points from the text log and JSON-lines log of populations.
+"""
+from __future__ import absolute_import
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+if os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) not in sys.path:
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy
+
+try:
+    from scenario_analysis.visualization import read_pareto_from_jsonl, read_pareto_from_txt, \
+        load_population_records
+except ImportError as err:  # e.g., matplotlib is not installed
+    raise unittest.SkipTest('Visualization is not available: %s' % err)
+
+# Population of each generation: (scenario ID, economy, environment)
+POPULATIONS = [[(11, 10., 0.1), (12, 20., 0.2), (13, 30., 0.3)],  # initial population
+               [(11, 10., 0.1), (21, 15., 0.25), (13, 30., 0.3)],
+               [(21, 15., 0.25), (31, 12., 0.2), (32, 25., 0.35)]]
+
+
+class TestParetoReaders(unittest.TestCase):
+    """The text log and the JSON-lines log give the same Pareto points and counts."""
+
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        self.txt_file = self.workspace + os.path.sep + 'runtime.log'
+        self.json_file = self.workspace + os.path.sep + 'runtime.jsonl'
+        # The text log does not contain the initial population
+        with open(self.txt_file, 'w') as f:
+            f.write('### Generation number: 2, Population size: 3 ###\n')
+            for gen, pop in enumerate(POPULATIONS):
+                if gen == 0:
+                    continue
+                f.write('###### Generation: %d ######\n' % gen)
+                f.write('scenario\teconomy\tenvironment\tgene_values\n')
+                for sid, econ, env in pop:
+                    f.write('%d\t%f\t%f\t%s\n' % (sid, econ, env, str([0, 1, 2])))
+        with open(self.json_file, 'w') as f:
+            for gen, pop in enumerate(POPULATIONS):
+                for sid, econ, env in pop:
+                    f.write(json.dumps({'gen': gen, 'id': sid,
+                                        'objectives': {'Economy': econ, 'Environment': env},
+                                        'genes': [0, 1, 2]}) + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.workspace)
+
+    def test_case_insensitive_objectives(self):
+        _, _, objs = load_population_records(self.json_file, ['economy', 'ENVIRONMENT'])
+        self.assertFalse(numpy.isnan(objs).any())
+        self.assertEqual(objs[0].tolist(), [10., 0.1])
+
+    def test_same_as_text_log(self):
+        headers = ['economy', 'environment']
+        txt_points, txt_popsize = read_pareto_from_txt(self.txt_file, 'scenario', headers)
+        json_points, json_popsize = read_pareto_from_jsonl(self.json_file, headers)
+        self.assertEqual(list(json_points.keys()), list(txt_points.keys()))
+        self.assertEqual(list(json_points.keys()), [1, 2])
+        for gen in txt_points:
+            for hd in headers:
+                numpy.testing.assert_allclose(json_points[gen][hd], txt_points[gen][hd])
+        self.assertEqual(json_popsize, txt_popsize)
+        self.assertEqual(json_popsize, ([1, 2], [3, 5]))
+
+
+if __name__ == '__main__':
+    unittest.main()
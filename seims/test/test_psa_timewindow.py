@@ -0,0 +1,104 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  Unittest of time-windowed objectives of parameters sensitivity analysis.
+"""
+from __future__ import absolute_import
+
+import os
+import sys
+import unittest
+
+if os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) not in sys.path:
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy
+
+from parameters_sensitivity.timewindow import windowed_objectives, sliding_window_masks, \
+    season_masks, flow_regime_masks
+
+
+def reference_objective(obs, sim, objname):
+    """Objective of one run within one window, from the valid time steps only."""
+    valid = ~numpy.isnan(sim)
+    obs = obs[valid]
+    sim = sim[valid]
+    if len(obs) == 0:
+        return numpy.nan
+    sse = ((sim - obs) ** 2).sum()
+    sdo = ((obs - obs.mean()) ** 2).sum()
+    if objname == 'NSE':
+        return 1. - sse / sdo
+    if objname == 'RMSE':
+        return numpy.sqrt(sse / len(obs))
+    if objname == 'PBIAS':
+        return numpy.fabs((obs - sim).sum() * 100. / obs.sum())
+    return numpy.sqrt(sse) / numpy.sqrt(sdo)
+
+
+class TestWindowedObjectives(unittest.TestCase):
+    """Compare the vectorized objectives with the run-by-run and window-by-window loop."""
+
+    def setUp(self):
+        rng = numpy.random.RandomState(26)
+        self.obs = 1000. + rng.rand(60) * 50.
+        self.sim = (self.obs + rng.randn(5, 60) * 5.).astype(numpy.float32)
+        self.sim[1, 45] = numpy.nan  # missing value outside the first window only
+        self.sim[2, 5] = numpy.nan  # missing value inside the first window
+        self.sim[3, :] = numpy.nan  # failed model run
+        self.masks = numpy.zeros((3, 60), dtype=bool)
+        self.masks[0, :20] = True
+        self.masks[1, 10:60] = True
+        self.masks[2, 30:50] = True
+
+    def test_objectives_with_missing_values(self):
+        for objname in ['NSE', 'RMSE', 'PBIAS', 'RSR']:
+            values = windowed_objectives(self.obs, self.sim, self.masks, objname)
+            self.assertEqual(values.shape, (5, 3))
+            for irun in range(5):
+                for iwin in range(3):
+                    mask = self.masks[iwin]
+                    expected = reference_objective(self.obs[mask],
+                                                   self.sim[irun, mask].astype(numpy.float64),
+                                                   objname)
+                    if numpy.isnan(expected):
+                        self.assertTrue(numpy.isnan(values[irun, iwin]))
+                    else:
+                        self.assertAlmostEqual(values[irun, iwin], expected, places=6)
+
+    def test_missing_value_outside_window(self):
+        values = windowed_objectives(self.obs, self.sim, self.masks, 'NSE')
+        self.assertTrue(numpy.isfinite(values[1, 0]))
+        self.assertTrue(numpy.isfinite(values[2, :]).all())
+        self.assertTrue(numpy.isnan(values[3, :]).all())
+
+    def test_unsupported_objective(self):
+        self.assertRaises(ValueError, windowed_objectives, self.obs, self.sim, self.masks,
+                          'R-square')
+
+
+class TestWindowMasks(unittest.TestCase):
+    """Masks of sliding windows, seasons, and flow regimes."""
+
+    def test_sliding_window_masks(self):
+        times = numpy.arange('2014-01-01', '2014-01-11', dtype='datetime64[D]')
+        masks = sliding_window_masks(times.astype('datetime64[s]'), 4, 3)
+        self.assertEqual(masks.shape, (3, 10))
+        self.assertEqual(masks.sum(axis=1).tolist(), [4, 4, 4])
+        self.assertEqual(numpy.argmax(masks, axis=1).tolist(), [0, 3, 6])
+
+    def test_season_masks(self):
+        times = numpy.array(['2014-01-15', '2014-06-15', '2014-12-15'],
+                            dtype='datetime64[s]')
+        names, masks = season_masks(times, {'wet': [5, 6, 7, 8, 9], 'dry': [11, 12, 1, 2, 3]})
+        self.assertEqual(masks[names.index('wet')].tolist(), [False, True, False])
+        self.assertEqual(masks[names.index('dry')].tolist(), [True, False, True])
+
+    def test_flow_regime_masks(self):
+        masks = flow_regime_masks(numpy.arange(1., 11.), [0, 50, 100])
+        self.assertEqual(masks.shape, (2, 10))
+        self.assertTrue(masks.any(axis=0).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
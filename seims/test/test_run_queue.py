@@ -0,0 +1,110 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  Unittest of claiming, leasing, and requeueing tasks of the model-run queue.
+"""
+from __future__ import absolute_import
+
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta
+
+try:
+    from unittest import mock  # py3
+except ImportError:
+    import mock  # py2
+
+if os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) not in sys.path:
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+try:
+    import mongomock
+    import run_queue
+    from run_queue import ModelRunQueue, TaskStatus
+except ImportError as err:  # e.g., mongomock or pygeoc is not installed
+    raise unittest.SkipTest('Model-run queue is not available: %s' % err)
+
+
+class TestModelRunQueue(unittest.TestCase):
+    """Tasks are claimed once, requeued after lease expired, and failed without attempts."""
+
+    def setUp(self):
+        client = mongomock.MongoClient()
+        conn = mock.MagicMock()
+        conn.get_conn.return_value = client
+        patcher = mock.patch.object(run_queue, 'ConnectMongoDB', return_value=conn)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.queue = ModelRunQueue('127.0.0.1', 27017, 'demo')
+        self.coll = client['demo']['MODEL_RUN_QUEUE']
+
+    def expire(self, task_id):
+        self.coll.update_one({'_id': task_id},
+                             {'$set': {'LEASE_EXPIRE': datetime.utcnow() - timedelta(seconds=1)}})
+
+    def test_claim_in_order(self):
+        ids = self.queue.enqueue([{'calibration_id': i, 'outputs': ['Q']} for i in range(3)],
+                                 'run1')
+        claimed = [self.queue.claim('w%d' % i) for i in range(3)]
+        self.assertEqual([task['_id'] for task in claimed], ids)
+        self.assertEqual([task['CALIBRATION_ID'] for task in claimed], [0, 1, 2])
+        for task in claimed:
+            self.assertEqual(task['STATUS'], TaskStatus.running)
+            self.assertEqual(task['ATTEMPTS'], 1)
+            self.assertEqual(task['ATTEMPTS_LEFT'], 2)
+        # all tasks are leased
+        self.assertIsNone(self.queue.claim('w3'))
+
+    def test_expired_lease(self):
+        tid = self.queue.enqueue([{'calibration_id': 1}])[0]
+        self.queue.claim('w1')
+        self.assertTrue(self.queue.heartbeat(tid, 'w1'))
+        self.expire(tid)
+        task = self.queue.claim('w2')
+        self.assertEqual(task['_id'], tid)
+        self.assertEqual(task['WORKER'], 'w2')
+        self.assertEqual(task['ATTEMPTS'], 2)
+        # the crashed worker has lost the lease
+        self.assertFalse(self.queue.heartbeat(tid, 'w1'))
+        self.assertTrue(self.queue.heartbeat(tid, 'w2'))
+
+    def test_expired_lease_without_attempts(self):
+        tid = self.queue.enqueue([{'calibration_id': 1}], max_attempts=1)[0]
+        self.queue.claim('w1')
+        self.expire(tid)
+        self.assertIsNone(self.queue.claim('w2'))
+        task = self.coll.find_one({'_id': tid})
+        self.assertEqual(task['STATUS'], TaskStatus.failed)
+        self.assertEqual(self.queue.wait([tid], timeout=0)[0]['_id'], tid)
+
+    def test_fail_and_retry(self):
+        tid = self.queue.enqueue([{'calibration_id': 1}], max_attempts=2)[0]
+        self.queue.claim('w1')
+        self.queue.fail(tid, 'w1', 'error 1')
+        task = self.coll.find_one({'_id': tid})
+        self.assertEqual(task['STATUS'], TaskStatus.pending)
+        self.assertIsNone(task['WORKER'])
+        self.assertEqual(self.queue.claim('w2')['_id'], tid)
+        self.queue.fail(tid, 'w2', 'error 2')
+        task = self.coll.find_one({'_id': tid})
+        self.assertEqual(task['STATUS'], TaskStatus.failed)
+        self.assertEqual(task['ERROR'], 'error 2')
+        self.assertIsNone(self.queue.claim('w3'))
+
+    def test_complete_and_wait(self):
+        ids = self.queue.enqueue([{'calibration_id': i} for i in range(2)], 'run1')
+        task = self.queue.claim('w1')
+        self.queue.complete(task['_id'], 'w1', {'TIMESPAN': [0., 0., 1., 1.]})
+        docs = self.queue.wait(ids, timeout=0)
+        self.assertEqual(docs[0]['RESULT'], {'TIMESPAN': [0., 0., 1., 1.]})
+        self.assertIsNone(docs[1])
+        # the result of another worker is not accepted
+        self.queue.complete(ids[1], 'w2', {'TIMESPAN': []})
+        self.assertEqual(self.coll.find_one({'_id': ids[1]})['STATUS'], TaskStatus.pending)
+        self.queue.clear('run1')
+        self.assertEqual(self.coll.count_documents({}), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
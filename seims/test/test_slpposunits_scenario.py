@@ -0,0 +1,70 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  Unittest of environmental effectiveness evaluators of slope position units based scenario.
+"""
+from __future__ import absolute_import
+
+import os
+import sys
+import tempfile
+import unittest
+
+try:
+    from unittest import mock  # py3
+except ImportError:
+    import mock  # py2
+
+if os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) not in sys.path:
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy
+
+try:
+    from scenario_analysis.evaluator import MaskedRasterEvaluator, RasterSumEvaluator
+    from scenario_analysis.slpposunits import scenario
+except ImportError as err:  # e.g., GDAL is not installed
+    raise unittest.SkipTest('Scenario analysis is not available: %s' % err)
+
+
+class TestEnvironmentEvaluator(unittest.TestCase):
+    """Test `get_environment_evaluator` of raster outputs."""
+
+    def setUp(self):
+        scenario._env_evaluator_cache.clear()
+        fd, self.base_file = tempfile.mkstemp(suffix='.tif')
+        os.close(fd)
+        self.units = numpy.array([1, 2])
+        self.unit_idx = numpy.array([[0, 0], [1, -1]])
+
+    def tearDown(self):
+        scenario._env_evaluator_cache.clear()
+        os.remove(self.base_file)
+
+    def test_masked_raster_with_base_enveval(self):
+        """The subbasin raster of the whole basin is read to mask the base output."""
+        subbsn_r = {'units': self.units, 'unit_idx': self.unit_idx}
+        base_data = numpy.ones((2, 2))
+        with mock.patch.object(scenario, 'read_slppos_raster',
+                               return_value=subbsn_r) as read_subbsn, \
+                mock.patch.object(scenario, 'read_raster_window',
+                                  return_value=(base_data, -9999.)):
+            evaluator = scenario.get_environment_evaluator('127.0.0.1', 27017, 'demo',
+                                                           'SOER_SUM.tif', self.base_file)
+        read_subbsn.assert_called_once_with('127.0.0.1', 27017, 'demo', '0_SUBBASIN')
+        self.assertIsInstance(evaluator, MaskedRasterEvaluator)
+
+    def test_whole_raster_if_shape_mismatch(self):
+        """The whole output raster is evaluated if the base output does not match."""
+        subbsn_r = {'units': self.units, 'unit_idx': self.unit_idx}
+        with mock.patch.object(scenario, 'read_slppos_raster', return_value=subbsn_r), \
+                mock.patch.object(scenario, 'read_raster_window',
+                                  return_value=(numpy.ones((3, 3)), -9999.)):
+            evaluator = scenario.get_environment_evaluator('127.0.0.1', 27017, 'demo',
+                                                           'SOER_SUM.tif', self.base_file)
+        self.assertIsInstance(evaluator, RasterSumEvaluator)
+        self.assertNotIsInstance(evaluator, MaskedRasterEvaluator)
+
+
+if __name__ == '__main__':
+    unittest.main()
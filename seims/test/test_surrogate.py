@@ -0,0 +1,125 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+  Unittest of the additive response surrogate for pre-screening scenarios.
+"""
+from __future__ import absolute_import
+
+import os
+import sys
+import unittest
+
+if os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) not in sys.path:
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy
+
+from scenario_analysis.surrogate import AdditiveSurrogate, select_for_evaluation
+
+
+def one_hot(genes, values):
+    """One-hot encodings of (unit, BMP) pairs, ordered by unit then BMP."""
+    genes = numpy.asarray(genes)
+    return numpy.column_stack([(genes[:, i] == v) for i in range(genes.shape[1])
+                               for v in values]).astype(numpy.float64)
+
+
+class TestAdditiveSurrogate(unittest.TestCase):
+    """The dual ridge regression is the same as the primal one on one-hot encodings."""
+
+    def setUp(self):
+        self.rng = numpy.random.RandomState(33)
+        self.nunits = 20
+        self.values = [1, 3]
+        # contribution of each (unit, BMP) pair, and no contribution without BMP
+        self.weights = self.rng.random_sample((self.nunits, len(self.values)))
+        self.genes = self.rng.choice([0] + self.values, (150, self.nunits))
+
+    def response(self, genes):
+        env = numpy.full(len(genes), 2.)
+        for j, v in enumerate(self.values):
+            env += numpy.sum((genes == v) * self.weights[:, j], axis=1)
+        return env
+
+    def test_fit_additive_response(self):
+        alpha = 0.5
+        surrogate = AdditiveSurrogate([0] + self.values * 2, alpha, min_samples=10)
+        numpy.testing.assert_array_equal(surrogate.values, self.values)
+        surrogate.add(self.genes[:5], self.response(self.genes[:5]))
+        self.assertFalse(surrogate.fit())
+        self.assertFalse(surrogate.fitted)
+        surrogate.add(self.genes[5:], self.response(self.genes[5:]))
+        self.assertTrue(surrogate.fit())
+
+        new_genes = self.rng.choice([0] + self.values, (30, self.nunits))
+        mean, std = surrogate.predict(new_genes)
+        numpy.testing.assert_allclose(mean, self.response(new_genes), atol=0.2)
+        # the same as primal ridge regression with the intercept not regularized
+        x = one_hot(self.genes, self.values)
+        x_mean = x.mean(axis=0)
+        x -= x_mean
+        y = self.response(self.genes)
+        a_inv = numpy.linalg.inv(x.T.dot(x) + alpha * numpy.eye(x.shape[1]))
+        w = a_inv.dot(x.T.dot(y - y.mean()))
+        self.assertAlmostEqual(surrogate.intercept, y.mean() - x_mean.dot(w))
+        new_x = one_hot(new_genes, self.values) - x_mean
+        numpy.testing.assert_allclose(mean, y.mean() + new_x.dot(w))
+        numpy.testing.assert_allclose(surrogate.contributions().ravel(), w)
+        sigma2 = numpy.mean((y - y.mean() - x.dot(w)) ** 2)
+        self.assertAlmostEqual(surrogate.sigma2, sigma2)
+        numpy.testing.assert_allclose(std, numpy.sqrt(sigma2 * (1. + numpy.sum(
+            new_x.dot(a_inv) * new_x, axis=1))))
+        # unseen (unit, BMP) pairs are less certain
+        self.assertTrue(numpy.all(std >= numpy.sqrt(sigma2)))
+
+    def test_max_samples(self):
+        surrogate = AdditiveSurrogate(self.values, max_samples=50)
+        surrogate.add(self.genes, self.response(self.genes))
+        self.assertEqual(len(surrogate.genes), 50)
+        numpy.testing.assert_array_equal(surrogate.genes[0], self.genes[100])
+
+
+class TestSelectForEvaluation(unittest.TestCase):
+    """Select the requested fraction of candidates, including the non-dominated ones."""
+
+    def setUp(self):
+        self.rng = numpy.random.RandomState(33)
+
+    def non_dominated(self, econ, optimistic, evaluated):
+        ref = numpy.concatenate((evaluated, numpy.column_stack((econ, optimistic))))
+        return numpy.array([not numpy.any((ref[:, 0] <= c) & (ref[:, 1] >= e) &
+                                          ((ref[:, 0] < c) | (ref[:, 1] > e)))
+                            for c, e in zip(econ, optimistic)])
+
+    def test_fraction_and_non_dominated(self):
+        for num, ratio in [(10, 0.5), (25, 0.3), (40, 0.8), (7, 1.)]:
+            econ = self.rng.random_sample(num)
+            pred_env = self.rng.random_sample(num)
+            pred_std = self.rng.random_sample(num) * 0.1
+            evaluated = self.rng.random_sample((20, 2))
+            selected = select_for_evaluation(econ, pred_env, pred_std, evaluated, ratio)
+            nsel = int(numpy.ceil(num * ratio))
+            self.assertEqual(selected.sum(), nsel)
+            nd = self.non_dominated(econ, pred_env + pred_std, evaluated)
+            if nd.sum() <= nsel:
+                self.assertTrue(numpy.all(selected[nd]))
+            # the most uncertain candidate is selected
+            self.assertTrue(selected[numpy.argmax(pred_std)] or nd.sum() >= nsel)
+
+    def test_many_non_dominated(self):
+        # all candidates are on the same front, more than half of the selected ones
+        econ = numpy.linspace(0., 1., 10)
+        pred_env = numpy.linspace(0., 1., 10)
+        pred_std = numpy.array([0.] * 9 + [0.5])
+        selected = select_for_evaluation(econ, pred_env, pred_std, [], 0.6)
+        self.assertEqual(selected.sum(), 6)
+        # the non-dominated candidates with the best optimistic environment are selected
+        self.assertEqual(numpy.nonzero(selected)[0].tolist(), [4, 5, 6, 7, 8, 9])
+
+    def test_empty(self):
+        self.assertEqual(len(select_for_evaluation(numpy.array([]), numpy.array([]),
+                                                   numpy.array([]), [[1., 1.]])), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()